@@ -0,0 +1,292 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Adaptive rate limiting of cloud API calls.
+
+Retrying throttled calls on a fixed schedule keeps many threads and processes
+calling an API in lockstep, which gets them throttled again. With
+--api_rate_limiting, calls to each provider's API family (e.g. GCP compute or
+AWS ec2) first take a token from a token bucket shared by every thread of
+every PKB process of the run, including --run_processes workers:
+
+* The bucket's rate adapts to the API (additive increase, multiplicative
+  decrease): each successful call raises it slightly and each throttled call
+  halves it.
+* After --api_circuit_breaker_threshold throttled calls in a row, the circuit
+  breaker opens and no caller is given a token for
+  --api_circuit_breaker_seconds.
+
+The buckets are kept in a JSON file in the run's temp directory and updated
+under a file lock, so processes coordinate without a server. Where file locks
+are not available (Windows), buckets are only shared between threads.
+"""
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from absl import flags
+from perfkitbenchmarker import sample
+from perfkitbenchmarker import temp_dir
+
+try:
+  import fcntl  # pylint: disable=g-import-not-at-top
+except ImportError:
+  fcntl = None
+
+flags.DEFINE_boolean(
+    'api_rate_limiting', False,
+    'If true, calls to cloud provider CLIs are rate limited per provider and '
+    'API family, with a rate that adapts to throttling and a circuit breaker '
+    'shared by all PKB threads and processes of the run.')
+flags.DEFINE_float(
+    'api_rate_limit_initial_qps', 5.0,
+    'The initial rate in calls per second of each API family when '
+    '--api_rate_limiting is set.', lower_bound=0.01)
+flags.DEFINE_float(
+    'api_rate_limit_min_qps', 0.1,
+    'The lowest rate in calls per second that throttling can reduce an API '
+    'family to.', lower_bound=0.001)
+flags.DEFINE_float(
+    'api_rate_limit_max_qps', 50.0,
+    'The highest rate in calls per second that an API family can reach.',
+    lower_bound=0.01)
+flags.DEFINE_integer(
+    'api_circuit_breaker_threshold', 5,
+    'The number of throttled calls in a row to an API family that pauses all '
+    'calls to it when --api_rate_limiting is set.', lower_bound=1)
+flags.DEFINE_float(
+    'api_circuit_breaker_seconds', 60.0,
+    'The number of seconds calls to an API family are paused for once its '
+    'circuit breaker opens.', lower_bound=0)
+
+FLAGS = flags.FLAGS
+
+# Rate in calls per second added to a bucket by each successful call.
+_ADDITIVE_INCREASE = 0.1
+# Factor a bucket's rate is multiplied by for each throttled call.
+_MULTIPLICATIVE_DECREASE = 0.5
+# Fraction of each wait that is randomized, so waiting callers spread out.
+_WAIT_FUZZ = 0.1
+_STATE_FILE_NAME = 'api_rate_limits.json'
+
+
+class _LocalBackend(object):
+  """Keeps bucket state in memory, shared by the threads of one process."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._state = {}
+
+  @contextlib.contextmanager
+  def Transaction(self):
+    """Yields the state of all buckets, which may be updated in place."""
+    with self._lock:
+      yield self._state
+
+
+class _FileBackend(object):
+  """Keeps bucket state in a file, shared by every process of the run."""
+
+  def __init__(self, path):
+    self._path = path
+    self._lock = threading.Lock()
+
+  @contextlib.contextmanager
+  def Transaction(self):
+    """Yields the state of all buckets, which may be updated in place."""
+    with self._lock, open(self._path + '.lock', 'a') as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      try:
+        try:
+          with open(self._path) as state_file:
+            state = json.load(state_file)
+        except (IOError, ValueError):
+          state = {}
+        yield state
+        with open(self._path + '.tmp', 'w') as state_file:
+          json.dump(state, state_file)
+        os.rename(self._path + '.tmp', self._path)
+      finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class _LimiterStats(object):
+  """Thread-safe totals of the calls made by this process, per API family."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._stats = collections.defaultdict(collections.Counter)
+
+  def Record(self, key, **counts):
+    with self._lock:
+      self._stats[key].update(counts)
+
+  def GetSamples(self):
+    """Returns a throttled time sample per API family, and resets the stats."""
+    with self._lock:
+      stats, self._stats = self._stats, collections.defaultdict(
+          collections.Counter)
+    samples = []
+    for key, counts in sorted(stats.items()):
+      provider, family = key.split(':', 1)
+      samples.append(sample.Sample(
+          'API Rate Limiter Throttled Time', counts['waited_seconds'],
+          'seconds', {
+              'provider': provider,
+              'api_family': family,
+              'calls': counts['calls'],
+              'throttled_calls': counts['throttled_calls'],
+              'circuit_breaker_trips': counts['circuit_breaker_trips'],
+          }))
+    return samples
+
+
+class RateLimiter(object):
+  """An adaptive token bucket for one provider's API family."""
+
+  def __init__(self, provider, family, backend, stats):
+    self.key = '%s:%s' % (provider, family)
+    self._backend = backend
+    self._stats = stats
+
+  def _GetBucket(self, state, now):
+    if self.key not in state:
+      rate = FLAGS.api_rate_limit_initial_qps
+      state[self.key] = {'rate': rate, 'tokens': 1.0, 'updated': now,
+                         'breaker_until': 0.0, 'throttled_in_a_row': 0}
+    bucket = state[self.key]
+    capacity = max(1.0, bucket['rate'])
+    bucket['tokens'] = min(capacity, bucket['tokens'] +
+                           (now - bucket['updated']) * bucket['rate'])
+    bucket['updated'] = now
+    return bucket
+
+  def _TryAcquire(self):
+    """Takes a token if one is available.
+
+    Returns:
+      0 if a token was taken, otherwise the seconds to wait before trying again.
+    """
+    with self._backend.Transaction() as state:
+      now = time.time()
+      bucket = self._GetBucket(state, now)
+      if bucket['breaker_until'] > now:
+        return bucket['breaker_until'] - now
+      if bucket['tokens'] >= 1:
+        bucket['tokens'] -= 1
+        return 0
+      return (1 - bucket['tokens']) / bucket['rate']
+
+  def Acquire(self):
+    """Blocks until a call may be made."""
+    start = time.time()
+    while True:
+      wait = self._TryAcquire()
+      if not wait:
+        break
+      time.sleep(wait * (1 + random.random() * _WAIT_FUZZ))
+    self._stats.Record(self.key, calls=1, waited_seconds=time.time() - start)
+
+  def RecordResult(self, throttled):
+    """Adapts the rate to the result of a call.
+
+    Args:
+      throttled: Whether the call was rejected because of rate limits or quota.
+    """
+    with self._backend.Transaction() as state:
+      now = time.time()
+      bucket = self._GetBucket(state, now)
+      if not throttled:
+        bucket['throttled_in_a_row'] = 0
+        bucket['rate'] = min(FLAGS.api_rate_limit_max_qps,
+                             bucket['rate'] + _ADDITIVE_INCREASE)
+        return
+      bucket['rate'] = max(FLAGS.api_rate_limit_min_qps,
+                           bucket['rate'] * _MULTIPLICATIVE_DECREASE)
+      bucket['tokens'] = min(bucket['tokens'], 0.0)
+      bucket['throttled_in_a_row'] += 1
+      tripped = (bucket['throttled_in_a_row'] >=
+                 FLAGS.api_circuit_breaker_threshold)
+      if tripped:
+        bucket['throttled_in_a_row'] = 0
+        bucket['breaker_until'] = now + FLAGS.api_circuit_breaker_seconds
+      rate = bucket['rate']
+    self._stats.Record(self.key, throttled_calls=1,
+                       circuit_breaker_trips=int(tripped))
+    if tripped:
+      logging.warning('%s was throttled %d times in a row. Pausing calls to it '
+                      'for %s seconds.', self.key,
+                      FLAGS.api_circuit_breaker_threshold,
+                      FLAGS.api_circuit_breaker_seconds)
+    else:
+      logging.info('%s was throttled. Reduced its rate to %.2f calls per '
+                   'second.', self.key, rate)
+
+
+_lock = threading.Lock()
+_limiters = {}
+_backend = None
+_STATS = _LimiterStats()
+
+
+def _GetBackend():
+  global _backend
+  if _backend is None:
+    if fcntl:
+      _backend = _FileBackend(
+          os.path.join(temp_dir.GetRunDirPath(), _STATE_FILE_NAME))
+    else:
+      _backend = _LocalBackend()
+  return _backend
+
+
+def GetLimiter(provider, family):
+  """Returns the RateLimiter for an API family of a provider."""
+  with _lock:
+    key = (provider, family)
+    if key not in _limiters:
+      _limiters[key] = RateLimiter(provider, family, _GetBackend(), _STATS)
+    return _limiters[key]
+
+
+@contextlib.contextmanager
+def Limit(provider, family):
+  """Rate limits the API call made within the block.
+
+  Does nothing unless --api_rate_limiting is set.
+
+  Args:
+    provider: The cloud provider, e.g. providers.GCP.
+    family: The API family called, e.g. 'compute'.
+
+  Yields:
+    A function to call as report_throttled(throttled) once the result of the
+    call is known. Calls that are not reported do not change the rate.
+  """
+  if not FLAGS.api_rate_limiting:
+    yield lambda throttled: None
+    return
+  limiter = GetLimiter(provider, family)
+  limiter.Acquire()
+  yield limiter.RecordResult
+
+
+def GetSamples():
+  """Returns throttled time samples recorded since the last call."""
+  return _STATS.GetSamples()
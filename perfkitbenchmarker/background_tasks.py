@@ -56,9 +56,13 @@ from __future__ import division
 from __future__ import print_function
 
 import abc
+import collections
 from collections import deque
+import contextlib
 import ctypes
 import functools
+import heapq
+import itertools
 import logging
 import os
 import signal
@@ -71,6 +75,7 @@ from perfkitbenchmarker import context
 from perfkitbenchmarker import errors
 from absl import flags
 from perfkitbenchmarker import log_util
+from perfkitbenchmarker import sample
 import six
 from six.moves import queue
 from six.moves import range
@@ -100,8 +105,19 @@ MAX_CONCURRENT_THREADS = 200
 flags.DEFINE_integer(
     'max_concurrent_threads', None, 'Maximum number of concurrent threads to '
     'use when running a benchmark.')
+flags.DEFINE_list(
+    'concurrency_classes', [],
+    'Process-wide limits on the number of concurrent operations of a class, as '
+    'a list of NAME:LIMIT pairs, e.g. gcp-create:50,scp:16. Classes include '
+    '<cloud>-create (creating any resource of a cloud, e.g. gcp-create or '
+    'aws-create) and scp (copying files to or from VMs). Operations of a '
+    'class beyond its limit wait for a slot, higher priority operations '
+    'first, regardless of how many threads were started for them.')
 FLAGS = flags.FLAGS
 
+# Names of the concurrency classes that operations use.
+_known_concurrency_classes = set()
+
 
 def _GetCallString(target_arg_tuple):
   """Returns the string representation of a function call."""
@@ -213,16 +229,316 @@ class _BackgroundTaskThreadContext(object):
   Attributes:
     benchmark_spec: BenchmarkSpec of the benchmark currently being executed.
     log_context: ThreadLogContext of the parent thread.
+    held_concurrency_classes: frozenset of the names of the concurrency classes
+        the parent thread holds slots of.
   """
 
   def __init__(self):
     self.benchmark_spec = context.GetThreadBenchmarkSpec()
     self.log_context = log_util.GetThreadLogContext()
+    self.held_concurrency_classes = frozenset(
+        _concurrency_thread_data.held_classes)
 
   def CopyToCurrentThread(self):
     """Sets the thread context of the current thread."""
     log_util.SetThreadLogContext(log_util.ThreadLogContext(self.log_context))
     context.SetThreadBenchmarkSpec(self.benchmark_spec)
+    _concurrency_thread_data.held_classes = set(self.held_concurrency_classes)
+
+
+class CancellationToken(object):
+  """Asks a group of parallel tasks to stop early.
+
+  Python threads cannot be stopped from outside, so cancellation is
+  cooperative: long running task code, such as vm_util.Retry loops, calls
+  CheckCancelled between steps, which raises TaskCancelledError once the token
+  of the task's group or of any enclosing group has been cancelled.
+  """
+
+  def __init__(self, parent=None):
+    self._event = threading.Event()
+    self._lock = threading.Lock()
+    self._children = []
+    if parent:
+      parent._AddChild(self)  # pylint: disable=protected-access
+
+  def _AddChild(self, child):
+    with self._lock:
+      self._children.append(child)
+      cancelled = self.cancelled
+    if cancelled:
+      child.Cancel()
+
+  @property
+  def cancelled(self):
+    return self._event.is_set()
+
+  def Cancel(self):
+    """Cancels this token and the tokens of any groups started within it."""
+    with self._lock:
+      self._event.set()
+      children = list(self._children)
+    for child in children:
+      child.Cancel()
+
+
+class _CancellationThreadData(threading.local):
+
+  def __init__(self):
+    super(_CancellationThreadData, self).__init__()
+    self.token = None
+
+
+_cancellation = _CancellationThreadData()
+
+# The longest time CancellableSleep sleeps between checks for cancellation.
+_CANCELLATION_CHECK_SECONDS = 1
+
+
+def GetCancellationToken():
+  """Returns the CancellationToken of the current task, or None."""
+  return _cancellation.token
+
+
+def CheckCancelled():
+  """Raises TaskCancelledError if the current task has been cancelled."""
+  token = _cancellation.token
+  if token and token.cancelled:
+    raise errors.VmUtil.TaskCancelledError(
+        'Task was cancelled because another parallel task failed or the '
+        'tasks were cancelled by their caller.')
+
+
+def CancellableSleep(seconds):
+  """Sleeps, raising TaskCancelledError early if the current task is cancelled.
+  """
+  CheckCancelled()
+  if not _cancellation.token:
+    time.sleep(seconds)
+    return
+  while seconds > 0:
+    time.sleep(min(seconds, _CANCELLATION_CHECK_SECONDS))
+    seconds -= _CANCELLATION_CHECK_SECONDS
+    CheckCancelled()
+
+
+def _RunWithCancellationToken(token, target, *args, **kwargs):
+  """Runs target with token as the current thread's CancellationToken."""
+  previous, _cancellation.token = _cancellation.token, token
+  try:
+    return target(*args, **kwargs)
+  finally:
+    _cancellation.token = previous
+
+
+class _ConcurrencyClass(object):
+  """A process-wide limit on concurrent operations of one class.
+
+  Slots are handed to waiters in priority order, then in the order they asked,
+  and each wait is recorded for the class's samples.
+  """
+
+  def __init__(self, name, limit):
+    self.name = name
+    self.limit = limit
+    self._lock = threading.Lock()
+    self._active = 0
+    self._waiters = []  # Heap of (-priority, sequence number, threading.Event).
+    self._sequence = itertools.count()
+    self._stats = collections.Counter()
+
+  def Acquire(self, priority=0):
+    """Blocks until a slot is available and takes it."""
+    with self._lock:
+      self._stats['acquisitions'] += 1
+      if self._active < self.limit and not self._waiters:
+        self._active += 1
+        return
+      entry = (-priority, next(self._sequence), threading.Event())
+      heapq.heappush(self._waiters, entry)
+      self._stats['waits'] += 1
+      self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'],
+                                           len(self._waiters))
+    start = time.time()
+    event = entry[2]
+    try:
+      while not event.wait(_LONG_TIMEOUT):
+        pass
+    except BaseException:
+      with self._lock:
+        handed_over = event.is_set()
+        if not handed_over:
+          self._waiters.remove(entry)
+          heapq.heapify(self._waiters)
+      if handed_over:
+        self.Release()
+      raise
+    finally:
+      with self._lock:
+        self._stats['wait_seconds'] += time.time() - start
+
+  def Release(self):
+    """Hands the slot to the next waiter, or frees it."""
+    with self._lock:
+      if self._waiters:
+        heapq.heappop(self._waiters)[2].set()
+      else:
+        self._active -= 1
+
+  def GetQueueDepth(self):
+    with self._lock:
+      return len(self._waiters)
+
+  def GetSample(self):
+    """Returns a wait time sample for the class and resets its stats."""
+    with self._lock:
+      stats, self._stats = self._stats, collections.Counter()
+    if not stats['acquisitions']:
+      return None
+    return sample.Sample(
+        'Concurrency Class Wait Time', stats['wait_seconds'], 'seconds', {
+            'concurrency_class': self.name,
+            'limit': self.limit,
+            'acquisitions': stats['acquisitions'],
+            'waits': stats['waits'],
+            'max_queue_depth': stats['max_queue_depth'],
+        })
+
+
+class _ConcurrencyThreadData(threading.local):
+
+  def __init__(self):
+    super(_ConcurrencyThreadData, self).__init__()
+    self.held_classes = set()
+
+
+_concurrency_lock = threading.Lock()
+_concurrency_classes = {}
+_concurrency_classes_flag = None
+_concurrency_thread_data = _ConcurrencyThreadData()
+
+
+def _ParseConcurrencyClasses(values):
+  """Returns a dict of class name to limit from --concurrency_classes."""
+  limits = {}
+  for value in values:
+    name, _, limit = value.rpartition(':')
+    try:
+      limits[name] = int(limit)
+    except ValueError:
+      limits[name] = 0
+    if not name or limits[name] < 1:
+      raise ValueError('Invalid --concurrency_classes entry %r. Expected '
+                       'NAME:LIMIT with a positive LIMIT.' % value)
+  return limits
+
+
+def _ValidateConcurrencyClasses(values):
+  """Checks --concurrency_classes and warns about classes nothing uses."""
+  try:
+    limits = _ParseConcurrencyClasses(values)
+  except ValueError as e:
+    raise flags.ValidationError(str(e))
+  unknown = sorted(set(limits) - _known_concurrency_classes)
+  if unknown:
+    logging.warning(
+        'No operation uses the concurrency classes %s of '
+        '--concurrency_classes, so they do not limit anything. Known classes: '
+        '%s.', ', '.join(unknown), ', '.join(sorted(_known_concurrency_classes)))
+  return True
+
+
+flags.register_validator('concurrency_classes', _ValidateConcurrencyClasses)
+
+
+def RegisterConcurrencyClass(name):
+  """Declares a concurrency class that operations hold slots of.
+
+  --concurrency_classes warns about the classes that were not declared, which
+  is most likely a misspelled name.
+
+  Args:
+    name: string. The class name.
+  """
+  _known_concurrency_classes.add(name)
+
+
+def SetConcurrencyLimit(name, limit):
+  """Limits the number of concurrent operations of a class in this process.
+
+  Args:
+    name: string. The class name.
+    limit: int or None. The maximum number of concurrent operations, or None to
+        remove the limit. Operations already holding or waiting for a slot keep
+        the previous limit.
+  """
+  with _concurrency_lock:
+    _concurrency_classes.pop(name, None)
+    if limit is not None:
+      _concurrency_classes[name] = _ConcurrencyClass(name, limit)
+
+
+def _GetConcurrencyClass(name):
+  """Returns the _ConcurrencyClass called name, or None if it is unlimited."""
+  global _concurrency_classes_flag
+  with _concurrency_lock:
+    if (FLAGS.is_parsed() and
+        FLAGS.concurrency_classes != _concurrency_classes_flag):
+      _concurrency_classes_flag = list(FLAGS.concurrency_classes)
+      for class_name, limit in six.iteritems(
+          _ParseConcurrencyClasses(FLAGS.concurrency_classes)):
+        _concurrency_classes[class_name] = _ConcurrencyClass(class_name, limit)
+    return _concurrency_classes.get(name)
+
+
+@contextlib.contextmanager
+def ConcurrencySlot(name, priority=0):
+  """Holds a slot of a concurrency class for the duration of the block.
+
+  Does nothing if the class has no limit, or if the current thread already
+  holds a slot of the class, so nested operations do not deadlock. Tasks
+  started by RunThreaded and the other functions of this module inherit the
+  slots their caller holds, so operations that fan out to nested operations
+  of the same class do not deadlock either; they share the caller's slot.
+
+  Args:
+    name: string or None. The class name, e.g. 'scp'. None means no class.
+    priority: int. Waiters with a higher priority get slots first.
+
+  Yields:
+    None.
+  """
+  concurrency_class = _GetConcurrencyClass(name)
+  held_classes = _concurrency_thread_data.held_classes
+  if not concurrency_class or name in held_classes:
+    yield
+    return
+  concurrency_class.Acquire(priority)
+  held_classes.add(name)
+  try:
+    yield
+  finally:
+    held_classes.discard(name)
+    concurrency_class.Release()
+
+
+def GetConcurrencyQueueDepth(name):
+  """Returns the number of operations waiting for a slot of a class."""
+  concurrency_class = _GetConcurrencyClass(name)
+  return concurrency_class.GetQueueDepth() if concurrency_class else 0
+
+
+def GetConcurrencySamples():
+  """Returns wait time samples of the classes used since the last call."""
+  with _concurrency_lock:
+    classes = sorted(six.itervalues(_concurrency_classes),
+                     key=lambda c: c.name)
+  return [s for s in (c.GetSample() for c in classes) if s]
+
+
+def _RunInConcurrencyClass(name, priority, target, *args, **kwargs):
+  with ConcurrencySlot(name, priority):
+    return target(*args, **kwargs)
 
 
 class _BackgroundTask(object):
@@ -238,6 +554,7 @@ class _BackgroundTask(object):
         otherwise.
     traceback: The traceback string if the call raised an exception, or None
         otherwise.
+    cancelled: True if the call raised TaskCancelledError.
   """
 
   def __init__(self, target, args, kwargs, thread_context):
@@ -247,14 +564,16 @@ class _BackgroundTask(object):
     self.context = thread_context
     self.return_value = None
     self.traceback = None
+    self.cancelled = False
 
   def Run(self):
     """Sets the current thread context and executes the target."""
     self.context.CopyToCurrentThread()
     try:
       self.return_value = self.target(*self.args, **self.kwargs)
-    except Exception:
+    except Exception as e:  # pylint: disable=broad-except
       self.traceback = traceback.format_exc()
+      self.cancelled = isinstance(e, errors.VmUtil.TaskCancelledError)
 
 
 class _BackgroundTaskManager(six.with_metaclass(abc.ABCMeta, object)):
@@ -489,9 +808,11 @@ class _BackgroundProcessTaskManager(_BackgroundTaskManager):
     self._executor.shutdown(wait=True)
 
 
-def _RunParallelTasks(target_arg_tuples, max_concurrency, get_task_manager,
-                      parallel_exception_class, post_task_delay=0):
-  """Executes function calls concurrently in separate threads or processes.
+def _IterParallelTasks(target_arg_tuples, max_concurrency, get_task_manager,
+                       parallel_exception_class, post_task_delay=0,
+                       fail_fast=False, cancellation_token=None,
+                       concurrency_class=None, priority=0):
+  """Executes function calls concurrently, yielding results as they complete.
 
   Args:
     target_arg_tuples: list of (target, args, kwargs) tuples. Each tuple
@@ -503,47 +824,78 @@ def _RunParallelTasks(target_arg_tuples, max_concurrency, get_task_manager,
     parallel_exception_class: Type of exception to raise upon an exception in
         one of the called functions.
     post_task_delay: Delay in seconds between parallel task invocations.
-
-  Returns:
-    list of function return values in the order corresponding to the order of
-    target_arg_tuples.
+    fail_fast: If True, once a call fails no more calls are started and
+        cancellation_token is cancelled.
+    cancellation_token: CancellationToken or None. If given, it is made the
+        current token of the calls, which must then run in threads. Calls that
+        have not started when it is cancelled are skipped.
+    concurrency_class: string or None. The name of a concurrency class each
+        call holds a slot of while it runs. Calls must then run in threads.
+    priority: int. The priority of the calls within concurrency_class.
+
+  Yields:
+    (index, return value) tuples of the calls that succeeded, in the order they
+    completed, where index is the position of the call in target_arg_tuples.
 
   Raises:
     parallel_exception_class: When an exception occurred in any of the called
-        functions.
+        functions, or calls were skipped because of cancellation.
   """
   thread_context = _BackgroundTaskThreadContext()
   max_concurrency = min(max_concurrency, len(target_arg_tuples))
   error_strings = []
+  cancelled_task_count = 0
   started_task_count = 0
   active_task_count = 0
   with get_task_manager(max_concurrency) as task_manager:
     try:
       while started_task_count < len(target_arg_tuples) or active_task_count:
         if (started_task_count < len(target_arg_tuples) and
-            active_task_count < max_concurrency):
+            active_task_count < max_concurrency and
+            not (fail_fast and error_strings) and
+            not (cancellation_token and cancellation_token.cancelled)):
           # Start a new task.
           target, args, kwargs = target_arg_tuples[started_task_count]
+          if concurrency_class:
+            target, args = _RunInConcurrencyClass, (
+                concurrency_class, priority, target) + tuple(args)
+          if cancellation_token:
+            target, args = _RunWithCancellationToken, (
+                cancellation_token, target) + tuple(args)
           task_manager.StartTask(target, args, kwargs, thread_context)
           started_task_count += 1
           active_task_count += 1
           if post_task_delay:
             time.sleep(post_task_delay)
           continue
+        if not active_task_count:
+          # The remaining tasks are not started because of an earlier failure
+          # or cancellation.
+          break
 
         # Wait for a task to complete.
         task_id = task_manager.AwaitAnyTask()
         active_task_count -= 1
+        task = task_manager.tasks[task_id]
+        if task.cancelled:
+          cancelled_task_count += 1
+          logging.info('Cancelled %s.',
+                       _GetCallString(target_arg_tuples[task_id]))
+          continue
         # If the task failed, it may still be a long time until all remaining
         # tasks complete. Log the failure immediately before continuing to wait
         # for other tasks.
-        stacktrace = task_manager.tasks[task_id].traceback
+        stacktrace = task.traceback
         if stacktrace:
           msg = ('Exception occurred while calling {0}:{1}{2}'.format(
               _GetCallString(target_arg_tuples[task_id]), os.linesep,
               stacktrace))
           logging.error(msg)
           error_strings.append(msg)
+          if fail_fast and cancellation_token:
+            cancellation_token.Cancel()
+          continue
+        yield task_id, task.return_value
 
     except KeyboardInterrupt:
       logging.error(
@@ -551,7 +903,17 @@ def _RunParallelTasks(target_arg_tuples, max_concurrency, get_task_manager,
           'for %s tasks to clean up.', active_task_count)
       task_manager.HandleKeyboardInterrupt()
       raise
-
+    finally:
+      if active_task_count and cancellation_token:
+        # The caller stopped iterating early, so the running tasks' results
+        # are not needed.
+        cancellation_token.Cancel()
+
+  skipped_task_count = len(target_arg_tuples) - started_task_count
+  if skipped_task_count or cancelled_task_count:
+    error_strings.append(
+        '{0} tasks were cancelled and {1} were not started.'.format(
+            cancelled_task_count, skipped_task_count))
   if error_strings:
     # TODO(skschneider): Combine errors.VmUtil.ThreadException and
     # errors.VmUtil.CalledProcessException so this can be a single exception
@@ -559,12 +921,42 @@ def _RunParallelTasks(target_arg_tuples, max_concurrency, get_task_manager,
     raise parallel_exception_class(
         'The following exceptions occurred during parallel execution:'
         '{0}{1}'.format(os.linesep, os.linesep.join(error_strings)))
-  results = [task.return_value for task in task_manager.tasks]
-  assert len(target_arg_tuples) == len(results), (target_arg_tuples, results)
+
+
+def _RunParallelTasks(target_arg_tuples, max_concurrency, get_task_manager,
+                      parallel_exception_class, post_task_delay=0,
+                      fail_fast=False, cancellation_token=None,
+                      concurrency_class=None, priority=0):
+  """Executes function calls concurrently in separate threads or processes.
+
+  Args:
+    See _IterParallelTasks.
+
+  Returns:
+    list of function return values in the order corresponding to the order of
+    target_arg_tuples.
+
+  Raises:
+    parallel_exception_class: When an exception occurred in any of the called
+        functions.
+  """
+  results = [None] * len(target_arg_tuples)
+  for task_id, result in _IterParallelTasks(
+      target_arg_tuples, max_concurrency, get_task_manager,
+      parallel_exception_class, post_task_delay, fail_fast,
+      cancellation_token, concurrency_class, priority):
+    results[task_id] = result
   return results
 
 
-def RunParallelThreads(target_arg_tuples, max_concurrency, post_task_delay=0):
+def _NewCancellationToken(cancellation_token):
+  """Returns the token for a new group of tasks started by this thread."""
+  return cancellation_token or CancellationToken(GetCancellationToken())
+
+
+def RunParallelThreads(target_arg_tuples, max_concurrency, post_task_delay=0,
+                       fail_fast=False, cancellation_token=None,
+                       concurrency_class=None, priority=0):
   """Executes function calls concurrently in separate threads.
 
   Args:
@@ -573,6 +965,17 @@ def RunParallelThreads(target_arg_tuples, max_concurrency, post_task_delay=0):
     max_concurrency: int or None. The maximum number of concurrent new
         threads.
     post_task_delay: Delay in seconds between parallel task invocations.
+    fail_fast: If True, as soon as one call fails no more calls are started
+        and the running calls are cancelled, so the exception is raised
+        without waiting for all of them to finish.
+    cancellation_token: CancellationToken or None. A token the caller may
+        cancel to stop the calls early. By default a new token is created,
+        which is cancelled along with the token of the current thread.
+    concurrency_class: string or None. The name of a concurrency class (see
+        --concurrency_classes) each call holds a slot of while it runs, which
+        bounds the calls running at once across the whole process.
+    priority: int. Calls with a higher priority get concurrency_class slots
+        first.
 
   Returns:
     list of function return values in the order corresponding to the order of
@@ -580,17 +983,38 @@ def RunParallelThreads(target_arg_tuples, max_concurrency, post_task_delay=0):
 
   Raises:
     errors.VmUtil.ThreadException: When an exception occurred in any of the
-        called functions.
+        called functions, or they were cancelled.
   """
   return _RunParallelTasks(
       target_arg_tuples, max_concurrency, _BackgroundThreadTaskManager,
-      errors.VmUtil.ThreadException, post_task_delay)
+      errors.VmUtil.ThreadException, post_task_delay, fail_fast,
+      _NewCancellationToken(cancellation_token), concurrency_class, priority)
+
+
+def _GetTargetArgTuples(target, thread_params):
+  """Returns RunParallelThreads' target_arg_tuples for RunThreaded's args."""
+  if not isinstance(thread_params, list):
+    raise ValueError('Param "thread_params" must be a list')
+
+  if not thread_params:
+    return []
+
+  if not isinstance(thread_params[0], tuple):
+    return [(target, (arg,), {}) for arg in thread_params]
+  elif (not isinstance(thread_params[0][0], tuple) or
+        not isinstance(thread_params[0][1], dict)):
+    raise ValueError('If Param is a tuple, the tuple must be (tuple, dict)')
+  return [(target, args, kwargs) for args, kwargs in thread_params]
 
 
 def RunThreaded(target,
                 thread_params,
                 max_concurrent_threads=None,
-                post_task_delay=0):
+                post_task_delay=0,
+                fail_fast=False,
+                cancellation_token=None,
+                concurrency_class=None,
+                priority=0):
   """Runs the target method in parallel threads.
 
   The method starts up threads with one arg from thread_params as the first arg.
@@ -602,6 +1026,11 @@ def RunThreaded(target,
         Usually this is a list of VMs.
     max_concurrent_threads: The maximum number of concurrent threads to allow.
     post_task_delay: Delay in seconds between commands.
+    fail_fast: If True, as soon as one call fails no more calls are started
+        and the running calls are cancelled. See RunParallelThreads.
+    cancellation_token: CancellationToken or None. See RunParallelThreads.
+    concurrency_class: string or None. See RunParallelThreads.
+    priority: int. See RunParallelThreads.
 
   Returns:
     List of the same length as thread_params. Contains the return value from
@@ -626,30 +1055,176 @@ def RunThreaded(target,
     args = [((self.CreateVm(),), {'num': i, 'name': 'somestring'})
             for i in range(0, 10)]
     RunThreaded(MyThreadedTargetMethod, args)
+
+  Example 4: # stop booting the other VMs as soon as one fails:
+    RunThreaded(lambda vm: vm.WaitForBootCompletion(), vms, fail_fast=True)
   """
   if max_concurrent_threads is None:
     max_concurrent_threads = (
         FLAGS.max_concurrent_threads or MAX_CONCURRENT_THREADS)
 
-  if not isinstance(thread_params, list):
-    raise ValueError('Param "thread_params" must be a list')
-
-  if not thread_params:
+  target_arg_tuples = _GetTargetArgTuples(target, thread_params)
+  if not target_arg_tuples:
     # Nothing to do.
     return []
 
-  if not isinstance(thread_params[0], tuple):
-    target_arg_tuples = [(target, (arg,), {}) for arg in thread_params]
-  elif (not isinstance(thread_params[0][0], tuple) or
-        not isinstance(thread_params[0][1], dict)):
-    raise ValueError('If Param is a tuple, the tuple must be (tuple, dict)')
-  else:
-    target_arg_tuples = [(target, args, kwargs)
-                         for args, kwargs in thread_params]
-
   return RunParallelThreads(target_arg_tuples,
                             max_concurrency=max_concurrent_threads,
-                            post_task_delay=post_task_delay)
+                            post_task_delay=post_task_delay,
+                            fail_fast=fail_fast,
+                            cancellation_token=cancellation_token,
+                            concurrency_class=concurrency_class,
+                            priority=priority)
+
+
+def IterThreaded(target,
+                 thread_params,
+                 max_concurrent_threads=None,
+                 post_task_delay=0,
+                 fail_fast=False,
+                 cancellation_token=None,
+                 concurrency_class=None,
+                 priority=0):
+  """Runs the target method in parallel threads, yielding results as they come.
+
+  Takes the same arguments as RunThreaded. If the caller stops iterating
+  early, the calls still running are cancelled.
+
+  Yields:
+    (index, return value) tuples in the order the calls completed, where index
+    is the position of the call's params in thread_params.
+
+  Raises:
+    ValueError: when thread_params is not valid.
+    errors.VmUtil.ThreadException: Once the calls have completed, if an
+        exception occurred in any of them.
+
+  Example:
+    for i, boot_time in IterThreaded(_BootVm, vms):
+      logging.info('%s booted in %s seconds.', vms[i].name, boot_time)
+  """
+  if max_concurrent_threads is None:
+    max_concurrent_threads = (
+        FLAGS.max_concurrent_threads or MAX_CONCURRENT_THREADS)
+  target_arg_tuples = _GetTargetArgTuples(target, thread_params)
+  if not target_arg_tuples:
+    return
+  for task_id, result in _IterParallelTasks(
+      target_arg_tuples, max_concurrent_threads, _BackgroundThreadTaskManager,
+      errors.VmUtil.ThreadException, post_task_delay, fail_fast,
+      _NewCancellationToken(cancellation_token), concurrency_class, priority):
+    yield task_id, result
+
+
+def _TimeTask(target):
+  """Returns the start and end time of a call to target."""
+  start = time.time()
+  target()
+  return start, time.time()
+
+
+def RunDag(tasks, max_concurrency=None):
+  """Runs tasks in threads as soon as the tasks they depend on have completed.
+
+  Independent tasks run concurrently. Once a task fails, no more tasks are
+  started, and the tasks already running are waited for.
+
+  Args:
+    tasks: list of (name, target, dependencies) tuples. target is a function
+        called with no arguments, and dependencies is a list of the names of
+        the tasks that must complete before it is called. Ready tasks are
+        started in list order.
+    max_concurrency: int or None. The maximum number of tasks to run at once.
+        Defaults to the value of --max_concurrent_threads.
+
+  Returns:
+    dict mapping the name of each task to a (start, end) tuple of the times it
+    ran, in seconds since the epoch.
+
+  Raises:
+    ValueError: When a dependency is not the name of a task or the
+        dependencies form a cycle.
+    errors.VmUtil.ThreadException: When an exception occurred in any of the
+        tasks.
+  """
+  if max_concurrency is None:
+    max_concurrency = FLAGS.max_concurrent_threads or MAX_CONCURRENT_THREADS
+  names = [name for name, _, _ in tasks]
+  if len(set(names)) != len(names):
+    raise ValueError('Task names must be unique: %s' % names)
+  remaining = {}
+  for name, _, dependencies in tasks:
+    unknown = set(dependencies) - set(names)
+    if unknown:
+      raise ValueError('Task %s depends on unknown tasks %s.' %
+                       (name, sorted(unknown)))
+    remaining[name] = set(dependencies)
+  # Check for cycles before starting anything.
+  unblocked = set()
+  while len(unblocked) < len(names):
+    ready = [n for n in names if n not in unblocked and
+             remaining[n] <= unblocked]
+    if not ready:
+      raise ValueError('Task dependencies form a cycle among %s.' % sorted(
+          set(names) - unblocked))
+    unblocked.update(ready)
+  if not tasks:
+    return {}
+
+  thread_context = _BackgroundTaskThreadContext()
+  token = CancellationToken(GetCancellationToken())
+  max_concurrency = min(max_concurrency, len(tasks))
+  pending = list(tasks)
+  started_names = []
+  timings = {}
+  error_strings = []
+  with _BackgroundThreadTaskManager(max_concurrency) as task_manager:
+    try:
+      while pending or len(timings) + len(error_strings) < len(started_names):
+        ready = [t for t in pending if not remaining[t[0]]]
+        active_task_count = (
+            len(started_names) - len(timings) - len(error_strings))
+        if ready and not error_strings and active_task_count < max_concurrency:
+          name, target, _ = ready[0]
+          pending.remove(ready[0])
+          task_manager.StartTask(_RunWithCancellationToken,
+                                 (token, _TimeTask, target), {},
+                                 thread_context)
+          started_names.append(name)
+          continue
+        if not active_task_count:
+          # A task failed, so the rest can never start.
+          break
+
+        task_id = task_manager.AwaitAnyTask()
+        name = started_names[task_id]
+        task = task_manager.tasks[task_id]
+        if task.traceback:
+          msg = 'Exception occurred while running task {0}:{1}{2}'.format(
+              name, os.linesep, task.traceback)
+          logging.error(msg)
+          error_strings.append(msg)
+          continue
+        timings[name] = task.return_value
+        for dependencies in six.itervalues(remaining):
+          dependencies.discard(name)
+
+    except KeyboardInterrupt:
+      logging.error(
+          'Received KeyboardInterrupt while executing parallel tasks. Waiting '
+          'for %s tasks to clean up.',
+          len(started_names) - len(timings) - len(error_strings))
+      task_manager.HandleKeyboardInterrupt()
+      raise
+
+  if error_strings:
+    if pending:
+      logging.error('Did not run tasks %s because of earlier failures.',
+                    [name for name, _, _ in pending])
+    raise errors.VmUtil.ThreadException(
+        'The following exceptions occurred during parallel execution:'
+        '{0}{1}'.format(os.linesep, os.linesep.join(error_strings)))
+  return timings
 
 
 def RunParallelProcesses(target_arg_tuples, max_concurrency,
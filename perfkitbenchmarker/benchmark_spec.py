@@ -17,40 +17,54 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
 import contextlib
 import copy
 import datetime
 import importlib
+import itertools
 import logging
 import os
 import pickle
 import threading
+import time
 import uuid
 
 from absl import flags
+from perfkitbenchmarker import api_rate_limiter
+from perfkitbenchmarker import background_tasks
 from perfkitbenchmarker import benchmark_status
 from perfkitbenchmarker import capacity_reservation
 from perfkitbenchmarker import cloud_tpu
+from perfkitbenchmarker import command_profiler
 from perfkitbenchmarker import container_service
 from perfkitbenchmarker import context
+from perfkitbenchmarker import data_distribution
 from perfkitbenchmarker import disk
 from perfkitbenchmarker import dpb_service
 from perfkitbenchmarker import edw_service
 from perfkitbenchmarker import errors
+from perfkitbenchmarker import flag_util
 from perfkitbenchmarker import nfs_service
 from perfkitbenchmarker import non_relational_db
 from perfkitbenchmarker import os_types
 from perfkitbenchmarker import placement_group
 from perfkitbenchmarker import provider_info
+from perfkitbenchmarker import provision_graph
 from perfkitbenchmarker import providers
 from perfkitbenchmarker import relational_db
 from perfkitbenchmarker import smb_service
 from perfkitbenchmarker import spark_service
+from perfkitbenchmarker import spec_checkpoint
+from perfkitbenchmarker import ssh_session_pool
 from perfkitbenchmarker import stages
 from perfkitbenchmarker import static_virtual_machine as static_vm
+from perfkitbenchmarker import upload_cache
 from perfkitbenchmarker import virtual_machine
+from perfkitbenchmarker import vm_pool
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker import vpn_service
+from perfkitbenchmarker.configs import benchmark_config_spec
 from perfkitbenchmarker.providers.gcp import gcp_spanner
 import six
 from six.moves import range
@@ -92,6 +106,10 @@ flags.DEFINE_string('postrun_script', None,
                     'Script to run right after run stage.')
 flags.DEFINE_integer('create_and_boot_post_task_delay', None,
                      'Delay in seconds to delay in between boot tasks.')
+flags.DEFINE_boolean('create_and_boot_fail_fast', False,
+                     'If true, stop creating and booting VMs as soon as one '
+                     'fails, instead of waiting for all of them before '
+                     'raising the error and tearing down.')
 # pyformat: disable
 flags.DEFINE_enum('benchmark_compatibility_checking', SUPPORTED,
                   [SUPPORTED, NOT_EXCLUDED, SKIP_CHECK],
@@ -129,6 +147,8 @@ class BenchmarkSpec(object):
     BenchmarkSpec.total_benchmarks += 1
     self.sequence_number = BenchmarkSpec.total_benchmarks
     self.vms = []
+    # VMs leased from the vm_pool, which are already created.
+    self.leased_vms = []
     self.regional_networks = {}
     self.networks = {}
     self.custom_subnets = {k: {
@@ -163,6 +183,7 @@ class BenchmarkSpec(object):
         self.config.vm_groups if self.config.relational_db is None else
         relational_db.VmsToBoot(self.config.relational_db.vm_groups))
     self.vpc_peering = self.config.vpc_peering
+    self.provision_graph_samples = []
 
     self.vpn_service = None
     self.vpns = {}  # dict of vpn's
@@ -438,10 +459,21 @@ class BenchmarkSpec(object):
         if (disk_count > 1 and disk_spec.mount_point):
           for i, spec in enumerate(vm.disk_specs):
             spec.mount_point += str(i)
+      if FLAGS.vm_pool:
+        vm = self._LeaseVm(vm, group_spec.vm_spec)
       vms.append(vm)
 
     return vms
 
+  def _LeaseVm(self, vm, vm_spec):
+    """Returns an equivalent VM from the vm_pool if there is one, else vm."""
+    vm.vm_pool_key = vm_pool.GetKey(vm, vm_spec)
+    leased_vm = vm_pool.Lease(vm.vm_pool_key)
+    if not leased_vm:
+      return vm
+    self.leased_vms.append(leased_vm)
+    return leased_vm
+
   def ConstructCapacityReservations(self):
     """Construct capacity reservations for each VM group."""
     if not FLAGS.use_capacity_reservations:
@@ -572,19 +604,8 @@ class BenchmarkSpec(object):
     targets = [(vm.PrepareBackgroundWorkload, (), {}) for vm in self.vms]
     vm_util.RunParallelThreads(targets, len(targets))
 
-  def Provision(self):
-    """Prepares the VMs and networks necessary for the benchmark to run."""
-    # Create capacity reservations if the cloud supports it. Note that the
-    # capacity reservation class may update the VMs themselves. This is true
-    # on AWS, because the VM needs to be aware of the capacity reservation id
-    # before its Create() method is called. Furthermore, if the user does not
-    # specify an AWS zone, but a region instead, the AwsCapacityReservation
-    # class will make a reservation in a zone that has sufficient capacity.
-    # In this case the VM's zone attribute, and the VMs network instance
-    # need to be updated as well.
-    if self.capacity_reservations:
-      vm_util.RunThreaded(lambda res: res.Create(), self.capacity_reservations)
-
+  def _CreateNetworks(self):
+    """Creates the networks and peers them if requested."""
     # Sort networks into a guaranteed order of creation based on dict key.
     # There is a finite limit on the number of threads that are created to
     # provision networks. Until support is added to provision resources in an
@@ -607,13 +628,218 @@ class BenchmarkSpec(object):
       elif len(networks) == 2:
         networks[0].Peer(networks[1])
 
+  def _CreateContainerRegistry(self):
+    """Creates the container registry and builds the container images."""
+    self.container_registry.Create()
+    for container_spec in six.itervalues(self.container_specs):
+      if container_spec.static_image:
+        continue
+      container_spec.image = self.container_registry.GetOrBuild(
+          container_spec.image)
+
+  def _CreateAndBootVms(self):
+    self._CreateVms(self.CreateAndBootVm)
+
+  def _CreateVms(self, create_func):
+    """Calls create_func with each VM that is not leased from the vm_pool."""
+    background_tasks.RunThreaded(
+        create_func,
+        [vm for vm in self.vms if vm not in self.leased_vms],
+        post_task_delay=FLAGS.create_and_boot_post_task_delay,
+        fail_fast=FLAGS.create_and_boot_fail_fast)
+
+  def _WaitForVmsToBoot(self):
+    vm_util.RunThreaded(self.WaitForVmBoot,
+                        [vm for vm in self.vms if vm not in self.leased_vms])
+
+  def _PrepareVms(self):
+    """Prepares the booted VMs and writes their SSH config."""
+    vm_util.RunThreaded(self.PrepareVmAfterBoot, self.vms)
+
+    sshable_vms = [
+        vm for vm in self.vms if vm.OS_TYPE not in os_types.WINDOWS_OS_TYPES
+    ]
+    sshable_vm_groups = {}
+    for group_name, group_vms in six.iteritems(self.vm_groups):
+      sshable_vm_groups[group_name] = [
+          vm for vm in group_vms
+          if vm.OS_TYPE not in os_types.WINDOWS_OS_TYPES
+      ]
+    vm_util.GenerateSSHConfig(sshable_vms, sshable_vm_groups)
+
+  def _CreateRelationalDb(self):
+    self.relational_db.SetVms(self.vm_groups)
+    self.relational_db.Create()
+
+  def _CreateEdwService(self):
+    """Creates the EDW service, in the benchmark's VPC for Redshift."""
+    if (not self.edw_service.user_managed and
+        self.edw_service.SERVICE_TYPE == 'redshift'):
+      # The benchmark creates the Redshift cluster's subnet group in the
+      # already provisioned virtual private cloud (vpc).
+      for network in six.itervalues(self.networks):
+        if network.__class__.__name__ == 'AwsNetwork':
+          self.edw_service.cluster_subnet_group.subnet_id = network.subnet.id
+    self.edw_service.Create()
+
+  def _DeleteContainerCluster(self):
+    self.container_cluster.DeleteServices()
+    self.container_cluster.DeleteContainers()
+    self.container_cluster.Delete()
+
+  def _DeleteNetworks(self):
+    """Disables the firewalls and deletes the networks."""
+    for firewall in six.itervalues(self.firewalls):
+      try:
+        firewall.DisallowAllPorts()
+      except Exception:
+        logging.exception('Got an exception disabling firewalls. '
+                          'Attempting to continue tearing down.')
+
+    for net in six.itervalues(self.networks):
+      try:
+        net.Delete()
+      except Exception:
+        logging.exception('Got an exception deleting networks. '
+                          'Attempting to continue tearing down.')
+
+  def _GetProvisionSteps(self):
+    """Returns the provision_graph.Steps that create and delete the resources.
+
+    Each step depends on the steps its resources declare with
+    GetProvisionDependencies, except for the networks, which may be updated by
+    capacity reservations, and the VMs, which are created in their networks and
+    placement groups and prepared once the file services they mount exist.
+    """
+    steps = []
+
+    def _AddStep(name, create, delete, resources):
+      dependencies = set()
+      for resource in resources:
+        dependencies.update(resource.GetProvisionDependencies())
+      steps.append(provision_graph.Step(name, create, delete,
+                                        sorted(dependencies)))
+
+    if self.capacity_reservations:
+      _AddStep(provision_graph.CAPACITY_RESERVATIONS,
+               lambda: vm_util.RunThreaded(lambda res: res.Create(),
+                                           self.capacity_reservations),
+               lambda: vm_util.RunThreaded(lambda res: res.Delete(),
+                                           self.capacity_reservations),
+               self.capacity_reservations)
+    steps.append(provision_graph.Step(
+        provision_graph.NETWORKS, self._CreateNetworks, self._DeleteNetworks,
+        [provision_graph.CAPACITY_RESERVATIONS]))
+    if self.container_registry:
+      _AddStep(provision_graph.CONTAINER_REGISTRY,
+               self._CreateContainerRegistry, self.container_registry.Delete,
+               [self.container_registry])
+    if self.container_cluster:
+      _AddStep(provision_graph.CONTAINER_CLUSTER, self.container_cluster.Create,
+               self._DeleteContainerCluster, [self.container_cluster])
+    if self.nfs_service:
+      _AddStep(provision_graph.NFS_SERVICE, self.nfs_service.Create,
+               self.nfs_service.Delete, [self.nfs_service])
+    if self.smb_service:
+      _AddStep(provision_graph.SMB_SERVICE, self.smb_service.Create,
+               self.smb_service.Delete, [self.smb_service])
+    placement_groups = list(self.placement_groups.values())
+    if placement_groups:
+      _AddStep(provision_graph.PLACEMENT_GROUPS,
+               lambda: [group.Create() for group in placement_groups],
+               lambda: [group.Delete() for group in placement_groups],
+               placement_groups)
+    if self.vms:
+      steps.append(provision_graph.Step(
+          provision_graph.VMS_CREATED,
+          lambda: self._CreateVms(self.CreateVm),
+          lambda: vm_util.RunThreaded(self.DeleteVm, self.vms),
+          [provision_graph.NETWORKS, provision_graph.PLACEMENT_GROUPS]))
+      steps.append(provision_graph.Step(
+          provision_graph.VMS_BOOTED, self._WaitForVmsToBoot, None,
+          [provision_graph.VMS_CREATED]))
+      steps.append(provision_graph.Step(
+          provision_graph.VMS_READY, self._PrepareVms, None,
+          [provision_graph.VMS_BOOTED, provision_graph.NFS_SERVICE,
+           provision_graph.SMB_SERVICE]))
+    if self.spark_service:
+      _AddStep(provision_graph.SPARK_SERVICE, self.spark_service.Create,
+               self.spark_service.Delete, [self.spark_service])
+    if self.dpb_service:
+      _AddStep(provision_graph.DPB_SERVICE, self.dpb_service.Create,
+               self.dpb_service.Delete, [self.dpb_service])
+    if self.relational_db:
+      _AddStep(provision_graph.RELATIONAL_DB, self._CreateRelationalDb,
+               self.relational_db.Delete, [self.relational_db])
+    if self.non_relational_db:
+      _AddStep(provision_graph.NON_RELATIONAL_DB, self.non_relational_db.Create,
+               self.non_relational_db.Delete, [self.non_relational_db])
+    if self.spanner:
+      _AddStep(provision_graph.SPANNER, self.spanner.Create,
+               self.spanner.Delete, [self.spanner])
+    if self.tpus:
+      _AddStep(provision_graph.TPUS,
+               lambda: vm_util.RunThreaded(lambda tpu: tpu.Create(), self.tpus),
+               lambda: vm_util.RunThreaded(lambda tpu: tpu.Delete(), self.tpus),
+               self.tpus)
+    if self.edw_service:
+      _AddStep(provision_graph.EDW_SERVICE, self._CreateEdwService,
+               self.edw_service.Delete, [self.edw_service])
+    if self.vpn_service:
+      _AddStep(provision_graph.VPN_SERVICE, self.vpn_service.Create,
+               self.vpn_service.Delete, [self.vpn_service])
+    return steps
+
+  def _DeleteGraph(self):
+    """Deletes the resources in reverse dependency order.
+
+    Raises:
+      errors.Error: If any resource could not be deleted. The others are still
+          deleted.
+    """
+    failed_steps = []
+
+    def _LogFailures(step):
+      def _Delete():
+        try:
+          step.delete()
+        except Exception:  # pylint: disable=broad-except
+          logging.exception('Got an exception deleting %s. Attempting to '
+                            'continue tearing down.', step.name)
+          failed_steps.append(step.name)
+      return _Delete
+
+    steps = self._GetProvisionSteps()
+    for step in steps:
+      if step.delete:
+        step.delete = _LogFailures(step)
+    self.provision_graph_samples.extend(provision_graph.Teardown(steps))
+    if failed_steps:
+      raise errors.Error('Failed to delete the resources of steps: %s' %
+                         ', '.join(sorted(failed_steps)))
+
+  def Provision(self):
+    """Prepares the VMs and networks necessary for the benchmark to run."""
+    if FLAGS.provision_dag:
+      self.provision_graph_samples.extend(
+          provision_graph.Provision(self._GetProvisionSteps()))
+      return
+
+    # Create capacity reservations if the cloud supports it. Note that the
+    # capacity reservation class may update the VMs themselves. This is true
+    # on AWS, because the VM needs to be aware of the capacity reservation id
+    # before its Create() method is called. Furthermore, if the user does not
+    # specify an AWS zone, but a region instead, the AwsCapacityReservation
+    # class will make a reservation in a zone that has sufficient capacity.
+    # In this case the VM's zone attribute, and the VMs network instance
+    # need to be updated as well.
+    if self.capacity_reservations:
+      vm_util.RunThreaded(lambda res: res.Create(), self.capacity_reservations)
+
+    self._CreateNetworks()
+
     if self.container_registry:
-      self.container_registry.Create()
-      for container_spec in six.itervalues(self.container_specs):
-        if container_spec.static_image:
-          continue
-        container_spec.image = self.container_registry.GetOrBuild(
-            container_spec.image)
+      self._CreateContainerRegistry()
 
     if self.container_cluster:
       self.container_cluster.Create()
@@ -632,31 +858,16 @@ class BenchmarkSpec(object):
       # We separate out creating, booting, and preparing the VMs into two phases
       # so that we don't slow down the creation of all the VMs by running
       # commands on the VMs that booted.
-      vm_util.RunThreaded(
-          self.CreateAndBootVm,
-          self.vms,
-          post_task_delay=FLAGS.create_and_boot_post_task_delay)
+      self._CreateAndBootVms()
       if self.nfs_service and self.nfs_service.CLOUD == nfs_service.UNMANAGED:
         self.nfs_service.Create()
-      vm_util.RunThreaded(self.PrepareVmAfterBoot, self.vms)
-
-      sshable_vms = [
-          vm for vm in self.vms if vm.OS_TYPE not in os_types.WINDOWS_OS_TYPES
-      ]
-      sshable_vm_groups = {}
-      for group_name, group_vms in six.iteritems(self.vm_groups):
-        sshable_vm_groups[group_name] = [
-            vm for vm in group_vms
-            if vm.OS_TYPE not in os_types.WINDOWS_OS_TYPES
-        ]
-      vm_util.GenerateSSHConfig(sshable_vms, sshable_vm_groups)
+      self._PrepareVms()
     if self.spark_service:
       self.spark_service.Create()
     if self.dpb_service:
       self.dpb_service.Create()
     if hasattr(self, 'relational_db') and self.relational_db:
-      self.relational_db.SetVms(self.vm_groups)
-      self.relational_db.Create()
+      self._CreateRelationalDb()
     if self.non_relational_db:
       self.non_relational_db.Create()
     if self.spanner:
@@ -664,14 +875,7 @@ class BenchmarkSpec(object):
     if self.tpus:
       vm_util.RunThreaded(lambda tpu: tpu.Create(), self.tpus)
     if self.edw_service:
-      if (not self.edw_service.user_managed and
-          self.edw_service.SERVICE_TYPE == 'redshift'):
-        # The benchmark creates the Redshift cluster's subnet group in the
-        # already provisioned virtual private cloud (vpc).
-        for network in networks:
-          if network.__class__.__name__ == 'AwsNetwork':
-            self.edw_service.cluster_subnet_group.subnet_id = network.subnet.id
-      self.edw_service.Create()
+      self._CreateEdwService()
     if self.vpn_service:
       self.vpn_service.Create()
 
@@ -679,6 +883,14 @@ class BenchmarkSpec(object):
     if self.deleted:
       return
 
+    if FLAGS.vm_pool:
+      vm_pool.Release(self)
+
+    if FLAGS.provision_dag:
+      self._DeleteGraph()
+      self.deleted = True
+      return
+
     if self.container_registry:
       self.container_registry.Delete()
     if self.spark_service:
@@ -751,6 +963,21 @@ class BenchmarkSpec(object):
       samples.extend(self.container_cluster.GetSamples())
     if self.container_registry:
       samples.extend(self.container_registry.GetSamples())
+    if FLAGS.ssh_session_pool:
+      samples.extend(ssh_session_pool.GetSamples())
+    if FLAGS.upload_cache:
+      samples.extend(upload_cache.GetSamples())
+    if FLAGS.preprovisioned_data_p2p:
+      samples.extend(data_distribution.GetSamples())
+    if FLAGS.api_rate_limiting:
+      samples.extend(api_rate_limiter.GetSamples())
+    if FLAGS.concurrency_classes:
+      samples.extend(background_tasks.GetConcurrencySamples())
+    if FLAGS.vm_pool:
+      samples.extend(vm_pool.GetSamples())
+    samples.extend(spec_checkpoint.GetSamples(
+        self._GetCheckpointFilename(self.uid)))
+    samples.extend(self.provision_graph_samples)
     return samples
 
   def StartBackgroundWorkload(self):
@@ -834,11 +1061,29 @@ class BenchmarkSpec(object):
     Args:
         vm: The BaseVirtualMachine object representing the VM.
     """
-    vm.Create()
-    logging.info('VM: %s', vm.ip_address)
-    logging.info('Waiting for boot completion.')
-    vm.AllowRemoteAccessPorts()
-    vm.WaitForBootCompletion()
+    self.CreateVm(vm)
+    self.WaitForVmBoot(vm)
+
+  def CreateVm(self, vm):
+    """Creates a single VM and opens its remote access ports.
+
+    Args:
+        vm: The BaseVirtualMachine object representing the VM.
+    """
+    with command_profiler.VmContext(vm.name):
+      vm.Create()
+      logging.info('VM: %s', vm.ip_address)
+      vm.AllowRemoteAccessPorts()
+
+  def WaitForVmBoot(self, vm):
+    """Waits for a created VM's boot to complete.
+
+    Args:
+        vm: The BaseVirtualMachine object representing the VM.
+    """
+    with command_profiler.VmContext(vm.name):
+      logging.info('Waiting for boot completion.')
+      vm.WaitForBootCompletion()
 
   def PrepareVmAfterBoot(self, vm):
     """Prepares a VM after it has booted.
@@ -851,23 +1096,28 @@ class BenchmarkSpec(object):
     Raises:
         Exception: If --vm_metadata is malformed.
     """
-    vm.AddMetadata()
-    vm.OnStartup()
-    # Prepare vm scratch disks:
-    if any((spec.disk_type == disk.LOCAL for spec in vm.disk_specs)):
-      vm.SetupLocalDisks()
-    for disk_spec in vm.disk_specs:
-      if disk_spec.disk_type == disk.RAM:
-        vm.CreateRamDisk(disk_spec)
+    with command_profiler.VmContext(vm.name):
+      vm.AddMetadata()
+      vm.OnStartup()
+      if vm in self.leased_vms:
+        # The scratch disks of a leased VM already exist.
+        vm_pool.PrepareLeasedVm(vm)
       else:
-        vm.CreateScratchDisk(disk_spec)
-      # TODO(user): Simplify disk logic.
-      if disk_spec.num_striped_disks > 1:
-        # scratch disks has already been created and striped together.
-        break
-    # This must come after Scratch Disk creation to support the
-    # Containerized VM case
-    vm.PrepareVMEnvironment()
+        # Prepare vm scratch disks:
+        if any((spec.disk_type == disk.LOCAL for spec in vm.disk_specs)):
+          vm.SetupLocalDisks()
+        for disk_spec in vm.disk_specs:
+          if disk_spec.disk_type == disk.RAM:
+            vm.CreateRamDisk(disk_spec)
+          else:
+            vm.CreateScratchDisk(disk_spec)
+          # TODO(user): Simplify disk logic.
+          if disk_spec.num_striped_disks > 1:
+            # scratch disks has already been created and striped together.
+            break
+      # This must come after Scratch Disk creation to support the
+      # Containerized VM case
+      vm.PrepareVMEnvironment()
 
   def DeleteVm(self, vm):
     """Deletes a single vm and scratch disk if required.
@@ -875,21 +1125,62 @@ class BenchmarkSpec(object):
     Args:
         vm: The BaseVirtualMachine object representing the VM.
     """
-    if vm.is_static and vm.install_packages:
-      vm.PackageCleanup()
-    vm.Delete()
-    vm.DeleteScratchDisks()
+    if FLAGS.vm_pool and vm_pool.IsIdle(vm):
+      return
+    with command_profiler.VmContext(vm.name):
+      if vm.is_static and vm.install_packages:
+        vm.PackageCleanup()
+      vm.Delete()
+      vm.DeleteScratchDisks()
 
   @staticmethod
-  def _GetPickleFilename(uid):
+  def _GetPickleFilename(uid, directory=None):
     """Returns the filename for the pickled BenchmarkSpec."""
-    return os.path.join(vm_util.GetTempDir(), uid)
+    return os.path.join(directory or vm_util.GetTempDir(), uid)
+
+  @staticmethod
+  def _GetCheckpointFilename(uid, directory=None):
+    """Returns the filename of the BenchmarkSpec's checkpoint journal."""
+    return os.path.join(directory or vm_util.GetTempDir(), uid + '.journal')
 
-  def Pickle(self):
-    """Pickles the spec so that it can be unpickled on a subsequent run."""
-    with open(self._GetPickleFilename(self.uid), 'wb') as pickle_file:
+  def Pickle(self, directory=None):
+    """Saves the spec so that it can be loaded on a subsequent run.
+
+    Args:
+      directory: The directory to save the spec to. Defaults to the temp dir
+        of the current run.
+    """
+    if FLAGS.spec_checkpoint_format == 'journal':
+      spec_checkpoint.Save(
+          self, self._GetCheckpointFilename(self.uid, directory))
+      return
+    with open(self._GetPickleFilename(self.uid, directory),
+              'wb') as pickle_file:
       pickle.dump(self, pickle_file, 2)
 
+  @classmethod
+  def Load(cls, uid, directory=None):
+    """Loads a spec saved with Pickle.
+
+    Args:
+      uid: The uid of the spec.
+      directory: The directory the spec was saved to. Defaults to the temp dir
+        of the current run.
+
+    Returns:
+      The BenchmarkSpec, as last saved.
+    """
+    # Load the journal if the spec was last saved to one.
+    checkpoint_filename = cls._GetCheckpointFilename(uid, directory)
+    pickle_filename = cls._GetPickleFilename(uid, directory)
+    if os.path.exists(checkpoint_filename) and (
+        not os.path.exists(pickle_filename) or
+        os.path.getmtime(checkpoint_filename) >=
+        os.path.getmtime(pickle_filename)):
+      return spec_checkpoint.Load(checkpoint_filename)
+    with open(pickle_filename, 'rb') as pickle_file:
+      return pickle.load(pickle_file)
+
   @classmethod
   def GetBenchmarkSpec(cls, benchmark_module, config, uid):
     """Unpickles or creates a BenchmarkSpec and returns it.
@@ -907,8 +1198,7 @@ class BenchmarkSpec(object):
       return cls(benchmark_module, config, uid)
 
     try:
-      with open(cls._GetPickleFilename(uid), 'rb') as pickle_file:
-        spec = pickle.load(pickle_file)
+      spec = cls.Load(uid)
     except Exception as e:  # pylint: disable=broad-except
       logging.error('Unable to unpickle spec file for benchmark %s.',
                     benchmark_module.BENCHMARK_NAME)
@@ -919,3 +1209,51 @@ class BenchmarkSpec(object):
     spec.status = benchmark_status.SKIPPED
     context.SetThreadBenchmarkSpec(spec)
     return spec
+
+
+def CreateBenchmarkSpecs(benchmark_tuple_list):
+  """Creates a BenchmarkSpec for each benchmark run to be scheduled.
+
+  Args:
+    benchmark_tuple_list: list of (benchmark module, user config dict) tuples,
+        e.g. as returned by benchmark_sets.GetBenchmarksFromFlags.
+
+  Returns:
+    A list of BenchmarkSpecs.
+  """
+  start_time = time.time()
+  specs = []
+  benchmark_counts = collections.defaultdict(itertools.count)
+  for benchmark_module, user_config in benchmark_tuple_list:
+    # Construct benchmark config object.
+    name = benchmark_module.BENCHMARK_NAME
+    expected_os_types = None if FLAGS.multi_os_benchmark else (
+        os_types.WINDOWS_OS_TYPES if FLAGS.os_type in os_types.WINDOWS_OS_TYPES
+        else os_types.LINUX_OS_TYPES)
+    with flag_util.OverrideFlags(FLAGS, user_config.get('flags')):
+      config_dict = benchmark_module.GetConfig(user_config)
+    config_spec_class = getattr(
+        benchmark_module, 'BENCHMARK_CONFIG_SPEC_CLASS',
+        benchmark_config_spec.BenchmarkConfigSpec)
+    config = config_spec_class(name, expected_os_types=expected_os_types,
+                               flag_values=FLAGS, **config_dict)
+
+    # Assign a unique ID to each benchmark run. This differs even between two
+    # runs of the same benchmark within a single PKB run.
+    uid = name + str(next(benchmark_counts[name]))
+
+    # Optional step to check flag values and verify files exist.
+    check_prereqs = getattr(benchmark_module, 'CheckPrerequisites', None)
+    if check_prereqs:
+      try:
+        with config.RedirectFlags(FLAGS):
+          check_prereqs(config)
+      except:
+        logging.exception('Prerequisite check failed for %s', name)
+        raise
+
+    specs.append(BenchmarkSpec.GetBenchmarkSpec(benchmark_module, config, uid))
+
+  logging.info('Created %d benchmark specs in %.2f seconds.', len(specs),
+               time.time() - start_time)
+  return specs
@@ -44,3 +44,7 @@ class BaseCapacityReservation(resource.BaseResource):
   def __init__(self, vm_group):
     super(BaseCapacityReservation, self).__init__()
     self.vm_group = vm_group
+
+  def GetProvisionDependencies(self):
+    """See base class."""
+    return []
@@ -0,0 +1,335 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Profiles the commands PKB runs.
+
+With --profile_commands, every command run through vm_util.IssueCommand, the
+streaming command functions, the SSH session pool and tar copies is recorded
+with its start and end time, category (ssh, scp, gcloud, ...), VM, benchmark
+phase and thread.
+
+At the end of each phase, a duration histogram sample per category and samples
+for the slowest commands are added to the results. The commands recorded so far
+are also written as a Chrome trace (load it in chrome://tracing or
+https://ui.perfetto.dev) to the run's temp directory, with one track per VM and
+thread, which shows which commands sit on the critical path.
+"""
+
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from absl import flags
+from perfkitbenchmarker import events
+from perfkitbenchmarker import sample
+from perfkitbenchmarker import temp_dir
+
+flags.DEFINE_boolean(
+    'profile_commands', False,
+    'If true, record every command run and add samples describing their '
+    'durations at the end of each phase, and write a Chrome trace of them to '
+    'the run temp directory.')
+flags.DEFINE_integer(
+    'profile_commands_top_n', 10,
+    'The number of slowest commands of each phase to add samples for when '
+    '--profile_commands is set.', lower_bound=0)
+
+FLAGS = flags.FLAGS
+
+CATEGORY_SSH = 'ssh'
+CATEGORY_SCP = 'scp'
+CATEGORY_GCLOUD = 'gcloud'
+CATEGORY_AWS = 'aws'
+CATEGORY_AZ = 'az'
+CATEGORY_KUBECTL = 'kubectl'
+CATEGORY_LOCAL = 'local'
+
+_CATEGORIES_BY_EXECUTABLE = {
+    'ssh': CATEGORY_SSH,
+    'scp': CATEGORY_SCP,
+    'gcloud': CATEGORY_GCLOUD,
+    'gsutil': CATEGORY_GCLOUD,
+    'aws': CATEGORY_AWS,
+    'az': CATEGORY_AZ,
+    'kubectl': CATEGORY_KUBECTL,
+}
+
+# Upper bounds in seconds of the histogram buckets. Durations above the last
+# bound are counted in an overflow bucket.
+_HISTOGRAM_BOUNDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+_MAX_COMMAND_LENGTH = 1000
+_UNKNOWN_PHASE = 'unknown'
+
+CommandRecord = collections.namedtuple('CommandRecord', [
+    'start', 'end', 'category', 'vm', 'phase', 'thread', 'command', 'retcode'])
+
+
+class _ThreadData(threading.local):
+
+  def __init__(self):
+    super(_ThreadData, self).__init__()
+    self.vm = None
+
+
+_thread_local = _ThreadData()
+_lock = threading.Lock()
+_records = []
+_phase = _UNKNOWN_PHASE
+
+
+def Enabled():
+  return FLAGS.is_parsed() and FLAGS.profile_commands
+
+
+def GetCategory(cmd):
+  """Returns the category of a command given as a list of strings."""
+  if not cmd:
+    return CATEGORY_LOCAL
+  executable = os.path.basename(str(cmd[0]))
+  if executable.endswith('.exe'):
+    executable = executable[:-len('.exe')]
+  return _CATEGORIES_BY_EXECUTABLE.get(executable, CATEGORY_LOCAL)
+
+
+@contextlib.contextmanager
+def VmContext(vm_name):
+  """Attributes commands run by the current thread within the block to a VM."""
+  previous, _thread_local.vm = _thread_local.vm, vm_name
+  try:
+    yield
+  finally:
+    _thread_local.vm = previous
+
+
+def AttributeToVm(method):
+  """Decorates a VM method so that the commands it runs are attributed to it."""
+
+  @functools.wraps(method)
+  def _Wrapper(self, *args, **kwargs):
+    with VmContext(self.name):
+      return method(self, *args, **kwargs)
+
+  return _Wrapper
+
+
+def Record(cmd, start, end, retcode=None, category=None):
+  """Records a command run by the current thread.
+
+  Args:
+    cmd: A list of strings forming the command.
+    start: The time the command started, in seconds since the epoch.
+    end: The time the command ended, in seconds since the epoch.
+    retcode: The command's return code, or None if unknown.
+    category: The command's category. Defaults to the category of cmd's
+        executable.
+  """
+  if not Enabled():
+    return
+  record = CommandRecord(
+      start=start, end=end, category=category or GetCategory(cmd),
+      vm=_thread_local.vm, phase=_phase,
+      thread=threading.current_thread().name,
+      command=' '.join(str(w) for w in cmd)[:_MAX_COMMAND_LENGTH],
+      retcode=retcode)
+  with _lock:
+    _records.append(record)
+
+
+class _Measurement(object):
+  """Lets the code in a Measure block report the return code of its command."""
+
+  def __init__(self):
+    self.retcode = None
+
+
+@contextlib.contextmanager
+def Measure(cmd, category=None):
+  """Records the command run within the block.
+
+  Args:
+    cmd: A list of strings forming the command.
+    category: See Record.
+
+  Yields:
+    An object whose retcode attribute may be set to the command's return code.
+  """
+  measurement = _Measurement()
+  start = time.time()
+  try:
+    yield measurement
+  finally:
+    Record(cmd, start, time.time(), measurement.retcode, category)
+
+
+def GetRecords(phase=None):
+  """Returns the commands recorded, optionally only those of one phase."""
+  with _lock:
+    return [r for r in _records if phase is None or r.phase == phase]
+
+
+def _BucketLabel(index):
+  if index < len(_HISTOGRAM_BOUNDS):
+    return '<=%gs' % _HISTOGRAM_BOUNDS[index]
+  return '>%gs' % _HISTOGRAM_BOUNDS[-1]
+
+
+def _Histogram(durations):
+  """Returns an ordered mapping of bucket label to number of durations."""
+  counts = [0] * (len(_HISTOGRAM_BOUNDS) + 1)
+  for duration in durations:
+    index = 0
+    while (index < len(_HISTOGRAM_BOUNDS) and
+           duration > _HISTOGRAM_BOUNDS[index]):
+      index += 1
+    counts[index] += 1
+  return collections.OrderedDict(
+      (_BucketLabel(i), count) for i, count in enumerate(counts))
+
+
+def _Percentile(sorted_values, percentile):
+  index = int(round(percentile / 100.0 * (len(sorted_values) - 1)))
+  return sorted_values[index]
+
+
+def MakeSamples(records, phase, top_n):
+  """Returns the histogram and slowest command samples for records.
+
+  Args:
+    records: A list of CommandRecords.
+    phase: The phase the records belong to, added to the samples' metadata.
+    top_n: The number of slowest commands to add samples for.
+
+  Returns:
+    A list of sample.Sample.
+  """
+  samples = []
+  by_category = collections.defaultdict(list)
+  for record in records:
+    by_category[record.category].append(record.end - record.start)
+  for category, durations in sorted(by_category.items()):
+    durations.sort()
+    samples.append(sample.Sample(
+        'Command Duration Histogram', len(durations), 'commands', {
+            'phase': phase,
+            'category': category,
+            'histogram': json.dumps(_Histogram(durations)),
+            'total_seconds': sum(durations),
+            'p50_seconds': _Percentile(durations, 50),
+            'p99_seconds': _Percentile(durations, 99),
+            'max_seconds': durations[-1],
+        }))
+  slowest = sorted(records, key=lambda r: r.start - r.end)[:top_n]
+  for rank, record in enumerate(slowest, 1):
+    samples.append(sample.Sample(
+        'Slowest Command', record.end - record.start, 'seconds', {
+            'phase': phase,
+            'rank': rank,
+            'category': record.category,
+            'vm': record.vm,
+            'thread': record.thread,
+            'command': record.command,
+            'retcode': record.retcode,
+            'start_time': record.start,
+        }))
+  return samples
+
+
+def ToChromeTrace(records):
+  """Returns records in the Chrome trace event format.
+
+  Each VM (or the PKB host, for commands not attributed to a VM) is shown as a
+  process, and each PKB thread as a thread within it.
+
+  Args:
+    records: A list of CommandRecords.
+
+  Returns:
+    A dict that serializes to a Chrome trace JSON file.
+  """
+  trace_events = []
+  pids = {}
+  tids = {}
+  for record in sorted(records, key=lambda r: r.start):
+    process = record.vm or 'pkb'
+    if process not in pids:
+      pids[process] = len(pids) + 1
+      trace_events.append({'name': 'process_name', 'ph': 'M',
+                           'pid': pids[process], 'args': {'name': process}})
+    if (process, record.thread) not in tids:
+      tids[process, record.thread] = len(tids) + 1
+      trace_events.append({'name': 'thread_name', 'ph': 'M',
+                           'pid': pids[process],
+                           'tid': tids[process, record.thread],
+                           'args': {'name': record.thread}})
+    trace_events.append({
+        'name': ' '.join(record.command.split()[:3]),
+        'cat': record.category,
+        'ph': 'X',
+        'ts': int(record.start * 1e6),
+        'dur': int((record.end - record.start) * 1e6),
+        'pid': pids[process],
+        'tid': tids[process, record.thread],
+        'args': {'command': record.command, 'phase': record.phase,
+                 'retcode': record.retcode},
+    })
+  return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+
+def GetTracePath(benchmark_spec):
+  return os.path.join(temp_dir.GetRunDirPath(), 'command_trace_%s_%s.json' % (
+      benchmark_spec.name, benchmark_spec.sequence_number))
+
+
+def _WriteTrace(path):
+  with open(path, 'w') as trace_file:
+    json.dump(ToChromeTrace(GetRecords()), trace_file)
+  logging.info('Wrote command trace to %s', path)
+
+
+@contextlib.contextmanager
+def ProfilePhase(phase, benchmark_spec, collector):
+  """Attributes commands to a phase and adds their samples when it ends.
+
+  Args:
+    phase: The name of the phase, one of stages.STAGES.
+    benchmark_spec: The BenchmarkSpec running the phase.
+    collector: The SampleCollector to add the phase's samples to.
+
+  Yields:
+    None.
+  """
+  global _phase
+  if not Enabled():
+    yield
+    return
+  _phase = phase
+  try:
+    yield
+  finally:
+    _phase = _UNKNOWN_PHASE
+    collector.AddSamples(
+        MakeSamples(GetRecords(phase), phase, FLAGS.profile_commands_top_n),
+        benchmark_spec.name, benchmark_spec)
+    _WriteTrace(GetTracePath(benchmark_spec))
+
+
+@events.benchmark_end.connect
+def _ResetAtBenchmarkEnd(unused_sender, benchmark_spec):
+  del benchmark_spec  # unused
+  with _lock:
+    del _records[:]
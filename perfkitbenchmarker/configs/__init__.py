@@ -63,6 +63,7 @@ dictionary.
 """
 
 import copy
+import datetime
 import functools
 import logging
 import re
@@ -79,6 +80,8 @@ FLAGS = flags.FLAGS
 CONFIG_CONSTANTS = 'default_config_constants.yaml'
 FLAGS_KEY = 'flags'
 IMPORT_REGEX = re.compile('^#import (.*)')
+_IMMUTABLE_TYPES = (type(None), bool, int, float, six.text_type, bytes,
+                    datetime.date)
 
 flags.DEFINE_string('benchmark_config_file', None,
                     'The file path to the user config file which will '
@@ -163,7 +166,7 @@ def _LoadUserConfig(path):
 @functools.lru_cache()
 def _LoadConfigConstants():
   """Reads the config constants file."""
-  with open(data.ResourcePath(CONFIG_CONSTANTS, False)) as fp:
+  with open(GetConfigConstantsPath()) as fp:
     return fp.read()
 
 
@@ -233,6 +236,10 @@ def MergeConfigs(default_config, override_config, warn_new_key=False):
   leaf key/value pairs which are present in both dicts will take their value
   from the override_config.
 
+  Only the dicts on the paths to overridden keys are copied; the rest of the
+  result is shared with default_config, which must therefore not be modified
+  afterwards.
+
   Args:
     default_config: The dict which will have its values overridden.
     override_config: The dict wich contains the overrides.
@@ -245,7 +252,7 @@ def MergeConfigs(default_config, override_config, warn_new_key=False):
   """
   def _Merge(d1, d2):
     """Merge two nested dicts."""
-    merged_dict = copy.deepcopy(d1)
+    merged_dict = dict(d1)
     for k, v in six.iteritems(d2):
       if k not in d1:
         merged_dict[k] = copy.deepcopy(v)
@@ -279,6 +286,14 @@ def LoadMinimalConfig(benchmark_config, benchmark_name):
   Returns:
     dict. The loaded config.
   """
+  return _CopyConfig(_LoadCachedMinimalConfig(benchmark_config, benchmark_name))
+
+
+# Configs are loaded once per flag_matrix combination, so parsing is cached by
+# the config text. Callers get a copy, as benchmarks modify their configs.
+@functools.lru_cache(maxsize=256)
+def _LoadCachedMinimalConfig(benchmark_config, benchmark_name):
+  """Parses a benchmark config. The result must not be modified."""
   yaml_config = []
   yaml_config.append(_LoadConfigConstants())
   yaml_config.append(benchmark_config)
@@ -297,6 +312,70 @@ def LoadMinimalConfig(benchmark_config, benchmark_name):
   return config[benchmark_name]
 
 
+def _CopyConfig(value, memo=None):
+  """Returns a deep copy of a loaded config.
+
+  Loaded configs are made of dicts, lists and immutable scalars, which are
+  copied much faster than by copy.deepcopy. Like copy.deepcopy, objects that
+  appear several times (e.g. YAML aliases) are copied once.
+
+  Args:
+    value: A config, or a value within one.
+    memo: dict. The ids of the objects copied so far mapped to their copies.
+
+  Returns:
+    The copy.
+  """
+  if memo is None:
+    memo = {}
+  if isinstance(value, _IMMUTABLE_TYPES):
+    return value
+  value_id = id(value)
+  if value_id in memo:
+    return memo[value_id]
+  if type(value) is dict:
+    copied = memo[value_id] = {}
+    for k, v in six.iteritems(value):
+      copied[k] = _CopyConfig(v, memo)
+  elif type(value) is list:
+    copied = memo[value_id] = []
+    copied.extend(_CopyConfig(v, memo) for v in value)
+  else:
+    copied = copy.deepcopy(value, memo)
+  return copied
+
+
+def GetConfigSummary(benchmark_config, benchmark_name):
+  """Summarizes a benchmark's default config for documentation.
+
+  Args:
+    benchmark_config: str. The default config in YAML format.
+    benchmark_name: str. The name of the benchmark.
+
+  Returns:
+    str. The benchmark's description and default VM requirements.
+  """
+  config = _LoadCachedMinimalConfig(benchmark_config, benchmark_name)
+  total_vm_count = 0
+  vm_str = ''
+  scratch_disk_str = ''
+  for group in six.itervalues(config.get('vm_groups', {})):
+    group_vm_count = group.get('vm_count', 1)
+    if group_vm_count is None:
+      vm_str = 'variable'
+    else:
+      total_vm_count += group_vm_count
+    if group.get('disk_spec'):
+      scratch_disk_str = ' with scratch volume(s)'
+  return '%s (%s VMs%s)' % (config['description'], vm_str or total_vm_count,
+                            scratch_disk_str)
+
+
+def GetConfigConstantsPath():
+  """Returns the path of the config constants file."""
+  return data.ResourcePath(CONFIG_CONSTANTS, False)
+
+
 def LoadConfig(benchmark_config, user_config, benchmark_name):
   """Loads a benchmark configuration.
 
@@ -32,6 +32,7 @@ from perfkitbenchmarker import data
 from perfkitbenchmarker import events
 from perfkitbenchmarker import kubernetes_helper
 from perfkitbenchmarker import os_types
+from perfkitbenchmarker import provision_graph
 from perfkitbenchmarker import resource
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import virtual_machine
@@ -260,6 +261,10 @@ class BaseContainerRegistry(resource.BaseResource):
         'cloud': self.CLOUD
     })
 
+  def GetProvisionDependencies(self):
+    """See base class."""
+    return []
+
   def _Create(self):
     """Creates the image registry."""
     pass
@@ -413,6 +418,10 @@ class BaseContainerCluster(resource.BaseResource):
     self.services = {}
     self.zone = self.vm_config.zone
 
+  def GetProvisionDependencies(self):
+    """See base class."""
+    return [provision_graph.NETWORKS, provision_graph.CONTAINER_REGISTRY]
+
   def DeleteContainers(self):
     """Delete containers belonging to the cluster."""
     for container in itertools.chain(*list(self.containers.values())):
@@ -0,0 +1,221 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Distributes preprovisioned data files between VMs.
+
+Without this module every VM downloads preprovisioned data from the bucket or
+fallback URL itself. With --preprovisioned_data_p2p, only up to
+--preprovisioned_data_seeds VMs download each file. Every other VM copies the
+file from a VM that already holds a verified copy, over the internal network
+when it is reachable. Each VM that receives the file becomes a source for later
+VMs, and each source serves at most --preprovisioned_data_fanout copies at a
+time, so the copies spread out as a tree.
+
+VMs do not need to be known up front: each call to Install joins the
+distribution of its file, which is keyed by module, file name, install path and
+expected digest. Copies from peers are verified with the same sha256 check as
+downloads. If a copy from a peer fails, the VM downloads the file itself.
+"""
+
+import collections
+import logging
+import posixpath
+import threading
+import time
+
+from absl import flags
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import events
+from perfkitbenchmarker import sample
+from perfkitbenchmarker import vm_util
+
+flags.DEFINE_boolean(
+    'preprovisioned_data_p2p', False,
+    'If true, preprovisioned data is only downloaded by a few seed VMs and '
+    'the other VMs copy it from VMs that already have it.')
+flags.DEFINE_integer(
+    'preprovisioned_data_seeds', 1,
+    'The number of VMs that download each preprovisioned data file when '
+    '--preprovisioned_data_p2p is set.', lower_bound=1)
+flags.DEFINE_integer(
+    'preprovisioned_data_fanout', 2,
+    'The number of concurrent copies each VM serves to its peers when '
+    '--preprovisioned_data_p2p is set.', lower_bound=1)
+
+FLAGS = flags.FLAGS
+
+# Source recorded for VMs that downloaded a file themselves.
+SEED_SOURCE = 'download'
+
+
+class _FileDistribution(object):
+  """Thread-safe record of which VMs hold a file and which are busy serving it.
+
+  Attributes:
+    holders: The VMs holding a verified copy of the file, in the order they
+        received it.
+  """
+
+  def __init__(self, num_seeds, fanout):
+    self._num_seeds = num_seeds
+    self._fanout = fanout
+    self._cond = threading.Condition()
+    self._active_seeds = 0
+    self._active_copies = collections.Counter()
+    self.holders = []
+
+  def Acquire(self):
+    """Waits for a source of the file.
+
+    Returns:
+      A VM holding the file that has a free copy slot, or None if the caller
+      should download the file itself as a seed.
+    """
+    with self._cond:
+      while True:
+        free = [vm for vm in self.holders
+                if self._active_copies[vm.name] < self._fanout]
+        if free:
+          source = min(free, key=lambda vm: self._active_copies[vm.name])
+          self._active_copies[source.name] += 1
+          return source
+        # Failed seeds release their slot, so waiting VMs take over the
+        # download until one of them succeeds.
+        if not self.holders and self._active_seeds < self._num_seeds:
+          self._active_seeds += 1
+          return None
+        self._cond.wait()
+
+  def Release(self, source, vm, succeeded):
+    """Returns the slot taken by Acquire.
+
+    Args:
+      source: The VM returned by Acquire, or None for a seed.
+      vm: The VM that was given the file.
+      succeeded: Whether vm now holds a verified copy of the file.
+    """
+    with self._cond:
+      if source is None:
+        self._active_seeds -= 1
+      else:
+        self._active_copies[source.name] -= 1
+      if succeeded:
+        self.holders.append(vm)
+      self._cond.notify_all()
+
+
+class _TimeToDataStats(object):
+  """Thread-safe record of how long each VM took to get each file."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._records = []
+
+  def Record(self, vm, module_name, filename, source, seconds):
+    with self._lock:
+      self._records.append((vm.name, module_name, filename, source, seconds))
+
+  def GetSamples(self):
+    """Returns a sample per VM and file, and resets the stats."""
+    with self._lock:
+      records, self._records = self._records, []
+    return [
+        sample.Sample('Preprovisioned Data Time To Data', seconds, 'seconds', {
+            'vm_name': vm_name,
+            'module_name': module_name,
+            'filename': filename,
+            'source': source,
+            'preprovisioned_data_seeds': FLAGS.preprovisioned_data_seeds,
+            'preprovisioned_data_fanout': FLAGS.preprovisioned_data_fanout,
+        }) for vm_name, module_name, filename, source, seconds in records]
+
+
+_lock = threading.Lock()
+_distributions = {}
+_STATS = _TimeToDataStats()
+
+
+def _GetDistribution(key):
+  with _lock:
+    if key not in _distributions:
+      _distributions[key] = _FileDistribution(
+          FLAGS.preprovisioned_data_seeds, FLAGS.preprovisioned_data_fanout)
+    return _distributions[key]
+
+
+def _CopyFromPeer(source, vm, remote_path):
+  """Copies remote_path from source to the same path on vm."""
+  use_internal_ip = vm_util.ShouldRunOnInternalIpAddress(source, vm)
+  vm.RemoteCommand('mkdir -p %s' % posixpath.dirname(remote_path))
+  source.MoveFile(vm, remote_path, posixpath.dirname(remote_path),
+                  use_internal_ip=use_internal_ip)
+
+
+def Install(vm, module_name, filename, install_path, sha256sum, download):
+  """Installs a preprovisioned data file on a VM, copying it from a peer.
+
+  Args:
+    vm: The BaseVirtualMachine to install the file on.
+    module_name: Name of the module associated with this data file.
+    filename: The name of the data file.
+    install_path: The directory on the VM holding the file.
+    sha256sum: The expected sha256sum hash of the file, or None if it is not
+        checked.
+    download: A function that downloads and verifies the file on vm without
+        any peers.
+
+  Raises:
+    errors.Setup.BadPreprovisionedDataError: If the file has the wrong digest.
+  """
+  distribution = _GetDistribution(
+      (module_name, filename, install_path, sha256sum))
+  remote_path = posixpath.join(install_path, filename)
+  start_time = time.time()
+  source = distribution.Acquire()
+  succeeded = False
+  try:
+    if source is None:
+      download()
+      source_name = SEED_SOURCE
+    else:
+      try:
+        _CopyFromPeer(source, vm, remote_path)
+        if sha256sum:
+          vm.CheckPreprovisionedData(install_path, module_name, filename,
+                                     sha256sum)
+        source_name = source.name
+      except (errors.VirtualMachine.RemoteCommandError,
+              errors.Setup.BadPreprovisionedDataError) as e:
+        logging.warning('Copying %s from %s to %s failed, downloading it '
+                        'instead: %s', remote_path, source.name, vm.name, e)
+        download()
+        source_name = SEED_SOURCE
+    succeeded = True
+  finally:
+    distribution.Release(source, vm, succeeded)
+  seconds = time.time() - start_time
+  logging.info('%s got %s from %s in %.1f seconds.', vm.name, filename,
+               source_name, seconds)
+  _STATS.Record(vm, module_name, filename, source_name, seconds)
+
+
+def GetSamples():
+  """Returns time to data samples recorded since the last call."""
+  return _STATS.GetSamples()
+
+
+@events.benchmark_end.connect
+def _ResetAtBenchmarkEnd(unused_sender, benchmark_spec):
+  del benchmark_spec  # unused
+  with _lock:
+    _distributions.clear()
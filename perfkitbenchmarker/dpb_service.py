@@ -28,6 +28,7 @@ from typing import Dict, List, Optional
 from absl import flags
 from dataclasses import dataclass
 from perfkitbenchmarker import errors
+from perfkitbenchmarker import provision_graph
 from perfkitbenchmarker import resource
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.linux_packages import hadoop
@@ -154,6 +155,10 @@ class BaseDpbService(resource.BaseResource):
     self.dpb_service_type = 'unknown'
     self.storage_service = None
 
+  def GetProvisionDependencies(self):
+    """See base class."""
+    return [provision_graph.VMS_READY]
+
   @abc.abstractmethod
   def SubmitJob(self,
                 jarfile: str = None,
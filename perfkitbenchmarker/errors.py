@@ -148,6 +148,10 @@ class VmUtil(object):
   class CalledProcessException(Error):
     pass
 
+  class TaskCancelledError(Error):
+    """Raised by a parallel task that stopped because it was cancelled."""
+    pass
+
   class IssueCommandError(Error):
     pass
 
@@ -24,6 +24,7 @@ import re
 
 from absl import flags
 from perfkitbenchmarker import errors
+from perfkitbenchmarker import import_util
 from perfkitbenchmarker import units
 
 import six
@@ -287,6 +288,12 @@ class OverrideFlags(object):
     if not self._config_dict:
       return
 
+    # Benchmark and package modules are imported when they are used, so the
+    # flags may be defined by modules that have not been imported yet.
+    unknown_flags = [key for key in self._config_dict
+                     if key not in self._flag_values]
+    if unknown_flags:
+      import_util.ImportFlagModules(unknown_flags)
     for key, value in six.iteritems(self._config_dict):
       if key not in self._flag_values:
         raise errors.Config.UnrecognizedOption(
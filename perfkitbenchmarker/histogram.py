@@ -0,0 +1,309 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Mergeable histograms of latencies and other non-negative values.
+
+Benchmarks that report latency distributions record them in a Histogram,
+merge the histograms of their clients and compute percentiles from it. The
+histogram is attached to a sample's metadata under METADATA_KEY in a compact
+serialized form, from which publishers can restore it.
+"""
+
+import base64
+import struct
+import zlib
+
+import numpy as np
+
+# Each power of two is split into 2 ** DEFAULT_PRECISION_BITS buckets.
+DEFAULT_PRECISION_BITS = 8
+# The metadata key of the base64 serialized histogram of a sample.
+METADATA_KEY = 'hdr_histogram'
+
+# Values below 2 ** _MIN_EXPONENT share the lowest bucket above zero.
+_MIN_EXPONENT = -64
+_MAGIC = b'PKBH'
+_FORMAT_VERSION = 1
+# Magic, format version, precision bits, index of the first bucket and number
+# of buckets that are not empty.
+_HEADER = struct.Struct('<4sBBqI')
+
+
+class Histogram(object):
+  """A histogram with log-linear buckets, like HdrHistogram.
+
+  Each power of two is split into 2 ** precision_bits buckets of equal width,
+  so the values in a bucket differ by less than 2 ** -precision_bits of their
+  value. Zero has a bucket of its own. For each bucket, the histogram keeps the
+  number of values recorded in it, their sum, and the lowest and highest of
+  them, in numpy arrays that cover the buckets from the lowest to the highest
+  value recorded. The value of a bucket is the mean of its values, which is
+  exact for buckets that only have one distinct value, such as the buckets of
+  the histograms benchmarks report.
+
+  Attributes:
+    precision_bits: int. The log2 of the number of buckets per power of two.
+  """
+
+  def __init__(self, precision_bits=DEFAULT_PRECISION_BITS):
+    if not 0 <= precision_bits <= 16:
+      raise ValueError('Invalid precision bits: {0}'.format(precision_bits))
+    self.precision_bits = precision_bits
+    # The index of the bucket at position 0 of the arrays.
+    self._first = 0
+    self._counts = np.zeros(0, np.int64)
+    self._sums = np.zeros(0, np.float64)
+    self._mins = np.zeros(0, np.float64)
+    self._maxs = np.zeros(0, np.float64)
+
+  @classmethod
+  def FromItems(cls, items, precision_bits=DEFAULT_PRECISION_BITS):
+    """Returns a histogram of (value, count) pairs.
+
+    Args:
+      items: dict mapping values to counts, or iterable of (value, count)
+        pairs.
+      precision_bits: int. See Histogram.
+    """
+    if isinstance(items, dict):
+      items = items.items()
+    items = list(items)
+    histogram = cls(precision_bits)
+    if items:
+      values, counts = zip(*items)
+      histogram.Record(values, counts)
+    return histogram
+
+  def __eq__(self, other):
+    if not isinstance(other, Histogram):
+      return NotImplemented
+    return (self.precision_bits == other.precision_bits and
+            all(np.array_equal(a, b) for a, b in
+                zip(self._GetBuckets(), other._GetBuckets())))
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return '<{0} precision_bits={1} count={2}>'.format(
+        type(self).__name__, self.precision_bits, self.total_count)
+
+  @property
+  def total_count(self):
+    """The number of values recorded."""
+    return int(self._counts.sum())
+
+  def _GetIndices(self, values):
+    """Returns the bucket indices of an array of values."""
+    if np.any(~np.isfinite(values) | (values < 0)):
+      raise ValueError('Histogram values must be finite and non-negative.')
+    sub_buckets = 1 << self.precision_bits
+    # value = mantissa * 2 ** exponent, with mantissa in [0.5, 1).
+    mantissas, exponents = np.frexp(values)
+    offsets = np.floor((mantissas * 2 - 1) * sub_buckets).astype(np.int64)
+    exponents = exponents.astype(np.int64) - 1
+    indices = (exponents - _MIN_EXPONENT) * sub_buckets + offsets + 1
+    indices[exponents < _MIN_EXPONENT] = 1
+    indices[values == 0] = 0
+    return indices
+
+  def _Extend(self, first, last):
+    """Extends the arrays to cover the buckets from first to last."""
+    if not len(self._counts):
+      self._first = first
+      size = last - first + 1
+      self._counts = np.zeros(size, np.int64)
+      self._sums = np.zeros(size, np.float64)
+      self._mins = np.full(size, np.inf)
+      self._maxs = np.zeros(size, np.float64)
+      return
+    old_last = self._first + len(self._counts) - 1
+    new_first = min(first, self._first)
+    new_last = max(last, old_last)
+    if new_first == self._first and new_last == old_last:
+      return
+    size = new_last - new_first + 1
+    start = self._first - new_first
+    end = start + len(self._counts)
+    arrays = []
+    for array, fill in ((self._counts, 0), (self._sums, 0),
+                        (self._mins, np.inf), (self._maxs, 0)):
+      extended = np.full(size, fill, array.dtype)
+      extended[start:end] = array
+      arrays.append(extended)
+    self._counts, self._sums, self._mins, self._maxs = arrays
+    self._first = new_first
+
+  def Record(self, values, counts=None):
+    """Records values.
+
+    Args:
+      values: number or array-like of non-negative numbers.
+      counts: int or array-like of ints. The number of times each value is
+        recorded. Defaults to once.
+    """
+    values = np.atleast_1d(np.asarray(values, np.float64))
+    if counts is None:
+      counts = np.ones(len(values), np.int64)
+    else:
+      counts = np.atleast_1d(np.asarray(counts, np.int64))
+    if len(values) != len(counts):
+      raise ValueError('Lengths do not match: {0} != {1}'.format(
+          len(values), len(counts)))
+    if np.any(counts < 0):
+      raise ValueError('Histogram counts must be non-negative.')
+    values = values[counts > 0]
+    counts = counts[counts > 0]
+    if not len(values):
+      return
+    indices = self._GetIndices(values)
+    self._Extend(indices.min(), indices.max())
+    positions = indices - self._first
+    np.add.at(self._counts, positions, counts)
+    np.add.at(self._sums, positions, values * counts)
+    np.minimum.at(self._mins, positions, values)
+    np.maximum.at(self._maxs, positions, values)
+
+  def Merge(self, other):
+    """Adds the values of another histogram with the same precision."""
+    if other.precision_bits != self.precision_bits:
+      raise ValueError('Cannot merge histograms with {0} and {1} precision '
+                       'bits.'.format(self.precision_bits,
+                                      other.precision_bits))
+    if not len(other._counts):
+      return
+    self._Extend(other._first, other._first + len(other._counts) - 1)
+    start = other._first - self._first
+    end = start + len(other._counts)
+    self._counts[start:end] += other._counts
+    self._sums[start:end] += other._sums
+    np.minimum(self._mins[start:end], other._mins,
+               out=self._mins[start:end])
+    np.maximum(self._maxs[start:end], other._maxs,
+               out=self._maxs[start:end])
+
+  def _GetBuckets(self):
+    """Returns the indices, counts, sums, mins and maxs of non-empty buckets."""
+    positions = np.flatnonzero(self._counts)
+    return (positions + self._first, self._counts[positions],
+            self._sums[positions], self._mins[positions],
+            self._maxs[positions])
+
+  def _GetValues(self):
+    """Returns the values and counts of the non-empty buckets."""
+    _, counts, sums, mins, maxs = self._GetBuckets()
+    values = np.where(mins == maxs, mins,
+                      np.clip(sums / np.maximum(counts, 1), mins, maxs))
+    return values, counts
+
+  def GetItems(self):
+    """Returns the (value, count) pairs of the non-empty buckets, by value."""
+    values, counts = self._GetValues()
+    return list(zip(values.tolist(), counts.tolist()))
+
+  def GetPercentiles(self, percentiles):
+    """Returns the values at percentiles.
+
+    The p-th percentile is the lowest value that is at least as high as p
+    percent of the values, like in HdrHistogram.
+
+    Args:
+      percentiles: array-like of numbers in [0, 100].
+
+    Returns:
+      numpy array of the values at the percentiles.
+
+    Raises:
+      ValueError: if the histogram is empty or a percentile is not in
+        [0, 100].
+    """
+    percentiles = np.asarray(percentiles, np.float64)
+    if np.any((percentiles < 0) | (percentiles > 100)):
+      raise ValueError('Invalid percentiles: {0}'.format(percentiles))
+    values, counts = self._GetValues()
+    total_count = counts.sum()
+    if not total_count:
+      raise ValueError("Can't compute percentiles of an empty histogram.")
+    indices = np.searchsorted(np.cumsum(counts),
+                              total_count * percentiles / 100)
+    return values[np.minimum(indices, len(values) - 1)]
+
+  def GetStats(self, percentiles):
+    """Computes percentiles, mean and stddev.
+
+    Args:
+      percentiles: list of numbers in [0, 100].
+
+    Returns:
+      A dict mapping 'p<percentile>', 'average' and 'stddev' to their values.
+    """
+    stats = {'p%s' % str(percentile): value for percentile, value in
+             zip(percentiles, self.GetPercentiles(percentiles).tolist())}
+    values, counts = self._GetValues()
+    total_count = counts.sum()
+    average = self._sums.sum() / total_count
+    stats['average'] = float(average)
+    if total_count > 1:
+      stats['stddev'] = float(
+          (np.sum((values - average) ** 2 * counts) / (total_count - 1)) ** 0.5)
+    else:
+      stats['stddev'] = 0
+    return stats
+
+  def ToBytes(self):
+    """Serializes the histogram."""
+    indices, counts, sums, mins, maxs = self._GetBuckets()
+    first = int(indices[0]) if len(indices) else 0
+    gaps = np.diff(indices, prepend=first).astype('<u4')
+    payload = b''.join(array.tobytes() for array in (
+        gaps, counts.astype('<i8'), sums.astype('<f8'), mins.astype('<f8'),
+        maxs.astype('<f8')))
+    return (_HEADER.pack(_MAGIC, _FORMAT_VERSION, self.precision_bits, first,
+                         len(indices)) + zlib.compress(payload))
+
+  @classmethod
+  def FromBytes(cls, data):
+    """Deserializes a histogram serialized by ToBytes."""
+    magic, version, precision_bits, first, num_buckets = _HEADER.unpack_from(
+        data)
+    if magic != _MAGIC or version != _FORMAT_VERSION:
+      raise ValueError('Not a serialized histogram.')
+    payload = zlib.decompress(data[_HEADER.size:])
+    gaps = np.frombuffer(payload, '<u4', num_buckets)
+    offset = gaps.nbytes
+    arrays = []
+    for dtype in ('<i8', '<f8', '<f8', '<f8'):
+      arrays.append(np.frombuffer(payload, dtype, num_buckets, offset))
+      offset += arrays[-1].nbytes
+    histogram = cls(precision_bits)
+    if num_buckets:
+      positions = np.cumsum(gaps, dtype=np.int64)
+      histogram._Extend(first, first + int(positions[-1]))
+      histogram._counts[positions] = arrays[0]
+      histogram._sums[positions] = arrays[1]
+      histogram._mins[positions] = arrays[2]
+      histogram._maxs[positions] = arrays[3]
+    return histogram
+
+  def ToBase64(self):
+    """Serializes the histogram to an ASCII string."""
+    return base64.b64encode(self.ToBytes()).decode('ascii')
+
+  @classmethod
+  def FromBase64(cls, data):
+    """Deserializes a histogram serialized by ToBase64."""
+    return cls.FromBytes(base64.b64decode(data))
+
+  def GetMetadata(self):
+    """Returns sample metadata with the serialized histogram."""
+    return {METADATA_KEY: self.ToBase64()}
@@ -0,0 +1,263 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""HTTP transport for publishers that send samples to a server.
+
+A ConnectionPool keeps up to --publish_http_connections persistent connections
+to a server, so that publishing many samples does not open a connection per
+request. Publishers split their samples into chunks of at most
+--publish_http_chunk_bytes, and send the chunks concurrently, one per
+connection. Requests that fail with 429 (Too Many Requests), a 5xx status or
+a connection error are retried --publish_http_retries times with exponential
+backoff.
+"""
+
+import base64
+import collections
+import logging
+import queue
+import time
+
+from absl import flags
+from perfkitbenchmarker import background_tasks
+from six.moves import urllib
+import six.moves.http_client as httplib
+
+flags.DEFINE_integer(
+    'publish_http_connections', 4,
+    'The maximum number of concurrent requests publishers that send samples '
+    'over HTTP, e.g. the Elasticsearch and InfluxDB publishers, make to their '
+    'server.', lower_bound=1)
+flags.DEFINE_integer(
+    'publish_http_retries', 5,
+    'The number of times publishers that send samples over HTTP retry a '
+    'request that was throttled or failed with a server error.',
+    lower_bound=0)
+flags.DEFINE_integer(
+    'publish_http_chunk_bytes', 5 * 1024 * 1024,
+    'The maximum size of a request publishers that send samples over HTTP '
+    'make to their server, before compression. A single sample larger than '
+    'this is sent in a request of its own.', lower_bound=1)
+
+FLAGS = flags.FLAGS
+
+# Seconds to wait before the first retry. Doubles with every retry.
+_RETRY_DELAY = 1
+_MAX_RETRY_DELAY = 60
+
+Response = collections.namedtuple('Response', ['status', 'reason', 'data'])
+
+
+class HttpError(httplib.HTTPException):
+  """Raised when a request to a server failed.
+
+  Attributes:
+    status: The HTTP status of the last response, or None if there was none.
+  """
+
+  def __init__(self, message, status=None):
+    super(HttpError, self).__init__(message)
+    self.status = status
+
+
+def _IsRetryable(status):
+  return status == 429 or status >= 500
+
+
+def Backoff(retry, retry_after=None):
+  """Waits before a retry.
+
+  Args:
+    retry: int. The number of the retry, starting at 1.
+    retry_after: string. The value of the server's Retry-After header, if any.
+      Only numbers of seconds are supported.
+  """
+  delay = min(_MAX_RETRY_DELAY, _RETRY_DELAY * 2 ** (retry - 1))
+  try:
+    delay = max(delay, min(_MAX_RETRY_DELAY, float(retry_after)))
+  except (TypeError, ValueError):
+    pass
+  time.sleep(delay)
+
+
+def Chunk(records, max_bytes=None):
+  """Splits records into chunks of a bounded size.
+
+  Args:
+    records: iterable of strings.
+    max_bytes: int. The maximum size of a chunk: the UTF-8 size of its records
+      and a separator byte after each. Defaults to --publish_http_chunk_bytes.
+
+  Yields:
+    Non-empty lists of consecutive records.
+  """
+  max_bytes = max_bytes or FLAGS.publish_http_chunk_bytes
+  chunk = []
+  chunk_bytes = 0
+  for record in records:
+    record_bytes = len(record.encode('utf-8')) + 1
+    if chunk and chunk_bytes + record_bytes > max_bytes:
+      yield chunk
+      chunk = []
+      chunk_bytes = 0
+    chunk.append(record)
+    chunk_bytes += record_bytes
+  if chunk:
+    yield chunk
+
+
+class ConnectionPool(object):
+  """Persistent connections to an HTTP server.
+
+  Attributes:
+    uri: string. The server's URI, as passed to __init__.
+    max_connections: int. The maximum number of idle connections kept open,
+      and of chunks sent at once by Map.
+  """
+
+  def __init__(self, uri, max_connections=None):
+    """Initializes the pool. Connections are opened when they are needed.
+
+    Args:
+      uri: string. The server's address, either "[user:password@]host[:port]"
+        or "http[s]://[user:password@]host[:port][/path]". Request paths are
+        relative to path. Credentials are sent with HTTP basic authentication.
+      max_connections: int. Defaults to --publish_http_connections.
+    """
+    self.uri = uri
+    self.max_connections = max_connections or FLAGS.publish_http_connections
+    if '://' not in uri:
+      uri = 'http://' + uri
+    parsed = urllib.parse.urlsplit(uri)
+    self._connection_class = (httplib.HTTPSConnection
+                              if parsed.scheme == 'https'
+                              else httplib.HTTPConnection)
+    host = parsed.hostname
+    if ':' in host:
+      host = '[{0}]'.format(host)
+    self._netloc = (host if parsed.port is None
+                    else '{0}:{1}'.format(host, parsed.port))
+    self._base_path = parsed.path.rstrip('/')
+    self._headers = {}
+    if parsed.username is not None:
+      credentials = '{0}:{1}'.format(
+          urllib.parse.unquote(parsed.username),
+          urllib.parse.unquote(parsed.password or ''))
+      self._headers['Authorization'] = 'Basic ' + base64.b64encode(
+          credentials.encode('utf-8')).decode('ascii')
+    self._redacted_uri = urllib.parse.urlunsplit(
+        parsed._replace(netloc=self._netloc))
+    self._connections = queue.LifoQueue()
+
+  def __repr__(self):
+    return '<{0} uri={1}>'.format(type(self).__name__, self._redacted_uri)
+
+  def _GetConnection(self):
+    try:
+      return self._connections.get_nowait()
+    except queue.Empty:
+      return self._connection_class(self._netloc)
+
+  def _ReleaseConnection(self, connection):
+    if self._connections.qsize() < self.max_connections:
+      self._connections.put(connection)
+    else:
+      connection.close()
+
+  def _Send(self, method, path, body, headers):
+    """Makes one request on a pooled connection."""
+    connection = self._GetConnection()
+    try:
+      connection.request(method, self._base_path + path, body, headers)
+      response = connection.getresponse()
+      data = response.read()
+    except Exception:
+      connection.close()
+      raise
+    if response.will_close:
+      connection.close()
+    else:
+      self._ReleaseConnection(connection)
+    return response, data
+
+  def Request(self, method, path, body=None, headers=None,
+              allowed_statuses=()):
+    """Makes a request, retrying it if it was throttled or failed.
+
+    Args:
+      method: string. The HTTP method.
+      path: string. The request path, including the query string.
+      body: bytes or None. The request body.
+      headers: dict or None. The request headers.
+      allowed_statuses: collection of ints. Error statuses returned rather than
+        raised, e.g. 404 when checking whether something exists.
+
+    Returns:
+      A Response.
+
+    Raises:
+      HttpError: if the server returned an error status, or the request still
+        failed after --publish_http_retries retries.
+    """
+    headers = dict(self._headers, **(headers or {}))
+    retries = FLAGS.publish_http_retries
+    for retry in range(retries + 1):
+      retry_after = None
+      try:
+        response, data = self._Send(method, path, body, headers)
+      except (IOError, httplib.HTTPException) as e:
+        error = HttpError('{0} {1} failed: {2}'.format(method, path, e))
+      else:
+        if response.status < 400 or response.status in allowed_statuses:
+          return Response(response.status, response.reason, data)
+        error = HttpError(
+            '{0} {1} failed with {2} {3}: {4}'.format(
+                method, path, response.status, response.reason,
+                data[:1000].decode('utf-8', 'replace')),
+            response.status)
+        if not _IsRetryable(response.status):
+          raise error
+        retry_after = response.getheader('Retry-After')
+      if retry < retries:
+        logging.info('%s Retrying.', error)
+        Backoff(retry + 1, retry_after)
+    raise error
+
+  def Map(self, target, chunks):
+    """Calls target for each chunk, with up to max_connections at once.
+
+    Args:
+      target: function. Called with a chunk. Typically makes a request.
+      chunks: list of chunks.
+
+    Returns:
+      List of target's return values, in the order of chunks.
+
+    Raises:
+      Exception: The exception raised by target, if there is only one chunk.
+      errors.VmUtil.ThreadException: if target raised for any of several
+        chunks.
+    """
+    if len(chunks) == 1:
+      return [target(chunks[0])]
+    return background_tasks.RunThreaded(
+        target, [((chunk,), {}) for chunk in chunks],
+        max_concurrent_threads=self.max_connections)
+
+  def Close(self):
+    """Closes the idle connections."""
+    while True:
+      try:
+        self._connections.get_nowait().close()
+      except queue.Empty:
+        return
@@ -11,11 +11,32 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-
 """Utilities for dynamically importing python files."""
 
+import collections.abc
+import hashlib
 import importlib
+import json
+import logging
+import os
 import pkgutil
+import re
+import sys
+import tempfile
+import threading
+
+from absl import flags
+
+# Increment when the format of ModuleRegistry index files changes.
+_INDEX_VERSION = 1
+_INDEX_DIR = os.path.join(tempfile.gettempdir(), 'perfkitbenchmarker',
+                          'module_index')
+# Matches the flags a module reads, e.g. FLAGS.fio_jobfile.
+_FLAG_READ_REGEX = re.compile(r"""\bFLAGS(?:\.(\w+)|\[['"](\w+)['"]\])""")
+
+_registries = []
+# Guards importing the modules defining flags that imported modules read.
+_dependencies_lock = threading.RLock()
 
 
 def LoadModulesForPath(path, package_prefix=None):
@@ -41,3 +62,234 @@ def LoadModulesForPath(path, package_prefix=None):
     # Skip recursively listed modules (e.g. 'subpackage.module').
     if '.' not in modname:
       yield importlib.import_module(prefix + modname)
+
+
+def _GetFlagReads(module):
+  """Returns the names of the flags a module's source refers to."""
+  try:
+    with open(module.__file__) as source_file:
+      source = source_file.read()
+  except (IOError, OSError, TypeError):
+    return []
+  return sorted({a or b for a, b in _FLAG_READ_REGEX.findall(source)})
+
+
+def _ImportFlagDependencies():
+  """Imports the modules defining the flags read by imported modules.
+
+  Registered modules may read flags defined by other registered modules
+  without importing them (e.g. a package reading a benchmark's flags), which
+  only worked when every module was imported eagerly. Those modules are
+  imported until the flags read by every imported registered module are
+  defined.
+  """
+  with _dependencies_lock:
+    while True:
+      reads = set()
+      for registry in _registries:
+        reads.update(registry._TakeFlagReads())  # pylint: disable=protected-access
+      module_names = set()
+      for registry in _registries:
+        module_names.update(registry._GetFlagModules(reads))  # pylint: disable=protected-access
+      module_names.difference_update(sys.modules)
+      if not module_names:
+        return
+      for module_name in sorted(module_names):
+        importlib.import_module(module_name)
+
+
+def _GetFingerprint(path, source_files):
+  """Returns a hash of the names, sizes and mtimes of the source files."""
+  files = []
+  for source_file in source_files:
+    stat = os.stat(source_file)
+    files.append((source_file, stat.st_mtime_ns, stat.st_size))
+  for directory in path:
+    for root, dirnames, filenames in os.walk(directory):
+      dirnames.sort()
+      for filename in sorted(filenames):
+        if filename.endswith('.py'):
+          stat = os.stat(os.path.join(root, filename))
+          files.append((os.path.relpath(os.path.join(root, filename),
+                                        directory),
+                        stat.st_mtime_ns, stat.st_size))
+  return hashlib.sha1(
+      json.dumps([_INDEX_VERSION, files]).encode('utf-8')).hexdigest()
+
+
+class ModuleRegistry(collections.abc.Mapping):
+  """A mapping of names to the modules of a package, imported on first use.
+
+  Importing every module of a package, and everything those modules import, is
+  slow. Instead, the names each module registers, their metadata and the flags
+  defined by the package's modules are kept in an index file, which is rebuilt
+  (by importing every module once) when the package's source files change.
+  Modules are imported when a name they registered is looked up, or when the
+  registry's values are iterated over, along with the registered modules
+  defining the flags they read. Membership tests and iterating over names only
+  read the index.
+
+  Example usage, in a package's __init__.py:
+    PACKAGES = import_util.ModuleRegistry(
+        __path__, __name__, lambda module: [(module.__name__, {})])
+  """
+
+  def __init__(self, path, package_name, get_entries, source_files=()):
+    """Initializes the registry.
+
+    Args:
+      path: The package's __path__.
+      package_name: The package's __name__.
+      get_entries: Function called with each module of the package when the
+        index is built. Returns a list of (name, metadata) pairs for the names
+        the module registers, where metadata is a JSON serializable dict. If
+        metadata has a 'factory' key, the value registered for name is looked
+        up in the list of (name, value) pairs returned by calling the module's
+        function with that name, instead of being the module itself.
+      source_files: Other files the entries are derived from. The index is
+        rebuilt when they change, as when the package's source files change.
+    """
+    self._path = list(path)
+    self._package_name = package_name
+    self._get_entries = get_entries
+    self._source_files = list(source_files)
+    self._index = None
+    self._values = {}
+    # Modules whose flag reads were already resolved.
+    self._resolved_modules = set()
+    self._lock = threading.RLock()
+    path_hash = hashlib.sha1(
+        os.pathsep.join(self._path).encode('utf-8')).hexdigest()[:12]
+    self._index_path = os.path.join(
+        _INDEX_DIR, '%s-%s.json' % (package_name, path_hash))
+    _registries.append(self)
+
+  def _BuildIndex(self, fingerprint):
+    """Imports every module of the package and returns its index."""
+    entries = collections.OrderedDict()
+    flag_reads = {}
+    for module in LoadModulesForPath(self._path, self._package_name):
+      for name, metadata in self._get_entries(module):
+        if name in entries:
+          raise ValueError(
+              'Modules %s and %s both register "%s" in %s.' %
+              (entries[name]['module'], module.__name__, name,
+               self._package_name))
+        entry = dict(metadata)
+        entry['module'] = module.__name__
+        entries[name] = entry
+      flag_reads[module.__name__] = _GetFlagReads(module)
+    prefix = self._package_name + '.'
+    package_flags = {}
+    for module_name, module_flags in flags.FLAGS.flags_by_module_dict().items():
+      if module_name.startswith(prefix):
+        for flag in module_flags:
+          package_flags[flag.name] = module_name
+    return {'fingerprint': fingerprint, 'entries': entries,
+            'flags': package_flags, 'flag_reads': flag_reads}
+
+  def _WriteIndex(self, index):
+    """Atomically replaces the index file, which other processes may read."""
+    try:
+      os.makedirs(_INDEX_DIR, exist_ok=True)
+      fd, temp_path = tempfile.mkstemp(dir=_INDEX_DIR, suffix='.tmp')
+      with os.fdopen(fd, 'w') as index_file:
+        json.dump(index, index_file)
+      os.replace(temp_path, self._index_path)
+    except OSError as e:
+      logging.debug('Could not write module index %s: %s', self._index_path,
+                    e)
+
+  def _GetIndex(self):
+    """Returns the index, reading or rebuilding the index file if needed."""
+    with self._lock:
+      if self._index is None:
+        fingerprint = _GetFingerprint(self._path, self._source_files)
+        index = None
+        try:
+          with open(self._index_path) as index_file:
+            index = json.load(index_file,
+                              object_pairs_hook=collections.OrderedDict)
+        except (OSError, ValueError):
+          pass
+        if not index or index.get('fingerprint') != fingerprint:
+          index = self._BuildIndex(fingerprint)
+          self._WriteIndex(index)
+        self._index = index
+      return self._index
+
+  def __getitem__(self, name):
+    entry = self._GetIndex()['entries'][name]
+    with self._lock:
+      if name not in self._values:
+        module = importlib.import_module(entry['module'])
+        _ImportFlagDependencies()
+        if 'factory' in entry:
+          self._values.update(getattr(module, entry['factory'])())
+        else:
+          self._values[name] = module
+      return self._values[name]
+
+  def __contains__(self, name):
+    return name in self._GetIndex()['entries']
+
+  def __iter__(self):
+    return iter(self._GetIndex()['entries'])
+
+  def __len__(self):
+    return len(self._GetIndex()['entries'])
+
+  def GetMetadata(self, name):
+    """Returns the metadata registered with name, without importing it."""
+    entry = dict(self._GetIndex()['entries'][name])
+    del entry['module']
+    return entry
+
+  def _GetFlagModules(self, flag_names):
+    """Returns the modules of the package defining any of the flags."""
+    index_flags = self._GetIndex()['flags']
+    return {index_flags[flag] for flag in flag_names if flag in index_flags}
+
+  def _TakeFlagReads(self):
+    """Returns the flags read by newly imported modules of the package."""
+    reads = set()
+    with self._lock:
+      for module_name, module_reads in self._GetIndex()['flag_reads'].items():
+        if (module_name in sys.modules and
+            module_name not in self._resolved_modules):
+          self._resolved_modules.add(module_name)
+          reads.update(module_reads)
+    return reads
+
+  def ImportFlagModules(self, flag_names):
+    """Imports the modules of the package defining any of the flags."""
+    for module_name in sorted(self._GetFlagModules(flag_names)):
+      importlib.import_module(module_name)
+    _ImportFlagDependencies()
+
+  def ImportMatchingModules(self, regex):
+    """Imports the modules of the package whose names match the regex."""
+    index = self._GetIndex()
+    module_names = set(index['flags'].values())
+    module_names.update(entry['module'] for entry in index['entries'].values())
+    for module_name in sorted(module_names):
+      if re.search(regex, module_name):
+        importlib.import_module(module_name)
+    _ImportFlagDependencies()
+
+
+def ImportFlagModules(flag_names):
+  """Imports the registered modules defining any of the named flags."""
+  for registry in _registries:
+    registry.ImportFlagModules(flag_names)
+
+
+def ImportMatchingModules(regex):
+  """Imports the registered modules whose names match the regex."""
+  for registry in _registries:
+    registry.ImportMatchingModules(regex)
+
+
+def ImportAllModules():
+  """Imports every module of every registry."""
+  ImportMatchingModules('')
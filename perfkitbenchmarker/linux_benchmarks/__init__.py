@@ -14,20 +14,29 @@
 """Contains benchmark imports and a list of benchmarks.
 
 All modules within this package are considered benchmarks, and are loaded
-dynamically. Add non-benchmark code to other packages.
+dynamically when they are looked up in VALID_BENCHMARKS. Add non-benchmark
+code to other packages.
 """
 
+from perfkitbenchmarker import configs
 from perfkitbenchmarker import import_util
 
 
-def _LoadBenchmarks():
-  return list(import_util.LoadModulesForPath(__path__, __name__))
+def _GetBenchmarkEntries(module):
+  return [(module.BENCHMARK_NAME, {
+      'summary': configs.GetConfigSummary(module.BENCHMARK_CONFIG,
+                                          module.BENCHMARK_NAME),
+  })]
 
-BENCHMARKS = _LoadBenchmarks()
 
-VALID_BENCHMARKS = {}
-for module in BENCHMARKS:
-  if module.BENCHMARK_NAME in VALID_BENCHMARKS:
-    raise ValueError('There are multiple benchmarks with BENCHMARK_NAME "%s"' %
-                     (module.BENCHMARK_NAME))
-  VALID_BENCHMARKS[module.BENCHMARK_NAME] = module
+# Summaries depend on the config constants as well as the benchmark modules.
+VALID_BENCHMARKS = import_util.ModuleRegistry(
+    __path__, __name__, _GetBenchmarkEntries,
+    source_files=[configs.GetConfigConstantsPath()])
+
+
+def __getattr__(name):
+  # BENCHMARKS imports every benchmark module, so it is only built when used.
+  if name == 'BENCHMARKS':
+    return list(VALID_BENCHMARKS.values())
+  raise AttributeError('module %r has no attribute %r' % (__name__, name))
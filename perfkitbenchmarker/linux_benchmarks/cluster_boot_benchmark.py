@@ -16,9 +16,9 @@
 import logging
 import time
 from absl import flags
+from perfkitbenchmarker import background_tasks
 from perfkitbenchmarker import configs
 from perfkitbenchmarker import sample
-from perfkitbenchmarker import vm_util
 
 BENCHMARK_NAME = 'cluster_boot'
 BENCHMARK_CONFIG = """
@@ -53,10 +53,6 @@ flags.DEFINE_boolean(
     'cluster_boot_time_reboot', False,
     'Whether to reboot the VMs during the cluster boot benchmark to measure '
     'reboot performance.')
-flags.DEFINE_boolean(
-    'cluster_boot_test_port_listening', False,
-    'Test the time it takes to successfully connect to the port that is used to run the remote command.'
-)
 FLAGS = flags.FLAGS
 
 
@@ -166,7 +162,14 @@ def _MeasureReboot(vms):
   """
   samples = []
   before_reboot_timestamp = time.time()
-  reboot_times = vm_util.RunThreaded(lambda vm: vm.Reboot(), vms)
+  reboot_times = [None] * len(vms)
+  # Log reboot times as they arrive, which shows the progress of large
+  # clusters.
+  for count, (i, reboot_time) in enumerate(
+      background_tasks.IterThreaded(lambda vm: vm.Reboot(), vms), 1):
+    logging.info('%s rebooted in %s seconds (%d of %d VMs).', vms[i].name,
+                 reboot_time, count, len(vms))
+    reboot_times[i] = reboot_time
   cluster_reboot_time = time.time() - before_reboot_timestamp
   os_types = set()
   for i, vm in enumerate(vms):
@@ -35,6 +35,7 @@ from perfkitbenchmarker import configs
 from perfkitbenchmarker import data
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import flag_util
+from perfkitbenchmarker import parse_executor
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import units
 from perfkitbenchmarker import vm_util
@@ -623,8 +624,9 @@ def RunWithExec(vm, exec_path, remote_job_file_path, job_file_contents):
       bin_vals += [fio.ComputeHistogramBinVals(
           vm, '%s_clat_hist.%s.log' % (
               log_file_base, idx + 1)) for idx in range(num_logs)]
-  samples = fio.ParseResults(job_file_string, json.loads(stdout),
-                             log_file_base=log_file_base, bin_vals=bin_vals)
+  samples = parse_executor.Parse(
+      fio.ParseResults, job_file_string, json.loads(stdout),
+      log_file_base=log_file_base, bin_vals=bin_vals)
 
   samples.append(
       sample.Sample('start_time', start_time, 'sec', samples[0].metadata))
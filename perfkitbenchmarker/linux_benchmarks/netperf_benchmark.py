@@ -25,7 +25,7 @@ machines.
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
-import collections
+import bisect
 import csv
 import json
 import logging
@@ -36,6 +36,7 @@ from perfkitbenchmarker import configs
 from perfkitbenchmarker import data
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import flag_util
+from perfkitbenchmarker import histogram as histogram_lib
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.linux_packages import netperf
@@ -200,38 +201,39 @@ def _HistogramStatsCalculator(histogram, percentiles=PERCENTILES):
   """Computes values at percentiles in a distribution as well as stddev.
 
   Args:
-    histogram: A dict mapping values to the number of samples with that value.
+    histogram: A histogram.Histogram, or a dict mapping values to the number of
+      samples with that value.
     percentiles: An array of percentiles to calculate.
 
   Returns:
-    A dict mapping stat names to their values.
+    A dict mapping stat names to their values. The p-th percentile is the value
+    at 0-based index int(N * p / 100) of the N sorted samples.
   """
   stats = {}
 
-  # Histogram data in list form sorted by key
-  by_value = sorted([(value, count) for value, count in histogram.items()],
-                    key=lambda x: x[0])
-  total_count = sum(histogram.values())
+  # Histogram data in list form sorted by value
+  if isinstance(histogram, histogram_lib.Histogram):
+    by_value = histogram.GetItems()
+  else:
+    by_value = sorted(histogram.items())
+  cumulative_counts = []
+  total_count = 0
+  for _, count in by_value:
+    total_count += count
+    cumulative_counts.append(total_count)
 
-  cur_value_index = 0  # Current index in by_value
-  cur_index = 0  # Number of values we've passed so far
   for p in percentiles:
     index = int(float(total_count) * float(p) / 100.0)
     index = min(index, total_count - 1)  # Handle 100th percentile
-    for value, count in by_value[cur_value_index:]:
-      if cur_index + count > index:
-        stats['p%s' % str(p)] = by_value[cur_value_index][0]
-        break
-      else:
-        cur_index += count
-        cur_value_index += 1
+    stats['p%s' % str(p)] = by_value[
+        bisect.bisect_right(cumulative_counts, index)][0]
 
   # Compute stddev
-  value_sum = float(sum([value * count for value, count in histogram.items()]))
+  value_sum = float(sum([value * count for value, count in by_value]))
   average = value_sum / float(total_count)
   if total_count > 1:
     total_of_squares = sum([(value - average) ** 2 * count
-                            for value, count in histogram.items()])
+                            for value, count in by_value])
     stats['stddev'] = (total_of_squares / (total_count - 1)) ** 0.5
   else:
     stats['stddev'] = 0
@@ -250,7 +252,9 @@ def ParseNetperfOutput(stdout, metadata, benchmark_name,
         included in stdout
 
   Returns:
-    A tuple containing (throughput_sample, latency_samples, latency_histogram)
+    A tuple containing (throughput_sample, latency_samples, latency_histogram).
+    latency_histogram is a histogram.Histogram, or None if latency histograms
+    are not enabled.
   """
   # Don't modify the metadata dict that was passed in
   metadata = metadata.copy()
@@ -321,8 +325,10 @@ def ParseNetperfOutput(stdout, metadata, benchmark_name,
     # Parse the latency histogram. {latency: count} where "latency" is the
     # latency in microseconds with only 2 significant figures and "count" is the
     # number of response times that fell in that latency range.
-    latency_hist = netperf.ParseHistogram(stdout)
-    hist_metadata = {'histogram': json.dumps(latency_hist)}
+    hist_items = netperf.ParseHistogram(stdout)
+    latency_hist = histogram_lib.Histogram.FromItems(hist_items)
+    hist_metadata = {'histogram': json.dumps(hist_items)}
+    hist_metadata.update(latency_hist.GetMetadata())
     hist_metadata.update(metadata)
     latency_samples.append(sample.Sample(
         '%s_Latency_Histogram' % benchmark_name, 0, 'us', hist_metadata))
@@ -465,12 +471,14 @@ def RunNetperf(vm, benchmark_name, server_ip, num_streams):
                         float(value),
                         throughput_unit, metadata))
     if enable_latency_histograms:
-      # Combine all of the latency histogram dictionaries
-      latency_histogram = collections.Counter()
+      # Combine all of the latency histograms
+      latency_histogram = histogram_lib.Histogram()
       for histogram in latency_histograms:
-        latency_histogram.update(histogram)
+        latency_histogram.Merge(histogram)
       # Create a sample for the aggregate latency histogram
-      hist_metadata = {'histogram': json.dumps(latency_histogram)}
+      hist_metadata = {
+          'histogram': json.dumps(dict(latency_histogram.GetItems()))}
+      hist_metadata.update(latency_histogram.GetMetadata())
       hist_metadata.update(metadata)
       samples.append(sample.Sample(
           '%s_Latency_Histogram' % benchmark_name, 0, 'us', hist_metadata))
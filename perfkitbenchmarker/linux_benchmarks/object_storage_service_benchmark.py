@@ -73,9 +73,6 @@ flags.DEFINE_string('object_storage_region', None,
 flags.DEFINE_string('object_storage_gcs_multiregion', None,
                     'Storage multiregion for GCS in object storage benchmark.')
 
-flags.DEFINE_string('object_storage_storage_class', None,
-                    'Storage class to use in object storage benchmark.')
-
 flags.DEFINE_enum('object_storage_scenario', 'all',
                   ['all', 'cli', 'api_data', 'api_namespace',
                    'api_multistream', 'api_multistream_writes',
@@ -531,10 +528,10 @@ def _ProcessMultiStreamResults(start_times, latencies, sizes, operation,
 
     # Record samples for individual downloads and uploads if requested.
     if FLAGS.record_individual_latency_samples:
-      for latency in all_active_latencies[all_active_sizes == size]:
-        results.append(
-            sample.Sample('%s individual' % latency_prefix, latency,
-                          LATENCY_UNIT, this_size_metadata))
+      results.append(sample.SampleBatch(
+          '%s individual' % latency_prefix,
+          all_active_latencies[all_active_sizes == size], LATENCY_UNIT,
+          this_size_metadata))
 
     # Build the object latency histogram if user requested it
     if FLAGS.object_storage_latency_histogram_interval and any(
@@ -0,0 +1,351 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measures the overhead of PKB itself.
+
+Runs on the machine running PKB, without creating any cloud resources, so that
+regressions in the controller show up as regular samples:
+
+  ./pkb.py --benchmarks=pkb_self
+
+The measurements are:
+  import: Importing perfkitbenchmarker.pkb in a new interpreter.
+  startup: Running PKB until it would issue its first command, i.e. through
+      importing modules and parsing flags, with a cold and a warm module index.
+  flag_parsing: Parsing this run's command line.
+  config_loading: Loading the default config of every benchmark.
+  benchmark_specs: Creating the BenchmarkSpecs of a large flag matrix.
+  publishing: Annotating and publishing samples to a JSON file.
+  issue_command: The overhead of vm_util.IssueCommand over running a command.
+
+The benchmark_specs measurement temporarily changes global flags, so pkb_self
+should not run concurrently with other benchmarks.
+"""
+
+import contextlib
+import copy
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from absl import flags
+from perfkitbenchmarker import benchmark_sets
+from perfkitbenchmarker import benchmark_spec as benchmark_spec_lib
+from perfkitbenchmarker import configs
+from perfkitbenchmarker import context
+from perfkitbenchmarker import linux_benchmarks
+from perfkitbenchmarker import publisher
+from perfkitbenchmarker import sample
+from perfkitbenchmarker import vm_util
+from perfkitbenchmarker import windows_benchmarks
+import yaml
+
+BENCHMARK_NAME = 'pkb_self'
+BENCHMARK_CONFIG = """
+pkb_self:
+  description: >
+      Measures the overhead of PKB itself: import and startup time, flag
+      parsing, config loading, BenchmarkSpec creation, sample publishing and
+      command execution. Runs locally.
+"""
+
+IMPORT = 'import'
+STARTUP = 'startup'
+FLAG_PARSING = 'flag_parsing'
+CONFIG_LOADING = 'config_loading'
+BENCHMARK_SPECS = 'benchmark_specs'
+PUBLISHING = 'publishing'
+ISSUE_COMMAND = 'issue_command'
+MEASUREMENTS = [IMPORT, STARTUP, FLAG_PARSING, CONFIG_LOADING, BENCHMARK_SPECS,
+                PUBLISHING, ISSUE_COMMAND]
+
+flags.DEFINE_multi_enum(
+    'pkb_self_measurements', MEASUREMENTS, MEASUREMENTS,
+    'The PKB overhead measurements to run.')
+flags.DEFINE_integer(
+    'pkb_self_iterations', 3,
+    'The number of times to run each import, startup, flag parsing and config '
+    'loading measurement. Their samples report the median.', lower_bound=1)
+flags.DEFINE_integer(
+    'pkb_self_flag_matrix_size', 256,
+    'The number of BenchmarkSpecs in the flag matrix created by the '
+    'benchmark_specs measurement.', lower_bound=1)
+flags.DEFINE_string(
+    'pkb_self_flag_matrix_benchmark', 'cluster_boot',
+    'The benchmark whose BenchmarkSpecs the benchmark_specs measurement '
+    'creates.')
+flags.DEFINE_integer(
+    'pkb_self_num_samples', 1000000,
+    'The number of samples published by the publishing measurement.',
+    lower_bound=1)
+flags.DEFINE_integer(
+    'pkb_self_num_commands', 100,
+    'The number of commands run by the issue_command measurement.',
+    lower_bound=1)
+
+FLAGS = flags.FLAGS
+
+# Samples are added and published in batches of this size, as a benchmark
+# would, so that they are not all held in memory at once.
+_PUBLISH_BATCH_SIZE = 10000
+# Exits PKB right after flag parsing, before it issues any command.
+_STARTUP_ARGS = ['--helpmatch=^$']
+_IMPORT_SCRIPT = """
+import time
+start = time.time()
+import perfkitbenchmarker.pkb
+print(time.time() - start)
+"""
+_STARTUP_SCRIPT = """
+import sys
+from perfkitbenchmarker import pkb
+sys.exit(pkb.Main())
+"""
+
+
+def GetConfig(user_config):
+  return configs.LoadConfig(BENCHMARK_CONFIG, user_config, BENCHMARK_NAME)
+
+
+def Prepare(benchmark_spec):
+  del benchmark_spec
+
+
+def _GetRootDir():
+  """Returns the directory containing the perfkitbenchmarker package."""
+  return os.path.dirname(os.path.dirname(os.path.dirname(
+      os.path.abspath(__file__))))
+
+
+def _MakeTimingSample(metric, times, metadata=None):
+  """Returns a sample of the median of times, in seconds."""
+  metadata = dict(metadata or {})
+  metadata.update({
+      'iterations': len(times),
+      'min': min(times),
+      'max': max(times),
+  })
+  return sample.Sample(metric, statistics.median(times), 'seconds', metadata)
+
+
+def _RunPython(script, args=(), env=None):
+  """Runs a script in a new interpreter and returns (stdout, seconds taken)."""
+  start = time.time()
+  stdout = subprocess.check_output(
+      [sys.executable, '-c', script] + list(args), cwd=_GetRootDir(), env=env,
+      stderr=subprocess.DEVNULL, universal_newlines=True)
+  return stdout, time.time() - start
+
+
+def _MeasureImport():
+  times = [float(_RunPython(_IMPORT_SCRIPT)[0])
+           for _ in range(FLAGS.pkb_self_iterations)]
+  return [_MakeTimingSample('PKB Import Time', times,
+                            {'module': 'perfkitbenchmarker.pkb'})]
+
+
+def _MeasureStartup():
+  """Measures the time to first command with a cold and a warm module index.
+
+  The module index is kept in the temp dir, so a new temp dir makes it cold.
+  """
+  cold_times = []
+  for _ in range(FLAGS.pkb_self_iterations):
+    with tempfile.TemporaryDirectory(dir=vm_util.GetTempDir()) as temp_dir:
+      env = dict(os.environ, TMPDIR=temp_dir)
+      cold_times.append(_RunPython(_STARTUP_SCRIPT, _STARTUP_ARGS, env)[1])
+  # Make sure the index is warm, e.g. if this run started with a cold one.
+  _RunPython(_STARTUP_SCRIPT, _STARTUP_ARGS)
+  warm_times = [_RunPython(_STARTUP_SCRIPT, _STARTUP_ARGS)[1]
+                for _ in range(FLAGS.pkb_self_iterations)]
+  metadata = {'args': ' '.join(_STARTUP_ARGS)}
+  return [
+      _MakeTimingSample('PKB Time To First Command', cold_times,
+                        dict(metadata, module_index='cold')),
+      _MakeTimingSample('PKB Time To First Command', warm_times,
+                        dict(metadata, module_index='warm')),
+  ]
+
+
+def _MeasureFlagParsing():
+  """Measures parsing this run's command line into a copy of the flags."""
+  times = []
+  for _ in range(FLAGS.pkb_self_iterations):
+    flag_values = copy.deepcopy(FLAGS)
+    flag_values.unparse_flags()
+    start = time.time()
+    flag_values(sys.argv)
+    times.append(time.time() - start)
+  return [_MakeTimingSample('Flag Parsing Time', times,
+                            {'num_args': len(sys.argv) - 1,
+                             'num_flags': len(flag_values)})]
+
+
+def _MeasureConfigLoading():
+  """Measures loading and merging the default config of every benchmark."""
+  modules = (list(linux_benchmarks.VALID_BENCHMARKS.values()) +
+             list(windows_benchmarks.VALID_BENCHMARKS.values()))
+  times = []
+  slowest = (0, None)
+  for _ in range(FLAGS.pkb_self_iterations):
+    total = 0
+    for module in modules:
+      start = time.time()
+      configs.LoadConfig(module.BENCHMARK_CONFIG, {}, module.BENCHMARK_NAME)
+      seconds = time.time() - start
+      total += seconds
+      slowest = max(slowest, (seconds, module.BENCHMARK_NAME))
+    times.append(total)
+  return [_MakeTimingSample('Config Loading Time', times,
+                            {'num_configs': len(modules),
+                             'slowest_config': slowest[1],
+                             'slowest_config_seconds': slowest[0]})]
+
+
+@contextlib.contextmanager
+def _SetFlags(**values):
+  """Sets flags as if they were on the command line, then restores them."""
+  saved = {name: (FLAGS[name].value, FLAGS[name].present) for name in values}
+  try:
+    for name, value in values.items():
+      FLAGS[name].value = value
+      FLAGS[name].present = 1
+    yield
+  finally:
+    for name, (value, present) in saved.items():
+      FLAGS[name].value = value
+      FLAGS[name].present = present
+
+
+def _MeasureBenchmarkSpecs():
+  """Measures creating the BenchmarkSpecs of a large flag matrix."""
+  benchmark = FLAGS.pkb_self_flag_matrix_benchmark
+  user_config = {
+      benchmark: {
+          'flag_matrix_defs': {
+              BENCHMARK_NAME: {
+                  'machine_type': ['pkb-self-%d' % i for i in
+                                   range(FLAGS.pkb_self_flag_matrix_size)],
+              },
+          },
+      },
+  }
+  config_path = vm_util.PrependTempDir('pkb_self_flag_matrix.yaml')
+  with open(config_path, 'w') as config_file:
+    yaml.safe_dump(user_config, config_file)
+  # Creating specs sets the thread's spec and counts them, so both are
+  # restored afterwards.
+  current_spec = context.GetThreadBenchmarkSpec()
+  total_benchmarks = benchmark_spec_lib.BenchmarkSpec.total_benchmarks
+  try:
+    with _SetFlags(benchmarks=[benchmark], flag_matrix=BENCHMARK_NAME,
+                   benchmark_config_file=config_path, config_override=[]):
+      start = time.time()
+      specs = benchmark_spec_lib.CreateBenchmarkSpecs(
+          benchmark_sets.GetBenchmarksFromFlags())
+      seconds = time.time() - start
+  finally:
+    context.SetThreadBenchmarkSpec(current_spec)
+    benchmark_spec_lib.BenchmarkSpec.total_benchmarks = total_benchmarks
+  return [
+      sample.Sample('Benchmark Spec Creation Time', seconds, 'seconds',
+                    {'benchmark': benchmark, 'num_specs': len(specs)}),
+      sample.Sample('Benchmark Spec Creation Time Per Spec',
+                    seconds / len(specs), 'seconds',
+                    {'benchmark': benchmark, 'num_specs': len(specs)}),
+  ]
+
+
+def _MeasurePublishing(benchmark_spec):
+  """Measures annotating and publishing samples to a JSON file."""
+  json_path = vm_util.PrependTempDir('pkb_self_samples.json')
+  collector = publisher.SampleCollector(
+      publishers=[publisher.NewlineDelimitedJSONPublisher(json_path, 'at')],
+      publishers_from_flags=False, add_default_publishers=False)
+  add_seconds = 0
+  publish_seconds = 0
+  remaining = FLAGS.pkb_self_num_samples
+  while remaining:
+    batch = [sample.Sample('Sample', i, 'count', {'index': i})
+             for i in range(min(remaining, _PUBLISH_BATCH_SIZE))]
+    remaining -= len(batch)
+    start = time.time()
+    collector.AddSamples(batch, BENCHMARK_NAME, benchmark_spec)
+    add_seconds += time.time() - start
+    start = time.time()
+    collector.PublishSamples()
+    publish_seconds += time.time() - start
+  os.remove(json_path)
+  total_seconds = add_seconds + publish_seconds
+  return [sample.Sample(
+      'Sample Publishing Throughput',
+      FLAGS.pkb_self_num_samples / total_seconds, 'samples/sec', {
+          'num_samples': FLAGS.pkb_self_num_samples,
+          'add_seconds': add_seconds,
+          'publish_seconds': publish_seconds,
+          'publisher': 'NewlineDelimitedJSONPublisher',
+      })]
+
+
+def _MeasureIssueCommand():
+  """Measures the overhead of IssueCommand over running a command directly."""
+  command = ['true']
+  start = time.time()
+  for _ in range(FLAGS.pkb_self_num_commands):
+    subprocess.check_call(command)
+  direct_seconds = (time.time() - start) / FLAGS.pkb_self_num_commands
+  start = time.time()
+  for _ in range(FLAGS.pkb_self_num_commands):
+    vm_util.IssueCommand(command)
+  issue_seconds = (time.time() - start) / FLAGS.pkb_self_num_commands
+  return [sample.Sample('IssueCommand Overhead', issue_seconds - direct_seconds,
+                        'seconds', {
+                            'command': ' '.join(command),
+                            'num_commands': FLAGS.pkb_self_num_commands,
+                            'issue_command_seconds': issue_seconds,
+                            'direct_seconds': direct_seconds,
+                        })]
+
+
+def Run(benchmark_spec):
+  """Runs the selected measurements.
+
+  Args:
+    benchmark_spec: The benchmark specification.
+
+  Returns:
+    A list of sample.Sample objects.
+  """
+  measurements = {
+      IMPORT: _MeasureImport,
+      STARTUP: _MeasureStartup,
+      FLAG_PARSING: _MeasureFlagParsing,
+      CONFIG_LOADING: _MeasureConfigLoading,
+      BENCHMARK_SPECS: _MeasureBenchmarkSpecs,
+      PUBLISHING: lambda: _MeasurePublishing(benchmark_spec),
+      ISSUE_COMMAND: _MeasureIssueCommand,
+  }
+  samples = []
+  for measurement in MEASUREMENTS:
+    if measurement in FLAGS.pkb_self_measurements:
+      samples.extend(measurements[measurement]())
+  for s in samples:
+    s.metadata['python_version'] = '%d.%d.%d' % sys.version_info[:3]
+  return samples
+
+
+def Cleanup(benchmark_spec):
+  del benchmark_spec
@@ -14,7 +14,8 @@
 """Contains package imports and a dictionary of package names and modules.
 
 All modules within this package are considered packages, and are loaded
-dynamically. Add non-package code to other packages.
+dynamically when they are looked up in PACKAGES. Add non-package code to other
+packages.
 
 Packages should, at a minimum, define install functions for each type of
 package manager (e.g. YumInstall(vm) and AptInstall(vm)).
@@ -43,14 +44,17 @@ from perfkitbenchmarker import import_util
 INSTALL_DIR = '/opt/pkb'
 
 
-def _LoadPackages():
-  packages = dict([(module.__name__.split('.')[-1], module) for module in
-                   import_util.LoadModulesForPath(__path__, __name__)])
-  packages.update(packages['docker'].CreateImagePackages())
-  return packages
+def _GetPackageEntries(module):
+  """Returns the packages of a module: itself, and any image packages."""
+  entries = [(module.__name__.split('.')[-1], {})]
+  if hasattr(module, 'CreateImagePackages'):
+    entries.extend((name, {'factory': 'CreateImagePackages'})
+                   for name, _ in module.CreateImagePackages())
+  return entries
 
 
-PACKAGES = _LoadPackages()
+# Package modules are imported when they are looked up.
+PACKAGES = import_util.ModuleRegistry(__path__, __name__, _GetPackageEntries)
 
 
 def GetPipPackageVersion(vm, package_name):
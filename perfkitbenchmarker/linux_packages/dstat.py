@@ -21,6 +21,7 @@ from __future__ import print_function
 import csv
 import itertools
 import numpy as np
+from perfkitbenchmarker import parse_executor
 from six.moves import zip
 
 
@@ -81,6 +82,20 @@ def ParseCsvFile(fp):
   return labels, np.array(data, dtype=float)
 
 
+@parse_executor.Parser
+def ParseCsvPath(path):
+  """Parse a dstat results file in csv format.
+
+  Args:
+    path: string. Path of the file.
+
+  Returns:
+    A tuple of list of dstat labels and ndarray containing parsed data.
+  """
+  with open(path) as f:
+    return ParseCsvFile(iter(f))
+
+
 def _Install(vm):
   """Installs the dstat package on the VM."""
   vm.InstallPackages('dstat')
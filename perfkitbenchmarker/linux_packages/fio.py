@@ -26,7 +26,9 @@ import logging
 import time
 from absl import flags
 from perfkitbenchmarker import errors
+from perfkitbenchmarker import histogram as histogram_lib
 from perfkitbenchmarker import linux_packages
+from perfkitbenchmarker import parse_executor
 from perfkitbenchmarker import regex_util
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import vm_util
@@ -149,6 +151,7 @@ def FioParametersToJob(fio_parameters):
                                 JOB_STONEWALL_PARAMETER)
 
 
+@parse_executor.Parser
 def ParseResults(job_file, fio_json_result, base_metadata=None,
                  log_file_base='', bin_vals=None,
                  skip_latency_individual_stats=False):
@@ -259,7 +262,7 @@ def ParseResults(job_file, fio_json_result, base_metadata=None,
                           job[mode]['iops'], '', parameters, timestamp))
     if log_file_base and bin_vals:
       # Parse histograms
-      aggregates = collections.defaultdict(collections.Counter)
+      aggregates = collections.defaultdict(histogram_lib.Histogram)
       for _ in range(int(parameters.get('numjobs', 1))):
         clat_hist_idx += 1
         hist_file_path = vm_util.PrependTempDir(
@@ -267,7 +270,7 @@ def ParseResults(job_file, fio_json_result, base_metadata=None,
         hists = _ParseHistogram(hist_file_path, bin_vals[clat_hist_idx - 1])
 
         for key in hists:
-          aggregates[key].update(hists[key])
+          aggregates[key].Merge(hists[key])
       samples += _BuildHistogramSamples(aggregates, job_name, parameters)
 
   return samples
@@ -317,28 +320,21 @@ def _ParseHistogram(hist_log_file, mean_bin_vals):
     mean_bin_vals: List of float. Representing the mean value of each bucket.
 
   Returns:
-    A dict of the histograms, keyed by (data direction, block size).
+    A dict of the histogram.Histograms, keyed by (data direction, block size).
   """
   if not mean_bin_vals:
     logging.warning('Skipping log file %s.', hist_log_file)
     return {}
-  aggregates = dict()
+  aggregates = collections.defaultdict(histogram_lib.Histogram)
   with open(hist_log_file) as f:
     reader = csv.reader(f, delimiter=',')
     for r in reader:
       # Use (data direction, block size) as key
       key = (DATA_DIRECTION[int(r[1])], int(r[2]))
+      counts = [int(v) for v in r[HIST_BUCKET_START_IDX:]]
+      aggregates[key].Record(mean_bin_vals[:len(counts)], counts)
 
-      hist_list = []
-      for idx, v in enumerate(r[HIST_BUCKET_START_IDX:]):
-        if int(v):
-          hist_list.append((mean_bin_vals[idx], int(v)))
-      todict = dict(hist_list)
-      if key not in aggregates:
-        aggregates[key] = collections.Counter()
-      aggregates[key].update(todict)
-
-  return aggregates
+  return dict(aggregates)
 
 
 def _BuildHistogramSamples(aggregates, metric_prefix='',
@@ -353,8 +349,9 @@ def _BuildHistogramSamples(aggregates, metric_prefix='',
       samples.Sample object that reports the fio histogram.
   """
   samples = []
-  for (rw, bs) in aggregates.keys():
-    metadata = {'histogram': json.dumps(aggregates[(rw, bs)])}
+  for (rw, bs), histogram in aggregates.items():
+    metadata = {'histogram': json.dumps(dict(histogram.GetItems()))}
+    metadata.update(histogram.GetMetadata())
     if additional_metadata:
       metadata.update(additional_metadata)
     samples.append(
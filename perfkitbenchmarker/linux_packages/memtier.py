@@ -23,6 +23,7 @@ import json
 import logging
 import re
 from absl import flags
+from perfkitbenchmarker import histogram as histogram_lib
 from perfkitbenchmarker import linux_packages
 from perfkitbenchmarker import sample
 
@@ -246,8 +247,8 @@ def ParseResults(memtier_results, meta):
   GET              40       100.00
   GET              41       100.00
   """
-  set_histogram = []
-  get_histogram = []
+  set_histogram = histogram_lib.Histogram()
+  get_histogram = histogram_lib.Histogram()
   total_requests = FLAGS.memtier_requests
   approx_total_sets = round(float(total_requests) / (FLAGS.memtier_ratio + 1))
   last_total_sets = 0
@@ -277,7 +278,10 @@ def ParseResults(memtier_results, meta):
 
   for name, histogram in [('get', get_histogram), ('set', set_histogram)]:
     hist_meta = meta.copy()
-    hist_meta.update({'histogram': json.dumps(histogram)})
+    hist_meta.update({'histogram': json.dumps(
+        [{'microsec': microsec, 'count': count}
+         for microsec, count in histogram.GetItems()])})
+    hist_meta.update(histogram.GetMetadata())
     yield sample.Sample('{0} latency histogram'.format(name), 0, '', hist_meta)
 
 
@@ -290,8 +294,7 @@ def _ParseLine(pattern, line, approx_total, last_total, histogram):
   counts = _ConvertPercentToAbsolute(approx_total, float(percent))
   bucket_counts = int(round(counts - last_total))
   if bucket_counts > 0:
-    histogram.append({'microsec': float(msec) * 1000,
-                      'count': bucket_counts})
+    histogram.Record(float(msec) * 1000, bucket_counts)
   return counts
 
 
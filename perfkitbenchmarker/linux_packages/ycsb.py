@@ -39,7 +39,6 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import bisect
 import collections
 import copy
 import csv
@@ -53,10 +52,13 @@ import posixpath
 import re
 import time
 from absl import flags
+import numpy as np
 from perfkitbenchmarker import data
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import events
+from perfkitbenchmarker import histogram as histogram_lib
 from perfkitbenchmarker import linux_packages
+from perfkitbenchmarker import parse_executor
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.linux_packages import maven
@@ -335,6 +337,7 @@ def AptInstall(vm):
   _Install(vm)
 
 
+@parse_executor.Parser
 def ParseResults(ycsb_result_string, data_type='histogram'):
   """Parse YCSB results.
 
@@ -580,51 +583,14 @@ def ParseHdrLogs(hdrlogs):
   return parsed_hdr_histograms
 
 
-def _CumulativeSum(xs):
-  total = 0
-  for x in xs:
-    total += x
-    yield total
-
-
-def _WeightedQuantile(x, weights, p):
-  """Weighted quantile measurement for an ordered list.
-
-  This method interpolates to the higher value when the quantile is not a direct
-  member of the list. This works well for YCSB, since latencies are floored.
-
-  Args:
-    x: List of values.
-    weights: List of numeric weights.
-    p: float. Desired quantile in the interval [0, 1].
-
-  Returns:
-    float.
-
-  Raises:
-    ValueError: When 'x' and 'weights' are not the same length, or 'p' is not in
-      the interval [0, 1].
-  """
-  if len(x) != len(weights):
-    raise ValueError('Lengths do not match: {0} != {1}'.format(
-        len(x), len(weights)))
-  if p < 0 or p > 1:
-    raise ValueError('Invalid quantile: {0}'.format(p))
-  n = sum(weights)
-  target = n * float(p)
-  cumulative = list(_CumulativeSum(weights))
-
-  # Find the first cumulative weight >= target
-  i = bisect.bisect_left(cumulative, target)
-  if i == len(x):
-    return x[-1]
-  else:
-    return x[i]
-
-
 def _PercentilesFromHistogram(ycsb_histogram, percentiles=_DEFAULT_PERCENTILES):
   """Calculate percentiles for from a YCSB histogram.
 
+  The p-th percentile is the lowest latency that is at least as high as p
+  percent of the latencies. This works well for YCSB, since latencies are
+  floored. Percentiles are computed on the exact latencies rather than on a
+  histogram_lib.Histogram, whose buckets merge distinct latencies.
+
   Args:
     ycsb_histogram: List of (time_ms, frequency) tuples.
     percentiles: iterable of floats, in the interval [0, 100].
@@ -635,16 +601,23 @@ def _PercentilesFromHistogram(ycsb_histogram, percentiles=_DEFAULT_PERCENTILES):
     ValueError: If one or more percentiles are outside [0, 100].
   """
   result = collections.OrderedDict()
-  histogram = sorted(ycsb_histogram)
+  labels = []
+  quantiles = []
   for percentile in percentiles:
     if percentile < 0 or percentile > 100:
       raise ValueError('Invalid percentile: {0}'.format(percentile))
     if math.modf(percentile)[0] < 1e-7:
       percentile = int(percentile)
-    label = 'p{0}'.format(percentile)
-    latencies, freqs = list(zip(*histogram))
-    time_ms = _WeightedQuantile(latencies, freqs, percentile * 0.01)
-    result[label] = time_ms
+    labels.append('p{0}'.format(percentile))
+    quantiles.append(percentile * 0.01)
+  histogram = sorted(ycsb_histogram)
+  latencies = [latency for latency, _ in histogram]
+  cumulative_counts = np.cumsum([count for _, count in histogram])
+  # The first latency whose cumulative count reaches the target count.
+  indices = np.searchsorted(cumulative_counts,
+                            cumulative_counts[-1] * np.array(quantiles))
+  for label, i in zip(labels, np.minimum(indices, len(latencies) - 1)):
+    result[label] = latencies[i]
   return result
 
 
@@ -865,12 +838,14 @@ def _CreateSamples(ycsb_result, include_histogram=False, **kwargs):
         yield sample.Sample(' '.join([group_name, label, 'latency']),
                             value, 'ms', meta)
       if include_histogram:
+        latency_histogram = histogram_lib.Histogram.FromItems(histogram)
         histogram = []
         for _, value, bucket_count in group[HDRHISTOGRAM]:
           histogram.append({'microsec_latency': int(value * 1000),
                             'count': bucket_count})
         hist_meta = meta.copy()
         hist_meta.update({'histogram': json.dumps(histogram)})
+        hist_meta.update(latency_histogram.GetMetadata())
         yield sample.Sample('{0} latency histogram'.format(group_name),
                             0, '', hist_meta)
 
@@ -972,7 +947,8 @@ class YCSBExecutor(object):
       kwargs[param] = value
     command = self._BuildCommand('load', **kwargs)
     stdout, stderr = vm.RobustRemoteCommand(command, should_log=True)
-    return ParseResults(str(stderr + stdout), self.measurement_type)
+    return parse_executor.Parse(ParseResults, str(stderr + stdout),
+                                self.measurement_type)
 
   def _LoadThreaded(self, vms, workload_file, **kwargs):
     """Runs "Load" in parallel for each VM in VMs.
@@ -1061,7 +1037,12 @@ class YCSBExecutor(object):
     return samples
 
   def _Run(self, vm, **kwargs):
-    """Run a single workload from a client vm."""
+    """Run a single workload from a client vm.
+
+    Returns:
+      A parse_executor.ParseJob parsing the results, which may still be running
+      in the parse pool so that it overlaps the next run.
+    """
     for pv in FLAGS.ycsb_run_parameters:
       param, value = pv.split('=', 1)
       kwargs[param] = value
@@ -1073,10 +1054,15 @@ class YCSBExecutor(object):
     if hdr_files_dir:
       vm.RemoteCommand('mkdir -p {0}'.format(hdr_files_dir))
     stdout, stderr = vm.RobustRemoteCommand(command, should_log=True)
-    return ParseResults(str(stderr + stdout), self.measurement_type)
+    return parse_executor.Submit(ParseResults, str(stderr + stdout),
+                                 self.measurement_type)
 
   def _RunThreaded(self, vms, **kwargs):
-    """Run a single workload using `vms`."""
+    """Run a single workload using `vms`.
+
+    Returns:
+      List of the clients' parse_executor.ParseJobs.
+    """
     target = kwargs.pop('target', None)
     if target is not None:
       target_per_client = target // len(vms)
@@ -1168,6 +1154,72 @@ class YCSBExecutor(object):
     """
     all_results = []
     parameters = {}
+    pending_step = None
+
+    def _StartStairCaseLoad(client_count,
+                            target_qps_per_vm,
+                            workload_meta,
+                            is_sustained=False):
+      """Runs a step and returns the state to finish it with."""
+      parameters['threads'] = client_count
+      if target_qps_per_vm:
+        parameters['target'] = int(target_qps_per_vm * len(vms))
+      else:
+        parameters.pop('target', None)
+      if is_sustained:
+        parameters['maxexecutiontime'] = (
+            FLAGS.ycsb_dynamic_load_sustain_timelimit)
+      start = time.time()
+      jobs = self._RunThreaded(vms, **parameters)
+      events.record_event.send(
+          type(self).__name__, event='run', start_timestamp=start,
+          end_timestamp=time.time(), metadata=copy.deepcopy(parameters))
+      client_meta = workload_meta.copy()
+      client_meta.update(parameters)
+      client_meta.update(clients=len(vms) * client_count,
+                         threads_per_client_vm=client_count)
+      combined_log = None
+      if self.measurement_type == HDRHISTOGRAM:
+        # The next step overwrites the hdr log files.
+        combined_log = self.CombineHdrHistogramLogFiles(
+            parameters['hdrhistogram.output.path'], vms)
+      return jobs, client_meta, combined_log
+
+    def _FinishStairCaseLoad(jobs, client_meta, combined_log):
+      """Collects the results of a step started by _StartStairCaseLoad.
+
+      Returns:
+        A tuple of the overall throughput, the individual samples and the
+        combined samples of the step.
+      """
+      results = [job.Result() for job in jobs]
+      individual_samples = []
+      if FLAGS.ycsb_include_individual_results and len(results) > 1:
+        for i, result in enumerate(results):
+          individual_samples.extend(_CreateSamples(
+              result,
+              result_type='individual',
+              result_index=i,
+              include_histogram=FLAGS.ycsb_histogram,
+              **client_meta))
+
+      if combined_log is not None:
+        parsed_hdr = ParseHdrLogs(combined_log)
+        combined = _CombineResults(
+            results, self.measurement_type, parsed_hdr)
+      else:
+        combined = _CombineResults(results, self.measurement_type, {})
+      run_samples = list(_CreateSamples(
+          combined, result_type='combined',
+          include_histogram=FLAGS.ycsb_histogram,
+          **client_meta))
+
+      overall_throughput = 0
+      for s in run_samples:
+        if s.metric == 'overall Throughput':
+          overall_throughput += s.value
+      return overall_throughput, individual_samples, run_samples
+
     for workload_index, workload_file in enumerate(workloads):
       if FLAGS.ycsb_operation_count:
         parameters = {'operationcount': FLAGS.ycsb_operation_count}
@@ -1211,70 +1263,33 @@ class YCSBExecutor(object):
       parameters['parameter_files'] = [remote_path]
 
       for client_count, target_qps_per_vm in _GetThreadsQpsPerLoaderList():
-
-        def _DoRunStairCaseLoad(client_count,
-                                target_qps_per_vm,
-                                workload_meta,
-                                is_sustained=False):
-          parameters['threads'] = client_count
-          if target_qps_per_vm:
-            parameters['target'] = int(target_qps_per_vm * len(vms))
-          else:
-            parameters.pop('target', None)
-          if is_sustained:
-            parameters['maxexecutiontime'] = (
-                FLAGS.ycsb_dynamic_load_sustain_timelimit)
-          start = time.time()
-          results = self._RunThreaded(vms, **parameters)
-          events.record_event.send(
-              type(self).__name__, event='run', start_timestamp=start,
-              end_timestamp=time.time(), metadata=copy.deepcopy(parameters))
-          client_meta = workload_meta.copy()
-          client_meta.update(parameters)
-          client_meta.update(clients=len(vms) * client_count,
-                             threads_per_client_vm=client_count)
-
-          if FLAGS.ycsb_include_individual_results and len(results) > 1:
-            for i, result in enumerate(results):
-              all_results.extend(_CreateSamples(
-                  result,
-                  result_type='individual',
-                  result_index=i,
-                  include_histogram=FLAGS.ycsb_histogram,
-                  **client_meta))
-
-          if self.measurement_type == HDRHISTOGRAM:
-            combined_log = self.CombineHdrHistogramLogFiles(
-                parameters['hdrhistogram.output.path'], vms)
-            parsed_hdr = ParseHdrLogs(combined_log)
-            combined = _CombineResults(
-                results, self.measurement_type, parsed_hdr)
-          else:
-            combined = _CombineResults(results, self.measurement_type, {})
-          run_samples = list(_CreateSamples(
-              combined, result_type='combined',
-              include_histogram=FLAGS.ycsb_histogram,
-              **client_meta))
-
-          overall_throughput = 0
-          for s in run_samples:
-            if s.metric == 'overall Throughput':
-              overall_throughput += s.value
-          return overall_throughput, run_samples
-
-        target_throughput, run_samples = _DoRunStairCaseLoad(
-            client_count, target_qps_per_vm, workload_meta)
+        step = _StartStairCaseLoad(client_count, target_qps_per_vm,
+                                   workload_meta)
+        # A step's results are parsed while the next step runs, unless the
+        # dynamic load needs them to choose the next step's target.
+        if pending_step:
+          _, individual_samples, run_samples = _FinishStairCaseLoad(
+              *pending_step)
+          all_results.extend(individual_samples + run_samples)
+          pending_step = None
+        if not FLAGS.ycsb_dynamic_load:
+          pending_step = step
+          continue
+        target_throughput, individual_samples, run_samples = (
+            _FinishStairCaseLoad(*step))
 
         # Uses 5 * unthrottled throughput as starting point.
         target_throughput *= 5
-        all_results.extend(run_samples)
+        all_results.extend(individual_samples + run_samples)
         is_sustained = False
         while FLAGS.ycsb_dynamic_load:
-          actual_throughput, run_samples = _DoRunStairCaseLoad(
-              client_count,
-              target_throughput // len(vms),
-              workload_meta,
-              is_sustained)
+          actual_throughput, individual_samples, run_samples = (
+              _FinishStairCaseLoad(*_StartStairCaseLoad(
+                  client_count,
+                  target_throughput // len(vms),
+                  workload_meta,
+                  is_sustained)))
+          all_results.extend(individual_samples)
           is_sustained = FLAGS.ycsb_dynamic_load_sustain_throughput_ratio < (
               actual_throughput / target_throughput)
           for s in run_samples:
@@ -1285,6 +1300,9 @@ class YCSBExecutor(object):
           if target_throughput is None:
             break
 
+    if pending_step:
+      _, individual_samples, run_samples = _FinishStairCaseLoad(*pending_step)
+      all_results.extend(individual_samples + run_samples)
     return all_results
 
   def CombineHdrHistogramLogFiles(self, hdr_files_dir, vms):
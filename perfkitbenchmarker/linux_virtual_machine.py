@@ -39,13 +39,19 @@ from typing import Dict, Set
 import uuid
 
 from absl import flags
+from perfkitbenchmarker import background_tasks
+from perfkitbenchmarker import command_profiler
 from perfkitbenchmarker import context
 from perfkitbenchmarker import disk
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import linux_packages
 from perfkitbenchmarker import os_types
 from perfkitbenchmarker import regex_util
+from perfkitbenchmarker import robust_command_stream
+from perfkitbenchmarker import ssh_session_pool
+from perfkitbenchmarker import ssh_tar_copy
 from perfkitbenchmarker import virtual_machine
+from perfkitbenchmarker import vm_pool  # noqa  Defines --vm_pool.
 from perfkitbenchmarker import vm_util
 
 import yaml
@@ -58,6 +64,9 @@ CLEAR_BUILD_REGEXP = r'Installed version:\s*(.*)\s*'
 UPDATE_RETRIES = 5
 DEFAULT_SSH_PORT = 22
 REMOTE_KEY_PATH = '~/.ssh/id_rsa'
+# Concurrency class (see --concurrency_classes) of file copies to or from VMs.
+SCP_CONCURRENCY_CLASS = 'scp'
+background_tasks.RegisterConcurrencyClass(SCP_CONCURRENCY_CLASS)
 CONTAINER_MOUNT_DIR = '/mnt'
 CONTAINER_WORK_DIR = '/root'
 
@@ -246,6 +255,66 @@ class CpuVulnerabilities:
     return ret
 
 
+def _BuildBatchScript(commands, marker, stop_on_error):
+  """Returns a shell script running commands for RemoteCommandBatch.
+
+  After each command the script writes a line with the marker, the index of the
+  command, its return code and its start and end times in nanoseconds to
+  stdout, and a line with the marker and index to stderr. Both lines are
+  preceded by a newline so that output without a trailing newline is
+  preserved.
+
+  Args:
+    commands: A list of valid bash commands.
+    marker: A string that does not appear in the output of the commands.
+    stop_on_error: Whether the script exits after the first failing command.
+
+  Returns:
+    The script as a single command string.
+  """
+  steps = []
+  for i, command in enumerate(commands):
+    step = ('_pkb_start=$(date +%%s%%N); '
+            '"${SHELL:-/bin/sh}" -c %s </dev/null; _pkb_rc=$?; '
+            'printf "\\n%s %d %%s %%s %%s\\n" "$_pkb_rc" "$_pkb_start" '
+            '"$(date +%%s%%N)"; '
+            'printf "\\n%s %d\\n" >&2' %
+            (pipes.quote(command), marker, i, marker, i))
+    if stop_on_error:
+      step += '; [ "$_pkb_rc" -eq 0 ] || exit 0'
+    steps.append(step)
+  return '; '.join(steps)
+
+
+def _ParseBatchOutput(stdout, stderr, marker):
+  """Splits the output of a script from _BuildBatchScript by command.
+
+  Args:
+    stdout: The stdout of the script.
+    stderr: The stderr of the script.
+    marker: The marker passed to _BuildBatchScript.
+
+  Returns:
+    A tuple of a list of (stdout, stderr, return_code) tuples and a list of
+    elapsed times in milliseconds (None if unknown), one entry per command that
+    finished.
+  """
+  results = []
+  timings = []
+  stderr_parts = re.split(r'\n%s \d+\n' % marker, stderr)
+  start = 0
+  footers = re.finditer(r'\n%s \d+ (\d+) (\S*) (\S*)\n' % marker, stdout)
+  for i, match in enumerate(footers):
+    command_stdout = stdout[start:match.start()]
+    start = match.end()
+    command_stderr = stderr_parts[i] if i < len(stderr_parts) else ''
+    results.append((command_stdout, command_stderr, int(match.group(1))))
+    started, ended = match.group(2), match.group(3)
+    timings.append((int(ended) - int(started)) // 1000000
+                   if started.isdigit() and ended.isdigit() else None)
+  return results, timings
+
+
 class BaseLinuxMixin(virtual_machine.BaseOsMixin):
   """Class that holds Linux related VM methods and attributes."""
 
@@ -294,13 +363,15 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     """
     with self._remote_command_script_upload_lock:
       if not self._has_remote_command_script:
-        for f in (EXECUTE_COMMAND, WAIT_FOR_COMMAND):
-          remote_path = os.path.join(vm_util.VM_TMP_DIR, os.path.basename(f))
-          if os.path.basename(remote_path):
-            self.RemoteCommand('sudo rm -f ' + remote_path)
-          self.PushDataFile(f, remote_path)
+        data_file_pairs = [
+            (f, os.path.join(vm_util.VM_TMP_DIR, os.path.basename(f)))
+            for f in (EXECUTE_COMMAND, WAIT_FOR_COMMAND)]
+        self.RemoteCommand('sudo rm -f ' + ' '.join(
+            remote_path for _, remote_path in data_file_pairs))
+        self.PushDataFiles(data_file_pairs)
         self._has_remote_command_script = True
 
+  @command_profiler.AttributeToVm
   def RobustRemoteCommand(self, command, should_log=False, timeout=None,
                           ignore_failure=False):
     """Runs a command on the VM in a more robust way than RemoteCommand.
@@ -323,6 +394,11 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     remote command actually returns 255, SSH will return 1 instead to bypass
     retry behavior.
 
+    With --robust_remote_command_streaming, WAIT_FOR_COMMAND instead streams
+    the command's output over one connection while it runs, and is restarted
+    from the last byte received if the connection drops. See
+    robust_command_stream.
+
     Args:
       command: The command to run.
       should_log: Whether to log the command's output at the info level. The
@@ -368,23 +444,47 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
                                          wrapper_log)
     self.RemoteCommand(start_command)
 
+    wait_command = ['python', wait_path,
+                    '--status', status_file,
+                    '--exclusive', exclusive_file]  # pyformat: disable
+
+    def _FollowCommand():
+      follow_command = wait_command + ['--stdout', stdout_file,
+                                       '--stderr', stderr_file,
+                                       '--follow']  # pyformat: disable
+
+      def _BuildCmd(stdout_offset, stderr_offset):
+        return self._GetRemoteCommandSshCommand(' '.join(follow_command + [
+            '--stdout_offset', str(stdout_offset),
+            '--stderr_offset', str(stderr_offset)]))  # pyformat: disable
+
+      stdout, stderr, retcode = robust_command_stream.Follow(
+          _BuildCmd, should_log=should_log, retries=FLAGS.ssh_retries)
+      self.RemoteCommand(
+          'rm -f %s %s %s' % (stdout_file, stderr_file, status_file),
+          ignore_failure=True)
+      if retcode and not ignore_failure:
+        raise errors.VirtualMachine.RemoteCommandError(
+            'Got non-zero return code (%s) executing %s\nSTDOUT: %sSTDERR: %s' %
+            (retcode, command, stdout, stderr))
+      return stdout, stderr
+
     def _WaitForCommand():
-      wait_command = ['python', wait_path,
-                      '--status', status_file,
-                      '--exclusive', exclusive_file]  # pyformat: disable
       stdout = ''
       while 'Command finished.' not in stdout:
         stdout, _ = self.RemoteCommand(
             ' '.join(wait_command), should_log=should_log, timeout=1800)
-      wait_command.extend([
+      fetch_command = wait_command + [
           '--stdout', stdout_file,
           '--stderr', stderr_file,
           '--delete',
-      ])  # pyformat: disable
-      return self.RemoteCommand(' '.join(wait_command), should_log=should_log,
+      ]  # pyformat: disable
+      return self.RemoteCommand(' '.join(fetch_command), should_log=should_log,
                                 ignore_failure=ignore_failure)
 
     try:
+      if FLAGS.robust_remote_command_streaming:
+        return _FollowCommand()
       return _WaitForCommand()
     except errors.VirtualMachine.RemoteCommandError:
       # In case the error was with the wrapper script itself, print the log.
@@ -432,7 +532,7 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
       self.SetupRemoteFirewall()
     if self.install_packages:
       self._CreateInstallDir()
-      if self.is_static:
+      if self.is_static or FLAGS.vm_pool:
         self.SnapshotPackages()
       self.SetupPackageManager()
       self.Install('python')
@@ -456,10 +556,11 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
   def SetFiles(self):
     """Apply --set_files to the VM."""
 
+    commands = []
     for pair in FLAGS.set_files:
       path, value = pair.split('=')
-      self.RemoteCommand('echo "%s" | sudo tee %s' %
-                         (value, path))
+      commands.append('echo "%s" | sudo tee %s' % (value, path))
+    self.RemoteCommandBatch(commands)
 
   def _DisableCpus(self):
     """Apply num_disable_cpus to the VM.
@@ -484,10 +585,9 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     # of cpus for symmetry. So disable the last cpus in the range.
     # e.g.  If num_cpus = 4 and num_disable_cpus = 2,
     # then want cpus 0,1 active and 2,3 inactive.
-    for x in range(self.num_cpus - self.num_disable_cpus, self.num_cpus):
-      self.RemoteCommand('sudo bash -c '
-                         '"echo 0 > /sys/devices/system/cpu/cpu%s/online"' %
-                         x)
+    self.RemoteCommandBatch([
+        'sudo bash -c "echo 0 > /sys/devices/system/cpu/cpu%s/online"' % x
+        for x in range(self.num_cpus - self.num_disable_cpus, self.num_cpus)])
 
   def UpdateEnvironmentPath(self):
     """Specific Linux flavors should override this."""
@@ -513,9 +613,9 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     if not sysctl_params:
       return
 
-    for key, value in sysctl_params.items():
-      self.RemoteCommand('sudo bash -c \'echo "%s=%s" >> /etc/sysctl.conf\''
-                         % (key, value))
+    self.RemoteCommandBatch([
+        'sudo bash -c \'echo "%s=%s" >> /etc/sysctl.conf\'' % (key, value)
+        for key, value in sysctl_params.items()])
 
     self._needs_reboot = True
 
@@ -752,8 +852,9 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     Deletes the temp directory, restores packages, and uninstalls all
     PerfKit packages.
     """
-    for package_name in self._installed_packages:
+    for package_name in list(self._installed_packages):
       self.Uninstall(package_name)
+    self._installed_packages.clear()
     self.RestorePackages()
     self.RemoteCommand('sudo rm -rf %s' % linux_packages.INSTALL_DIR)
 
@@ -843,6 +944,66 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
   def RemoteCopy(self, file_path, remote_path='', copy_to=True):
     self.RemoteHostCopy(file_path, remote_path, copy_to)
 
+  def _GetSshCommand(self, connect_timeout=None):
+    """Returns the ssh command, without a remote command, for this VM."""
+    user_host = '%s@%s' % (self.user_name, self.GetConnectionIp())
+    ssh_cmd = ['ssh', '-A', '-p', str(self.ssh_port), user_host]
+    ssh_private_key = (self.ssh_private_key if self.is_static else
+                       vm_util.GetPrivateKeyPath())
+    ssh_cmd.extend(vm_util.GetSshOptions(ssh_private_key,
+                                         connect_timeout=connect_timeout))
+    return ssh_cmd
+
+  def _GetRemoteCommandSshCommand(self, command):
+    """Returns the ssh command running command where RemoteCommand would."""
+    return self._GetSshCommand() + [command]
+
+  def PushFiles(self, file_pairs):
+    """Copies several files or directories to the VM.
+
+    With --ssh_tar_copy, the files are copied in one tar stream. Otherwise
+    they are copied one at a time with PushFile.
+
+    Args:
+      file_pairs: An iterable of (source_path, remote_path) tuples, as passed
+          to PushFile.
+    """
+    if FLAGS.ssh_tar_copy and not vm_util.RunningOnWindows():
+      self.RemoteHostCopyFiles(file_pairs)
+    else:
+      super(BaseLinuxMixin, self).PushFiles(file_pairs)
+
+  @command_profiler.AttributeToVm
+  def RemoteHostCopyFiles(self, file_pairs, copy_to=True):
+    """Copies several files or directories to or from the VM at once.
+
+    The files are sent as a single tar stream over one ssh connection (see
+    ssh_tar_copy), compressed according to --ssh_tar_copy_compression.
+
+    Args:
+      file_pairs: An iterable of (file_path, remote_path) tuples, as passed to
+          RemoteHostCopy.
+      copy_to: True to copy to vm, False to copy from vm.
+
+    Returns:
+      An ssh_tar_copy.TransferSummary, or None if the files were copied one at a
+      time.
+
+    Raises:
+      RemoteCommandError: If there was a problem copying the files.
+    """
+    file_pairs = list(file_pairs)
+    if vm_util.RunningOnWindows():
+      for file_path, remote_path in file_pairs:
+        self.RemoteHostCopy(file_path, remote_path, copy_to)
+      return None
+    ssh_cmd = self._GetSshCommand(connect_timeout=FLAGS.scp_connect_timeout)
+    copy_function = ssh_tar_copy.Push if copy_to else ssh_tar_copy.Pull
+    with background_tasks.ConcurrencySlot(SCP_CONCURRENCY_CLASS):
+      return copy_function(ssh_cmd, file_pairs,
+                           compression=FLAGS.ssh_tar_copy_compression)
+
+  @command_profiler.AttributeToVm
   def RemoteHostCopy(self, file_path, remote_path='', copy_to=True):
     """Copies a file to or from the VM.
 
@@ -854,6 +1015,9 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     Raises:
       RemoteCommandError: If there was a problem copying the file.
     """
+    if FLAGS.ssh_tar_copy and not vm_util.RunningOnWindows():
+      self.RemoteHostCopyFiles([(file_path, remote_path)], copy_to)
+      return
     if vm_util.RunningOnWindows():
       if ':' in file_path:
         # scp doesn't like colons in paths.
@@ -874,8 +1038,9 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     else:
       scp_cmd.extend([remote_location, file_path])
 
-    stdout, stderr, retcode = vm_util.IssueCommand(scp_cmd, timeout=None,
-                                                   raise_on_failure=False)
+    with background_tasks.ConcurrencySlot(SCP_CONCURRENCY_CLASS):
+      stdout, stderr, retcode = vm_util.IssueCommand(scp_cmd, timeout=None,
+                                                     raise_on_failure=False)
 
     if retcode:
       full_cmd = ' '.join(scp_cmd)
@@ -916,6 +1081,7 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     """
     return self.RemoteHostCommandWithReturnCode(*args, **kwargs)
 
+  @command_profiler.AttributeToVm
   def RemoteHostCommandWithReturnCode(self,
                                       command,
                                       should_log=False,
@@ -955,24 +1121,32 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
       # Multi-line commands passed to ssh won't work on Windows unless the
       # newlines are escaped.
       command = command.replace('\n', '\\n')
-    ip_address = self.GetConnectionIp()
-    user_host = '%s@%s' % (self.user_name, ip_address)
-    ssh_cmd = ['ssh', '-A', '-p', str(self.ssh_port), user_host]
-    ssh_private_key = (self.ssh_private_key if self.is_static else
-                       vm_util.GetPrivateKeyPath())
-    ssh_cmd.extend(vm_util.GetSshOptions(ssh_private_key))
+    ssh_cmd = self._GetSshCommand()
+    # Commands needing a login shell require a pseudo-tty, which the
+    # persistent sessions do not provide.
+    use_session_pool = (FLAGS.ssh_session_pool and not login_shell and
+                        not vm_util.RunningOnWindows())
     try:
       if login_shell:
         ssh_cmd.extend(['-t', '-t', 'bash -l -c "%s"' % command])
         self._pseudo_tty_lock.acquire()
+      elif use_session_pool:
+        ssh_cmd.extend(['-T', ssh_session_pool.REMOTE_SHELL])
       else:
         ssh_cmd.append(command)
 
       for _ in range(retries):
-        stdout, stderr, retcode = vm_util.IssueCommand(
-            ssh_cmd, force_info_log=should_log,
-            suppress_warning=suppress_warning,
-            timeout=timeout, raise_on_failure=False)
+        if use_session_pool:
+          with command_profiler.Measure(ssh_cmd + [command]) as measurement:
+            stdout, stderr, retcode = ssh_session_pool.RunCommand(
+                ssh_cmd, command, force_info_log=should_log,
+                suppress_warning=suppress_warning, timeout=timeout)
+            measurement.retcode = retcode
+        else:
+          stdout, stderr, retcode = vm_util.IssueCommand(
+              ssh_cmd, force_info_log=should_log,
+              suppress_warning=suppress_warning,
+              timeout=timeout, raise_on_failure=False)
         # Retry on 255 because this indicates an SSH failure
         if retcode != RETRYABLE_SSH_RETCODE:
           break
@@ -1009,6 +1183,69 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     """
     return self.RemoteHostCommandWithReturnCode(*args, **kwargs)[:2]
 
+  def RemoteCommandBatch(self, commands, stop_on_error=True, should_log=False,
+                         ignore_failure=False, timeout=None):
+    """Runs several commands on the VM over a single connection.
+
+    Each command runs in its own shell, as with RemoteCommand, so changes to the
+    working directory or environment do not carry over to later commands.
+
+    Args:
+      commands: A list of valid bash commands.
+      stop_on_error: A boolean indicating whether to skip the remaining
+          commands once one returns a non-zero return code.
+      should_log: A boolean indicating whether each command result should be
+          logged at the info level.
+      ignore_failure: Ignore non-zero return codes if set to true. Otherwise
+          the first failing command raises a RemoteCommandError once the batch
+          has finished.
+      timeout: The timeout for the whole batch.
+
+    Returns:
+      A list of (stdout, stderr, return_code) tuples, one per command that was
+      run. When stop_on_error is set, commands after the first failure are not
+      run and have no entry.
+
+    Raises:
+      RemoteCommandError: If a command failed and ignore_failure is not set, or
+          if the batch itself could not be run.
+    """
+    if not commands:
+      return []
+    marker = 'PKB_BATCH_%s' % uuid.uuid4().hex
+    script = _BuildBatchScript(commands, marker, stop_on_error)
+    stdout, stderr = self.RemoteCommand(script, ignore_failure=True,
+                                        timeout=timeout)
+    results, timings = _ParseBatchOutput(stdout, stderr, marker)
+
+    finished = (len(results) == len(commands) or
+                (stop_on_error and results and results[-1][2]))
+    if not finished:
+      raise errors.VirtualMachine.RemoteCommandError(
+          'Batch of %d commands on %s stopped after %d commands.\n'
+          'STDOUT: %sSTDERR: %s' %
+          (len(commands), self.name, len(results), stdout, stderr))
+
+    failure_text = None
+    for i, ((command_stdout, command_stderr, retcode),
+            elapsed_ms) in enumerate(zip(results, timings)):
+      debug_text = ('Batch command %d/%d ran in %s ms: {%s}\nReturnCode:%s\n'
+                    'STDOUT: %s\nSTDERR: %s' %
+                    (i + 1, len(commands),
+                     'unknown' if elapsed_ms is None else elapsed_ms,
+                     commands[i], retcode, command_stdout, command_stderr))
+      if should_log:
+        logging.info(debug_text)
+      else:
+        logging.debug(debug_text)
+      if retcode and failure_text is None:
+        failure_text = ('Got non-zero return code (%s) executing %s\n'
+                        'STDOUT: %sSTDERR: %s' %
+                        (retcode, commands[i], command_stdout, command_stderr))
+    if failure_text and not ignore_failure:
+      raise errors.VirtualMachine.RemoteCommandError(failure_text)
+    return results
+
   def _Reboot(self):
     """OS-specific implementation of reboot command."""
     if not self.IS_REBOOTABLE:
@@ -1037,10 +1274,13 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     self._has_remote_command_script = False
     self._DisableCpus()
 
-  def MoveFile(self, target, source_path, remote_path=''):
-    self.MoveHostFile(target, source_path, remote_path)
+  def MoveFile(self, target, source_path, remote_path='',
+               use_internal_ip=False):
+    self.MoveHostFile(target, source_path, remote_path,
+                      use_internal_ip=use_internal_ip)
 
-  def MoveHostFile(self, target, source_path, remote_path=''):
+  def MoveHostFile(self, target, source_path, remote_path='',
+                   use_internal_ip=False):
     """Copies a file from one VM to a target VM.
 
     Args:
@@ -1048,8 +1288,11 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
       source_path: The location of the file on the REMOTE machine.
       remote_path: The destination of the file on the TARGET machine, default
           is the home directory.
+      use_internal_ip: Whether to copy to the target's internal IP address
+          rather than its external one.
     """
     self.AuthenticateVm()
+    target_ip = target.internal_ip if use_internal_ip else target.ip_address
 
     # TODO(user): For security we may want to include
     #     -o UserKnownHostsFile=/dev/null in the scp command
@@ -1057,7 +1300,7 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     #     ie: the key is added to know known_hosts which allows
     #     OpenMPI to operate correctly.
     remote_location = '%s@%s:%s' % (
-        target.user_name, target.ip_address, remote_path)
+        target.user_name, target_ip, remote_path)
     self.RemoteHostCommand('scp -P %s -o StrictHostKeyChecking=no -i %s %s %s' %
                            (target.ssh_port, REMOTE_KEY_PATH, source_path,
                             remote_location))
@@ -1301,6 +1544,35 @@ class BaseLinuxMixin(virtual_machine.BaseOsMixin):
     sha256sum, _ = stdout.split()
     return sha256sum
 
+  def GetDestinationSha256sums(self, file_pairs):
+    """Gets the sha256sum hashes of the files that pushed files would replace.
+
+    All destinations are hashed with a single remote command.
+
+    Args:
+      file_pairs: A list of (source_path, remote_path) tuples, as passed to
+          PushFile. If remote_path is a directory, the file at
+          remote_path/basename(source_path) is hashed.
+
+    Returns:
+      A list with the sha256sum hash of each destination, or None for
+      destinations that do not exist.
+    """
+    commands = []
+    for i, (source_path, remote_path) in enumerate(file_pairs):
+      commands.append(
+          'f=%s; if [ -d "$f" ]; then f="$f"/%s; fi; '
+          'printf "%d "; sha256sum < "$f" 2>/dev/null || echo missing' %
+          (ssh_tar_copy.RemotePathExpression(remote_path),
+           pipes.quote(os.path.basename(source_path)), i))
+    stdout, _ = self.RemoteCommand('; '.join(commands))
+    digests = [None] * len(file_pairs)
+    for line in stdout.splitlines():
+      fields = line.split()
+      if len(fields) >= 2 and fields[0].isdigit() and fields[1] != 'missing':
+        digests[int(fields[0])] = fields[1]
+    return digests
+
   def _GetNfsService(self):
     """Returns the NfsService created in the benchmark spec.
 
@@ -1712,8 +1984,8 @@ class ContainerOptimizedOsMixin(BaseContainerLinuxMixin):
     # COS mounts /home and /tmp with -o noexec, which blocks running benchmark
     # binaries.
     # TODO(user): Support reboots
-    self.RemoteCommand('sudo mount -o remount,exec /home')
-    self.RemoteCommand('sudo mount -o remount,exec /tmp')
+    self.RemoteCommandBatch(['sudo mount -o remount,exec /home',
+                             'sudo mount -o remount,exec /tmp'])
 
 
 class CoreOsMixin(BaseContainerLinuxMixin):
@@ -2010,12 +2282,18 @@ class ContainerizedDebianMixin(BaseDebianMixin):
     Returns:
       A tuple of stdout and stderr from running the command.
     """
+    logging.info('Docker running: %s', command)
+    return self.RemoteHostCommand(self._DockerExecCommand(command), **kwargs)
+
+  def _DockerExecCommand(self, command):
+    """Returns a host command running command inside the container."""
     # Escapes bash sequences
     command = command.replace("'", r"'\''")
+    return "sudo docker exec %s bash -c '%s'" % (self.docker_id, command)
 
-    logging.info('Docker running: %s', command)
-    command = "sudo docker exec %s bash -c '%s'" % (self.docker_id, command)
-    return self.RemoteHostCommand(command, **kwargs)
+  def _GetRemoteCommandSshCommand(self, command):
+    """Returns the ssh command running command inside the container."""
+    return self._GetSshCommand() + [self._DockerExecCommand(command)]
 
   def ContainerCopy(self, file_name, container_path='', copy_to=True):
     """Copies a file to or from container_path to the host's vm_util.VM_TMP_DIR.
@@ -2066,7 +2344,13 @@ class ContainerizedDebianMixin(BaseDebianMixin):
       self.ContainerCopy(file_name, remote_path, copy_to)
       self.RemoteHostCopy(file_path, tmp_path, copy_to)
 
-  def MoveFile(self, target, source_path, remote_path=''):
+  def PushFiles(self, file_pairs):
+    """Copies several files or directories into the container."""
+    # Each file is staged on the host before being copied into the container.
+    virtual_machine.BaseOsMixin.PushFiles(self, file_pairs)
+
+  def MoveFile(self, target, source_path, remote_path='',
+               use_internal_ip=False):
     """Copies a file from one VM to a target VM.
 
     Copies a file from a container in the source VM to a container
@@ -2077,6 +2361,8 @@ class ContainerizedDebianMixin(BaseDebianMixin):
       source_path: The location of the file on the REMOTE machine.
       remote_path: The destination of the file on the TARGET machine, default
           is the root directory.
+      use_internal_ip: Whether to copy to the target's internal IP address
+          rather than its external one.
     """
     file_name = posixpath.basename(source_path)
 
@@ -2086,7 +2372,8 @@ class ContainerizedDebianMixin(BaseDebianMixin):
     # Moves the file to vm_util.VM_TMP_DIR in target
     source_host_path = posixpath.join(vm_util.VM_TMP_DIR, file_name)
     target_host_dir = vm_util.VM_TMP_DIR
-    self.MoveHostFile(target, source_host_path, target_host_dir)
+    self.MoveHostFile(target, source_host_path, target_host_dir,
+                      use_internal_ip=use_internal_ip)
 
     # Copies the file to its final destination in the container
     target.ContainerCopy(file_name, remote_path)
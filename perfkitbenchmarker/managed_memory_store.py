@@ -40,6 +40,9 @@ flags.DEFINE_enum(
      Failover.FAILOVER_SAME_REGION],
     'Failover behavior of cloud redis cluster. Acceptable values are:'
     'failover_none, failover_same_zone, and failover_same_region')
+flags.DEFINE_string('redis_region',
+                    'us-central1',
+                    'The region to spin up cloud redis in.')
 
 # List of redis versions
 REDIS_3_2 = 'redis_3_2'
@@ -44,6 +44,7 @@ from absl import flags
 from perfkitbenchmarker import disk
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import os_types
+from perfkitbenchmarker import provision_graph
 from perfkitbenchmarker import resource
 
 flags.DEFINE_string('nfs_tier', None, 'NFS Mode')
@@ -177,6 +178,10 @@ class UnmanagedNfsService(BaseNfsService):
       assert self.server_directory != disk_spec.mount_point, (
           'export server directory must be different from mount point')
 
+  def GetProvisionDependencies(self):
+    """See base class."""
+    return [provision_graph.VMS_BOOTED]
+
   def GetRemoteAddress(self):
     """The NFS server's address."""
     return self.server_vm.internal_ip
@@ -30,6 +30,8 @@ flags.DEFINE_string('object_storage_credential_file', None,
                     'Directory of credential file.')
 flags.DEFINE_string('boto_file_location', None,
                     'The location of the boto file.')
+flags.DEFINE_string('object_storage_storage_class', None,
+                    'Storage class to use in object storage benchmark.')
 
 FLAGS = flags.FLAGS
 
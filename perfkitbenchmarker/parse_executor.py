@@ -0,0 +1,246 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Parses benchmark results in a pool of processes.
+
+Parsing the output of many clients (e.g. YCSB with histograms, fio histogram
+logs, dstat CSV files) is CPU bound, so in threads it is serialized by the GIL
+and blocks the threads that drive the benchmark. With --parse_processes, parse
+jobs run in a pool of processes instead:
+
+  @parse_executor.Parser
+  def ParseResults(output):
+    ...
+
+  job = parse_executor.Submit(ParseResults, output)
+  ...  # Start the next workload iteration.
+  results = job.Result()
+
+Parsers run in the pool must be module level functions decorated with Parser.
+Their arguments and results are pickled, except for numpy arrays in the results
+(including within dicts, lists and tuples), which are returned through shared
+memory. Without --parse_processes, parsers run in the thread that submits them.
+"""
+
+import atexit
+import signal
+import threading
+
+from absl import flags
+from concurrent import futures
+import numpy as np
+from perfkitbenchmarker import background_tasks
+
+try:
+  # pylint: disable=g-import-not-at-top
+  from multiprocessing import resource_tracker
+  from multiprocessing import shared_memory
+except ImportError:
+  resource_tracker = shared_memory = None
+
+flags.DEFINE_integer(
+    'parse_processes', 0,
+    'The number of processes to parse benchmark results in. If 0, results are '
+    'parsed in the thread that collected them.', lower_bound=0)
+
+FLAGS = flags.FLAGS
+
+# Arrays smaller than this are pickled, as shared memory has a fixed cost.
+_MIN_SHARED_BYTES = 1 << 16
+# Seconds between checks for cancellation while waiting for a result.
+_RESULT_POLL_SECONDS = 1
+
+_parsers = {}
+_lock = threading.Lock()
+_executor = None
+_unretrieved_jobs = set()
+
+
+def _GetParserName(function):
+  return '%s.%s' % (function.__module__, function.__name__)
+
+
+def Parser(function):
+  """Registers a module level function as a parser that may run in the pool."""
+  _parsers[_GetParserName(function)] = function
+  return function
+
+
+class _SharedArray(object):
+  """A numpy array copied to a shared memory block by a pool process."""
+
+  def __init__(self, array):
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+    self.name = block.name
+    self.shape = array.shape
+    self.dtype = array.dtype.str
+    # The parent process unlinks the block once it has read it, so the pool
+    # process must not clean it up when it exits.
+    resource_tracker.unregister(block._name, 'shared_memory')  # pylint: disable=protected-access
+    block.close()
+
+  def Load(self):
+    """Returns a copy of the array and frees the shared memory block."""
+    block = shared_memory.SharedMemory(name=self.name)
+    try:
+      return np.ndarray(self.shape, self.dtype, buffer=block.buf).copy()
+    finally:
+      block.close()
+      block.unlink()
+
+
+def _Share(value):
+  """Replaces large numpy arrays in value with _SharedArrays."""
+  if isinstance(value, np.ndarray):
+    if value.dtype.hasobject or value.nbytes < _MIN_SHARED_BYTES:
+      return value
+    return _SharedArray(value)
+  if isinstance(value, dict):
+    return {k: _Share(v) for k, v in value.items()}
+  if type(value) in (list, tuple):
+    return type(value)(_Share(v) for v in value)
+  return value
+
+
+def _Unshare(value, load=True):
+  """Replaces _SharedArrays in value with numpy arrays.
+
+  Args:
+    value: A value returned by _Share.
+    load: If False, the shared memory blocks are only freed.
+
+  Returns:
+    value with the arrays loaded.
+  """
+  if isinstance(value, _SharedArray):
+    array = value.Load()
+    return array if load else None
+  if isinstance(value, dict):
+    return {k: _Unshare(v, load) for k, v in value.items()}
+  if type(value) in (list, tuple):
+    return type(value)(_Unshare(v, load) for v in value)
+  return value
+
+
+def _InitializeWorker():
+  # The parent process handles interrupts and shuts the pool down.
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _RunParser(parser, args, kwargs):
+  """Runs a parser in a pool process."""
+  return _Share(parser(*args, **kwargs))
+
+
+def _GetExecutor():
+  global _executor
+  with _lock:
+    if _executor is None:
+      _executor = futures.ProcessPoolExecutor(
+          FLAGS.parse_processes, initializer=_InitializeWorker)
+      atexit.register(Shutdown)
+    return _executor
+
+
+def Shutdown():
+  """Stops the pool processes and frees the results that were not retrieved."""
+  global _executor
+  with _lock:
+    executor, _executor = _executor, None
+    jobs = list(_unretrieved_jobs)
+    _unretrieved_jobs.clear()
+  if executor:
+    executor.shutdown(wait=True)
+  for job in jobs:
+    job._Free()  # pylint: disable=protected-access
+
+
+class ParseJob(object):
+  """A parse job, running in the pool or already run in the calling thread."""
+
+  def __init__(self, future):
+    self._future = future
+    self._result = None
+
+  def Done(self):
+    return self._future.done()
+
+  def _Free(self):
+    """Frees the shared memory of a result that was not retrieved."""
+    if (self._future.done() and not self._future.cancelled() and
+        not self._future.exception()):
+      _Unshare(self._future.result(), load=False)
+
+  def Result(self):
+    """Waits for the job to finish and returns the parser's result.
+
+    Waiting may be cancelled like other background tasks (see
+    background_tasks.CancellationToken).
+
+    Raises:
+      The exception raised by the parser, if any.
+    """
+    while True:
+      background_tasks.CheckCancelled()
+      try:
+        result = self._future.result(timeout=_RESULT_POLL_SECONDS)
+        break
+      except futures.TimeoutError:
+        continue
+    with _lock:
+      if self in _unretrieved_jobs:
+        _unretrieved_jobs.discard(self)
+        self._result = _Unshare(result)
+      elif self._result is None:
+        self._result = result
+    return self._result
+
+
+def Submit(parser, *args, **kwargs):
+  """Starts parsing with a registered parser.
+
+  Args:
+    parser: A function decorated with Parser.
+    *args: Arguments to pass to parser.
+    **kwargs: Keyword arguments to pass to parser.
+
+  Returns:
+    A ParseJob.
+
+  Raises:
+    ValueError: If parser was not registered and would run in the pool.
+  """
+  if not FLAGS.parse_processes or shared_memory is None:
+    future = futures.Future()
+    try:
+      future.set_result(parser(*args, **kwargs))
+    except Exception as e:  # pylint: disable=broad-except
+      future.set_exception(e)
+    return ParseJob(future)
+  name = _GetParserName(parser)
+  if _parsers.get(name) is not parser:
+    raise ValueError('%s is not a registered parser.' % name)
+  job = ParseJob(_GetExecutor().submit(_RunParser, parser, args, kwargs))
+  with _lock:
+    _unretrieved_jobs.add(job)
+  return job
+
+
+def Parse(parser, *args, **kwargs):
+  """Parses with a registered parser and returns its result.
+
+  Like Submit(...).Result(), which lets parsing run in the pool while the
+  calling thread waits without holding the GIL.
+  """
+  return Submit(parser, *args, **kwargs).Result()
@@ -61,7 +61,6 @@ from __future__ import print_function
 
 import collections
 import getpass
-import itertools
 import json
 import logging
 import multiprocessing
@@ -81,16 +80,19 @@ from perfkitbenchmarker import benchmark_lookup
 from perfkitbenchmarker import benchmark_sets
 from perfkitbenchmarker import benchmark_spec
 from perfkitbenchmarker import benchmark_status
-from perfkitbenchmarker import configs
+from perfkitbenchmarker import command_profiler
 from perfkitbenchmarker import context
 from perfkitbenchmarker import disk
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import events
 from perfkitbenchmarker import flag_util
+from perfkitbenchmarker import import_util
 from perfkitbenchmarker import linux_benchmarks
 from perfkitbenchmarker import log_util
 from perfkitbenchmarker import os_types
 from perfkitbenchmarker import package_lookup
+from perfkitbenchmarker import publisher
+from perfkitbenchmarker import reaper
 from perfkitbenchmarker import requirements
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import spark_service
@@ -99,9 +101,9 @@ from perfkitbenchmarker import static_virtual_machine
 from perfkitbenchmarker import timing_util
 from perfkitbenchmarker import traces
 from perfkitbenchmarker import version
+from perfkitbenchmarker import vm_pool
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker import windows_benchmarks
-from perfkitbenchmarker.configs import benchmark_config_spec
 from perfkitbenchmarker.linux_benchmarks import cluster_boot_benchmark
 from perfkitbenchmarker.publisher import SampleCollector
 import six
@@ -291,6 +293,18 @@ flags.DEFINE_float(
     'The delay in seconds between parallel processes\' invocation. '
     'Increasing this value may reduce provider throttling issues.',
     lower_bound=0)
+flags.DEFINE_integer(
+    'pipeline_depth', None,
+    'If set, benchmarks run in separate processes as a pipeline: while one '
+    'benchmark runs, the resources of up to this many later benchmarks are '
+    'provisioned, and earlier benchmarks are torn down. Prepare, run and '
+    'cleanup phases still run one benchmark at a time, in order. Mutually '
+    'exclusive with --run_processes.', lower_bound=1)
+flags.DEFINE_integer(
+    'pipeline_max_vms', None,
+    'The maximum number of VMs that benchmarks run with --pipeline_depth may '
+    'hold at once, e.g. to stay within quota. A benchmark is not provisioned '
+    'ahead of its turn if it would exceed this limit.', lower_bound=1)
 flags.DEFINE_string(
     'completion_status_file', None,
     'If specified, this file will contain the completion status of each '
@@ -385,6 +399,8 @@ flags.DEFINE_bool('randomize_run_order', False,
                   'randomize order of the benchmarks.')
 
 _TEARDOWN_EVENT = multiprocessing.Event()
+# Seconds between checks of the pipeline state by pipelined benchmarks.
+_PIPELINE_POLL_SECONDS = 1
 
 events.initialization_complete.connect(traces.RegisterAll)
 
@@ -411,8 +427,62 @@ def _InjectBenchmarkInfoIntoDocumentation():
                                       % '\n\t'.join(benchmark_sets_list))
 
 
+# Flags that print the help for all flags.
+_HELP_FLAGS = frozenset(['help', 'helpfull', 'helpshort', 'helpxml'])
+
+
+def _GetFlagNames(args):
+  """Returns the names of the flags set by command-line arguments.
+
+  Arguments that are not flags are ignored, and flag files are read for the
+  flags they set.
+
+  Args:
+    args: list of command-line arguments, not including the program name.
+
+  Returns:
+    A set of flag names. A '--noname' argument yields both 'noname' and 'name'.
+  """
+  names = set()
+  for arg in args:
+    if arg == '--':
+      break
+    if not arg.startswith('-'):
+      continue
+    name, _, value = arg.lstrip('-').partition('=')
+    names.add(name)
+    if name.startswith('no'):
+      names.add(name[2:])
+    if name == 'flagfile' and value:
+      try:
+        with open(value) as flag_file:
+          names.update(_GetFlagNames(line.strip() for line in flag_file))
+      except (IOError, OSError):
+        # Reported when the flags are parsed.
+        pass
+  return names
+
+
+def _ImportFlagModules(argv):
+  """Imports the benchmark and package modules defining flags in argv.
+
+  Benchmark and package modules are only imported when they are used, so the
+  modules defining the flags set on the command line must be imported before
+  the flags are parsed.
+
+  Args:
+    argv: list of command-line arguments, including the program name.
+  """
+  names = _GetFlagNames(argv[1:])
+  if names & _HELP_FLAGS:
+    import_util.ImportAllModules()
+  else:
+    import_util.ImportFlagModules(names)
+
+
 def _ParseFlags(argv=sys.argv):
   """Parses the command-line flags."""
+  _ImportFlagModules(argv)
   try:
     argv = FLAGS(argv)
   except flags.Error as e:
@@ -430,8 +500,10 @@ def _PrintHelp(matches=None):
       matched the regex. If None then all flags are printed.
   """
   if not matches:
+    import_util.ImportAllModules()
     print(FLAGS)
   else:
+    import_util.ImportMatchingModules(matches)
     flags_by_module = FLAGS.flags_by_module_dict()
     modules = sorted(flags_by_module)
     regex = re.compile(matches)
@@ -459,6 +531,7 @@ def _PrintHelpMD(matches=None):
     testsuite_docs/providers_gcp.md`
   """
 
+  import_util.ImportMatchingModules(matches)
   flags_by_module = FLAGS.flags_by_module_dict()
   modules = sorted(flags_by_module)
   regex = re.compile(matches)
@@ -535,49 +608,6 @@ def _InitializeRunUri():
                                       'length.' % MAX_RUN_URI_LENGTH)
 
 
-def _CreateBenchmarkSpecs():
-  """Create a list of BenchmarkSpecs for each benchmark run to be scheduled.
-
-  Returns:
-    A list of BenchmarkSpecs.
-  """
-  specs = []
-  benchmark_tuple_list = benchmark_sets.GetBenchmarksFromFlags()
-  benchmark_counts = collections.defaultdict(itertools.count)
-  for benchmark_module, user_config in benchmark_tuple_list:
-    # Construct benchmark config object.
-    name = benchmark_module.BENCHMARK_NAME
-    expected_os_types = None if FLAGS.multi_os_benchmark else (
-        os_types.WINDOWS_OS_TYPES if FLAGS.os_type in os_types.WINDOWS_OS_TYPES
-        else os_types.LINUX_OS_TYPES)
-    with flag_util.OverrideFlags(FLAGS, user_config.get('flags')):
-      config_dict = benchmark_module.GetConfig(user_config)
-    config_spec_class = getattr(
-        benchmark_module, 'BENCHMARK_CONFIG_SPEC_CLASS',
-        benchmark_config_spec.BenchmarkConfigSpec)
-    config = config_spec_class(name, expected_os_types=expected_os_types,
-                               flag_values=FLAGS, **config_dict)
-
-    # Assign a unique ID to each benchmark run. This differs even between two
-    # runs of the same benchmark within a single PKB run.
-    uid = name + str(next(benchmark_counts[name]))
-
-    # Optional step to check flag values and verify files exist.
-    check_prereqs = getattr(benchmark_module, 'CheckPrerequisites', None)
-    if check_prereqs:
-      try:
-        with config.RedirectFlags(FLAGS):
-          check_prereqs(config)
-      except:
-        logging.exception('Prerequisite check failed for %s', name)
-        raise
-
-    specs.append(benchmark_spec.BenchmarkSpec.GetBenchmarkSpec(
-        benchmark_module, config, uid))
-
-  return specs
-
-
 def _WriteCompletionStatusFile(benchmark_specs, status_file):
   """Writes a completion status file.
 
@@ -619,6 +649,8 @@ def DoProvisionPhase(spec, timer):
   if FLAGS.create_started_run_sample:
     PublishRunStartedSample(spec)
   logging.info('Provisioning resources for benchmark %s', spec.name)
+  if FLAGS.vm_pool:
+    vm_pool.AdoptNetworks(spec)
   spec.ConstructContainerCluster()
   spec.ConstructContainerRegistry()
   # spark service needs to go first, because it adds some vms.
@@ -832,10 +864,20 @@ def DoTeardownPhase(spec, timer):
   """
   logging.info('Tearing down resources for benchmark %s', spec.name)
 
+  if _TearDownInBackground(spec):
+    reaper.Submit(spec)
+    return
   with timer.Measure('Resource Teardown'):
     spec.Delete()
 
 
+def _TearDownInBackground(spec):
+  """Returns whether the background reaper tears down a spec."""
+  return (FLAGS.async_teardown and not FLAGS.vm_pool and
+          FLAGS.run_processes is None and not FLAGS.pipeline_depth and
+          reaper.CanSubmit(spec))
+
+
 def _SkipPendingRunsFile():
   if FLAGS.skip_pending_runs_file and isfile(FLAGS.skip_pending_runs_file):
     logging.warning('%s exists.  Skipping benchmark.',
@@ -875,12 +917,14 @@ def PublishRunStartedSample(spec):
   collector.PublishSamples()
 
 
-def RunBenchmark(spec, collector):
+def RunBenchmark(spec, collector, pipeline_turn=None):
   """Runs a single benchmark and adds the results to the collector.
 
   Args:
     spec: The BenchmarkSpec object with run information.
     collector: The SampleCollector object to add samples to.
+    pipeline_turn: _PipelineTurn. If set, the prepare phase waits until the
+      previous benchmark of the pipeline has finished its cleanup phase.
   """
 
   # Since there are issues with the handling SIGINT/KeyboardInterrupt (see
@@ -906,32 +950,49 @@ def RunBenchmark(spec, collector):
       try:
         with end_to_end_timer.Measure('End to End'):
           if stages.PROVISION in FLAGS.run_stage:
-            DoProvisionPhase(spec, detailed_timer)
+            with command_profiler.ProfilePhase(stages.PROVISION, spec,
+                                               collector):
+              DoProvisionPhase(spec, detailed_timer)
+
+          if pipeline_turn and not pipeline_turn.WaitToRun():
+            raise errors.Benchmarks.RunError(
+                'Execution was stopped before benchmark %s could run.' %
+                spec.name)
 
           if stages.PREPARE in FLAGS.run_stage:
             current_run_stage = stages.PREPARE
             interrupt_checker = InterruptChecker(spec.vms)
-            DoPreparePhase(spec, detailed_timer)
+            with command_profiler.ProfilePhase(stages.PREPARE, spec,
+                                               collector):
+              DoPreparePhase(spec, detailed_timer)
             interrupt_checker.EndCheckInterruptThreadAndRaiseError()
             interrupt_checker = None
 
           if stages.RUN in FLAGS.run_stage:
             current_run_stage = stages.RUN
             interrupt_checker = InterruptChecker(spec.vms)
-            DoRunPhase(spec, collector, detailed_timer)
+            with command_profiler.ProfilePhase(stages.RUN, spec, collector):
+              DoRunPhase(spec, collector, detailed_timer)
             interrupt_checker.EndCheckInterruptThreadAndRaiseError()
             interrupt_checker = None
 
           if stages.CLEANUP in FLAGS.run_stage:
             current_run_stage = stages.CLEANUP
             interrupt_checker = InterruptChecker(spec.vms)
-            DoCleanupPhase(spec, detailed_timer)
+            with command_profiler.ProfilePhase(stages.CLEANUP, spec,
+                                               collector):
+              DoCleanupPhase(spec, detailed_timer)
             interrupt_checker.EndCheckInterruptThreadAndRaiseError()
             interrupt_checker = None
 
+          if pipeline_turn:
+            pipeline_turn.FinishRun()
+
           if stages.TEARDOWN in FLAGS.run_stage:
             current_run_stage = stages.TEARDOWN
-            DoTeardownPhase(spec, detailed_timer)
+            with command_profiler.ProfilePhase(stages.TEARDOWN, spec,
+                                               collector):
+              DoTeardownPhase(spec, detailed_timer)
 
         # Add timing samples.
         if (FLAGS.run_stage == stages.STAGES and
@@ -982,15 +1043,22 @@ def RunBenchmark(spec, collector):
       finally:
         if interrupt_checker:
           interrupt_checker.EndCheckInterruptThread()
+        if pipeline_turn:
+          pipeline_turn.FinishRun()
         # Deleting resources should happen first so any errors with publishing
         # don't prevent teardown.
         if stages.TEARDOWN in FLAGS.run_stage:
-          spec.Delete()
+          if _TearDownInBackground(spec):
+            reaper.Submit(spec)
+          else:
+            spec.Delete()
         if FLAGS.publish_after_run:
           collector.PublishSamples()
         events.benchmark_end.send(benchmark_spec=spec)
-        # Pickle spec to save final resource state.
-        spec.Pickle()
+        # Pickle spec to save final resource state. The reaper saves the specs
+        # it tears down.
+        if not reaper.IsSubmitted(spec):
+          spec.Pickle()
   spec.status = benchmark_status.SUCCEEDED
 
 
@@ -1061,13 +1129,14 @@ def MakeFailedRunSample(spec, error_message, run_stage_that_failed):
   return [sample.Sample('Run Failed', 1, 'Run Failed', metadata)]
 
 
-def RunBenchmarkTask(spec):
+def RunBenchmarkTask(spec, pipeline_turn=None):
   """Task that executes RunBenchmark.
 
   This is designed to be used with RunParallelProcesses.
 
   Arguments:
     spec: BenchmarkSpec. The spec to call RunBenchmark with.
+    pipeline_turn: _PipelineTurn. Passed to RunBenchmark.
 
   Returns:
     A tuple of BenchmarkSpec, list of samples.
@@ -1078,14 +1147,14 @@ def RunBenchmarkTask(spec):
   # Many providers name resources using run_uris. When running multiple
   # benchmarks in parallel, this causes name collisions on resources.
   # By modifying the run_uri, we avoid the collisions.
-  if FLAGS.run_processes and FLAGS.run_processes > 1:
+  if (FLAGS.run_processes and FLAGS.run_processes > 1) or FLAGS.pipeline_depth:
     spec.config.flags['run_uri'] = FLAGS.run_uri + str(spec.sequence_number)
     # Unset run_uri so the config value takes precedence.
     FLAGS['run_uri'].present = 0
 
   collector = SampleCollector()
   try:
-    RunBenchmark(spec, collector)
+    RunBenchmark(spec, collector, pipeline_turn)
   except BaseException as e:
     logging.exception('Exception running benchmark')
     msg = 'Benchmark {0}/{1} {2} (UID: {3}) failed.'.format(
@@ -1156,6 +1225,12 @@ def SetUpPKB():
   if FLAGS.run_stage_iterations > 1 and FLAGS.run_stage_time > 0:
     raise errors.Setup.InvalidFlagConfigurationError(
         'Flags run_stage_iterations and run_stage_time are mutually exclusive')
+  if FLAGS.pipeline_depth and FLAGS.run_processes:
+    raise errors.Setup.InvalidFlagConfigurationError(
+        'Flags pipeline_depth and run_processes are mutually exclusive')
+  if FLAGS.vm_pool and (FLAGS.pipeline_depth or FLAGS.run_processes):
+    raise errors.Setup.InvalidFlagConfigurationError(
+        'Flag vm_pool requires benchmarks to run in series')
 
   vm_util.SSHKeyGen()
 
@@ -1192,13 +1267,166 @@ def RunBenchmarkTasksInSeries(tasks):
   return [func(*args, **kwargs) for func, args, kwargs in tasks]
 
 
+class _PipelineTurn(object):
+  """The place of a benchmark in a pipeline run by RunBenchmarkTasksPipelined.
+
+  Attributes:
+    waited_seconds: float. Time spent waiting for earlier benchmarks.
+  """
+
+  def __init__(self, vm_count, max_vms, ran, released, previous_ran, earlier):
+    """Initializes a _PipelineTurn.
+
+    Args:
+      vm_count: int. The number of VMs of the benchmark.
+      max_vms: int or None. The maximum number of VMs the benchmarks of the
+        pipeline may hold at once.
+      ran: Event to set once the benchmark has finished its cleanup phase.
+      released: Event to set once the benchmark has been torn down.
+      previous_ran: The ran Event of the previous benchmark, or None for the
+        first benchmark.
+      earlier: list of (vm_count, released) tuples of the earlier benchmarks.
+    """
+    self._vm_count = vm_count
+    self._max_vms = max_vms
+    self._ran = ran
+    self._released = released
+    self._previous_ran = previous_ran
+    self._earlier = earlier
+    self.waited_seconds = 0
+
+  def _Wait(self, ready):
+    """Waits until ready() returns True or execution is stopped.
+
+    Returns:
+      False if execution was stopped, otherwise True.
+    """
+    start = time.time()
+    try:
+      while not ready():
+        if _TEARDOWN_EVENT.wait(_PIPELINE_POLL_SECONDS):
+          return False
+      return True
+    finally:
+      self.waited_seconds += time.time() - start
+
+  def _FitsWithinMaxVms(self):
+    held_vms = sum(vm_count for vm_count, released in self._earlier
+                   if not released.is_set())
+    return not held_vms or held_vms + self._vm_count <= self._max_vms
+
+  def WaitToProvision(self):
+    """Waits until the benchmark's VMs fit within --pipeline_max_vms.
+
+    Returns:
+      False if execution was stopped while waiting, otherwise True.
+    """
+    if not self._max_vms or self._FitsWithinMaxVms():
+      return True
+    logging.info('Waiting for earlier benchmarks to release VMs before '
+                 'provisioning %d more.', self._vm_count)
+    return self._Wait(self._FitsWithinMaxVms)
+
+  def WaitToRun(self):
+    """Waits until the previous benchmark has finished its cleanup phase.
+
+    Returns:
+      False if execution was stopped while waiting, otherwise True.
+    """
+    if not self._previous_ran:
+      return True
+    return self._Wait(self._previous_ran.is_set)
+
+  def FinishRun(self):
+    """Lets the next benchmark start its prepare phase."""
+    self._ran.set()
+
+  def Release(self):
+    """Records that the benchmark no longer holds any resources."""
+    self._ran.set()
+    self._released.set()
+
+
+def _GetVmCount(spec):
+  return sum(group.vm_count or 0 for group in spec.config.vm_groups.values())
+
+
+def _RunPipelinedTask(pipeline_turn, func, args, kwargs):
+  """Runs a RunBenchmarkTask task in its turn of a pipeline.
+
+  Returns:
+    A tuple of the task's return value and the seconds it took, not counting
+    time spent waiting for other benchmarks.
+  """
+  try:
+    pipeline_turn.WaitToProvision()
+    start = time.time() - pipeline_turn.waited_seconds
+    result = func(*args, pipeline_turn=pipeline_turn, **kwargs)
+    return result, time.time() - start - pipeline_turn.waited_seconds
+  finally:
+    pipeline_turn.Release()
+
+
+def RunBenchmarkTasksPipelined(tasks, depth, max_vms=None):
+  """Runs benchmarks in a pipeline.
+
+  Each benchmark runs in its own process. The prepare, run and cleanup phases
+  of the benchmarks run one at a time, in order, while up to depth later
+  benchmarks are provisioned and earlier benchmarks are torn down, so that at
+  most depth + 1 benchmarks hold resources at once.
+
+  Arguments:
+    tasks: list of tuples of task: [(RunBenchmarkTask, (spec,), {}),]
+    depth: int. The number of benchmarks to provision ahead of the one running.
+    max_vms: int or None. The maximum number of VMs the benchmarks may hold at
+      once. A benchmark is always provisioned once all earlier benchmarks have
+      been torn down.
+
+  Returns:
+    list of tuples of func results. The samples of the first benchmark
+    include a sample of the time saved by pipelining.
+  """
+  start = time.time()
+  with multiprocessing.Manager() as manager:
+    ran = [manager.Event() for _ in tasks]
+    released = [manager.Event() for _ in tasks]
+    vm_counts = [_GetVmCount(args[0]) for _, args, _ in tasks]
+    pipelined_tasks = []
+    for i, task in enumerate(tasks):
+      pipeline_turn = _PipelineTurn(
+          vm_counts[i], max_vms, ran[i], released[i], ran[i - 1] if i else None,
+          list(zip(vm_counts[:i], released[:i])))
+      pipelined_tasks.append((_RunPipelinedTask, (pipeline_turn,) + task, {}))
+    results = background_tasks.RunParallelProcesses(pipelined_tasks, depth + 1)
+  wall_seconds = time.time() - start
+  serial_seconds = sum(seconds for _, seconds in results)
+  spec_sample_tuples = [result for result, _ in results]
+  logging.info('Pipelining saved %.1f seconds: the benchmarks took %.1f '
+               'seconds, in %.1f seconds of wall time.',
+               serial_seconds - wall_seconds, serial_seconds, wall_seconds)
+  if spec_sample_tuples:
+    spec, samples = spec_sample_tuples[0]
+    collector = SampleCollector()
+    collector.AddSamples([sample.Sample(
+        'Pipeline Time Saved', serial_seconds - wall_seconds, 'seconds', {
+            'pipeline_depth': depth,
+            'pipeline_max_vms': max_vms,
+            'num_benchmarks': len(tasks),
+            'serial_seconds': serial_seconds,
+            'wall_seconds': wall_seconds,
+        })], spec.name, spec)
+    samples.extend(collector.samples)
+  return spec_sample_tuples
+
+
 def RunBenchmarks():
   """Runs all benchmarks in PerfKitBenchmarker.
 
   Returns:
     Exit status for the process.
   """
-  benchmark_specs = _CreateBenchmarkSpecs()
+  benchmark_specs = benchmark_spec.CreateBenchmarkSpecs(
+      benchmark_sets.GetBenchmarksFromFlags())
   if FLAGS.randomize_run_order:
     random.shuffle(benchmark_specs)
   if FLAGS.dry_run:
@@ -1208,11 +1436,16 @@ def RunBenchmarks():
       print('')
     return 0
 
+  if FLAGS.streaming_publish:
+    publisher.StartStreaming()
   collector = SampleCollector()
   try:
     tasks = [(RunBenchmarkTask, (spec,), {})
              for spec in benchmark_specs]
-    if FLAGS.run_processes is None:
+    if FLAGS.pipeline_depth:
+      spec_sample_tuples = RunBenchmarkTasksPipelined(
+          tasks, FLAGS.pipeline_depth, FLAGS.pipeline_max_vms)
+    elif FLAGS.run_processes is None:
       spec_sample_tuples = RunBenchmarkTasksInSeries(tasks)
     else:
       spec_sample_tuples = background_tasks.RunParallelProcesses(
@@ -1222,8 +1455,13 @@ def RunBenchmarks():
       collector.samples.extend(sample_list)
 
   finally:
+    if FLAGS.vm_pool:
+      vm_pool.TearDown()
     if collector.samples:
       collector.PublishSamples()
+    publisher.StopStreaming()
+    if FLAGS.async_teardown:
+      reaper.WaitForPending(FLAGS.async_teardown_exit_timeout)
 
     if benchmark_specs:
       logging.info(benchmark_status.CreateSummary(benchmark_specs))
@@ -1259,31 +1497,14 @@ def RunBenchmarks():
 def _GenerateBenchmarkDocumentation():
   """Generates benchmark documentation to show in --help."""
   benchmark_docs = []
-  for benchmark_module in (linux_benchmarks.BENCHMARKS +
-                           windows_benchmarks.BENCHMARKS):
-    benchmark_config = configs.LoadMinimalConfig(
-        benchmark_module.BENCHMARK_CONFIG, benchmark_module.BENCHMARK_NAME)
-    vm_groups = benchmark_config.get('vm_groups', {})
-    total_vm_count = 0
-    vm_str = ''
-    scratch_disk_str = ''
-    for group in six.itervalues(vm_groups):
-      group_vm_count = group.get('vm_count', 1)
-      if group_vm_count is None:
-        vm_str = 'variable'
-      else:
-        total_vm_count += group_vm_count
-      if group.get('disk_spec'):
-        scratch_disk_str = ' with scratch volume(s)'
-
-    name = benchmark_module.BENCHMARK_NAME
-    if benchmark_module in windows_benchmarks.BENCHMARKS:
-      name += ' (Windows)'
-    benchmark_docs.append('%s: %s (%s VMs%s)' %
-                          (name,
-                           benchmark_config['description'],
-                           vm_str or total_vm_count,
-                           scratch_disk_str))
+  for registry, suffix in ((linux_benchmarks.VALID_BENCHMARKS, ''),
+                           (windows_benchmarks.VALID_BENCHMARKS, ' (Windows)')):
+    # Summaries are read from the registry's index, so that neither the
+    # benchmark modules nor their configs are loaded.
+    for benchmark_name in registry:
+      benchmark_docs.append('%s%s: %s' % (
+          benchmark_name, suffix,
+          registry.GetMetadata(benchmark_name)['summary']))
   return '\n\t'.join(benchmark_docs)
 
 
@@ -1340,4 +1561,6 @@ def Main():
     return 0
   CheckVersionFlag()
   SetUpPKB()
+  if FLAGS.reap:
+    return reaper.ReapPending()
   return RunBenchmarks()
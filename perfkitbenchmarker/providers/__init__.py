@@ -16,9 +16,11 @@ import importlib
 import logging
 import os
 
+from perfkitbenchmarker import background_tasks
 from perfkitbenchmarker import events
 from perfkitbenchmarker import import_util
 from perfkitbenchmarker import requirements
+from perfkitbenchmarker import resource
 from perfkitbenchmarker.providers import aws
 from perfkitbenchmarker.providers import azure
 from perfkitbenchmarker.providers import gcp
@@ -42,6 +44,10 @@ DOCKER = 'Docker'
 VALID_CLOUDS = (GCP, AZURE, AWS, DIGITALOCEAN, KUBERNETES, OPENSTACK,
                 RACKSPACE, CLOUDSTACK, ALICLOUD, MESOS, PROFITBRICKS, DOCKER)
 
+for _cloud in VALID_CLOUDS:
+  background_tasks.RegisterConcurrencyClass(
+      resource.CREATE_CONCURRENCY_CLASS % _cloud.lower())
+
 
 _imported_providers = set()
 
@@ -23,14 +23,28 @@ import json
 import re
 import string
 from absl import flags
+from perfkitbenchmarker import api_rate_limiter
 from perfkitbenchmarker import context
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import vm_util
+from perfkitbenchmarker.providers import aws
 import six
 
 AWS_PATH = 'aws'
 AWS_PREFIX = [AWS_PATH, '--output', 'json']
 FLAGS = flags.FLAGS
+
+# Global options of the aws CLI that are followed by a value, which precede
+# the service name.
+_GLOBAL_OPTIONS_WITH_VALUES = frozenset([
+    '--ca-bundle', '--cli-binary-format', '--cli-connect-timeout',
+    '--cli-read-timeout', '--color', '--endpoint-url', '--output', '--profile',
+    '--query', '--region'])
+
+# Errors returned by AWS APIs when requests are throttled.
+_THROTTLING_REGEX = re.compile(
+    r'Throttling|RequestLimitExceeded|TooManyRequests|SlowDown|'
+    r'Rate exceeded')
 STOCKOUT_MESSAGE = ('Creation failed due to insufficient capacity indicating a '
                     'potential stockout scenario.')
 
@@ -207,6 +221,17 @@ def GetAccount():
   return json.loads(stdout)['Account']
 
 
+def _GetApiFamily(cmd):
+  """Returns the AWS service called by an aws CLI command, e.g. 'ec2'."""
+  args = iter(cmd[1:])
+  for arg in args:
+    if arg in _GLOBAL_OPTIONS_WITH_VALUES:
+      next(args, None)
+    elif not arg.startswith('-'):
+      return arg
+  return 'aws'
+
+
 @vm_util.Retry()
 def IssueRetryableCommand(cmd, env=None, suppress_failure=None):
   """Tries running the provided command until it succeeds or times out.
@@ -224,8 +249,11 @@ def IssueRetryableCommand(cmd, env=None, suppress_failure=None):
   Returns:
     A tuple of stdout and stderr from running the provided command.
   """
-  stdout, stderr, retcode = vm_util.IssueCommand(
-      cmd, env=env, raise_on_failure=False, suppress_failure=suppress_failure)
+  with api_rate_limiter.Limit(aws.CLOUD,
+                              _GetApiFamily(cmd)) as report_throttled:
+    stdout, stderr, retcode = vm_util.IssueCommand(
+        cmd, env=env, raise_on_failure=False, suppress_failure=suppress_failure)
+    report_throttled(bool(retcode and _THROTTLING_REGEX.search(stderr)))
   if retcode:
     raise errors.VmUtil.CalledProcessException(
         'Command returned a non-zero exit code.\n')
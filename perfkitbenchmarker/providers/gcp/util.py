@@ -19,10 +19,12 @@ import json
 import logging
 import re
 from absl import flags
+from perfkitbenchmarker import api_rate_limiter
 from perfkitbenchmarker import context
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import virtual_machine
 from perfkitbenchmarker import vm_util
+from perfkitbenchmarker.providers import gcp
 import six
 
 FLAGS = flags.FLAGS
@@ -233,23 +235,32 @@ class GcloudCommand(object):
       IssueCommandError: if command fails without Rate Limit Exceeded.
 
     """
-    if FLAGS.retry_on_rate_limited:
+    with api_rate_limiter.Limit(gcp.CLOUD,
+                                self._GetApiFamily()) as report_throttled:
       try:
         stdout, stderr, retcode = _issue_command_function(self, **kwargs)
       except errors.VmUtil.IssueCommandError as error:
-        if GcloudCommand._IsIssueRateLimitMessage(str(error)):
+        rate_limited = bool(GcloudCommand._IsIssueRateLimitMessage(str(error)))
+        report_throttled(rate_limited)
+        if rate_limited and FLAGS.retry_on_rate_limited:
           self.rate_limited = True
           raise errors.Benchmarks.QuotaFailure.RateLimitExceededError(
               str(error))
-        else:
-          raise error
-      if retcode and GcloudCommand._IsIssueRateLimitMessage(stderr):
+        raise error
+      rate_limited = bool(
+          retcode and GcloudCommand._IsIssueRateLimitMessage(stderr))
+      report_throttled(rate_limited)
+      if rate_limited and FLAGS.retry_on_rate_limited:
         self.rate_limited = True
         raise errors.Benchmarks.QuotaFailure.RateLimitExceededError(stderr)
-
       return stdout, stderr, retcode
-    else:
-      return _issue_command_function(self, **kwargs)
+
+  def _GetApiFamily(self):
+    """Returns the API family for rate limiting, e.g. 'compute'."""
+    for arg in self.args:
+      if arg not in ('alpha', 'beta'):
+        return arg
+    return 'gcloud'
 
   def IssueRetryable(self, **kwargs):
     """Tries running the gcloud command until it succeeds or times out.
@@ -0,0 +1,212 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provisions the resources of a benchmark as a dependency graph.
+
+By default BenchmarkSpec.Provision creates resources one kind at a time, in a
+fixed order. With --provision_dag, provisioning is split into steps (create the
+networks, create the VMs, create the relational database, ...) which declare the
+steps they depend on, and each step starts as soon as its dependencies are done.
+Resources declare the steps their Create depends on with
+resource.BaseResource.GetProvisionDependencies, so e.g. a managed database is
+created while the VMs boot.
+
+Teardown runs the same steps in reverse: a step's resources are deleted once
+every step that depended on them has been deleted.
+
+Samples record how long each step took and which steps formed the critical
+path, i.e. the chain of dependent steps that determined how long provisioning
+took.
+"""
+
+from absl import flags
+from perfkitbenchmarker import background_tasks
+from perfkitbenchmarker import sample
+
+flags.DEFINE_boolean(
+    'provision_dag', False,
+    'If true, provision independent resources of a benchmark concurrently, '
+    'creating each once the resources it depends on exist, and tear them down '
+    'in reverse dependency order.')
+flags.DEFINE_integer(
+    'provision_dag_max_concurrency', None,
+    'The maximum number of provisioning steps to run at once when '
+    '--provision_dag is set. Defaults to --max_concurrent_threads.',
+    lower_bound=1)
+
+FLAGS = flags.FLAGS
+
+# Provisioning step names.
+CAPACITY_RESERVATIONS = 'capacity_reservations'
+NETWORKS = 'networks'
+CONTAINER_REGISTRY = 'container_registry'
+CONTAINER_CLUSTER = 'container_cluster'
+NFS_SERVICE = 'nfs_service'
+SMB_SERVICE = 'smb_service'
+PLACEMENT_GROUPS = 'placement_groups'
+VMS_CREATED = 'vms_created'
+VMS_BOOTED = 'vms_booted'
+VMS_READY = 'vms_ready'
+SPARK_SERVICE = 'spark_service'
+DPB_SERVICE = 'dpb_service'
+RELATIONAL_DB = 'relational_db'
+NON_RELATIONAL_DB = 'non_relational_db'
+SPANNER = 'spanner'
+TPUS = 'tpus'
+EDW_SERVICE = 'edw_service'
+VPN_SERVICE = 'vpn_service'
+
+PROVISION = 'provision'
+TEARDOWN = 'teardown'
+
+
+class Step(object):
+  """A provisioning step.
+
+  Attributes:
+    name: The step name.
+    create: Function called with no arguments that creates the step's
+        resources.
+    delete: Function called with no arguments that deletes them, or None.
+    dependencies: The names of the steps that must finish before this step's
+        resources are created, and that may only be deleted after they are.
+        Steps that are not part of the graph are ignored.
+  """
+
+  def __init__(self, name, create, delete, dependencies):
+    self.name = name
+    self.create = create
+    self.delete = delete
+    self.dependencies = list(dependencies)
+
+
+def _GetDependencies(steps):
+  """Returns a dict of step name to the dependencies present in steps."""
+  names = {step.name for step in steps}
+  return {step.name: [d for d in step.dependencies if d in names]
+          for step in steps}
+
+
+def _GetReverseDependencies(steps):
+  """Returns a dict of step name to the names of the steps depending on it."""
+  reverse = {step.name: [] for step in steps}
+  for name, dependencies in _GetDependencies(steps).items():
+    for dependency in dependencies:
+      reverse[dependency].append(name)
+  return reverse
+
+
+def GetCriticalPath(dependencies, timings):
+  """Returns the chain of steps that determined when the last step finished.
+
+  Starting with the step that finished last, each step's predecessor on the
+  path is the dependency that finished last, i.e. the one it waited for.
+
+  Args:
+    dependencies: dict mapping each step name to the names of its dependencies.
+    timings: dict mapping each step name to its (start, end) times.
+
+  Returns:
+    A list of step names, in the order they ran.
+  """
+  if not timings:
+    return []
+  path = [max(timings, key=lambda name: timings[name][1])]
+  while True:
+    ran = [d for d in dependencies[path[-1]] if d in timings]
+    if not ran:
+      break
+    path.append(max(ran, key=lambda name: timings[name][1]))
+  path.reverse()
+  return path
+
+
+def MakeSamples(stage, dependencies, timings):
+  """Returns step duration and critical path samples.
+
+  Args:
+    stage: PROVISION or TEARDOWN.
+    dependencies: dict mapping each step name to the names of the steps it
+        waited for in this stage.
+    timings: dict mapping each step name to its (start, end) times.
+
+  Returns:
+    A list of sample.Sample.
+  """
+  if not timings:
+    return []
+  critical_path = GetCriticalPath(dependencies, timings)
+  first_start = min(start for start, _ in timings.values())
+  samples = []
+  for name, (start, end) in sorted(timings.items(), key=lambda t: t[1]):
+    samples.append(sample.Sample(
+        'Resource Step Time', end - start, 'seconds', {
+            'stage': stage,
+            'step': name,
+            'start_offset': start - first_start,
+            'on_critical_path': name in critical_path,
+        }))
+  samples.append(sample.Sample(
+      'Resource Critical Path Time',
+      sum(timings[name][1] - timings[name][0] for name in critical_path),
+      'seconds', {
+          'stage': stage,
+          'critical_path': ' -> '.join(critical_path),
+          'total_seconds': (max(end for _, end in timings.values()) -
+                            first_start),
+      }))
+  return samples
+
+
+def _Noop():
+  pass
+
+
+def Provision(steps):
+  """Creates the resources of steps, running independent steps concurrently.
+
+  Args:
+    steps: list of Steps.
+
+  Returns:
+    A list of sample.Sample describing the time taken by the steps.
+
+  Raises:
+    errors.VmUtil.ThreadException: When a step failed. Steps depending on it are
+        not run.
+  """
+  dependencies = _GetDependencies(steps)
+  timings = background_tasks.RunDag(
+      [(step.name, step.create, dependencies[step.name]) for step in steps],
+      FLAGS.provision_dag_max_concurrency)
+  return MakeSamples(PROVISION, dependencies, timings)
+
+
+def Teardown(steps):
+  """Deletes the resources of steps, in reverse dependency order.
+
+  Args:
+    steps: list of Steps. The delete functions should log and suppress their
+        errors so that the rest of the resources are still deleted.
+
+  Returns:
+    A list of sample.Sample describing the time taken by the steps.
+  """
+  reverse = _GetReverseDependencies(steps)
+  # Steps without a delete function are kept so that their dependencies are
+  # still deleted after the steps that depend on them.
+  timings = background_tasks.RunDag(
+      [(step.name, step.delete or _Noop, reverse[step.name])
+       for step in steps],
+      FLAGS.provision_dag_max_concurrency)
+  return MakeSamples(TEARDOWN, reverse, timings)
@@ -0,0 +1,470 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Publishes samples in the background while benchmarks run.
+
+With --streaming_publish, SampleCollectors hand their samples to a pipeline
+instead of keeping them until PublishSamples is called. Each publisher that
+supports streaming gets a worker thread with a queue of at most
+--publish_queue_size samples. When a queue is full, adding samples waits, so a
+slow publisher slows down the benchmark rather than using more memory, and
+does not delay the other publishers. A worker publishes --publish_batch_size
+samples at a time, or the samples it has once the oldest of them waited
+--publish_flush_interval seconds, and retries a failed batch
+--publish_retries times. Publishers that do not support streaming publish all
+samples once when the pipeline stops. Their samples are kept in a separate
+log, so that they do not keep the samples the other publishers published on
+disk.
+
+Samples are written to a write-ahead log in the run's temp dir before they are
+queued, and the log records how far each publisher has published. Samples
+that were not published, because PKB crashed or a publisher failed, are
+published the next time the pipeline starts for the run, e.g. when PKB runs
+again with the same --run_uri. Samples may be published more than once, but
+are not lost.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from absl import flags
+import numpy as np
+
+flags.DEFINE_boolean(
+    'streaming_publish', False,
+    'If true, samples are published in the background as they are collected, '
+    'rather than kept in memory until they are published. Samples are kept '
+    'in a write-ahead log in the run directory until they are published.')
+flags.DEFINE_integer(
+    'publish_queue_size', 10000,
+    'With --streaming_publish, the maximum number of samples queued for each '
+    'publisher. Collecting more samples waits for the publishers.',
+    lower_bound=1)
+flags.DEFINE_integer(
+    'publish_batch_size', 1000,
+    'With --streaming_publish, the maximum number of samples a publisher '
+    'publishes at once.', lower_bound=1)
+flags.DEFINE_float(
+    'publish_flush_interval', 60,
+    'With --streaming_publish, the maximum number of seconds a sample waits '
+    'for a batch to fill before it is published.', lower_bound=0)
+flags.DEFINE_integer(
+    'publish_retries', 3,
+    'With --streaming_publish, the number of times a failed batch of samples '
+    'is published again.', lower_bound=0)
+
+FLAGS = flags.FLAGS
+
+# Seconds between the first retries of a batch. Later retries back off.
+_RETRY_DELAY = 1
+_MAX_RETRY_DELAY = 60
+# Number of samples in each file of the write-ahead log.
+_SEGMENT_SIZE = 10000
+_ACKS_FILE_NAME = 'acks.json'
+# The subdirectory of the log of publishers that do not support streaming.
+_DEFERRED_DIR = 'deferred'
+
+_FLUSH = object()
+_STOP = object()
+
+_pipeline = None
+
+
+def _ToJson(value):
+  """Returns a form of a value that json can serialize.
+
+  Numpy scalars are converted to Python values. Other values, e.g. sets, are
+  converted to strings, as the publishers convert metadata to strings.
+  """
+  if isinstance(value, np.generic):
+    return value.item()
+  return str(value)
+
+
+class _WriteAheadLog(object):
+  """Keeps samples on disk until every publisher published them.
+
+  Samples are numbered in the order they are appended, starting at 1, and
+  written to files of _SEGMENT_SIZE samples. Each publisher acknowledges the
+  number of the last sample it published, after which files whose samples all
+  publishers acknowledged are deleted.
+  """
+
+  def __init__(self, directory, keys):
+    """Opens the log in a directory, which may hold the log of a past pipeline.
+
+    Args:
+      directory: string. The directory of the log.
+      keys: list of strings. The keys of the publishers.
+    """
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+    self._lock = threading.Lock()
+    self._acks_path = os.path.join(directory, _ACKS_FILE_NAME)
+    acks = {}
+    if os.path.exists(self._acks_path):
+      with open(self._acks_path) as acks_file:
+        acks = json.load(acks_file)
+    self._acks = {key: acks.get(key, 0) for key in keys}
+    self._segments = sorted(int(name.split('.')[0])
+                            for name in os.listdir(directory)
+                            if name.endswith('.jsonl'))
+    last_seq = 0
+    if self._segments:
+      for last_seq, _ in self._ReadSegment(self._segments[-1]):
+        pass
+      last_seq = max(last_seq, self._segments[-1] - 1)
+    # Acknowledged samples may not have reached the disk before a crash.
+    self.last_seq = max([last_seq] + list(acks.values()))
+    self._file = None
+    self._segment_end = 0
+
+  def _GetSegmentPath(self, first_seq):
+    return os.path.join(self.directory, '%d.jsonl' % first_seq)
+
+  def _ReadSegment(self, first_seq):
+    """Yields the (number, sample) tuples of a file of the log."""
+    with open(self._GetSegmentPath(first_seq)) as segment:
+      for line in segment:
+        try:
+          seq, sample = json.loads(line)
+        except ValueError:
+          # The rest of the file was not written before a crash.
+          return
+        yield seq, sample
+
+  def Append(self, sample):
+    """Appends a sample to the log and returns its number."""
+    with self._lock:
+      self.last_seq += 1
+      if self.last_seq > self._segment_end:
+        if self._file:
+          self._file.close()
+        # A file of a past pipeline that has no samples is overwritten.
+        if not self._segments or self._segments[-1] != self.last_seq:
+          self._segments.append(self.last_seq)
+        self._file = open(self._GetSegmentPath(self.last_seq), 'w')
+        self._segment_end = self.last_seq + _SEGMENT_SIZE - 1
+      self._file.write(
+          json.dumps([self.last_seq, sample], default=_ToJson) + '\n')
+      return self.last_seq
+
+  def Sync(self):
+    """Writes the appended samples to disk."""
+    with self._lock:
+      if self._file:
+        self._file.flush()
+
+  def Read(self, after_seq, until_seq):
+    """Yields the (number, sample) tuples in a range of numbers.
+
+    Args:
+      after_seq: int. Samples with higher numbers are read.
+      until_seq: int. Samples up to this number are read.
+    """
+    with self._lock:
+      segments = list(self._segments)
+    for first_seq, next_seq in zip(segments, segments[1:] + [None]):
+      if next_seq is not None and next_seq <= after_seq + 1:
+        continue
+      if first_seq > until_seq:
+        return
+      for seq, sample in self._ReadSegment(first_seq):
+        if seq > until_seq:
+          return
+        if seq > after_seq:
+          yield seq, sample
+
+  def GetAck(self, key):
+    with self._lock:
+      return self._acks[key]
+
+  def Ack(self, key, seq):
+    """Records that a publisher published the samples up to a number."""
+    with self._lock:
+      self._acks[key] = seq
+      with open(self._acks_path + '.tmp', 'w') as acks_file:
+        json.dump(self._acks, acks_file)
+      os.replace(self._acks_path + '.tmp', self._acks_path)
+      # Delete the files whose samples were all published, except the one
+      # being written.
+      published = min(self._acks.values(), default=self.last_seq)
+      while (len(self._segments) > 1 and
+             self._segments[1] - 1 <= published):
+        os.remove(self._GetSegmentPath(self._segments.pop(0)))
+
+  def Close(self):
+    """Closes the log, and deletes it if all samples were published.
+
+    Returns:
+      Whether the log was deleted.
+    """
+    with self._lock:
+      if self._file:
+        self._file.close()
+        self._file = None
+      if min(self._acks.values(), default=self.last_seq) < self.last_seq:
+        return False
+      for first_seq in self._segments:
+        os.remove(self._GetSegmentPath(first_seq))
+      self._segments = []
+      return True
+
+
+def _PublishWithRetries(publisher, samples, retries):
+  """Publishes samples, retrying on failure. Returns whether it succeeded."""
+  for attempt in range(retries + 1):
+    try:
+      publisher.PublishSamples(samples)
+      return True
+    except Exception:  # pylint: disable=broad-except
+      logging.exception('%s failed to publish %d samples (attempt %d of %d).',
+                        publisher, len(samples), attempt + 1, retries + 1)
+      if attempt < retries:
+        time.sleep(min(_MAX_RETRY_DELAY, _RETRY_DELAY * 2 ** attempt))
+  return False
+
+
+class _PublisherWorker(object):
+  """Publishes the samples queued for a publisher in a thread.
+
+  Attributes:
+    publisher: The SamplePublisher.
+    key: string. Identifies the publisher in the write-ahead log.
+    failed: boolean. Whether a batch of samples could not be published. The
+      log then keeps the samples from that batch on.
+  """
+
+  def __init__(self, publisher, key, wal, queue_size, batch_size,
+               flush_interval, retries):
+    self.publisher = publisher
+    self.key = key
+    self.failed = False
+    self._wal = wal
+    self._queue = queue.Queue(queue_size)
+    self._batch_size = batch_size
+    self._flush_interval = flush_interval
+    self._retries = retries
+    # The samples of a past pipeline of the run are published first.
+    self._replay_until = wal.last_seq
+    self._thread = threading.Thread(target=self._Run,
+                                    name='publisher-%s' % key)
+    self._thread.daemon = True
+
+  def Start(self):
+    self._thread.start()
+
+  def Put(self, seq, sample):
+    """Queues a sample, waiting while the queue is full."""
+    self._queue.put((seq, sample))
+
+  def Flush(self):
+    """Publishes the queued samples without waiting for a full batch."""
+    self._queue.put(_FLUSH)
+
+  def Stop(self):
+    """Publishes the queued samples and stops the worker."""
+    self._queue.put(_STOP)
+
+  def Join(self, timeout=None):
+    self._thread.join(timeout)
+    return not self._thread.is_alive()
+
+  def _Publish(self, batch):
+    if not _PublishWithRetries(self.publisher, [s for _, s in batch],
+                               self._retries):
+      logging.error('%s failed to publish %d samples. They are kept in the '
+                    'write-ahead log %s.', self.publisher, len(batch),
+                    self._wal.directory)
+      self.failed = True
+    elif not self.failed:
+      self._wal.Ack(self.key, batch[-1][0])
+
+  def _Run(self):
+    batch = []
+    published = self._wal.GetAck(self.key)
+    if published < self._replay_until:
+      logging.info('Publishing %d samples of the write-ahead log %s to %s.',
+                   self._replay_until - published, self._wal.directory,
+                   self.publisher)
+    for item in self._wal.Read(published, self._replay_until):
+      batch.append(item)
+      if len(batch) >= self._batch_size:
+        self._Publish(batch)
+        batch = []
+    if batch:
+      self._Publish(batch)
+      batch = []
+    deadline = None
+    while True:
+      try:
+        item = self._queue.get(
+            timeout=None if deadline is None else max(0,
+                                                      deadline - time.time()))
+      except queue.Empty:
+        item = _FLUSH
+      if item is _FLUSH or item is _STOP:
+        if batch:
+          self._Publish(batch)
+          batch = []
+          deadline = None
+        if item is _STOP:
+          return
+        continue
+      batch.append(item)
+      if deadline is None:
+        deadline = time.time() + self._flush_interval
+      if len(batch) >= self._batch_size:
+        self._Publish(batch)
+        batch = []
+        deadline = None
+
+
+class Pipeline(object):
+  """Publishes samples to a list of publishers in the background.
+
+  Attributes:
+    pid: int. The process that started the pipeline. Child processes inherit
+      the pipeline, but not its threads, so they must not use it.
+  """
+
+  def __init__(self, publishers, directory):
+    """Starts the pipeline.
+
+    Args:
+      publishers: list of SamplePublishers. Publishers whose STREAMING
+        attribute is false publish all samples when the pipeline stops.
+      directory: string. The directory of the write-ahead log.
+    """
+    self.pid = os.getpid()
+    self._lock = threading.Lock()
+    keys = ['%d-%s' % (i, type(publisher).__name__)
+            for i, publisher in enumerate(publishers)]
+    streaming = [(key, publisher) for key, publisher in zip(keys, publishers)
+                 if getattr(publisher, 'STREAMING', False)]
+    self._deferred = [(key, publisher)
+                      for key, publisher in zip(keys, publishers)
+                      if (key, publisher) not in streaming]
+    self._wal = _WriteAheadLog(directory, [key for key, _ in streaming])
+    # Deferred publishers only acknowledge samples when the pipeline stops, so
+    # their samples are logged separately.
+    self._deferred_wal = _WriteAheadLog(os.path.join(directory, _DEFERRED_DIR),
+                                        [key for key, _ in self._deferred])
+    self._retries = FLAGS.publish_retries
+    self._chunk_size = FLAGS.publish_batch_size
+    self._workers = [
+        _PublisherWorker(publisher, key, self._wal, FLAGS.publish_queue_size,
+                         FLAGS.publish_batch_size, FLAGS.publish_flush_interval,
+                         FLAGS.publish_retries)
+        for key, publisher in streaming]
+    for worker in self._workers:
+      worker.Start()
+
+  def Put(self, samples):
+    """Logs samples and queues them for the publishers.
+
+    Args:
+      samples: iterable of sample dicts.
+    """
+    with self._lock:
+      chunk = []
+      for sample in samples:
+        if self._deferred:
+          self._deferred_wal.Append(sample)
+        if not self._workers:
+          continue
+        chunk.append((self._wal.Append(sample), sample))
+        if len(chunk) >= self._chunk_size:
+          self._Queue(chunk)
+          chunk = []
+      if chunk:
+        self._Queue(chunk)
+
+  def _Queue(self, chunk):
+    # Samples must be on disk before they can be acknowledged.
+    self._wal.Sync()
+    for worker in self._workers:
+      for seq, sample in chunk:
+        worker.Put(seq, sample)
+
+  def Flush(self):
+    """Publishes the queued samples without waiting for full batches."""
+    for worker in self._workers:
+      worker.Flush()
+
+  def Stop(self):
+    """Publishes the remaining samples and stops the pipeline.
+
+    Returns:
+      The number of publishers that failed to publish samples.
+    """
+    for worker in self._workers:
+      worker.Stop()
+    failed = 0
+    for worker in self._workers:
+      worker.Join()
+      failed += worker.failed
+    self._deferred_wal.Sync()
+    last_seq = self._deferred_wal.last_seq
+    for key, publisher in self._deferred:
+      samples = [sample for _, sample in
+                 self._deferred_wal.Read(self._deferred_wal.GetAck(key),
+                                         last_seq)]
+      if not samples:
+        continue
+      if _PublishWithRetries(publisher, samples, self._retries):
+        self._deferred_wal.Ack(key, last_seq)
+      else:
+        failed += 1
+    # Both logs are closed, even if the first one is kept.
+    if not all([self._wal.Close(), self._deferred_wal.Close()]):
+      logging.error('Samples that were not published are kept in %s. They '
+                    'are published when PKB runs again with --run_uri=%s and '
+                    '--streaming_publish.', self._wal.directory, FLAGS.run_uri)
+    return failed
+
+
+def Start(publishers, directory):
+  """Starts the pipeline of the process.
+
+  Args:
+    publishers: list of SamplePublishers to publish samples to.
+    directory: string. The directory of the write-ahead log.
+  """
+  global _pipeline
+  _pipeline = Pipeline(publishers, directory)
+
+
+def GetPipeline():
+  """Returns the pipeline of the process, or None if it was not started."""
+  if _pipeline and _pipeline.pid == os.getpid():
+    return _pipeline
+  return None
+
+
+def Stop():
+  """Stops the pipeline of the process, if it was started.
+
+  Returns:
+    The number of publishers that failed to publish samples.
+  """
+  global _pipeline
+  pipeline = GetPipeline()
+  if not pipeline:
+    return 0
+  _pipeline = None
+  return pipeline.Stop()
@@ -21,15 +21,18 @@ from __future__ import division
 from __future__ import print_function
 
 import abc
+import base64
 import collections
 import copy
 import csv
 import fcntl
+import gzip
 import itertools
 import json
 import logging
 import math
 import operator
+import os
 import pprint
 import sys
 import time
@@ -37,8 +40,13 @@ import uuid
 
 from absl import flags
 from perfkitbenchmarker import events
+from perfkitbenchmarker import errors
 from perfkitbenchmarker import flag_util
+from perfkitbenchmarker import histogram
+from perfkitbenchmarker import http_pool
 from perfkitbenchmarker import log_util
+from perfkitbenchmarker import publish_pipeline
+from perfkitbenchmarker import sample as sample_lib
 from perfkitbenchmarker import version
 from perfkitbenchmarker import vm_util
 import six
@@ -84,6 +92,12 @@ flags.DEFINE_string(
     None,
     'A path to write CSV-format results')
 
+flags.DEFINE_string(
+    'parquet_path',
+    None,
+    'A directory to append results to as a Parquet dataset, partitioned by '
+    'test and date. Requires the "pyarrow" package.')
+
 flags.DEFINE_string(
     'bigquery_table',
     None,
@@ -137,6 +151,7 @@ flags.DEFINE_boolean(
 
 DEFAULT_JSON_OUTPUT_NAME = 'perfkitbenchmarker_results.json'
 DEFAULT_CREDENTIALS_JSON = 'credentials.json'
+WRITE_AHEAD_LOG_NAME = 'publish_wal'
 GCS_OBJECT_NAME_LENGTH = 20
 
 # A list of SamplePublishers that can be extended to add support for publishing
@@ -264,18 +279,27 @@ DEFAULT_METADATA_PROVIDERS = [DefaultMetadataProvider()]
 
 
 class SamplePublisher(six.with_metaclass(abc.ABCMeta, object)):
-  """An object that can publish performance samples."""
+  """An object that can publish performance samples.
+
+  Attributes:
+    STREAMING: boolean. Whether PublishSamples can be called repeatedly, each
+      time with the samples collected since the last call. Used with
+      --streaming_publish.
+  """
+
+  STREAMING = False
 
   @abc.abstractmethod
   def PublishSamples(self, samples):
     """Publishes 'samples'.
 
-    PublishSamples will be called exactly once. Calling
-    SamplePublisher.PublishSamples multiple times may result in data being
-    overwritten.
+    Unless STREAMING is true, PublishSamples will be called exactly once.
+    Calling SamplePublisher.PublishSamples multiple times may result in data
+    being overwritten.
 
     Args:
-      samples: list of dicts to publish.
+      samples: list of dicts to publish. The samples of a SampleBatch share
+        their metadata dict, so publishers must not modify it.
     """
     raise NotImplementedError()
 
@@ -444,6 +468,8 @@ class LogPublisher(SamplePublisher):
     logger: Logger to publish to. Defaults to the root logger.
   """
 
+  STREAMING = True
+
   def __init__(self, level=logging.INFO, logger=None):
     super().__init__()
     self.level = level
@@ -477,6 +503,8 @@ class NewlineDelimitedJSONPublisher(SamplePublisher):
     collapse_labels: boolean. If true, collapse sample metadata.
   """
 
+  STREAMING = True
+
   def __init__(self, file_path, mode='wt', collapse_labels=True):
     super().__init__()
     self.file_path = file_path
@@ -490,7 +518,10 @@ class NewlineDelimitedJSONPublisher(SamplePublisher):
   def PublishSamples(self, samples):
     logging.info('Publishing %d samples to %s', len(samples),
                  self.file_path)
-    with open(self.file_path, self.mode) as fp:
+    mode = self.mode
+    # Only the first call overwrites the file.
+    self.mode = self.mode.replace('w', 'a')
+    with open(self.file_path, mode) as fp:
       fcntl.flock(fp, fcntl.LOCK_EX)
       for sample in samples:
         sample = sample.copy()
@@ -499,6 +530,130 @@ class NewlineDelimitedJSONPublisher(SamplePublisher):
         fp.write(json.dumps(sample) + '\n')
 
 
+def _GetParquetPartition(sample):
+  """Returns the (test, date) partition of a sample dict."""
+  return (sample['test'],
+          time.strftime('%Y-%m-%d', time.gmtime(sample['timestamp'])))
+
+
+def _GetParquetColumns(samples):
+  """Returns the columns of a Parquet table of samples.
+
+  Args:
+    samples: list of sample dicts.
+
+  Returns:
+    OrderedDict mapping the names of ParquetPublisher.COLUMNS to lists of
+    values. The "histogram" column has the serialized histogram.Histogram of
+    samples that have one. The "metadata" column has the rest of the metadata
+    of each sample as a list of (key, string value) pairs, sorted by key.
+    Missing values are None.
+  """
+  columns = collections.OrderedDict(
+      (name, [sample.get(name) for sample in samples])
+      for name in ParquetPublisher.COLUMNS)
+  columns['histogram'] = [
+      base64.b64decode(sample['metadata'][histogram.METADATA_KEY])
+      if histogram.METADATA_KEY in sample.get('metadata', {}) else None
+      for sample in samples]
+  columns['metadata'] = [
+      sorted((key, None if value is None else str(value))
+             for key, value in six.iteritems(sample.get('metadata', {}))
+             if key != histogram.METADATA_KEY)
+      for sample in samples]
+  return columns
+
+
+class ParquetPublisher(SamplePublisher):
+  """Appends samples to a Parquet dataset.
+
+  The dataset is partitioned Hive-style by test and date (in UTC), e.g.
+  "<dataset_path>/test=iperf/date=2020-06-01/<uuid>.parquet", so the test is
+  not a column of the files. Each call to PublishSamples adds a file to each
+  partition it has samples for. Files are written next to the partitions with
+  a "_" prefix, which readers ignore, and then renamed, so readers never see
+  partially written files.
+
+  Histograms in the metadata of samples are stored in the binary "histogram"
+  column, which histogram.Histogram.FromBytes reads. The rest of the metadata
+  is stored in the "metadata" column, a map of strings to strings, so that all
+  files have the same schema and the whole dataset can be read at once.
+
+  String columns, including the keys and values of the metadata, are
+  dictionary encoded, which stores repeated values, such as the metadata of
+  the samples of a run, once per column chunk.
+
+  Attributes:
+    dataset_path: string. The directory of the dataset.
+  """
+
+  # The columns of each file, besides the histogram and the metadata.
+  COLUMNS = ('metric', 'value', 'unit', 'timestamp', 'run_uri', 'sample_uri',
+             'official', 'owner', 'product_name')
+
+  def __init__(self, dataset_path):
+    super().__init__()
+    self.dataset_path = dataset_path
+
+  def __repr__(self):
+    return '<{0} dataset_path="{1}">'.format(type(self).__name__,
+                                             self.dataset_path)
+
+  def _GetSchema(self, pyarrow):
+    """Returns the pyarrow Schema of every file of the dataset."""
+    types = {
+        'value': pyarrow.float64(),
+        'timestamp': pyarrow.timestamp('us', tz='UTC'),
+        'official': pyarrow.bool_(),
+        'sample_uri': pyarrow.string(),
+        'histogram': pyarrow.binary(),
+        'metadata': pyarrow.map_(pyarrow.string(), pyarrow.string()),
+    }
+    return pyarrow.schema([
+        (name, types.get(name,
+                         pyarrow.dictionary(pyarrow.int32(), pyarrow.string())))
+        for name in self.COLUMNS + ('histogram', 'metadata')])
+
+  def _MakeTable(self, pyarrow, samples):
+    """Returns a pyarrow Table of samples."""
+    schema = self._GetSchema(pyarrow)
+    arrays = []
+    for name, values in six.iteritems(_GetParquetColumns(samples)):
+      if name == 'timestamp':
+        values = [int(round(t * 1e6)) for t in values]
+      elif pyarrow.types.is_dictionary(schema.field(name).type):
+        values = [None if v is None else str(v) for v in values]
+        arrays.append(
+            pyarrow.array(values, type=pyarrow.string()).dictionary_encode())
+        continue
+      arrays.append(pyarrow.array(values, type=schema.field(name).type))
+    return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+  def PublishSamples(self, samples):
+    try:
+      import pyarrow
+      from pyarrow import parquet
+    except ImportError:
+      raise ImportError('The "pyarrow" package is required to use the Parquet '
+                        'publisher. Please make sure it is installed.')
+
+    partitions = collections.defaultdict(list)
+    for sample in samples:
+      partitions[_GetParquetPartition(sample)].append(sample)
+    logging.info('Publishing %d samples to %d partitions of %s', len(samples),
+                 len(partitions), self.dataset_path)
+    for (test, date), partition_samples in sorted(partitions.items()):
+      directory = os.path.join(
+          self.dataset_path, 'test=' + urllib.parse.quote(test, safe=''),
+          'date=' + date)
+      os.makedirs(directory, exist_ok=True)
+      file_name = uuid.uuid4().hex + '.parquet'
+      temp_path = os.path.join(self.dataset_path, '_' + file_name)
+      parquet.write_table(self._MakeTable(pyarrow, partition_samples),
+                          temp_path, use_dictionary=True)
+      os.replace(temp_path, os.path.join(directory, file_name))
+
+
 class BigQueryPublisher(SamplePublisher):
   """Publishes samples to BigQuery.
 
@@ -513,6 +668,8 @@ class BigQueryPublisher(SamplePublisher):
       private key. Must be specified if service_account is specified.
   """
 
+  STREAMING = True
+
   def __init__(self, bigquery_table, project_id=None, bq_path='bq',
                service_account=None, service_account_private_key_file=None):
     super().__init__()
@@ -579,6 +736,8 @@ class CloudStoragePublisher(SamplePublisher):
     gsutil_path: string. The path to the 'gsutil' tool.
   """
 
+  STREAMING = True
+
   def __init__(self, bucket, gsutil_path='gsutil'):
     super().__init__()
     self.bucket = bucket
@@ -609,17 +768,26 @@ class ElasticsearchPublisher(SamplePublisher):
   """Publish samples to an Elasticsearch server. Index and document type
   will be created if they do not exist.
 
+  Samples are indexed with concurrent _bulk requests. Samples that were
+  published before, e.g. when the streaming pipeline publishes them again, are
+  not indexed twice.
+
   Attributes:
     es_uri: String. e.g. "http://localhost:9200"
     es_index: String. Default "perfkit"
     es_type: String. Default "result"
   """
 
+  STREAMING = True
+
   def __init__(self, es_uri=None, es_index=None, es_type=None):
     super().__init__()
     self.es_uri = es_uri
     self.es_index = es_index.lower()
     self.es_type = es_type
+    self._pool = http_pool.ConnectionPool(es_uri)
+    # The major version of the server, once the index was created.
+    self._version = None
     self.mapping_5_plus = {
         "mappings": {
             "result": {
@@ -682,29 +850,79 @@ class ElasticsearchPublisher(SamplePublisher):
         }
     }
 
-  def PublishSamples(self, samples):
-    """Publish samples to Elasticsearch service."""
-    try:
-      from elasticsearch import Elasticsearch
-    except ImportError:
-      raise ImportError('The "elasticsearch" package is required to use '
-                        'the Elasticsearch publisher. Please make sure it '
-                        'is installed.')
-
-    es = Elasticsearch([self.es_uri])
-    if not es.indices.exists(index=self.es_index):
+  def _CreateIndex(self):
+    """Creates the index if it does not exist. Returns the server version."""
+    version = int(json.loads(self._pool.Request('GET', '/').data)
+                  ['version']['number'].split('.')[0])
+    index_path = '/' + urllib.parse.quote(self.es_index)
+    if self._pool.Request('HEAD', index_path,
+                          allowed_statuses=(404,)).status == 404:
       # choose whether to use old or new mapings based on
       # the version of elasticsearch that is being used
-      if int(es.info()['version']['number'].split('.')[0]) >= 5:
-        es.indices.create(index=self.es_index, body=self.mapping_5_plus)
+      if version >= 5:
+        mapping = self.mapping_5_plus
         logging.info('Create index %s and default mappings for'
                      ' elasticsearch version >= 5.0.0',
                      self.es_index)
       else:
-        es.indices.create(index=self.es_index, body=self.mapping_before_5)
+        mapping = self.mapping_before_5
         logging.info('Create index %s and default mappings for'
                      ' elasticsearch version < 5.0.0',
                      self.es_index)
+      if version >= 7:
+        # Indices no longer have mapping types.
+        mapping = {'mappings': mapping['mappings']['result']}
+      response = self._pool.Request(
+          'PUT', index_path, json.dumps(mapping).encode('utf-8'),
+          {'Content-Type': 'application/json'}, allowed_statuses=(400,))
+      # Another publisher may have created the index in the meantime.
+      if (response.status == 400 and
+          b'already_exists_exception' not in response.data):
+        raise http_pool.HttpError(
+            'Creating index {0} failed: {1}'.format(
+                self.es_index, response.data.decode('utf-8', 'replace')), 400)
+    return version
+
+  def _Bulk(self, actions):
+    """Indexes documents with a _bulk request, retrying rejected ones.
+
+    Args:
+      actions: list of strings. Each is a create action and its document,
+        both followed by a newline.
+
+    Raises:
+      http_pool.HttpError: if documents could not be indexed.
+    """
+    for retry in range(FLAGS.publish_http_retries + 1):
+      if retry:
+        http_pool.Backoff(retry)
+      response = self._pool.Request(
+          'POST', '/_bulk', ''.join(actions).encode('utf-8'),
+          {'Content-Type': 'application/x-ndjson'})
+      result = json.loads(response.data)
+      if not result.get('errors'):
+        return
+      rejected = []
+      for action, item in zip(actions, result['items']):
+        status = item['create']['status']
+        if status == 429:
+          rejected.append(action)
+        # 409 means that the document was published before.
+        elif status >= 300 and status != 409:
+          raise http_pool.HttpError(
+              'Indexing sample failed: {0}'.format(item['create']), status)
+      if not rejected:
+        return
+      actions = rejected
+    raise http_pool.HttpError('Elasticsearch rejected {0} samples.'.format(
+        len(actions)), 429)
+
+  def PublishSamples(self, samples):
+    """Publish samples to Elasticsearch service."""
+    if self._version is None:
+      self._version = self._CreateIndex()
+    start_time = time.time()
+    actions = []
     for s in samples:
       sample = copy.deepcopy(s)
       # Make timestamp understandable by ES and human.
@@ -715,8 +933,14 @@ class ElasticsearchPublisher(SamplePublisher):
       sample = self._deDotKeys(sample)
       # Add sample to the "perfkit index" of "result type" and using sample_uri
       # as each ES's document's unique _id
-      es.create(index=self.es_index, doc_type=self.es_type,
-                id=sample['sample_uri'], body=json.dumps(sample))
+      action = {'_index': self.es_index, '_id': sample['sample_uri']}
+      if self._version < 7:
+        action['_type'] = self.es_type
+      actions.append('%s\n%s\n' % (json.dumps({'create': action}),
+                                   json.dumps(sample)))
+    self._pool.Map(self._Bulk, list(http_pool.Chunk(actions)))
+    logging.info('Published %d samples to Elasticsearch in %.1f seconds.',
+                 len(actions), time.time() - start_time)
 
   def _FormatTimestampForElasticsearch(self, epoch_us):
     """Convert the floating epoch timestamp in micro seconds epoch_us to
@@ -729,7 +953,7 @@ class ElasticsearchPublisher(SamplePublisher):
 
   def _deDotKeys(self, res):
     """Recursively replace dot with underscore in all keys in a dictionary."""
-    for key, value in res.items():
+    for key, value in list(res.items()):
       if isinstance(value, dict):
         self._deDotKeys(value)
       new_key = key.replace('.', '_')
@@ -741,6 +965,9 @@ class ElasticsearchPublisher(SamplePublisher):
 class InfluxDBPublisher(SamplePublisher):
   """Publisher writes samples to InfluxDB.
 
+  Samples are written in gzip-compressed line protocol, with concurrent
+  requests of at most --publish_http_chunk_bytes each.
+
   Attributes:
     influx_uri: Takes in type string. Consists of the Influx DB address and
       port.Expects the format hostname:port
@@ -749,11 +976,15 @@ class InfluxDBPublisher(SamplePublisher):
       create.
   """
 
+  STREAMING = True
+
   def __init__(self, influx_uri=None, influx_db_name=None):
     super().__init__()
     # set to default above in flags unless changed
     self.influx_uri = influx_uri
     self.influx_db_name = influx_db_name
+    self._pool = http_pool.ConnectionPool(influx_uri)
+    self._db_created = False
 
   def PublishSamples(self, samples):
     formated_samples = []
@@ -763,10 +994,17 @@ class InfluxDBPublisher(SamplePublisher):
 
   def _Publish(self, formated_samples):
     try:
-      self._CreateDB()
-      body = '\n'.join(formated_samples)
-      self._WriteData(body)
-    except (IOError, httplib.HTTPException) as http_exception:
+      if not self._db_created:
+        self._CreateDB()
+        self._db_created = True
+      start_time = time.time()
+      bodies = ['\n'.join(chunk)
+                for chunk in http_pool.Chunk(formated_samples)]
+      self._pool.Map(self._WriteData, bodies)
+      logging.info('Published %d samples to InfluxDB in %.1f seconds.',
+                   len(formated_samples), time.time() - start_time)
+    except (IOError, httplib.HTTPException,
+            errors.VmUtil.ThreadException) as http_exception:
       logging.error('Error connecting to the database:  %s', http_exception)
 
   def _ConstructSample(self, sample):
@@ -806,37 +1044,83 @@ class InfluxDBPublisher(SamplePublisher):
     """This method is idempotent. If the DB already exists it will simply
     return a 200 code without re-creating it.
     """
-    successful_http_request_codes = [200, 202, 204]
     header = {'Content-type': 'application/x-www-form-urlencoded',
               'Accept': 'text/plain'}
     params = urllib.parse.urlencode(
         {'q': 'CREATE DATABASE ' + self.influx_db_name})
-    conn = httplib.HTTPConnection(self.influx_uri)
-    conn.request('POST', '/query?' + params, headers=header)
-    response = conn.getresponse()
-    conn.close()
-    if response.status in successful_http_request_codes:
-      logging.debug('Success! %s DB Created', self.influx_db_name)
-    else:
-      logging.error('%d Request could not be completed due to: %s',
-                    response.status, response.reason)
-      raise httplib.HTTPException
+    self._pool.Request('POST', '/query?' + params, headers=header)
+    logging.debug('Success! %s DB Created', self.influx_db_name)
 
   def _WriteData(self, data):
-    successful_http_request_codes = [200, 202, 204]
-    params = data
-    header = {"Content-type": "application/octet-stream"}
-    conn = httplib.HTTPConnection(self.influx_uri)
-    conn.request('POST', '/write?' + 'db=' + self.influx_db_name, params,
-                 headers=header)
-    response = conn.getresponse()
-    conn.close()
-    if response.status in successful_http_request_codes:
-      logging.debug('Writing samples to publisher: writing samples.')
-    else:
-      logging.error('%d Request could not be completed due to: %s %s',
-                    response.status, response.reason, data)
-      raise httplib.HTTPException
+    """Writes line protocol data, compressed with gzip."""
+    header = {'Content-type': 'application/octet-stream',
+              'Content-Encoding': 'gzip'}
+    params = urllib.parse.urlencode({'db': self.influx_db_name})
+    self._pool.Request('POST', '/write?' + params,
+                       gzip.compress(data.encode('utf-8')), headers=header)
+    logging.debug('Writing samples to publisher: writing samples.')
+
+
+class _AnnotatedSampleBatch(object):
+  """A SampleBatch with the fields SampleCollector adds to each sample.
+
+  Attributes:
+    batch: The SampleBatch.
+    metadata: dict. The batch's metadata, with the metadata of the
+      MetadataProviders added.
+    fields: dict. Fields added to each sample.
+  """
+
+  def __init__(self, batch, metadata, fields):
+    self.batch = batch
+    self.metadata = metadata
+    self.fields = fields
+    # The sample uris of the batch differ in their last 32 bits.
+    self._uri_base = uuid.uuid4().int & ~0xFFFFFFFF
+
+  def __len__(self):
+    return len(self.batch)
+
+  def __iter__(self):
+    """Yields the samples of the batch as dicts."""
+    batch = self.batch
+    columns = {key: column.tolist()
+               for key, column in batch.metadata_columns.items()}
+    for index, (value, timestamp) in enumerate(zip(batch.values.tolist(),
+                                                   batch.timestamps.tolist())):
+      metadata = self.metadata
+      if columns:
+        metadata = metadata.copy()
+        for key, column in columns.items():
+          metadata[key] = column[index]
+      sample_dict = {'metric': batch.metric, 'value': value,
+                     'unit': batch.unit, 'metadata': metadata,
+                     'timestamp': timestamp}
+      sample_dict.update(self.fields)
+      sample_dict['sample_uri'] = str(uuid.UUID(int=self._uri_base | index))
+      yield sample_dict
+
+
+class _SampleList(object):
+  """The samples of a SampleCollector, as a read-only sequence of dicts.
+
+  The samples of batches are converted to dicts as they are iterated over.
+  """
+
+  def __init__(self, items):
+    self._items = items
+
+  def __len__(self):
+    return sum(len(item) if isinstance(item, _AnnotatedSampleBatch) else 1
+               for item in self._items)
+
+  def __iter__(self):
+    for item in self._items:
+      if isinstance(item, _AnnotatedSampleBatch):
+        for sample_dict in item:
+          yield sample_dict
+      else:
+        yield item
 
 
 class SampleCollector(object):
@@ -846,7 +1130,8 @@ class SampleCollector(object):
   results via any number of SamplePublishers.
 
   Attributes:
-    samples: A list of Sample objects.
+    samples: A list of the annotated samples, as dicts, and annotated
+      SampleBatches.
     metadata_providers: A list of MetadataProvider objects. Metadata providers
       to use.  Defaults to DEFAULT_METADATA_PROVIDERS.
     publishers: A list of SamplePublisher objects to publish to.
@@ -874,6 +1159,10 @@ class SampleCollector(object):
       self.publishers.extend(SampleCollector._PublishersFromFlags())
     if add_default_publishers:
       self.publishers.extend(SampleCollector._DefaultPublishers())
+    # With --streaming_publish, the samples of collectors with the default
+    # publishers are published by the pipeline started by StartStreaming.
+    self._streaming = (not publishers and publishers_from_flags and
+                       add_default_publishers)
 
     logging.debug('Using publishers: {0}'.format(self.publishers))
 
@@ -919,6 +1208,9 @@ class SampleCollector(object):
     if FLAGS.csv_path:
       publishers.append(CSVPublisher(FLAGS.csv_path))
 
+    if FLAGS.parquet_path:
+      publishers.append(ParquetPublisher(FLAGS.parquet_path))
+
     if FLAGS.es_uri:
       publishers.append(ElasticsearchPublisher(es_uri=FLAGS.es_uri,
                                                es_index=FLAGS.es_index,
@@ -932,37 +1224,94 @@ class SampleCollector(object):
   def AddSamples(self, samples, benchmark, benchmark_spec):
     """Adds data samples to the publisher.
 
+    Samples that share a metadata dict share their annotated metadata dict,
+    and a SampleBatch is annotated once for all its samples.
+
     Args:
-      samples: A list of Sample objects.
+      samples: A list of Sample and SampleBatch objects.
       benchmark: string. The name of the benchmark.
       benchmark_spec: BenchmarkSpec. Benchmark specification.
     """
+    # Maps the id of a metadata dict to the dict and its annotated copy. The
+    # dict is kept so that its id is not reused while samples are added.
+    annotated_metadata = {}
+
+    def _Annotate(metadata):
+      if id(metadata) not in annotated_metadata:
+        annotated = metadata
+        for meta_provider in self.metadata_providers:
+          annotated = meta_provider.AddMetadata(annotated, benchmark_spec)
+        annotated_metadata[id(metadata)] = metadata, annotated
+      return annotated_metadata[id(metadata)][1]
+
+    fields = {
+        'product_name': FLAGS.product_name,
+        'official': FLAGS.official,
+        'owner': FLAGS.owner,
+        'run_uri': benchmark_spec.uuid,
+    }
+    items = []
     for s in samples:
+      if isinstance(s, sample_lib.SampleBatch):
+        batch_fields = {'test': benchmark}
+        batch_fields.update(fields)
+        items.append(_AnnotatedSampleBatch(
+            s, _Annotate(s.metadata), batch_fields))
+        continue
       # Annotate the sample.
       sample = dict(s.asdict())
       sample['test'] = benchmark
-
-      for meta_provider in self.metadata_providers:
-        sample['metadata'] = meta_provider.AddMetadata(
-            sample['metadata'], benchmark_spec)
-
-      sample['product_name'] = FLAGS.product_name
-      sample['official'] = FLAGS.official
-      sample['owner'] = FLAGS.owner
-      sample['run_uri'] = benchmark_spec.uuid
+      sample['metadata'] = _Annotate(s.metadata)
+      sample.update(fields)
       sample['sample_uri'] = str(uuid.uuid4())
-      self.samples.append(sample)
+      items.append(sample)
+    pipeline = self._GetPipeline()
+    if pipeline:
+      pipeline.Put(_SampleList(items))
+    else:
+      self.samples.extend(items)
+
+  def _GetPipeline(self):
+    """Returns the pipeline publishing the samples, if they are streamed."""
+    return publish_pipeline.GetPipeline() if self._streaming else None
 
   def PublishSamples(self):
     """Publish samples via all registered publishers."""
+    pipeline = self._GetPipeline()
+    if pipeline:
+      # The samples were added in other processes, e.g. with --run_processes.
+      pipeline.Put(_SampleList(self.samples))
+      self.samples = []
+      pipeline.Flush()
+      return
     if not self.samples:
       logging.warn('No samples to publish.')
       return
+    samples = _SampleList(self.samples)
     for publisher in self.publishers:
-      publisher.PublishSamples(self.samples)
+      publisher.PublishSamples(samples)
     self.samples = []
 
 
+def StartStreaming():
+  """Starts publishing samples in the background as they are collected.
+
+  Until StopStreaming is called, the samples added to SampleCollectors with the
+  default publishers are handed to a publish_pipeline.Pipeline.
+  """
+  publish_pipeline.Start(SampleCollector().publishers,
+                         vm_util.PrependTempDir(WRITE_AHEAD_LOG_NAME))
+
+
+def StopStreaming():
+  """Publishes the remaining samples and stops publishing in the background.
+
+  Returns:
+    The number of publishers that failed to publish samples.
+  """
+  return publish_pipeline.Stop()
+
+
 def RepublishJSONSamples(path):
   """Read samples from a JSON file and re-export them.
 
@@ -973,6 +1322,9 @@ def RepublishJSONSamples(path):
   with open(path, 'r') as file:
     samples = [json.loads(s) for s in file if s]
   for sample in samples:
+    # Samples written with --nocollapse_labels have their metadata.
+    if 'labels' not in sample:
+      continue
     # Chop '|' at the beginning and end of labels and split labels by '|,|'
     fields = sample.pop('labels')[1:-1].split('|,|')
     # Turn the fields into [[key, value], ...]
@@ -993,14 +1345,13 @@ if __name__ == '__main__':
     argv = FLAGS(sys.argv)
   except flags.Error as e:
     logging.error(e)
-    logging.info('Flag error. Usage: publisher.py <flags> path-to-json-file')
+    logging.info('Flag error. Usage: publisher.py <flags> path-to-json-file...')
     sys.exit(1)
 
-  if len(argv) != 2:
+  if len(argv) < 2:
     logging.info('Argument number error. Usage: publisher.py <flags> '
-                 'path-to-json-file')
+                 'path-to-json-file...')
     sys.exit(1)
 
-  json_path = argv[1]
-
-  RepublishJSONSamples(json_path)
+  for json_path in argv[1:]:
+    RepublishJSONSamples(json_path)
@@ -0,0 +1,296 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tears down benchmark resources in the background.
+
+Deleting a benchmark's resources can not affect its results, but can take a
+long time. With --async_teardown, the teardown phase hands the BenchmarkSpec to
+the reaper, which deletes its resources in a child process while PKB publishes
+the results and goes on to the next benchmark. The child process is forked
+while the benchmark's flags are in effect, so it is not affected by the flags
+of the benchmarks that run next. At most --async_teardown_max_pending specs are
+torn down at once; handing off another waits for one of them to finish, which
+bounds how far teardown can fall behind. Specs with static VMs are torn down
+in the PKB process, which returns the VMs to the static VM pool for the next
+benchmarks.
+
+Before PKB exits, it waits for pending teardowns for at most
+--async_teardown_exit_timeout seconds and stops the ones that did not finish.
+Specs are recorded in a queue directory shared by all runs until their
+resources are deleted, so the resources of a run whose teardowns were stopped,
+or that crashed, are deleted by a later `pkb.py --reap`.
+"""
+
+import json
+import logging
+import multiprocessing
+from multiprocessing import connection
+import os
+import time
+
+from absl import flags
+from perfkitbenchmarker import background_tasks
+from perfkitbenchmarker import benchmark_spec as benchmark_spec_lib
+from perfkitbenchmarker import context
+from perfkitbenchmarker import vm_util
+
+flags.DEFINE_boolean(
+    'async_teardown', False,
+    'If true, the teardown phase of a benchmark hands its resources to a '
+    'background reaper and PKB goes on to the next benchmark while they are '
+    'deleted. Resources that were not deleted when PKB exits are deleted by '
+    'pkb.py --reap. Has no effect with --vm_pool, --run_processes or '
+    '--pipeline_depth, or for benchmarks that use static VMs.')
+flags.DEFINE_integer(
+    'async_teardown_max_pending', 4,
+    'The maximum number of benchmarks whose resources are deleted in the '
+    'background at once with --async_teardown. Further teardowns wait.',
+    lower_bound=1)
+flags.DEFINE_integer(
+    'async_teardown_exit_timeout', None,
+    'The maximum number of seconds PKB waits for background teardowns before '
+    'it exits. Teardowns that did not finish are stopped and their resources '
+    'are deleted by pkb.py --reap. If unset, PKB waits for all of them.',
+    lower_bound=0)
+flags.DEFINE_boolean(
+    'reap', False,
+    'If true, instead of running benchmarks, deletes the resources of '
+    'benchmarks whose --async_teardown did not finish, e.g. because PKB exited '
+    'or crashed first.')
+
+FLAGS = flags.FLAGS
+
+_QUEUE_DIR = 'reap_queue'
+
+# Reaper processes are forked so that they inherit the flags in effect.
+_FORK = multiprocessing.get_context('fork')
+
+# Spec uuids mapped to the processes tearing them down.
+_pending = {}
+# Uuids of the specs that were handed to the reaper.
+_submitted = set()
+_num_failed = 0
+
+
+def _GetQueueDir():
+  return os.path.join(FLAGS.temp_dir, _QUEUE_DIR)
+
+
+def _WriteEntry(path, entry):
+  """Atomically writes a queue entry."""
+  with open(path + '.tmp', 'w') as entry_file:
+    json.dump(entry, entry_file)
+  os.replace(path + '.tmp', path)
+
+
+def _DeleteResources(spec, directory):
+  """Deletes a spec's resources and saves its final state."""
+  spec.Delete()
+  spec.Pickle(directory)
+
+
+def _TearDown(spec, entry_path, handed_off):
+  """Tears down a spec in a reaper process.
+
+  Args:
+    spec: The BenchmarkSpec to tear down.
+    entry_path: The path of the spec's queue entry.
+    handed_off: multiprocessing.Event set once the entry records this process,
+      after which this process owns the entry.
+  """
+  handed_off.wait()
+  context.SetThreadBenchmarkSpec(spec)
+  start_time = time.time()
+  try:
+    _DeleteResources(spec, None)
+    os.remove(entry_path)
+  except Exception:  # pylint: disable=broad-except
+    logging.exception('Background teardown of %s failed. Run pkb.py --reap '
+                      'to retry it.', spec.name)
+    raise SystemExit(1)
+  logging.info('Tore down the resources of %s in the background in %.1f '
+               'seconds.', spec.name, time.time() - start_time)
+
+
+def _CollectFinished():
+  """Forgets the reaper processes that finished."""
+  global _num_failed
+  for uuid, process in list(_pending.items()):
+    if process.exitcode is None:
+      continue
+    del _pending[uuid]
+    if process.exitcode:
+      _num_failed += 1
+
+
+def _WaitForSlot():
+  """Waits until fewer than --async_teardown_max_pending specs are pending."""
+  _CollectFinished()
+  if len(_pending) < FLAGS.async_teardown_max_pending:
+    return
+  logging.info('Waiting for one of %d background teardowns to finish.',
+               len(_pending))
+  while len(_pending) >= FLAGS.async_teardown_max_pending:
+    connection.wait([process.sentinel for process in _pending.values()])
+    _CollectFinished()
+
+
+def CanSubmit(spec):
+  """Returns whether a spec's resources can be deleted in the background.
+
+  Deleting a static VM returns it to the static VM pool, which only a teardown
+  in the PKB process can do.
+
+  Args:
+    spec: The BenchmarkSpec to tear down.
+  """
+  return not any(vm.is_static for vm in spec.vms)
+
+
+def Submit(spec):
+  """Hands a spec to the reaper to delete its resources in the background.
+
+  Must be called while the spec's flags are in effect, and only for specs that
+  CanSubmit accepts. Waits while
+  --async_teardown_max_pending specs are being torn down. Does nothing if the
+  spec's resources were deleted or handed to the reaper before.
+
+  Args:
+    spec: The BenchmarkSpec to tear down. It is saved before it is handed off,
+      and must not be changed or saved afterwards.
+  """
+  if spec.deleted or spec.uuid in _submitted:
+    return
+  _WaitForSlot()
+  spec.Pickle()
+  queue_dir = _GetQueueDir()
+  os.makedirs(queue_dir, exist_ok=True)
+  entry_path = os.path.join(queue_dir, spec.uuid + '.json')
+  entry = {
+      'name': spec.name,
+      'uid': spec.uid,
+      'run_uri': FLAGS.run_uri,
+      'directory': vm_util.GetTempDir(),
+      'pid': os.getpid(),
+      'submit_time': time.time(),
+  }
+  _WriteEntry(entry_path, entry)
+  handed_off = _FORK.Event()
+  process = _FORK.Process(
+      target=_TearDown, name='reaper-%s' % spec.uid,
+      args=(spec, entry_path, handed_off))
+  # The entry lets pkb.py --reap finish the teardown if PKB stops it.
+  process.daemon = True
+  logging.info('Tearing down the resources of %s in the background.',
+               spec.name)
+  process.start()
+  # The entry is only written by this process, so stopping the reaper process
+  # can not leave a partly written entry behind.
+  entry['pid'] = process.pid
+  _WriteEntry(entry_path, entry)
+  handed_off.set()
+  _pending[spec.uuid] = process
+  _submitted.add(spec.uuid)
+
+
+def IsSubmitted(spec):
+  """Returns whether a spec was handed to the reaper."""
+  return spec.uuid in _submitted
+
+
+def WaitForPending(timeout=None):
+  """Waits for the pending teardowns to finish and stops the rest.
+
+  Args:
+    timeout: The maximum number of seconds to wait, or None to wait until they
+      finish.
+
+  Returns:
+    The number of teardowns that failed or did not finish.
+  """
+  global _num_failed
+  deadline = None if timeout is None else time.time() + timeout
+  if _pending:
+    logging.info('Waiting for %d background teardowns to finish.',
+                 len(_pending))
+  for process in list(_pending.values()):
+    process.join(None if deadline is None else max(0, deadline - time.time()))
+  _CollectFinished()
+  for process in _pending.values():
+    process.terminate()
+    process.join()
+  num_unfinished = _num_failed + len(_pending)
+  _pending.clear()
+  _num_failed = 0
+  if num_unfinished:
+    logging.warning('%d background teardowns failed or did not finish. Run '
+                    'pkb.py --reap to delete their resources.', num_unfinished)
+  return num_unfinished
+
+
+def _IsRunning(pid):
+  """Returns whether another process with the pid is running."""
+  if pid == os.getpid():
+    return False
+  try:
+    os.kill(pid, 0)
+  except OSError:
+    return False
+  return True
+
+
+def _Reap(entry_path):
+  """Tears down the spec of a queue entry. Returns whether it succeeded."""
+  with open(entry_path) as entry_file:
+    entry = json.load(entry_file)
+  if _IsRunning(entry['pid']):
+    logging.info('Skipping %s of run %s, whose teardown is still running.',
+                 entry['name'], entry['run_uri'])
+    return True
+  logging.info('Tearing down %s of run %s.', entry['name'], entry['run_uri'])
+  try:
+    spec = benchmark_spec_lib.BenchmarkSpec.Load(entry['uid'],
+                                                 entry['directory'])
+    context.SetThreadBenchmarkSpec(spec)
+    with spec.RedirectGlobalFlags():
+      _DeleteResources(spec, entry['directory'])
+  except Exception:  # pylint: disable=broad-except
+    logging.exception('Teardown of %s of run %s failed.', entry['name'],
+                      entry['run_uri'])
+    return False
+  os.remove(entry_path)
+  return True
+
+
+def ReapPending():
+  """Tears down the specs whose background teardowns did not finish.
+
+  Each spec is torn down in its own process, so that its flags do not affect
+  the others.
+
+  Returns:
+    Exit status for the process.
+  """
+  queue_dir = _GetQueueDir()
+  entry_paths = []
+  if os.path.isdir(queue_dir):
+    entry_paths = sorted(os.path.join(queue_dir, name)
+                         for name in os.listdir(queue_dir)
+                         if name.endswith('.json'))
+  logging.info('Found %d pending teardowns.', len(entry_paths))
+  if not entry_paths:
+    return 0
+  results = background_tasks.RunParallelProcesses(
+      [(_Reap, (entry_path,), {}) for entry_path in entry_paths],
+      FLAGS.async_teardown_max_pending)
+  return 0 if all(results) else 1
@@ -20,6 +20,7 @@ import string
 import uuid
 
 from absl import flags
+from perfkitbenchmarker import provision_graph
 from perfkitbenchmarker import resource
 from perfkitbenchmarker import vm_util
 import six
@@ -195,6 +196,17 @@ class BaseRelationalDb(resource.BaseResource):
     else:
       self.is_managed_db = True
 
+  def GetProvisionDependencies(self):
+    """See base class.
+
+    A managed database only needs the client VMs' network addresses, so it is
+    created while the VMs boot, while an unmanaged database is installed on a
+    VM once it is ready.
+    """
+    if self.is_managed_db:
+      return [provision_graph.NETWORKS, provision_graph.VMS_CREATED]
+    return [provision_graph.VMS_READY]
+
   @property
   def client_vm(self):
     """Client VM which will drive the database test.
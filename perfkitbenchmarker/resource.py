@@ -26,12 +26,18 @@ from __future__ import print_function
 import abc
 import time
 
+from perfkitbenchmarker import background_tasks
 from perfkitbenchmarker import errors
+from perfkitbenchmarker import provision_graph
 from perfkitbenchmarker import vm_util
 import six
 
 _RESOURCE_REGISTRY = {}
 
+# Concurrency class (see --concurrency_classes) of resource creation, formatted
+# with the lower case cloud name, e.g. gcp-create.
+CREATE_CONCURRENCY_CLASS = '%s-create'
+
 
 def GetResourceClass(base_class, **kwargs):
   """Returns the subclass with the corresponding attributes.
@@ -111,6 +117,14 @@ class BaseResource(six.with_metaclass(AutoRegisterResourceMeta, object)):
     """Returns a dictionary of metadata about the resource."""
     return self.metadata.copy()
 
+  def GetProvisionDependencies(self):
+    """Returns the provisioning steps that must finish before Create is called.
+
+    Only used with --provision_dag, which creates independent resources
+    concurrently. See provision_graph for the step names.
+    """
+    return [provision_graph.NETWORKS]
+
   @abc.abstractmethod
   def _Create(self):
     """Creates the underlying resource."""
@@ -200,12 +214,15 @@ class BaseResource(six.with_metaclass(AutoRegisterResourceMeta, object)):
     """Reliably creates the underlying resource."""
     if self.created:
       return
-    # Overwrite create_start_time each time this is called,
-    # with the assumption that multple calls to Create() imply
-    # that the resource was not actually being created on the
-    # backend during previous failed attempts.
-    self.create_start_time = time.time()
-    self._Create()
+    cloud = getattr(self, 'CLOUD', None)
+    with background_tasks.ConcurrencySlot(
+        CREATE_CONCURRENCY_CLASS % str(cloud).lower() if cloud else None):
+      # Overwrite create_start_time each time this is called,
+      # with the assumption that multple calls to Create() imply
+      # that the resource was not actually being created on the
+      # backend during previous failed attempts.
+      self.create_start_time = time.time()
+      self._Create()
     try:
       if not self._Exists():
         raise errors.Resource.RetryableCreationError(
@@ -0,0 +1,186 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Follows the output of a command started by RobustRemoteCommand.
+
+By default RobustRemoteCommand polls for completion with repeated ssh calls to
+wait_for_command.py and fetches all of the command's output once it finishes.
+With --robust_remote_command_streaming, a single ssh call to
+wait_for_command.py --follow instead streams stdout and stderr while the command
+runs and reports the return code as soon as it finishes.
+
+The stream is made of frames carrying the byte offset of their data, so if the
+connection drops, Follow reconnects and resumes from the last byte received.
+Output lines are logged as they arrive, which shows the progress of long
+benchmarks.
+"""
+
+import base64
+import logging
+import subprocess
+import tempfile
+import time
+
+from absl import flags
+from perfkitbenchmarker import command_profiler
+from perfkitbenchmarker import errors
+
+flags.DEFINE_boolean(
+    'robust_remote_command_streaming', False,
+    'If true, RobustRemoteCommand streams the output of commands over one ssh '
+    'connection while they run, resuming from the last byte received if the '
+    'connection drops, instead of polling for completion and fetching all of '
+    'the output at the end.')
+
+FLAGS = flags.FLAGS
+
+# Must match wait_for_command.py.
+FRAME_PREFIX = 'PKB-STREAM'
+STDOUT = 'out'
+STDERR = 'err'
+_EXIT = 'exit'
+
+# Seconds to wait before reconnecting after the connection drops.
+_RECONNECT_SECONDS = 5
+
+
+class CommandStream(object):
+  """Reassembles the output of a command from wait_for_command.py frames.
+
+  Frames may be received more than once when a stream is resumed, so only the
+  data past the offset already received is kept.
+
+  Attributes:
+    offsets: Dict mapping STDOUT and STDERR to the number of bytes received.
+    retcode: The command's return code, or None until it has finished.
+  """
+
+  def __init__(self, log_level=logging.DEBUG):
+    self._log_level = log_level
+    self._chunks = {STDOUT: [], STDERR: []}
+    self._partial_lines = {STDOUT: b'', STDERR: b''}
+    self.offsets = {STDOUT: 0, STDERR: 0}
+    self.retcode = None
+
+  def Parse(self, line):
+    """Handles one line printed by wait_for_command.py --follow.
+
+    Args:
+      line: string. The line, with or without its line ending.
+
+    Returns:
+      True if the line was a frame, False if it was ignored.
+
+    Raises:
+      RemoteCommandError: If the frame skips over output not yet received.
+    """
+    fields = line.split()
+    if len(fields) < 3 or fields[0] != FRAME_PREFIX:
+      return False
+    if fields[1] == _EXIT:
+      self.retcode = int(fields[2])
+      return True
+    if fields[1] not in self._chunks or len(fields) != 4:
+      return False
+    stream, offset = fields[1], int(fields[2])
+    if offset > self.offsets[stream]:
+      raise errors.VirtualMachine.RemoteCommandError(
+          'Output of %s stream received at byte %d, expected byte %d.' %
+          (stream, offset, self.offsets[stream]))
+    data = base64.b64decode(fields[3])[self.offsets[stream] - offset:]
+    if data:
+      self._chunks[stream].append(data)
+      self.offsets[stream] += len(data)
+      self._LogLines(stream, data)
+    return True
+
+  def _LogLines(self, stream, data):
+    lines = (self._partial_lines[stream] + data).split(b'\n')
+    self._partial_lines[stream] = lines.pop()
+    for line in lines:
+      logging.log(self._log_level, '[%s] %s', stream,
+                  line.decode('ascii', 'ignore'))
+
+  def Output(self, stream):
+    """Returns the text received on STDOUT or STDERR."""
+    partial, self._partial_lines[stream] = self._partial_lines[stream], b''
+    if partial:
+      logging.log(self._log_level, '[%s] %s', stream,
+                  partial.decode('ascii', 'ignore'))
+    return b''.join(self._chunks[stream]).decode('ascii', 'ignore')
+
+
+def _ReadStream(cmd, stream):
+  """Runs cmd once, passing each line of its stdout to stream.
+
+  Returns:
+    A tuple of the return code and the stderr of cmd.
+  """
+  with tempfile.TemporaryFile() as stderr_file, command_profiler.Measure(
+      cmd) as measurement:
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+    try:
+      for line in process.stdout:
+        if not stream.Parse(line.decode('ascii', 'ignore')):
+          logging.debug('Ignoring unexpected output: %s', line)
+    finally:
+      process.stdout.close()
+      retcode = measurement.retcode = process.wait()
+    stderr_file.seek(0)
+    return retcode, stderr_file.read().decode('ascii', 'ignore')
+
+
+def Follow(build_cmd, should_log=False, retries=None):
+  """Streams the output of a command until it finishes.
+
+  Args:
+    build_cmd: A function called as build_cmd(stdout_offset, stderr_offset)
+        that returns a list of strings running wait_for_command.py --follow
+        with those offsets on the VM.
+    should_log: Whether to log the command's output lines at the info level as
+        they arrive. They are always logged at the debug level.
+    retries: The maximum number of consecutive connections that may end
+        without receiving any output before giving up. If None, it defaults to
+        the value of the flag ssh_retries.
+
+  Returns:
+    A tuple of stdout, stderr, return_code of the command.
+
+  Raises:
+    RemoteCommandError: If the stream could not be followed to completion.
+  """
+  if retries is None:
+    retries = FLAGS.ssh_retries
+  stream = CommandStream(logging.INFO if should_log else logging.DEBUG)
+  failures = 0
+  while True:
+    received = sum(stream.offsets.values())
+    cmd = build_cmd(stream.offsets[STDOUT], stream.offsets[STDERR])
+    logging.info('Running: %s', ' '.join(cmd))
+    retcode, stderr = _ReadStream(cmd, stream)
+    if stream.retcode is not None:
+      return stream.Output(STDOUT), stream.Output(STDERR), stream.retcode
+    if sum(stream.offsets.values()) > received:
+      failures = 0
+    else:
+      failures += 1
+    if failures > retries:
+      raise errors.VirtualMachine.RemoteCommandError(
+          'Lost the output stream of a remote command %d times in a row. Last '
+          'return code: %s\nFull command: %s\nSTDERR: %s' %
+          (failures, retcode, ' '.join(cmd), stderr))
+    logging.warning('Output stream ended before the command finished (return '
+                    'code %s), resuming at stdout byte %d and stderr byte %d: '
+                    '%s', retcode, stream.offsets[STDOUT],
+                    stream.offsets[STDERR], stderr)
+    time.sleep(_RECONNECT_SECONDS)
@@ -14,6 +14,7 @@
 """A performance sample class."""
 
 import collections
+import itertools
 import time
 import numpy as np
 PERCENTILES_LIST = 0.1, 1, 5, 10, 50, 90, 95, 99, 99.9
@@ -109,3 +110,77 @@ class Sample(collections.namedtuple('Sample', _SAMPLE_FIELDS)):
   def asdict(self):
     """Converts the Sample to a dictionary."""
     return self._asdict()
+
+
+def _ToPython(value):
+  """Converts a numpy scalar to the equivalent Python value."""
+  return value.item() if isinstance(value, np.generic) else value
+
+
+class SampleBatch(object):
+  """Samples of one metric, stored by column.
+
+  A benchmark that records many samples of a metric, like a time series, can
+  return a SampleBatch in place of them. The values and timestamps are stored
+  in numpy arrays and the metadata the samples share is stored once, which
+  takes a fraction of the memory of the equivalent Samples. Iterating over a
+  batch yields its Samples.
+
+  Attributes:
+    metric: string. Name of the metric within the benchmark.
+    values: numpy array of float. Results for 'metric'.
+    unit: string. Units for 'values'.
+    metadata: dict. Metadata shared by all samples in the batch.
+    timestamps: numpy array of float. Unix timestamps.
+    metadata_columns: dict mapping metadata keys to sequences with one value
+      per sample. The value of a sample is added to the shared metadata.
+  """
+
+  def __init__(self, metric, values, unit, metadata=None, timestamps=None,
+               metadata_columns=None):
+    self.metric = metric
+    self.values = np.asarray(values, dtype=np.float64)
+    self.unit = unit
+    self.metadata = metadata or {}
+    if timestamps is None:
+      timestamps = np.full(len(self.values), time.time())
+    self.timestamps = np.asarray(timestamps, dtype=np.float64)
+    self.metadata_columns = {
+        key: np.asarray(column)
+        for key, column in (metadata_columns or {}).items()}
+    for name, column in itertools.chain(
+        [('timestamps', self.timestamps)], self.metadata_columns.items()):
+      if column.shape != self.values.shape:
+        raise ValueError(
+            'SampleBatch %s has %d values, but %d %s.' %
+            (metric, len(self.values), len(column), name))
+
+  def __len__(self):
+    return len(self.values)
+
+  def __iter__(self):
+    for index in range(len(self)):
+      yield self[index]
+
+  def __getitem__(self, index):
+    return Sample(self.metric, _ToPython(self.values[index]), self.unit,
+                  self.GetMetadata(index), _ToPython(self.timestamps[index]))
+
+  def __repr__(self):
+    return '<{0} metric="{1}" len={2}>'.format(
+        type(self).__name__, self.metric, len(self))
+
+  def GetMetadata(self, index):
+    """Returns the metadata of a sample in the batch.
+
+    Samples without metadata columns share the batch's metadata dict.
+
+    Args:
+      index: int. Index of the sample.
+    """
+    if not self.metadata_columns:
+      return self.metadata
+    metadata = self.metadata.copy()
+    for key, column in self.metadata_columns.items():
+      metadata[key] = _ToPython(column[index])
+    return metadata
@@ -23,7 +23,9 @@ child process running the user-specified command exits.
 This command will fail if the status file cannot be successfully locked.
 
 To await completion, "wait_for_command.py" acquires a shared lock on the
-status file, which blocks until the process completes.
+status file, which blocks until the process completes. Since the command writes
+straight to the stdout and stderr files, "wait_for_command.py --follow" can also
+stream them while the command runs.
 
 *Runs on the guest VM. Supports Python 2.6, 2.7, and 3.x.*
 """
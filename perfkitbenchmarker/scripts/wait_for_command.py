@@ -25,11 +25,23 @@ If passed the path to the status file, but not the stdout and stderr files,
 this script will block until command completion, then print
 'Command finished.' before returning with status 0.
 
+With --follow, the wrapped command's stdout and stderr are instead streamed as
+they are written, starting from --stdout_offset and --stderr_offset, until the
+command completes. Each line printed is a frame:
+
+  PKB-STREAM out OFFSET DATA   DATA, in base64, was read from stdout at OFFSET.
+  PKB-STREAM err OFFSET DATA   DATA, in base64, was read from stderr at OFFSET.
+  PKB-STREAM exit RETURN_CODE  The command finished with RETURN_CODE.
+
+The script then exits with status 0. A reader whose connection drops can run
+the script again with the offsets it has received so far to resume the stream.
+
 *Runs on the guest VM. Supports Python 2.6, 2.7, and 3.x.*
 """
 
 from __future__ import print_function
 
+import base64
 import errno
 import fcntl
 import optparse
@@ -43,6 +55,87 @@ import time
 WAIT_TIMEOUT_IN_SEC = 120.0
 WAIT_SLEEP_IN_SEC = 5.0
 RETRYABLE_SSH_RETCODE = 255
+FOLLOW_POLL_IN_SEC = 0.5
+# Multiple of 3, so that only the last frame of a read may need base64 padding.
+FOLLOW_CHUNK_BYTES = 48 * 1024
+FRAME_PREFIX = 'PKB-STREAM'
+
+
+def _WaitForFiles(options):
+  """Waits for execute_command.py to create the exclusive and status files."""
+  start = time.time()
+  while time.time() < WAIT_TIMEOUT_IN_SEC + start:
+    try:
+      with open(options.exclusive, 'r'):
+        with open(options.status, 'r'):
+          break
+    except IOError as e:
+      print('WARNING: file doesn\'t exist, retrying: %s' % e, file=sys.stderr)
+      time.sleep(WAIT_SLEEP_IN_SEC)
+
+
+def _ParseReturnCode(return_code_str):
+  """Returns the return code to report for the wrapped command."""
+  if return_code_str:
+    return_code = int(return_code_str)
+  else:
+    print('WARNING: wrapper script interrupted.', file=sys.stderr)
+    return_code = 1
+
+  # RemoteCommand retries 255 as temporary SSH failure. In this case,
+  # long running command actually returned 255 and should not be retried.
+  if return_code == RETRYABLE_SSH_RETCODE:
+    print('WARNING: command returned 255.', file=sys.stderr)
+    return_code = 1
+  return return_code
+
+
+def _PrintFrame(*fields):
+  print(' '.join([FRAME_PREFIX] + [str(field) for field in fields]))
+
+
+def _StreamNewOutput(f, name, offset):
+  """Prints frames for the data in f after offset, returning the new offset."""
+  f.seek(offset)
+  while True:
+    data = f.read(FOLLOW_CHUNK_BYTES)
+    if not data:
+      return offset
+    _PrintFrame(name, offset, base64.b64encode(data).decode('ascii'))
+    offset += len(data)
+
+
+def _Follow(options):
+  """Streams the command's output until it completes. See module docstring."""
+  _WaitForFiles(options)
+  offsets = {'out': options.stdout_offset, 'err': options.stderr_offset}
+  with open(options.status, 'r') as status:
+    with open(options.stdout, 'rb') as stdout:
+      with open(options.stderr, 'rb') as stderr:
+        while True:
+          # Check for completion before reading, so that the final read sees
+          # all of the command's output.
+          try:
+            fcntl.lockf(status, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            finished = True
+          except IOError as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+              raise e
+            finished = False
+          offsets['out'] = _StreamNewOutput(stdout, 'out', offsets['out'])
+          offsets['err'] = _StreamNewOutput(stderr, 'err', offsets['err'])
+          sys.stdout.flush()
+          if finished:
+            break
+          time.sleep(FOLLOW_POLL_IN_SEC)
+    return_code_str = status.read()
+
+  _PrintFrame('exit', _ParseReturnCode(return_code_str))
+  sys.stdout.flush()
+  if options.delete:
+    for f in [options.stdout, options.stderr, options.status]:
+      os.unlink(f)
+  return 0
 
 
 def main():
@@ -63,13 +156,23 @@ def main():
       help='Will block until FILE exists to ensure that status is ready to be '
       'read. Required.',
       metavar='FILE')
+  p.add_option('-f', '--follow', dest='follow', action='store_true',
+               help='Stream stdout and stderr as frames until the command '
+               'completes. Requires --stdout and --stderr.')
+  p.add_option('--stdout_offset', dest='stdout_offset', type='int', default=0,
+               help='With --follow, the byte offset to stream stdout from.')
+  p.add_option('--stderr_offset', dest='stderr_offset', type='int', default=0,
+               help='With --follow, the byte offset to stream stderr from.')
   options, args = p.parse_args()
   if args:
     sys.stderr.write('Unexpected arguments: {0}\n'.format(args))
     return 1
 
   missing = []
-  for option in ('status', 'exclusive'):
+  required = ['status', 'exclusive']
+  if options.follow:
+    required.extend(['stdout', 'stderr'])
+  for option in required:
     if getattr(options, option) is None:
       missing.append(option)
 
@@ -80,16 +183,11 @@ def main():
     sys.stderr.write(msg)
     return 1
 
-  start = time.time()
+  if options.follow:
+    return _Follow(options)
+
   return_code_str = None
-  while time.time() < WAIT_TIMEOUT_IN_SEC + start:
-    try:
-      with open(options.exclusive, 'r'):
-        with open(options.status, 'r'):
-          break
-    except IOError as e:
-      print('WARNING: file doesn\'t exist, retrying: %s' % e, file=sys.stderr)
-      time.sleep(WAIT_SLEEP_IN_SEC)
+  _WaitForFiles(options)
 
   signal.signal(signal.SIGALRM, lambda signum, frame: None)
   signal.alarm(int(WAIT_TIMEOUT_IN_SEC))
@@ -118,17 +216,7 @@ def main():
 
   with open(options.stdout, 'r') as stdout:
     with open(options.stderr, 'r') as stderr:
-      if return_code_str:
-        return_code = int(return_code_str)
-      else:
-        print('WARNING: wrapper script interrupted.', file=sys.stderr)
-        return_code = 1
-
-      # RemoteCommand retries 255 as temporary SSH failure. In this case,
-      # long running command actually returned 255 and should not be retried.
-      if return_code == RETRYABLE_SSH_RETCODE:
-        print('WARNING: command returned 255.', file=sys.stderr)
-        return_code = 1
+      return_code = _ParseReturnCode(return_code_str)
 
       stderr_copier = threading.Thread(target=shutil.copyfileobj,
                                        args=[stderr, sys.stderr],
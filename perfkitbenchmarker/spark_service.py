@@ -31,6 +31,7 @@ import datetime
 import posixpath
 
 from absl import flags
+from perfkitbenchmarker import provision_graph
 from perfkitbenchmarker import resource
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.linux_packages import hadoop
@@ -99,6 +100,10 @@ class BaseSparkService(resource.BaseResource):
             spark_service_spec.worker_group.vm_spec.zone)
     self.zone = spark_service_spec.master_group.vm_spec.zone
 
+  def GetProvisionDependencies(self):
+    """See base class."""
+    return [provision_graph.VMS_READY]
+
   @abc.abstractmethod
   def SubmitJob(self, job_jar, class_name,
                 job_script=None,
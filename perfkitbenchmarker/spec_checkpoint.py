@@ -0,0 +1,426 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Saves BenchmarkSpecs as append-only journals of their resources' state.
+
+A BenchmarkSpec is saved after each phase so that a later run with --run_stage
+can load it. Instead of pickling the whole spec each time, the spec and each
+resource it references (VMs, disks, networks, firewalls, ...) are pickled
+separately, with references between them replaced by keys, and only the
+objects whose state changed since the last save are appended to the journal.
+An attribute that can not be pickled is left out with a warning rather than
+failing the save.
+
+The journal is a sequence of records, each a line of JSON followed by a
+pickled payload of the size given in the JSON:
+
+  {"type": "header", "schema_version": 1, ...}
+  {"type": "object", "key": "GceVirtualMachine-0", "class": ...,
+   "summary": {"name": ..., "zone": ..., ...}, "size": 1234}<payload>
+  ...
+  {"type": "commit", ...}
+
+Records are only used once a commit record follows them, so a save that is
+interrupted leaves the previous one intact. The summaries hold the attributes
+that identify a resource, so e.g. which resources a spec created can be seen in
+the journal without unpickling anything. The journal is rewritten with only the
+latest records once it grows to several times their size.
+"""
+
+import collections
+import hashlib
+import importlib
+import io
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+
+from absl import flags
+from perfkitbenchmarker import network
+from perfkitbenchmarker import resource
+from perfkitbenchmarker import sample
+
+flags.DEFINE_enum(
+    'spec_checkpoint_format', 'journal', ['journal', 'pickle'],
+    'How BenchmarkSpecs are saved after each phase for later runs with '
+    '--run_stage. "journal" appends the state of the resources that changed '
+    'since the last save to a journal, "pickle" pickles the whole spec each '
+    'time. Specs saved in either format can be loaded.')
+
+FLAGS = flags.FLAGS
+
+# Readers accept journals written with this or an earlier schema version.
+SCHEMA_VERSION = 1
+ROOT_KEY = 'root'
+
+_HEADER = 'header'
+_OBJECT = 'object'
+_COMMIT = 'commit'
+# Objects of these types get their own records.
+_TRACKED_TYPES = (resource.BaseResource, network.BaseNetwork,
+                  network.BaseFirewall, network.BaseVpnGateway)
+# Attributes copied to the summaries of object records when they are JSON
+# scalars.
+_SUMMARY_ATTRIBUTES = ('CLOUD', 'RESOURCE_TYPE', 'name', 'id', 'zone',
+                       'region', 'created', 'deleted', 'user_managed',
+                       'uid')
+# Journals are rewritten when they are this many times larger than their
+# latest records.
+_COMPACTION_RATIO = 3
+_PICKLE_ERRORS = (pickle.PicklingError, TypeError, AttributeError)
+
+_lock = threading.Lock()
+# Journal path to the Journal saving to it.
+_journals = {}
+
+
+class CheckpointError(Exception):
+  """Raised when a journal can not be loaded."""
+
+
+def _GetClassName(cls):
+  return '%s:%s' % (cls.__module__, cls.__qualname__)
+
+
+def _GetClass(class_name):
+  module_name, qualname = class_name.split(':')
+  value = importlib.import_module(module_name)
+  for name in qualname.split('.'):
+    value = getattr(value, name)
+  return value
+
+
+def _Summarize(obj):
+  """Returns the JSON scalar attributes of an object that identify it."""
+  summary = {}
+  for name in _SUMMARY_ATTRIBUTES:
+    value = getattr(obj, name, None)
+    if isinstance(value, (str, int, float, bool)):
+      summary[name] = value
+  return summary
+
+
+def _LoadReference(key):
+  """Stands in for a reference to a tracked object in pickled state.
+
+  _Unpickler resolves it to the loaded object instead of calling it.
+  """
+  raise pickle.UnpicklingError('No object with key %s.' % key)
+
+
+class _Pickler(pickle.Pickler):
+  """Pickles an object's state, replacing tracked objects with their keys."""
+
+  def __init__(self, journal, stream):
+    super(_Pickler, self).__init__(stream, pickle.HIGHEST_PROTOCOL)
+    self._journal = journal
+    self.references = []
+
+  # Unlike persistent_id, this is not called for builtin scalars and
+  # containers, which make up most of the state.
+  def reducer_override(self, obj):
+    if not self._journal.IsTracked(obj):
+      return NotImplemented
+    self.references.append(obj)
+    return _LoadReference, (self._journal.GetKey(obj),)
+
+
+class _Unpickler(pickle.Unpickler):
+  """Unpickles an object's state, resolving keys to the loaded objects."""
+
+  def __init__(self, stream, objects):
+    super(_Unpickler, self).__init__(stream)
+    self._objects = objects
+
+  def _Resolve(self, key):
+    if key not in self._objects:
+      return _LoadReference(key)
+    return self._objects[key]
+
+  def find_class(self, module, name):
+    if module == __name__ and name == _LoadReference.__name__:
+      return self._Resolve
+    return super(_Unpickler, self).find_class(module, name)
+
+
+def _WriteRecord(stream, record, payload=b''):
+  record = dict(record, size=len(payload))
+  stream.write(json.dumps(record, sort_keys=True).encode('utf-8') + b'\n')
+  stream.write(payload)
+
+
+def _ReadRecords(path):
+  """Returns the latest committed record of each key in a journal.
+
+  Args:
+    path: The path of the journal.
+
+  Returns:
+    (dict, int) tuple. The keys mapped to (record, payload) tuples, and the
+    number of bytes read.
+
+  Raises:
+    CheckpointError: If the journal was written with a newer schema.
+  """
+  latest = {}
+  pending = []
+  size = 0
+  with open(path, 'rb') as stream:
+    while True:
+      line = stream.readline()
+      try:
+        record = json.loads(line.decode('utf-8'))
+      except ValueError:
+        # The end of the journal, or a record whose save was interrupted.
+        break
+      payload = stream.read(record['size'])
+      if len(payload) < record['size']:
+        break
+      if record['type'] == _HEADER:
+        if record['schema_version'] > SCHEMA_VERSION:
+          raise CheckpointError(
+              '%s was written with schema version %d, but only versions up to '
+              '%d can be read.' % (path, record['schema_version'],
+                                   SCHEMA_VERSION))
+      elif record['type'] == _OBJECT:
+        pending.append((record, payload))
+      elif record['type'] == _COMMIT:
+        for object_record, object_payload in pending:
+          latest[object_record['key']] = (object_record, object_payload)
+        pending = []
+        size = stream.tell()
+  if ROOT_KEY not in latest:
+    raise CheckpointError('%s has no committed save.' % path)
+  return latest, size
+
+
+class Journal(object):
+  """Saves an object graph to a journal at a path.
+
+  Attributes:
+    path: The path of the journal.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    # Ids of the objects saved so far mapped to their keys, and the keys mapped
+    # to the objects, which keeps the ids from being reused.
+    self._keys = {}
+    self._objects = {}
+    self._key_counts = collections.Counter()
+    # Keys mapped to the digests and sizes of their latest records.
+    self._records = {}
+    # The size of the journal, or None if it was not written or loaded.
+    self._size = None
+    self._stats = collections.Counter()
+
+  def IsTracked(self, obj):
+    """Returns whether an object is saved in its own records."""
+    return (isinstance(obj, _TRACKED_TYPES) or
+            obj is self._objects.get(ROOT_KEY))
+
+  def GetKey(self, obj):
+    """Returns the key of an object, assigning one if it has none."""
+    key = self._keys.get(id(obj))
+    if key is None:
+      name = type(obj).__name__
+      key = '%s-%d' % (name, self._key_counts[name])
+      self._key_counts[name] += 1
+      self._Track(obj, key)
+    return key
+
+  def _Track(self, obj, key):
+    self._keys[id(obj)] = key
+    self._objects[key] = obj
+
+  def _Dump(self, state):
+    stream = io.BytesIO()
+    pickler = _Pickler(self, stream)
+    pickler.dump(state)
+    return stream.getvalue(), pickler.references
+
+  def _PickleState(self, obj, key):
+    """Returns an object's pickled state and the tracked objects it refers to.
+
+    Attributes that can not be pickled are left out.
+    """
+    state = vars(obj)
+    try:
+      return self._Dump(state)
+    except _PICKLE_ERRORS:
+      pass
+    picklable = {}
+    for name, value in list(state.items()):
+      try:
+        self._Dump(value)
+        picklable[name] = value
+      except _PICKLE_ERRORS as e:
+        logging.warning('Not saving attribute %s of %s in the spec checkpoint, '
+                        'as it can not be pickled: %s', name, key, e)
+    return self._Dump(picklable)
+
+  def Save(self, root):
+    """Appends the objects reachable from root that changed to the journal.
+
+    Args:
+      root: The object to save, e.g. a BenchmarkSpec.
+    """
+    start_time = time.time()
+    with self._lock:
+      if self._keys.get(id(root)) != ROOT_KEY:
+        self._Track(root, ROOT_KEY)
+      records = []
+      pending = [root]
+      seen = {id(root)}
+      while pending:
+        obj = pending.pop()
+        key = self.GetKey(obj)
+        payload, references = self._PickleState(obj, key)
+        for reference in references:
+          if id(reference) not in seen:
+            seen.add(id(reference))
+            pending.append(reference)
+        record = {'type': _OBJECT, 'key': key,
+                  'class': _GetClassName(type(obj)), 'summary': _Summarize(obj)}
+        record['digest'] = hashlib.sha1(
+            payload + json.dumps(record, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        records.append((record, payload))
+      changed = [(record, payload) for record, payload in records
+                 if self._records.get(record['key'], (None,))[0] !=
+                 record['digest']]
+      live_size = sum(len(payload) for _, payload in records)
+      appended_size = sum(len(payload) for _, payload in changed)
+      if (self._size is None or
+          self._size + appended_size > _COMPACTION_RATIO * live_size):
+        written = self._Rewrite(records)
+      else:
+        written = self._Append(changed)
+      self._records = {record['key']: (record['digest'], len(payload))
+                       for record, payload in records}
+      self._stats['saves'] += 1
+      self._stats['records_written'] += written
+      self._stats['save_seconds'] += time.time() - start_time
+
+  def _Append(self, records):
+    """Appends records and a commit record, returning the number written."""
+    if not records:
+      return 0
+    with open(self.path, 'r+b') as stream:
+      # Overwrite anything an interrupted save left after the last commit.
+      stream.seek(self._size)
+      stream.truncate()
+      for record, payload in records:
+        _WriteRecord(stream, record, payload)
+      _WriteRecord(stream, {'type': _COMMIT, 'time': time.time()})
+      self._size = stream.tell()
+    self._stats['bytes_written'] += sum(len(p) for _, p in records)
+    return len(records)
+
+  def _Rewrite(self, records):
+    """Replaces the journal with the records, returning the number written."""
+    temp_path = self.path + '.tmp'
+    with open(temp_path, 'wb') as stream:
+      _WriteRecord(stream, {'type': _HEADER, 'schema_version': SCHEMA_VERSION})
+      for record, payload in records:
+        _WriteRecord(stream, record, payload)
+      _WriteRecord(stream, {'type': _COMMIT, 'time': time.time()})
+      self._size = stream.tell()
+    os.replace(temp_path, self.path)
+    if self._records:
+      self._stats['compactions'] += 1
+    self._stats['bytes_written'] += sum(len(p) for _, p in records)
+    return len(records)
+
+  def Load(self):
+    """Loads the objects saved in the journal and returns the root."""
+    start_time = time.time()
+    with self._lock:
+      latest, size = _ReadRecords(self.path)
+      objects = {}
+      for key, (record, _) in latest.items():
+        cls = _GetClass(record['class'])
+        objects[key] = cls.__new__(cls)
+      for key, (record, payload) in latest.items():
+        state = _Unpickler(io.BytesIO(payload), objects).load()
+        objects[key].__dict__.update(state)
+        self._Track(objects[key], key)
+        name, _, count = key.rpartition('-')
+        if count.isdigit():
+          self._key_counts[name] = max(self._key_counts[name], int(count) + 1)
+        self._records[key] = (record['digest'], record['size'])
+      self._size = size
+      self._stats['load_seconds'] += time.time() - start_time
+      self._stats['records_read'] += len(latest)
+      self._stats['bytes_read'] += size
+      return objects[ROOT_KEY]
+
+  def GetSamples(self):
+    """Returns samples of the saves and loads since the last call."""
+    with self._lock:
+      stats = self._stats.copy()
+      self._stats.clear()
+    samples = []
+    if stats['saves']:
+      samples.append(sample.Sample(
+          'Spec Checkpoint Save Time', stats['save_seconds'], 'seconds', {
+              'saves': stats['saves'],
+              'records_written': stats['records_written'],
+              'bytes_written': stats['bytes_written'],
+              'compactions': stats['compactions'],
+              'objects': len(self._records),
+          }))
+    if stats['records_read']:
+      samples.append(sample.Sample(
+          'Spec Checkpoint Load Time', stats['load_seconds'], 'seconds', {
+              'records_read': stats['records_read'],
+              'bytes_read': stats['bytes_read'],
+          }))
+    return samples
+
+
+def _GetJournal(path):
+  with _lock:
+    if path not in _journals:
+      _journals[path] = Journal(path)
+    return _journals[path]
+
+
+def Save(root, path):
+  """Saves the changes to the objects reachable from root to a journal."""
+  _GetJournal(path).Save(root)
+
+
+def Load(path):
+  """Loads the object saved to a journal, which later saves append to.
+
+  Raises:
+    CheckpointError: If the journal has no committed save or was written with a
+      newer schema.
+  """
+  journal = Journal(path)
+  root = journal.Load()
+  with _lock:
+    _journals[path] = journal
+  return root
+
+
+def GetSamples(path):
+  """Returns samples of the saves and loads of a journal since the last call."""
+  with _lock:
+    journal = _journals.get(path)
+  return journal.GetSamples() if journal else []
@@ -0,0 +1,395 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pool of persistent SSH sessions used to run remote commands.
+
+Running a remote command normally forks a new ssh process per command (see
+vm_util.IssueCommand). When thousands of small commands are issued against many
+VMs, the controller spends most of its time creating processes. With
+--ssh_session_pool, each VM instead gets a small number of long-lived ssh
+processes, each running a remote shell that reads commands from stdin. Commands
+are written to an idle session and their output is read back until a unique
+end-of-command marker is seen, which also carries the exit status.
+
+Each command is still run in a fresh "$SHELL -c" process on the VM with stdin
+redirected from /dev/null, so it observes the same environment and working
+directory as a command issued through a new ssh connection.
+
+A session that dies (for example because the VM rebooted) reports a return code
+of 255, the same code ssh reports for connection failures, so the caller's
+retry logic applies unchanged. The next command opens a new session.
+"""
+
+import collections
+import logging
+import os
+import pipes
+import selectors
+import subprocess
+import threading
+import time
+import uuid
+
+from absl import flags
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import events
+from perfkitbenchmarker import sample
+
+flags.DEFINE_boolean(
+    'ssh_session_pool', False,
+    'If true, run remote commands on Linux VMs over a pool of persistent SSH '
+    'sessions instead of starting a new ssh process per command. Commands '
+    'requiring a login shell still use a new ssh process.')
+flags.DEFINE_integer(
+    'ssh_session_pool_size', 4,
+    'The maximum number of persistent SSH sessions per VM when '
+    '--ssh_session_pool is set. Sessions are opened lazily, so a VM only gets '
+    'more than one session when commands are issued to it concurrently.',
+    lower_bound=1)
+
+FLAGS = flags.FLAGS
+
+# Return code reported when the session dies before a command completes. This
+# matches the return code ssh uses for connection errors so that callers retry.
+SESSION_FAILURE_RETCODE = 255
+
+# The remote program that reads commands from stdin.
+REMOTE_SHELL = '/bin/sh'
+
+_MARKER_PREFIX = '__PKB_SESSION_END_'
+_READ_SIZE = 65536
+# Percentiles reported for per-command latency.
+_LATENCY_PERCENTILES = (50, 99)
+
+
+class SshSession(object):
+  """A single long-lived process running a shell that executes commands.
+
+  Commands are executed one at a time. A session is not thread-safe; the
+  SshSessionPool hands each session to one thread at a time.
+
+  Attributes:
+    cmd: list of strings. Command that starts the shell, e.g. an ssh command
+        whose remote command is REMOTE_SHELL.
+  """
+
+  def __init__(self, cmd):
+    self.cmd = cmd
+    self._process = None
+    self._selector = None
+
+  def __repr__(self):
+    return '<{0} cmd="{1}">'.format(type(self).__name__, ' '.join(self.cmd))
+
+  @property
+  def alive(self):
+    return self._process is not None and self._process.poll() is None
+
+  def Start(self):
+    """Starts the session process."""
+    self._process = subprocess.Popen(
+        self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE)
+    self._selector = selectors.DefaultSelector()
+    self._selector.register(self._process.stdout, selectors.EVENT_READ,
+                            'stdout')
+    self._selector.register(self._process.stderr, selectors.EVENT_READ,
+                            'stderr')
+
+  def Close(self):
+    """Kills the session process and releases its resources."""
+    if self._process is None:
+      return
+    if self._process.poll() is None:
+      self._process.kill()
+    self._process.wait()
+    self._selector.close()
+    for stream in (self._process.stdin, self._process.stdout,
+                   self._process.stderr):
+      stream.close()
+    self._process = None
+    self._selector = None
+
+  def Run(self, command, timeout=None):
+    """Runs a command in the session.
+
+    Args:
+      command: string. A valid shell command.
+      timeout: Timeout for the command in seconds, or None to wait forever.
+
+    Returns:
+      A tuple of stdout, stderr, and retcode from running the command. If the
+      session died before the command completed, retcode is
+      SESSION_FAILURE_RETCODE and the session is closed.
+
+    Raises:
+      IssueCommandTimeoutError: When the command does not finish before the
+          timeout. The session is closed.
+    """
+    if not self.alive:
+      self.Close()
+      self.Start()
+    marker = _MARKER_PREFIX + uuid.uuid4().hex
+    script = ('"${{SHELL:-{shell}}}" -c {command} </dev/null; '
+              'printf "\\n%s %d\\n" {marker} "$?"; '
+              'printf "\\n%s\\n" {marker} >&2\n').format(
+                  shell=REMOTE_SHELL, command=pipes.quote(command),
+                  marker=marker)
+    try:
+      self._process.stdin.write(script.encode())
+      self._process.stdin.flush()
+    except (BrokenPipeError, OSError):
+      self.Close()
+      return '', '', SESSION_FAILURE_RETCODE
+    return self._ReadUntilMarker(marker, timeout)
+
+  def _ReadUntilMarker(self, marker, timeout):
+    """Reads stdout and stderr until both contain the end-of-command marker."""
+    deadline = None if timeout is None else time.time() + timeout
+    stdout_end = ('\n%s ' % marker).encode()
+    stderr_end = ('\n%s\n' % marker).encode()
+    buffers = {'stdout': bytearray(), 'stderr': bytearray()}
+    stdout_end_index = -1
+    stdout_done = stderr_done = False
+    while not (stdout_done and stderr_done):
+      remaining = None if deadline is None else deadline - time.time()
+      if remaining is not None and remaining <= 0:
+        self.Close()
+        raise errors.VmUtil.IssueCommandTimeoutError(
+            'Command timed out after {0} seconds in {1}. The session was '
+            'closed.'.format(timeout, self))
+      for key, _ in self._selector.select(remaining):
+        data = os.read(key.fileobj.fileno(), _READ_SIZE)
+        if not data:
+          logging.debug('Session %s exited before the command completed.',
+                        self)
+          self.Close()
+          return (buffers['stdout'].decode('ascii', 'ignore'),
+                  buffers['stderr'].decode('ascii', 'ignore'),
+                  SESSION_FAILURE_RETCODE)
+        buffer = buffers[key.data]
+        # Only the tail of the buffer needs to be searched for the marker.
+        search_start = max(0, len(buffer) - len(stdout_end))
+        buffer.extend(data)
+        if key.data == 'stderr':
+          stderr_done = buffer.endswith(stderr_end)
+          continue
+        if stdout_end_index < 0:
+          stdout_end_index = buffer.find(stdout_end, search_start)
+        # The marker is followed by the return code and a newline.
+        stdout_done = stdout_end_index >= 0 and buffer.endswith(b'\n')
+    stdout = buffers['stdout']
+    retcode = int(stdout[stdout_end_index + len(stdout_end):])
+    stderr = buffers['stderr'][:-len(stderr_end)]
+    return (stdout[:stdout_end_index].decode('ascii', 'ignore'),
+            stderr.decode('ascii', 'ignore'), retcode)
+
+
+class _SessionPoolStats(object):
+  """Thread-safe record of commands run through the session pool."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.Reset()
+
+  def Reset(self):
+    with self._lock:
+      self.latencies = []
+      self.sessions_opened = 0
+      self.first_start = None
+      self.last_end = None
+
+  def RecordSessionOpened(self):
+    with self._lock:
+      self.sessions_opened += 1
+
+  def RecordCommand(self, start_time, end_time):
+    with self._lock:
+      self.latencies.append(end_time - start_time)
+      if self.first_start is None or start_time < self.first_start:
+        self.first_start = start_time
+      if self.last_end is None or end_time > self.last_end:
+        self.last_end = end_time
+
+  def GetSamples(self):
+    """Returns samples for the recorded commands and resets the stats."""
+    with self._lock:
+      latencies = self.latencies
+      sessions_opened = self.sessions_opened
+      duration = (self.last_end - self.first_start) if latencies else 0
+    self.Reset()
+    if not latencies:
+      return []
+    metadata = {'num_commands': len(latencies),
+                'sessions_opened': sessions_opened,
+                'ssh_session_pool_size': FLAGS.ssh_session_pool_size}
+    samples = []
+    if duration > 0:
+      samples.append(sample.Sample('SSH Session Pool Commands Per Second',
+                                   len(latencies) / duration, 'commands/sec',
+                                   metadata))
+    stats = sample.PercentileCalculator(
+        [latency * 1000 for latency in latencies],
+        percentiles=_LATENCY_PERCENTILES)
+    for percentile in _LATENCY_PERCENTILES:
+      samples.append(sample.Sample(
+          'SSH Session Pool Command Latency p%s' % percentile,
+          stats['p%s' % percentile], 'ms', metadata))
+    return samples
+
+
+class SshSessionPool(object):
+  """Thread-safe pool of SshSessions keyed by the command that starts them.
+
+  Each distinct session command (i.e. each VM) gets at most max_sessions
+  sessions. A thread running a command leases an idle session, or opens a new
+  one if fewer than max_sessions exist, or waits for one to become idle.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._condition = threading.Condition(self._lock)
+    self._idle = collections.defaultdict(list)
+    self._open_counts = collections.defaultdict(int)
+    self.stats = _SessionPoolStats()
+
+  def _Lease(self, key, max_sessions):
+    """Returns an idle session for key, opening one if allowed."""
+    with self._condition:
+      while True:
+        if self._idle[key]:
+          return self._idle[key].pop()
+        if self._open_counts[key] < max_sessions:
+          self._open_counts[key] += 1
+          break
+        self._condition.wait()
+    session = SshSession(list(key))
+    try:
+      session.Start()
+    except Exception:
+      self._Discard(key)
+      raise
+    self.stats.RecordSessionOpened()
+    return session
+
+  def _Return(self, key, session):
+    with self._condition:
+      self._idle[key].append(session)
+      self._condition.notify()
+
+  def _Discard(self, key):
+    with self._condition:
+      self._open_counts[key] -= 1
+      self._condition.notify()
+
+  def RunCommand(self, session_cmd, command, timeout=None, max_sessions=None):
+    """Runs a command on a session started by session_cmd.
+
+    Args:
+      session_cmd: list of strings. Command that starts a session, e.g. an ssh
+          command ending in REMOTE_SHELL.
+      command: string. The command to run in the session.
+      timeout: Timeout for the command in seconds, or None to wait forever.
+      max_sessions: The maximum number of sessions for session_cmd. Defaults to
+          --ssh_session_pool_size.
+
+    Returns:
+      A tuple of stdout, stderr, and retcode from running the command.
+
+    Raises:
+      IssueCommandTimeoutError: When the command does not finish before the
+          timeout.
+    """
+    key = tuple(session_cmd)
+    session = self._Lease(key, max_sessions or FLAGS.ssh_session_pool_size)
+    start_time = time.time()
+    try:
+      result = session.Run(command, timeout=timeout)
+    except BaseException:
+      session.Close()
+      self._Discard(key)
+      raise
+    self.stats.RecordCommand(start_time, time.time())
+    if session.alive:
+      self._Return(key, session)
+    else:
+      session.Close()
+      self._Discard(key)
+    return result
+
+  def CloseAll(self):
+    """Closes all idle sessions."""
+    with self._condition:
+      idle = self._idle
+      self._idle = collections.defaultdict(list)
+      for key, sessions in idle.items():
+        self._open_counts[key] -= len(sessions)
+      self._condition.notify_all()
+    for sessions in idle.values():
+      for session in sessions:
+        session.Close()
+
+
+_POOL = SshSessionPool()
+
+
+def RunCommand(session_cmd, command, force_info_log=False,
+               suppress_warning=False, timeout=None):
+  """Runs a command on the process-wide session pool.
+
+  Logs the command and its results the same way as vm_util.IssueCommand.
+
+  Args:
+    session_cmd: list of strings. Command that starts a session, e.g. an ssh
+        command ending in REMOTE_SHELL.
+    command: string. The command to run in the session.
+    force_info_log: A boolean indicating whether the command result should
+        always be logged at the info level.
+    suppress_warning: A boolean indicating whether the results should not be
+        logged at the info level in the event of a non-zero return code.
+    timeout: Timeout for the command in seconds, or None to wait forever.
+
+  Returns:
+    A tuple of stdout, stderr, and retcode from running the command.
+
+  Raises:
+    IssueCommandTimeoutError: When the command does not finish before the
+        timeout.
+  """
+  full_cmd = ' '.join(session_cmd)
+  logging.info('Running on SSH session: %s', command)
+  stdout, stderr, retcode = _POOL.RunCommand(session_cmd, command,
+                                             timeout=timeout)
+  debug_text = ('Ran on SSH session {%s}: {%s}\nReturnCode:%s\nSTDOUT: %s\n'
+                'STDERR: %s' % (full_cmd, command, retcode, stdout, stderr))
+  if force_info_log or (retcode and not suppress_warning):
+    logging.info(debug_text)
+  else:
+    logging.debug(debug_text)
+  return stdout, stderr, retcode
+
+
+def CloseAll():
+  """Closes all idle sessions of the process-wide session pool."""
+  _POOL.CloseAll()
+
+
+def GetSamples():
+  """Returns session pool samples recorded since the last call."""
+  return _POOL.stats.GetSamples()
+
+
+@events.benchmark_end.connect
+def _CloseSessionsAtBenchmarkEnd(unused_sender, benchmark_spec):
+  del benchmark_spec  # unused
+  CloseAll()
@@ -0,0 +1,314 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Copies files to and from VMs as a single tar stream over ssh.
+
+Copying files with scp costs one process and one SSH handshake per call. The
+functions in this module instead copy any number of (local path, remote path)
+pairs in one ssh invocation: the local side writes or reads a tar stream with
+the tarfile module, and the remote side runs tar.
+
+Each pair is stored in the archive under its index, which lets every file or
+directory have an arbitrary destination. Destinations follow scp -pr semantics:
+if the destination is an existing directory, the source is placed inside it
+under its own name, otherwise it is copied to the destination path. Relative
+remote paths are relative to the remote user's home directory.
+"""
+
+import collections
+import logging
+import os
+import pipes
+import posixpath
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+
+from absl import flags
+from perfkitbenchmarker import command_profiler
+from perfkitbenchmarker import errors
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_GZIP = 'gzip'
+
+flags.DEFINE_boolean(
+    'ssh_tar_copy', False,
+    'If true, copy files and directories to and from Linux VMs as a tar stream '
+    'over ssh instead of with scp. Several files pushed at once share one '
+    'stream.')
+flags.DEFINE_enum(
+    'ssh_tar_copy_compression', COMPRESSION_NONE,
+    [COMPRESSION_NONE, COMPRESSION_GZIP],
+    'Compression applied to tar streams copied over ssh. Compression helps on '
+    'slow links with compressible data at the cost of CPU time.')
+
+FLAGS = flags.FLAGS
+
+_BUFFER_SIZE = 1024 * 1024
+
+# Places a staged file or directory at its destination with scp semantics.
+# Arguments are the staged path, the destination and the source's base name.
+_PLACE_FUNCTION = """_pkb_place() {
+  dest=$2
+  if [ -d "$dest" ]; then dest=$dest/$3; fi
+  if [ -d "$1" ] && [ -d "$dest" ]; then
+    cp -pr "$1"/. "$dest"/
+  else
+    mv -f "$1" "$dest"
+  fi
+}"""
+
+
+class TransferSummary(collections.namedtuple(
+    'TransferSummary', ['files', 'bytes', 'seconds'])):
+  """Totals for one tar copy.
+
+  Attributes:
+    files: Number of regular files copied.
+    bytes: Number of bytes of file content copied, before compression.
+    seconds: Wall time of the copy.
+  """
+
+  @property
+  def files_per_second(self):
+    return self.files / self.seconds if self.seconds else 0.0
+
+  @property
+  def bytes_per_second(self):
+    return self.bytes / self.seconds if self.seconds else 0.0
+
+
+def RemotePathExpression(remote_path):
+  """Returns a shell expression for a remote path as scp would resolve it.
+
+  Args:
+    remote_path: string. An absolute path, or a path relative to the remote
+        user's home directory, optionally starting with '~/'.
+
+  Returns:
+    string. The path, quoted for a POSIX shell.
+  """
+  if remote_path in ('', '~'):
+    return '"$HOME"'
+  if remote_path.startswith('~/'):
+    remote_path = remote_path[2:]
+  elif posixpath.isabs(remote_path):
+    return pipes.quote(remote_path)
+  return '"$HOME"/' + pipes.quote(remote_path)
+
+
+def _TarFlag(compression):
+  return 'z' if compression == COMPRESSION_GZIP else ''
+
+
+def _TarMode(direction, compression):
+  """Returns the tarfile stream mode for reading ('r') or writing ('w')."""
+  return direction + '|' + ('gz' if compression == COMPRESSION_GZIP else '')
+
+
+def _StagingScript(body):
+  """Wraps body so that it runs with $staging set to a scratch directory."""
+  return ('set -e; staging=$(mktemp -d); '
+          'trap \'rm -rf "$staging"\' EXIT; ' + body)
+
+
+def _PushScript(file_pairs, compression):
+  """Returns the remote script extracting a pushed archive."""
+  lines = [_PLACE_FUNCTION,
+           'tar -x%spf - -C "$staging"' % _TarFlag(compression)]
+  for i, (local_path, remote_path) in enumerate(file_pairs):
+    lines.append('_pkb_place "$staging"/%d %s %s' % (
+        i, RemotePathExpression(remote_path),
+        pipes.quote(os.path.basename(os.path.normpath(local_path)))))
+  return _StagingScript('\n'.join(lines))
+
+
+def _PullScript(file_pairs, compression):
+  """Returns the remote script writing an archive of the pulled paths."""
+  lines = []
+  for i, (_, remote_path) in enumerate(file_pairs):
+    lines.append('ln -s %s "$staging"/%d' % (
+        RemotePathExpression(remote_path), i))
+  # -h follows the links above, as well as links within copied directories,
+  # which matches scp -r.
+  lines.append('tar -c%shf - -C "$staging" %s' % (
+      _TarFlag(compression), ' '.join(str(i) for i in range(len(file_pairs)))))
+  return _StagingScript('\n'.join(lines))
+
+
+def _RaiseOnFailure(ssh_cmd, retcode, output_file):
+  if not retcode:
+    return
+  output_file.seek(0)
+  output = output_file.read().decode('ascii', 'ignore')
+  raise errors.VirtualMachine.RemoteCommandError(
+      'Got non-zero return code (%s) executing tar copy %s\nOUTPUT: %s' %
+      (retcode, ' '.join(ssh_cmd), output))
+
+
+def _LogSummary(verb, summary):
+  logging.info('%s %d files (%d bytes) in %.2f seconds: %.1f files/sec, '
+               '%.2f MB/sec.', verb, summary.files, summary.bytes,
+               summary.seconds, summary.files_per_second,
+               summary.bytes_per_second / (1024 * 1024))
+
+
+def Push(ssh_cmd, file_pairs, compression=COMPRESSION_NONE):
+  """Copies local files and directories to a VM in one tar stream.
+
+  Args:
+    ssh_cmd: A list of strings forming an ssh command to the VM, to which the
+        remote script is appended.
+    file_pairs: An iterable of (local path, remote path) tuples.
+    compression: COMPRESSION_NONE or COMPRESSION_GZIP.
+
+  Returns:
+    A TransferSummary.
+
+  Raises:
+    RemoteCommandError: If the copy failed.
+  """
+  file_pairs = list(file_pairs)
+  totals = collections.Counter()
+
+  def _CountFile(tarinfo):
+    if tarinfo.isfile():
+      totals['files'] += 1
+      totals['bytes'] += tarinfo.size
+    return tarinfo
+
+  cmd = ssh_cmd + [_PushScript(file_pairs, compression)]
+  logging.info('Running: %s', ' '.join(cmd[:-1] + ['<tar extract script>']))
+  start_time = time.time()
+  with tempfile.TemporaryFile() as output_file, command_profiler.Measure(
+      cmd[:-1], category=command_profiler.CATEGORY_SCP) as measurement:
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=output_file,
+                               stderr=output_file)
+    try:
+      with tarfile.open(fileobj=process.stdin,
+                        mode=_TarMode('w', compression),
+                        bufsize=_BUFFER_SIZE, dereference=True) as tar:
+        for i, (local_path, _) in enumerate(file_pairs):
+          tar.add(local_path, arcname=str(i), filter=_CountFile)
+    except BrokenPipeError:
+      # ssh exited early. Its return code and output describe why.
+      pass
+    finally:
+      try:
+        process.stdin.close()
+      except BrokenPipeError:
+        pass
+    retcode = process.wait()
+    measurement.retcode = retcode
+    _RaiseOnFailure(cmd, retcode, output_file)
+  summary = TransferSummary(totals['files'], totals['bytes'],
+                            time.time() - start_time)
+  _LogSummary('Pushed', summary)
+  return summary
+
+
+def _LocalTarget(local_path, remote_path):
+  """Returns where a pulled path is written, following scp semantics."""
+  if os.path.isdir(local_path):
+    return os.path.join(local_path,
+                        posixpath.basename(posixpath.normpath(remote_path)))
+  return local_path
+
+
+def _ExtractMember(tar, member, target):
+  """Writes one archive member to target.
+
+  Directory permissions and times are left for the caller to set once the
+  directory's contents have been written.
+  """
+  if member.isdir():
+    if not os.path.isdir(target):
+      os.makedirs(target)
+  elif member.isfile():
+    parent = os.path.dirname(target)
+    if parent and not os.path.isdir(parent):
+      os.makedirs(parent)
+    with open(target, 'wb') as f:
+      shutil.copyfileobj(tar.extractfile(member), f, _BUFFER_SIZE)
+    os.chmod(target, member.mode)
+    os.utime(target, (member.mtime, member.mtime))
+  else:
+    logging.warning('Skipping %s, which is not a file or directory.',
+                    member.name)
+
+
+def Pull(ssh_cmd, file_pairs, compression=COMPRESSION_NONE):
+  """Copies files and directories from a VM in one tar stream.
+
+  Args:
+    ssh_cmd: A list of strings forming an ssh command to the VM, to which the
+        remote script is appended.
+    file_pairs: An iterable of (local path, remote path) tuples.
+    compression: COMPRESSION_NONE or COMPRESSION_GZIP.
+
+  Returns:
+    A TransferSummary.
+
+  Raises:
+    RemoteCommandError: If the copy failed.
+  """
+  file_pairs = list(file_pairs)
+  files = bytes_copied = 0
+  targets = {}
+  directories = []
+  cmd = ssh_cmd + [_PullScript(file_pairs, compression)]
+  logging.info('Running: %s', ' '.join(cmd[:-1] + ['<tar create script>']))
+  start_time = time.time()
+  with tempfile.TemporaryFile() as output_file, command_profiler.Measure(
+      cmd[:-1], category=command_profiler.CATEGORY_SCP) as measurement:
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=output_file)
+    try:
+      with tarfile.open(fileobj=process.stdout,
+                        mode=_TarMode('r', compression),
+                        bufsize=_BUFFER_SIZE) as tar:
+        for member in tar:
+          index, _, relative_path = member.name.partition('/')
+          if index not in targets:
+            local_path, remote_path = file_pairs[int(index)]
+            targets[index] = _LocalTarget(local_path, remote_path)
+          parts = relative_path.split('/') if relative_path else []
+          if '..' in parts:
+            raise errors.VirtualMachine.RemoteCommandError(
+                'Unexpected path in tar copy: %s' % member.name)
+          target = os.path.join(targets[index], *parts)
+          _ExtractMember(tar, member, target)
+          if member.isdir():
+            directories.append((target, member))
+          elif member.isfile():
+            files += 1
+            bytes_copied += member.size
+    except tarfile.TarError:
+      # An empty or truncated stream means the remote side failed, which is
+      # reported below. Otherwise the archive itself is bad.
+      process.stdout.close()
+      if not process.wait():
+        raise
+    finally:
+      process.stdout.close()
+    retcode = process.wait()
+    measurement.retcode = retcode
+    _RaiseOnFailure(cmd, retcode, output_file)
+  # Extracting files into a directory updates its mtime, so restore them last.
+  for target, member in reversed(directories):
+    os.chmod(target, member.mode)
+    os.utime(target, (member.mtime, member.mtime))
+  summary = TransferSummary(files, bytes_copied, time.time() - start_time)
+  _LogSummary('Pulled', summary)
+  return summary
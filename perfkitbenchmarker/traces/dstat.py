@@ -28,6 +28,7 @@ from absl import flags
 import numpy as np
 
 from perfkitbenchmarker import events
+from perfkitbenchmarker import parse_executor
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.linux_packages import dstat
@@ -115,20 +116,17 @@ class _DStatCollector(base_collector.BaseCollector):
         for i, label in enumerate(labels[1:]):
           metric_idx = i + 1  # Skipped first label for the epoch.
           if re.search(dstat_publish_regex, label):
-            for sample_idx, value in enumerate(out[:, metric_idx]):
-              individual_sample_metadata = copy.deepcopy(metadata)
-              individual_sample_metadata['dstat_epoch'] = out[sample_idx, 0]
-              samples.append(
-                  sample.Sample(label, value, '', individual_sample_metadata))
+            samples.append(sample.SampleBatch(
+                label, out[:, metric_idx], '', copy.deepcopy(metadata),
+                metadata_columns={'dstat_epoch': out[:, 0]}))
 
     def _Analyze(role, file):
-      with open(os.path.join(self.output_directory,
-                             os.path.basename(file)), 'r') as f:
-        fp = iter(f)
-        labels, out = dstat.ParseCsvFile(fp)
-        vm_util.RunThreaded(
-            _AnalyzeEvent,
-            [((role, labels, out, e), {}) for e in events.TracingEvent.events])
+      labels, out = parse_executor.Parse(
+          dstat.ParseCsvPath,
+          os.path.join(self.output_directory, os.path.basename(file)))
+      vm_util.RunThreaded(
+          _AnalyzeEvent,
+          [((role, labels, out, e), {}) for e in events.TracingEvent.events])
 
     vm_util.RunThreaded(
         _Analyze, [((k, w), {}) for k, w in six.iteritems(self._role_mapping)])
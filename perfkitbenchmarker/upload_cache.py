@@ -0,0 +1,150 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Skips uploading files whose contents are already on the VM.
+
+Static VMs reused across runs, and repeated --run_stage=prepare invocations,
+often push data files that are already present on the VM. With --upload_cache,
+the sha256 digest of each local file is compared with the digest of the file at
+its destination on the VM, and only files that differ are uploaded.
+
+Local digests are computed once per process for each (path, mtime, size). Remote
+digests are read with one command per batch of files (see
+BaseOsMixin.GetDestinationSha256sums).
+"""
+
+import hashlib
+import logging
+import os
+import threading
+
+from absl import flags
+from perfkitbenchmarker import sample
+
+flags.DEFINE_boolean(
+    'upload_cache', False,
+    'If true, data files pushed to VMs are only uploaded if a file with the '
+    'same sha256 digest is not already at the destination.')
+
+FLAGS = flags.FLAGS
+
+_READ_SIZE = 1024 * 1024
+
+_digest_lock = threading.Lock()
+# Maps (absolute path, mtime, size) to the sha256 hex digest of the file.
+_local_digests = {}
+
+
+def LocalSha256sum(path):
+  """Returns the sha256 hex digest of a local file, memoized per process.
+
+  The digest is recomputed if the file's modification time or size changes.
+
+  Args:
+    path: string. Path of a local file.
+
+  Returns:
+    string. The sha256 hex digest.
+  """
+  stat = os.stat(path)
+  key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+  with _digest_lock:
+    if key in _local_digests:
+      return _local_digests[key]
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(_READ_SIZE), b''):
+      digest.update(chunk)
+  with _digest_lock:
+    _local_digests[key] = digest.hexdigest()
+  return _local_digests[key]
+
+
+class _UploadStats(object):
+  """Thread-safe totals of files uploaded and skipped."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.Reset()
+
+  def Reset(self):
+    with self._lock:
+      self.files_skipped = 0
+      self.bytes_skipped = 0
+      self.files_uploaded = 0
+      self.bytes_uploaded = 0
+
+  def Record(self, skipped_sizes, uploaded_sizes):
+    with self._lock:
+      self.files_skipped += len(skipped_sizes)
+      self.bytes_skipped += sum(skipped_sizes)
+      self.files_uploaded += len(uploaded_sizes)
+      self.bytes_uploaded += sum(uploaded_sizes)
+
+  def GetSamples(self):
+    """Returns samples for the recorded uploads and resets the stats."""
+    with self._lock:
+      metadata = {'files_skipped': self.files_skipped,
+                  'files_uploaded': self.files_uploaded,
+                  'bytes_uploaded': self.bytes_uploaded}
+      bytes_skipped = self.bytes_skipped
+    self.Reset()
+    if not metadata['files_skipped'] and not metadata['files_uploaded']:
+      return []
+    return [sample.Sample('Upload Cache Bytes Skipped', bytes_skipped, 'bytes',
+                          metadata)]
+
+
+_STATS = _UploadStats()
+
+
+def FilterUnchangedFiles(vm, file_pairs):
+  """Returns the file pairs whose contents are not already on the VM.
+
+  Only regular files are checked; directories are always returned. If the VM
+  cannot report remote digests, every pair is returned.
+
+  Args:
+    vm: The BaseOsMixin the files are pushed to.
+    file_pairs: A list of (local path, remote path) tuples, as passed to
+        vm.PushFiles.
+
+  Returns:
+    The sublist of file_pairs that need to be uploaded.
+  """
+  candidates = [pair for pair in file_pairs if os.path.isfile(pair[0])]
+  if not candidates:
+    return file_pairs
+  try:
+    remote_digests = vm.GetDestinationSha256sums(candidates)
+  except NotImplementedError:
+    return file_pairs
+  unchanged = {
+      pair for pair, remote_digest in zip(candidates, remote_digests)
+      if remote_digest and remote_digest == LocalSha256sum(pair[0])}
+  changed = [pair for pair in file_pairs if pair not in unchanged]
+  skipped_sizes = [os.path.getsize(local_path)
+                   for local_path, _ in unchanged]
+  uploaded_sizes = [os.path.getsize(local_path)
+                    for local_path, _ in changed
+                    if os.path.isfile(local_path)]
+  _STATS.Record(skipped_sizes, uploaded_sizes)
+  if unchanged:
+    logging.info('Skipping upload of %d unchanged files (%d bytes) to %s.',
+                 len(unchanged), sum(skipped_sizes), vm.name)
+  return changed
+
+
+def GetSamples():
+  """Returns upload cache samples recorded since the last call."""
+  return _STATS.GetSamples()
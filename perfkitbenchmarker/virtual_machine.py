@@ -24,6 +24,7 @@ from __future__ import print_function
 
 import abc
 import contextlib
+import functools
 import logging
 import os.path
 import socket
@@ -35,12 +36,14 @@ import jinja2
 from perfkitbenchmarker import background_workload
 from perfkitbenchmarker import benchmark_lookup
 from perfkitbenchmarker import data
+from perfkitbenchmarker import data_distribution
 from perfkitbenchmarker import disk
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import events
 from perfkitbenchmarker import os_types
 from perfkitbenchmarker import package_lookup
 from perfkitbenchmarker import resource
+from perfkitbenchmarker import upload_cache
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.configs import option_decoders
 from perfkitbenchmarker.configs import spec
@@ -122,6 +125,15 @@ flags.DEFINE_boolean(
     'addresses.')
 flags.DEFINE_boolean('retry_on_rate_limited', True,
                      'Whether to retry commands when rate limited.')
+# Used by the cluster_boot benchmark. Defined here as VMs read them while
+# booting, and benchmark modules are only imported when they are run.
+flags.DEFINE_boolean(
+    'cluster_boot_test_port_listening', False,
+    'Test the time it takes to successfully connect to the port that is used to run the remote command.'
+)
+flags.DEFINE_boolean(
+    'cluster_boot_test_rdp_port_listening', False,
+    'Test the time it takes to successfully connect to the RDP port.')
 
 GPU_K80 = 'k80'
 GPU_P100 = 'p100'
@@ -531,6 +543,18 @@ class BaseOsMixin(six.with_metaclass(abc.ABCMeta, object)):
     """
     self.RemoteCopy(source_path, remote_path)
 
+  def PushFiles(self, file_pairs):
+    """Copies several files or directories to the VM.
+
+    OS mixins may override this to copy all of the files at once.
+
+    Args:
+      file_pairs: An iterable of (source_path, remote_path) tuples, as passed
+          to PushFile.
+    """
+    for source_path, remote_path in file_pairs:
+      self.PushFile(source_path, remote_path)
+
   def PullFile(self, local_path, remote_path):
     """Copies a file or a directory from the VM to the local machine.
 
@@ -559,9 +583,56 @@ class BaseOsMixin(six.with_metaclass(abc.ABCMeta, object)):
       self.PushFile(file_path, home_file_path)
       copy_cmd = (' '.join(['cp', home_file_path, remote_path]))
       self.RemoteCommand(copy_cmd)
-    else:
+    elif self._FilterUploads([(file_path, remote_path)]):
       self.PushFile(file_path, remote_path)
 
+  def PushDataFiles(self, data_file_pairs):
+    """Upload several files in perfkitbenchmarker.data directory to the VM.
+
+    Args:
+      data_file_pairs: An iterable of (data_file, remote_path) tuples, as passed
+          to PushDataFile.
+    Raises:
+      perfkitbenchmarker.data.ResourceNotFound: if a data file does not exist.
+    """
+    file_pairs = self._FilterUploads(
+        [(data.ResourcePath(data_file), remote_path)
+         for data_file, remote_path in data_file_pairs])
+    if file_pairs:
+      self.PushFiles(file_pairs)
+
+  def _FilterUploads(self, file_pairs):
+    """Returns the file pairs to upload, dropping unchanged files.
+
+    Files are only dropped with --upload_cache.
+
+    Args:
+      file_pairs: A list of (source_path, remote_path) tuples.
+
+    Returns:
+      The list of (source_path, remote_path) tuples that should be pushed.
+    """
+    if not FLAGS.upload_cache:
+      return file_pairs
+    return upload_cache.FilterUnchangedFiles(self, file_pairs)
+
+  def GetDestinationSha256sums(self, file_pairs):
+    """Gets the sha256sum hashes of the files that pushed files would replace.
+
+    This function should be overridden by each OS-specific MixIn that supports
+    --upload_cache.
+
+    Args:
+      file_pairs: A list of (source_path, remote_path) tuples, as passed to
+          PushFile. If remote_path is a directory, the file at
+          remote_path/basename(source_path) is hashed.
+
+    Returns:
+      A list with the sha256sum hash of each destination, or None for
+      destinations that do not exist.
+    """
+    raise NotImplementedError()
+
   def RenderTemplate(self, template_path, remote_path, context):
     """Renders a local Jinja2 template and copies it to the remote host.
 
@@ -1071,21 +1142,15 @@ class BaseVirtualMachine(BaseOsMixin, resource.BaseResource):
           not defined with preprovisioned data, or if the sha256sum hash in the
           code does not match the sha256 of the file.
     """
+    filenames = list(filenames)
+    local_filenames = [f for f in filenames if data.ResourceExists(f)]
+    for local_tar_file_path, remote_path in self._FilterUploads(
+        [(data.ResourcePath(f), install_path) for f in local_filenames]):
+      self.PushFile(local_tar_file_path, remote_path)
     for filename in filenames:
-      if data.ResourceExists(filename):
-        local_tar_file_path = data.ResourcePath(filename)
-        self.PushFile(local_tar_file_path, install_path)
+      if filename in local_filenames:
         continue
-      url = fallback_url.get(filename)
       sha256sum = preprovisioned_data.get(filename)
-      try:
-        preprovisioned = self.ShouldDownloadPreprovisionedData(
-            module_name, filename)
-      except NotImplementedError:
-        logging.info('The provider does not implement '
-                     'ShouldDownloadPreprovisionedData. Attempting to '
-                     'download the data via URL')
-        preprovisioned = False
       if not FLAGS.preprovision_ignore_checksum and not sha256sum:
         raise errors.Setup.BadPreprovisionedDataError(
             'Cannot find sha256sum hash for file %s in module %s. Might want '
@@ -1093,26 +1158,60 @@ class BaseVirtualMachine(BaseOsMixin, resource.BaseResource):
             'See README.md for information about preprovisioned data. '
             'Cannot find file in /data directory either, fail to upload from '
             'local directory.' % (filename, module_name))
-
-      if preprovisioned:
-        self.DownloadPreprovisionedData(install_path, module_name, filename)
-      elif url:
-        self.Install('wget')
-        file_name = os.path.basename(url)
-        self.RemoteCommand(
-            'wget -O {0} {1}'.format(
-                os.path.join(install_path, file_name), url))
+      download = functools.partial(
+          self._DownloadData, module_name, filename, install_path,
+          fallback_url.get(filename), sha256sum)
+      if (FLAGS.preprovisioned_data_p2p and
+          self.BASE_OS_TYPE != os_types.WINDOWS):
+        data_distribution.Install(
+            self, module_name, filename, install_path,
+            None if FLAGS.preprovision_ignore_checksum else sha256sum,
+            download)
       else:
-        raise errors.Setup.BadPreprovisionedDataError(
-            'Cannot find preprovisioned file %s inside preprovisioned bucket '
-            'in module %s. See README.md for information about '
-            'preprovisioned data. '
-            'Cannot find fallback url of the file to download from web. '
-            'Cannot find file in /data directory either, fail to upload from '
-            'local directory.' % (filename, module_name))
-      if not FLAGS.preprovision_ignore_checksum:
-        self.CheckPreprovisionedData(
-            install_path, module_name, filename, sha256sum)
+        download()
+
+  def _DownloadData(self, module_name, filename, install_path, url, sha256sum):
+    """Downloads one preprovisioned data file and verifies its checksum.
+
+    Args:
+      module_name: The name of the module defining the preprovisioned data.
+      filename: The name of the data file.
+      install_path: The path to download the data file.
+      url: The fallback url for downloading the file, or None.
+      sha256sum: The expected sha256sum hash of the file.
+
+    Raises:
+      errors.Setup.BadPreprovisionedDataError: If the file cannot be found or
+          its sha256sum hash does not match.
+    """
+    try:
+      preprovisioned = self.ShouldDownloadPreprovisionedData(
+          module_name, filename)
+    except NotImplementedError:
+      logging.info('The provider does not implement '
+                   'ShouldDownloadPreprovisionedData. Attempting to '
+                   'download the data via URL')
+      preprovisioned = False
+
+    if preprovisioned:
+      self.DownloadPreprovisionedData(install_path, module_name, filename)
+    elif url:
+      self.Install('wget')
+      # Saved under filename, where checksums and peers look for the file.
+      self.RemoteCommand(
+          'wget -O {0} {1}'.format(
+              os.path.join(install_path, filename), url))
+    else:
+      raise errors.Setup.BadPreprovisionedDataError(
+          'Cannot find preprovisioned file %s inside preprovisioned bucket '
+          'in module %s. See README.md for information about '
+          'preprovisioned data. '
+          'Cannot find fallback url of the file to download from web. '
+          'Cannot find file in /data directory either, fail to upload from '
+          'local directory.' % (filename, module_name))
+    if not FLAGS.preprovision_ignore_checksum:
+      self.CheckPreprovisionedData(
+          install_path, module_name, filename, sha256sum)
 
   def InstallPreprovisionedBenchmarkData(self, benchmark_name, filenames,
                                          install_path):
@@ -0,0 +1,236 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Reuses the VMs of a benchmark in later benchmarks of the same run.
+
+With --vm_pool, when a benchmark is torn down its Linux VMs are reset and kept
+in a pool instead of being deleted, along with the networks and firewalls they
+use. Later benchmarks lease a pooled VM instead of creating one when the VM
+they would create has the same VM spec, disk specs and OS, so e.g.
+--benchmarks=fio,iperf,coremark boots its VMs once.
+
+Resetting a VM uninstalls the packages the benchmark installed, restores the
+OS packages to the snapshot taken when the VM was first prepared, and
+unmounts its scratch disks. When the VM is leased, its scratch disks are
+reformatted and its caches dropped before it is prepared again.
+
+The pool is torn down once all benchmarks have run.
+"""
+
+import collections
+import json
+import logging
+import threading
+
+from absl import flags
+from perfkitbenchmarker import background_tasks
+from perfkitbenchmarker import disk
+from perfkitbenchmarker import os_types
+from perfkitbenchmarker import sample
+
+flags.DEFINE_boolean(
+    'vm_pool', False,
+    'If true, Linux VMs are not deleted when a benchmark is torn down but '
+    'reset and kept in a pool, and later benchmarks that need VMs with the '
+    'same VM spec, disk specs and OS lease them instead of creating new ones. '
+    'Pooled VMs are deleted once all benchmarks have run. Benchmarks must run '
+    'in series.')
+
+FLAGS = flags.FLAGS
+
+# Scratch disks of these types are not owned by the VM or not reformattable.
+_UNPOOLED_DISK_TYPES = frozenset([disk.NFS, disk.SMB, disk.RAM])
+
+_lock = threading.Lock()
+# Pool key to the idle VMs with that key.
+_idle_vms = collections.defaultdict(list)
+_networks = {}
+_firewalls = {}
+# The spec that last released resources to the pool, whose flags are used to
+# tear it down.
+_last_spec = None
+_stats = collections.Counter()
+
+
+def _Normalize(value):
+  """Returns a JSON serializable form of a spec's value."""
+  if value is None or isinstance(value, (str, int, float, bool)):
+    return value
+  if isinstance(value, (list, tuple)):
+    return [_Normalize(v) for v in value]
+  if isinstance(value, dict):
+    return {str(k): _Normalize(v) for k, v in value.items()}
+  if hasattr(value, '__dict__'):
+    return {k: _Normalize(v) for k, v in vars(value).items()
+            if not k.startswith('_')}
+  return repr(value)
+
+
+def GetKey(vm, vm_spec):
+  """Returns the key of the pool a VM may be leased from, or None.
+
+  Args:
+    vm: A constructed, not yet created, BaseVirtualMachine.
+    vm_spec: The BaseVmSpec the VM was constructed from.
+
+  Returns:
+    A string that is the same for VMs that are interchangeable, or None if the
+    VM can not be pooled.
+  """
+  if (vm.is_static or vm.OS_TYPE not in os_types.LINUX_OS_TYPES or
+      getattr(vm_spec, 'placement_group', None)):
+    return None
+  if any(d.disk_type in _UNPOOLED_DISK_TYPES for d in vm.disk_specs):
+    return None
+  return json.dumps([vm.CLOUD, vm.OS_TYPE, _Normalize(vm_spec),
+                     [_Normalize(d) for d in vm.disk_specs]], sort_keys=True)
+
+
+def AdoptNetworks(spec):
+  """Gives a spec the pooled networks and firewalls, which already exist."""
+  with _lock:
+    spec.networks.update(_networks)
+    spec.firewalls.update(_firewalls)
+
+
+def Lease(key):
+  """Returns an idle VM with the key, or None if there is none."""
+  if not key:
+    return None
+  with _lock:
+    if not _idle_vms[key]:
+      return None
+    vm = _idle_vms[key].pop()
+    _stats['reused_vms'] += 1
+    if vm.bootable_time and vm.create_start_time:
+      _stats['boot_seconds_saved'] += vm.bootable_time - vm.create_start_time
+  logging.info('Leased VM %s from the VM pool.', vm.name)
+  return vm
+
+
+def IsIdle(vm):
+  """Returns whether the VM is in the pool, so must not be deleted."""
+  with _lock:
+    return any(vm in vms for vms in _idle_vms.values())
+
+
+def _UnmountScratchDisks(vm):
+  for scratch_disk in vm.scratch_disks:
+    if scratch_disk.mount_point:
+      vm.RemoteCommand(
+          'sudo umount {0}; sudo sed -i "\\# {0} #d" /etc/fstab'.format(
+              scratch_disk.mount_point))
+
+
+def _ResetVm(vm):
+  """Removes what a benchmark left on a VM before the VM is pooled."""
+  vm.PackageCleanup()
+  _UnmountScratchDisks(vm)
+
+
+def PrepareLeasedVm(vm):
+  """Reformats the scratch disks of a leased VM and drops its caches."""
+  for scratch_disk in vm.scratch_disks:
+    if scratch_disk.mount_point:
+      vm.FormatDisk(scratch_disk.GetDevicePath(), scratch_disk.disk_type)
+      vm.MountDisk(scratch_disk.GetDevicePath(), scratch_disk.mount_point,
+                   scratch_disk.disk_type, scratch_disk.mount_options,
+                   scratch_disk.fstab_options)
+  vm.DropCaches()
+
+
+def Release(spec):
+  """Moves the VMs of a torn down spec that can be reused into the pool.
+
+  VMs that can not be reset are left to be deleted with the spec. The spec's
+  networks and firewalls are moved into the pool, as pooled VMs use them.
+
+  Args:
+    spec: The BenchmarkSpec being torn down.
+  """
+  global _last_spec
+  vms = [vm for vm in spec.vms
+         if getattr(vm, 'vm_pool_key', None) and vm.created and not vm.deleted]
+
+  def _Reset(vm):
+    try:
+      _ResetVm(vm)
+      return True
+    except Exception:  # pylint: disable=broad-except
+      logging.exception('Could not reset VM %s. Deleting it instead of '
+                        'pooling it.', vm.name)
+      return False
+
+  reset = background_tasks.RunThreaded(_Reset, vms)
+  with _lock:
+    for vm, was_reset in zip(vms, reset):
+      if was_reset:
+        _idle_vms[vm.vm_pool_key].append(vm)
+    _networks.update(spec.networks)
+    _firewalls.update(spec.firewalls)
+    _last_spec = spec
+  spec.networks.clear()
+  spec.firewalls.clear()
+
+
+def _DeleteVm(vm):
+  vm.Delete()
+  vm.DeleteScratchDisks()
+
+
+def TearDown():
+  """Deletes the pooled VMs, then the pooled firewalls and networks."""
+  global _last_spec
+  with _lock:
+    vms = [vm for pooled in _idle_vms.values() for vm in pooled]
+    networks = list(_networks.values())
+    firewalls = list(_firewalls.values())
+    spec, _last_spec = _last_spec, None
+    _idle_vms.clear()
+    _networks.clear()
+    _firewalls.clear()
+  if not spec:
+    return
+  logging.info('Tearing down the VM pool: %d VMs.', len(vms))
+  with spec.RedirectGlobalFlags():
+    try:
+      background_tasks.RunThreaded(_DeleteVm, vms)
+    except Exception:  # pylint: disable=broad-except
+      logging.exception('Got an exception deleting pooled VMs. Attempting to '
+                        'continue tearing down.')
+    for firewall in firewalls:
+      try:
+        firewall.DisallowAllPorts()
+      except Exception:  # pylint: disable=broad-except
+        logging.exception('Got an exception disabling firewalls. Attempting '
+                          'to continue tearing down.')
+    for network in networks:
+      try:
+        network.Delete()
+      except Exception:  # pylint: disable=broad-except
+        logging.exception('Got an exception deleting networks. Attempting to '
+                          'continue tearing down.')
+
+
+def GetSamples():
+  """Returns samples of the VMs reused since the last call, and resets them."""
+  with _lock:
+    stats = _stats.copy()
+    _stats.clear()
+  if not stats['reused_vms']:
+    return []
+  return [
+      sample.Sample('VM Pool Reused VMs', stats['reused_vms'], 'count', {}),
+      sample.Sample('VM Pool Boot Time Saved', stats['boot_seconds_saved'],
+                    'seconds', {'reused_vms': stats['reused_vms']}),
+  ]
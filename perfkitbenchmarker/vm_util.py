@@ -25,6 +25,7 @@ import platform
 import posixpath
 import random
 import re
+import selectors
 import string
 import subprocess
 import tempfile
@@ -34,6 +35,7 @@ import time
 from absl import flags
 import jinja2
 from perfkitbenchmarker import background_tasks
+from perfkitbenchmarker import command_profiler
 from perfkitbenchmarker import data
 from perfkitbenchmarker import errors
 from perfkitbenchmarker import temp_dir
@@ -66,10 +68,24 @@ OUTPUT_STDOUT = 0
 OUTPUT_STDERR = 1
 OUTPUT_EXIT_CODE = 2
 
+# Engines used by IssueCommand to collect command output.
+ISSUE_COMMAND_ENGINE_TEMPFILE = 'tempfile'
+ISSUE_COMMAND_ENGINE_PIPE = 'pipe'
+
+# Bytes of each output stream IssueStreamingCommand keeps in memory by default.
+DEFAULT_MAX_BUFFER_BYTES = 64 * 1024 * 1024
+_PIPE_READ_SIZE = 64 * 1024
+
 _SIMULATE_MAINTENANCE_SEMAPHORE = threading.Semaphore(0)
 
 flags.DEFINE_integer('default_timeout', TIMEOUT, 'The default timeout for '
                      'retryable commands in seconds.')
+flags.DEFINE_enum('issue_command_engine', ISSUE_COMMAND_ENGINE_TEMPFILE,
+                  [ISSUE_COMMAND_ENGINE_TEMPFILE, ISSUE_COMMAND_ENGINE_PIPE],
+                  'How IssueCommand collects the output of local commands. '
+                  '"tempfile" redirects output to temporary files that are '
+                  'read once the command exits. "pipe" reads output from '
+                  'pipes as it is produced, which avoids writing it to disk.')
 flags.DEFINE_integer('burn_cpu_seconds', 0,
                      'Amount of time in seconds to burn cpu on vm before '
                      'starting benchmark')
@@ -248,7 +264,9 @@ def Retry(poll_interval=POLL_INTERVAL, max_retries=MAX_RETRIES,
 
   Returns:
     A function that wraps functions in retry logic. It can be
-        used as a decorator.
+        used as a decorator. When the wrapped function runs in a parallel task
+        that is cancelled (see background_tasks.CancellationToken), it raises
+        errors.VmUtil.TaskCancelledError instead of retrying.
   """
   if retryable_exceptions is None:
     retryable_exceptions = Exception
@@ -278,7 +296,8 @@ def Retry(poll_interval=POLL_INTERVAL, max_retries=MAX_RETRIES,
           else:
             if log_errors:
               logging.info('Retrying exception running %s: %s', f.__name__, e)
-            time.sleep(sleep_time)
+            # Stops retrying if a parallel task this runs in was cancelled.
+            background_tasks.CancellableSleep(sleep_time)
     return WrappedFunction
   return Wrap
 
@@ -303,6 +322,48 @@ def _ReadIssueCommandOutput(tf_out, tf_err):
   return stdout, stderr
 
 
+def _LogAndCheckCommandResult(full_cmd, stdout, stderr, retcode, timing_output,
+                              did_timeout, was_killed, timeout,
+                              force_info_log, suppress_warning,
+                              raise_on_failure, suppress_failure,
+                              raise_on_timeout):
+  """Logs the result of a command and raises or suppresses failures.
+
+  Shared by the IssueCommand engines so that they report results identically.
+
+  Returns:
+    A tuple of stdout, stderr, and retcode, rewritten as passing if the failure
+    was suppressed.
+  """
+  debug_text = ('Ran: {%s}\nReturnCode:%s%s\nSTDOUT: %s\nSTDERR: %s' %
+                (full_cmd, retcode, timing_output, stdout, stderr))
+  if force_info_log or (retcode and not suppress_warning):
+    logging.info(debug_text)
+  else:
+    logging.debug(debug_text)
+
+  # Raise timeout error regardless of raise_on_failure - as the intended
+  # semantics is to ignore expected errors caused by invoking the command
+  # not errors from PKB infrastructure.
+  if did_timeout and raise_on_timeout:
+    debug_text = (
+        '{0}\nIssueCommand timed out after {1} seconds.  '
+        '{2} by perfkitbenchmarker.'.format(
+            debug_text, timeout,
+            'Process was killed' if was_killed else
+            'Process may have been killed'))
+    raise errors.VmUtil.IssueCommandTimeoutError(debug_text)
+  elif retcode and (raise_on_failure or suppress_failure):
+    if suppress_failure and suppress_failure(stdout, stderr, retcode):
+      # failure is suppressible, rewrite the stderr and return code as passing
+      # since some callers assume either is a failure e.g.
+      # perfkitbenchmarker.providers.aws.util.IssueRetryableCommand()
+      return stdout, '', 0
+    raise errors.VmUtil.IssueCommandError(debug_text)
+
+  return stdout, stderr, retcode
+
+
 def IssueCommand(cmd, force_info_log=False, suppress_warning=False,
                  env=None, timeout=DEFAULT_TIMEOUT, cwd=None,
                  raise_on_failure=True, suppress_failure=None,
@@ -345,6 +406,43 @@ def IssueCommand(cmd, force_info_log=False, suppress_warning=False,
     IssueCommandTimeoutError:  When raise_on_timeout=True and
                                command duration exceeds timeout
   """
+  if (FLAGS.issue_command_engine == ISSUE_COMMAND_ENGINE_PIPE and
+      not RunningOnWindows()):
+    result = IssueStreamingCommand(
+        cmd, force_info_log=force_info_log, suppress_warning=suppress_warning,
+        env=env, timeout=timeout, cwd=cwd, raise_on_failure=raise_on_failure,
+        suppress_failure=suppress_failure, raise_on_timeout=raise_on_timeout,
+        max_buffer_bytes=None)
+    return tuple(result)
+
+  with command_profiler.Measure(cmd) as measurement:
+    result = _IssueTempfileCommand(
+        cmd, force_info_log, suppress_warning, env, timeout, cwd,
+        raise_on_failure, suppress_failure, raise_on_timeout, measurement)
+  return result
+
+
+def _IssueTempfileCommand(cmd, force_info_log, suppress_warning, env, timeout,
+                          cwd, raise_on_failure, suppress_failure,
+                          raise_on_timeout, measurement):
+  """Runs a command for IssueCommand, reading its output from temp files.
+
+  Args:
+    cmd: See IssueCommand.
+    force_info_log: See IssueCommand.
+    suppress_warning: See IssueCommand.
+    env: See IssueCommand.
+    timeout: See IssueCommand.
+    cwd: See IssueCommand.
+    raise_on_failure: See IssueCommand.
+    suppress_failure: See IssueCommand.
+    raise_on_timeout: See IssueCommand.
+    measurement: The command_profiler measurement of the command, given its
+        return code once the command exits.
+
+  Returns:
+    See IssueCommand.
+  """
   if env:
     logging.debug('Environment variables: %s', env)
 
@@ -393,6 +491,7 @@ def IssueCommand(cmd, force_info_log=False, suppress_warning=False,
       process.wait()
     finally:
       timer.cancel()
+    measurement.retcode = process.returncode
 
     stdout, stderr = _ReadIssueCommandOutput(tf_out, tf_err)
 
@@ -400,34 +499,418 @@ def IssueCommand(cmd, force_info_log=False, suppress_warning=False,
     if should_time:
       timing_output = tf_timing.read().rstrip('\n')
 
-  debug_text = ('Ran: {%s}\nReturnCode:%s%s\nSTDOUT: %s\nSTDERR: %s' %
-                (full_cmd, process.returncode, timing_output, stdout, stderr))
-  if force_info_log or (process.returncode and not suppress_warning):
-    logging.info(debug_text)
+  return _LogAndCheckCommandResult(
+      full_cmd, stdout, stderr, process.returncode, timing_output,
+      did_timeout.value, was_killed.value, timeout, force_info_log,
+      suppress_warning, raise_on_failure, suppress_failure, raise_on_timeout)
+
+
+def _DecodeCommandOutput(data):
+  """Decodes command output the same way _ReadIssueCommandOutput does."""
+  return data.decode('ascii', 'ignore')
+
+
+class _CommandOutputBuffer(object):
+  """Accumulates one output stream of a command, spilling to disk when large.
+
+  Attributes:
+    path: Path of the file holding the complete output once the buffer has
+        spilled, otherwise None. The file is not deleted by PKB.
+    size: Number of bytes written to the buffer.
+  """
+
+  def __init__(self, name, max_buffer_bytes, spill_dir):
+    self._name = name
+    self._max_buffer_bytes = max_buffer_bytes
+    self._spill_dir = spill_dir
+    self._chunks = []
+    self._file = None
+    self.path = None
+    self.size = 0
+
+  def Write(self, data):
+    self.size += len(data)
+    if self._file:
+      self._file.write(data)
+      return
+    self._chunks.append(data)
+    if (self._max_buffer_bytes is not None and
+        self.size > self._max_buffer_bytes):
+      self._Spill()
+
+  def _Spill(self):
+    spill_dir = self._spill_dir
+    if spill_dir is None and os.path.isdir(GetTempDir()):
+      spill_dir = GetTempDir()
+    self._file = tempfile.NamedTemporaryFile(
+        prefix='pkb-%s-' % self._name, suffix='.log', dir=spill_dir,
+        delete=False)
+    self.path = self._file.name
+    logging.info('Command %s exceeded %d bytes, spilling it to %s.',
+                 self._name, self._max_buffer_bytes, self.path)
+    for chunk in self._chunks:
+      self._file.write(chunk)
+    self._chunks = []
+
+  def Close(self):
+    if self._file:
+      self._file.close()
+
+  def Read(self):
+    """Returns the decoded output, reading it back from disk if spilled."""
+    if self.path:
+      with open(self.path, 'rb') as f:
+        return _DecodeCommandOutput(f.read())
+    return _DecodeCommandOutput(b''.join(self._chunks))
+
+  def LogText(self):
+    """Returns the output as it should appear in the command log."""
+    if self.path:
+      return '<%d bytes in %s>' % (self.size, self.path)
+    return self.Read()
+
+
+class StreamingCommandResult(object):
+  """Result of IssueStreamingCommand.
+
+  Unpacks as (stdout, stderr, retcode) like the result of IssueCommand. Output
+  that was spilled to disk is only read back into memory when stdout or stderr
+  is accessed, so callers handling large outputs should prefer stdout_path and
+  stderr_path.
+  """
+
+  def __init__(self, stdout_buffer, stderr_buffer, retcode,
+               suppressed=False):
+    self._stdout_buffer = stdout_buffer
+    self._stderr_buffer = stderr_buffer
+    self.retcode = retcode
+    self._suppressed = suppressed
+
+  @property
+  def stdout(self):
+    return self._stdout_buffer.Read()
+
+  @property
+  def stderr(self):
+    return '' if self._suppressed else self._stderr_buffer.Read()
+
+  @property
+  def stdout_path(self):
+    return self._stdout_buffer.path
+
+  @property
+  def stderr_path(self):
+    return self._stderr_buffer.path
+
+  def __iter__(self):
+    return iter((self.stdout, self.stderr, self.retcode))
+
+
+class _LineSplitter(object):
+  """Splits chunks of command output into decoded lines."""
+
+  def __init__(self):
+    self._partial = b''
+
+  def Split(self, data):
+    """Returns the complete lines in data, including their line endings."""
+    lines = (self._partial + data).split(b'\n')
+    self._partial = lines.pop()
+    return [_DecodeCommandOutput(line + b'\n') for line in lines]
+
+  def Flush(self):
+    """Returns the trailing text without a line ending, if any."""
+    partial, self._partial = self._partial, b''
+    return [_DecodeCommandOutput(partial)] if partial else []
+
+
+class _PipeCommand(object):
+  """A command whose stdout and stderr are read through pipes as they arrive.
+
+  Iterating over Chunks() drives the command: output is read with a selector
+  as soon as it is available and the command is killed once its timeout has
+  passed, so no timer thread or temporary file is needed.
+  """
+
+  # Seconds to keep reading after the command exits or is killed, in case
+  # descendants of the command still hold the pipes open.
+  _DRAIN_SECONDS = 1
+  # Seconds between checks of whether the command has exited while its pipes
+  # are idle.
+  _POLL_SECONDS = 1
+
+  def __init__(self, cmd, env=None, timeout=DEFAULT_TIMEOUT, cwd=None,
+               raise_on_timeout=True):
+    self.full_cmd = ' '.join(str(w) for w in cmd)
+    self.timeout = timeout
+    self.did_timeout = False
+    self.was_killed = False
+    self.timing_output = ''
+    self._raise_on_timeout = raise_on_timeout
+    self._cmd = cmd
+    self._env = env
+    self._cwd = cwd
+    self._timing_file = None
+    self._start_time = None
+    self.process = None
+
+  def Start(self):
+    if self._env:
+      logging.debug('Environment variables: %s', self._env)
+    logging.info('Running: %s', self.full_cmd)
+
+    time_file_path = '/usr/bin/time'
+    cmd_to_use = self._cmd
+    if (not RunningOnDarwin() and os.path.isfile(time_file_path) and
+        FLAGS.time_commands):
+      self._timing_file = tempfile.NamedTemporaryFile(mode='r')
+      cmd_to_use = [time_file_path,
+                    '-o', self._timing_file.name,
+                    '--quiet',
+                    '-f', ',  WallTime:%Es,  CPU:%Us,  MaxMemory:%Mkb ']
+      cmd_to_use += self._cmd
+    self._start_time = time.time()
+    self.process = subprocess.Popen(cmd_to_use, env=self._env,
+                                    stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, cwd=self._cwd)
+
+  def _Kill(self):
+    self.did_timeout = True
+    if not self._raise_on_timeout:
+      logging.warning('IssueCommand timed out after %d seconds. '
+                      'Killing command "%s".', self.timeout, self.full_cmd)
+    self.process.kill()
+    self.was_killed = True
+
+  def Chunks(self):
+    """Runs the command to completion.
+
+    Yields:
+      (stream, data) tuples where stream is OUTPUT_STDOUT or OUTPUT_STDERR and
+      data is the bytes read from it.
+    """
+    deadline = None if self.timeout is None else time.time() + self.timeout
+    selector = selectors.DefaultSelector()
+    selector.register(self.process.stdout, selectors.EVENT_READ, OUTPUT_STDOUT)
+    selector.register(self.process.stderr, selectors.EVENT_READ, OUTPUT_STDERR)
+    finished = False
+    try:
+      drain_deadline = None
+      while selector.get_map():
+        now = time.time()
+        if drain_deadline is not None and now >= drain_deadline:
+          break
+        if deadline is not None and now >= deadline and not self.did_timeout:
+          self._Kill()
+          drain_deadline = now + self._DRAIN_SECONDS
+          continue
+        wait = self._POLL_SECONDS
+        if deadline is not None and not self.did_timeout:
+          wait = min(wait, deadline - now)
+        if drain_deadline is not None:
+          wait = min(wait, drain_deadline - now)
+        events = selector.select(wait)
+        if (not events and drain_deadline is None and
+            self.process.poll() is not None):
+          drain_deadline = time.time() + self._DRAIN_SECONDS
+        for key, _ in events:
+          data = os.read(key.fileobj.fileno(), _PIPE_READ_SIZE)
+          if data:
+            yield key.data, data
+          else:
+            selector.unregister(key.fileobj)
+      finished = True
+    finally:
+      selector.close()
+      self._Finish(finished)
+
+  def _Finish(self, finished):
+    """Reaps the process and releases its resources."""
+    if not finished and self.process.poll() is None:
+      # The caller stopped consuming output early.
+      self.process.kill()
+      self.was_killed = True
+    self.process.wait()
+    command_profiler.Record(self._cmd, self._start_time, time.time(),
+                            self.process.returncode)
+    for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+      pipe.close()
+    if self._timing_file:
+      self.timing_output = self._timing_file.read().rstrip('\n')
+      self._timing_file.close()
+
+
+def _StreamCommand(cmd, result, split_lines, force_info_log, suppress_warning,
+                   env, timeout, cwd, raise_on_failure, suppress_failure,
+                   raise_on_timeout, max_buffer_bytes, spill_dir):
+  """Runs a command, yielding its output lines as they are produced.
+
+  Args:
+    cmd: See IssueStreamingCommand.
+    result: A _BoxedObject set to the StreamingCommandResult once the command
+        has finished and its result has been checked.
+    split_lines: Whether to yield lines. If False the output is only buffered.
+    force_info_log: See IssueCommand.
+    suppress_warning: See IssueCommand.
+    env: See IssueCommand.
+    timeout: See IssueCommand.
+    cwd: See IssueCommand.
+    raise_on_failure: See IssueCommand.
+    suppress_failure: See IssueCommand.
+    raise_on_timeout: See IssueCommand.
+    max_buffer_bytes: See IssueStreamingCommand.
+    spill_dir: See IssueStreamingCommand.
+
+  Yields:
+    (stream, line) tuples where stream is OUTPUT_STDOUT or OUTPUT_STDERR.
+  """
+  stdout_buffer = _CommandOutputBuffer('stdout', max_buffer_bytes, spill_dir)
+  stderr_buffer = _CommandOutputBuffer('stderr', max_buffer_bytes, spill_dir)
+  buffers = {OUTPUT_STDOUT: stdout_buffer, OUTPUT_STDERR: stderr_buffer}
+  splitters = {OUTPUT_STDOUT: _LineSplitter(), OUTPUT_STDERR: _LineSplitter()}
+
+  if RunningOnWindows():
+    # Selectors do not support pipes on Windows, so run the command as usual and
+    # replay its output afterwards.
+    stdout, stderr, retcode = IssueCommand(
+        cmd, force_info_log=force_info_log, suppress_warning=suppress_warning,
+        env=env, timeout=timeout, cwd=cwd, raise_on_failure=raise_on_failure,
+        suppress_failure=suppress_failure, raise_on_timeout=raise_on_timeout)
+    command = None
+    chunks = iter([(OUTPUT_STDOUT, stdout.encode('ascii')),
+                   (OUTPUT_STDERR, stderr.encode('ascii'))])
   else:
-    logging.debug(debug_text)
+    command = _PipeCommand(cmd, env=env, timeout=timeout, cwd=cwd,
+                           raise_on_timeout=raise_on_timeout)
+    command.Start()
+    chunks = command.Chunks()
 
-  # Raise timeout error regardless of raise_on_failure - as the intended
-  # semantics is to ignore expected errors caused by invoking the command
-  # not errors from PKB infrastructure.
-  if did_timeout.value and raise_on_timeout:
-    debug_text = (
-        '{0}\nIssueCommand timed out after {1} seconds.  '
-        '{2} by perfkitbenchmarker.'.format(
-            debug_text, timeout,
-            'Process was killed' if was_killed.value else
-            'Process may have been killed'))
-    raise errors.VmUtil.IssueCommandTimeoutError(debug_text)
-  elif process.returncode and (raise_on_failure or suppress_failure):
-    if (suppress_failure and
-        suppress_failure(stdout, stderr, process.returncode)):
-      # failure is suppressible, rewrite the stderr and return code as passing
-      # since some callers assume either is a failure e.g.
-      # perfkitbenchmarker.providers.aws.util.IssueRetryableCommand()
-      return stdout, '', 0
-    raise errors.VmUtil.IssueCommandError(debug_text)
+  try:
+    for stream, chunk in chunks:
+      buffers[stream].Write(chunk)
+      if split_lines:
+        for line in splitters[stream].Split(chunk):
+          yield stream, line
+    if split_lines:
+      for stream in (OUTPUT_STDOUT, OUTPUT_STDERR):
+        for line in splitters[stream].Flush():
+          yield stream, line
+  finally:
+    stdout_buffer.Close()
+    stderr_buffer.Close()
+    if command:
+      # Reaps the process if the consumer stopped early or raised.
+      chunks.close()
+
+  if command:
+    def _SuppressFailure(unused_stdout, unused_stderr, retcode):
+      # Spilled output is only read back if a caller needs to inspect it.
+      return suppress_failure(stdout_buffer.Read(), stderr_buffer.Read(),
+                              retcode)
+
+    _, _, retcode = _LogAndCheckCommandResult(
+        command.full_cmd, stdout_buffer.LogText(), stderr_buffer.LogText(),
+        command.process.returncode, command.timing_output, command.did_timeout,
+        command.was_killed, timeout, force_info_log, suppress_warning,
+        raise_on_failure, suppress_failure and _SuppressFailure,
+        raise_on_timeout)
+    suppressed = retcode != command.process.returncode
+  else:
+    suppressed = False
+  result.value = StreamingCommandResult(stdout_buffer, stderr_buffer, retcode,
+                                        suppressed=suppressed)
 
-  return stdout, stderr, process.returncode
+
+def IssueStreamingCommand(cmd, line_callback=None, force_info_log=False,
+                          suppress_warning=False, env=None,
+                          timeout=DEFAULT_TIMEOUT, cwd=None,
+                          raise_on_failure=True, suppress_failure=None,
+                          raise_on_timeout=True,
+                          max_buffer_bytes=DEFAULT_MAX_BUFFER_BYTES,
+                          spill_dir=None):
+  """Runs the provided command once, reading its output as it is produced.
+
+  Unlike IssueCommand, output is read from pipes incrementally rather than
+  being written to temporary files and read back after the command exits. Each
+  stream is held in memory until it exceeds max_buffer_bytes, after which it is
+  written to a file instead.
+
+  Args:
+    cmd: A list of strings such as is given to the subprocess.Popen()
+        constructor.
+    line_callback: Optional function called as line_callback(stream, line) for
+        each line of output as it arrives, where stream is OUTPUT_STDOUT or
+        OUTPUT_STDERR and line includes its line ending (except possibly for the
+        final line of a stream).
+    force_info_log: See IssueCommand.
+    suppress_warning: See IssueCommand.
+    env: See IssueCommand.
+    timeout: See IssueCommand.
+    cwd: See IssueCommand.
+    raise_on_failure: See IssueCommand.
+    suppress_failure: See IssueCommand.
+    raise_on_timeout: See IssueCommand.
+    max_buffer_bytes: Number of bytes of each stream to keep in memory before
+        spilling it to a file, or None to always keep the output in memory.
+    spill_dir: Directory for spilled output. Defaults to the run's temporary
+        directory.
+
+  Returns:
+    A StreamingCommandResult, which unpacks as (stdout, stderr, retcode).
+
+  Raises:
+    IssueCommandError: When raise_on_failure=True and retcode is non-zero.
+    IssueCommandTimeoutError:  When raise_on_timeout=True and
+                               command duration exceeds timeout
+  """
+  result = _BoxedObject(None)
+  lines = _StreamCommand(
+      cmd, result, bool(line_callback), force_info_log, suppress_warning, env,
+      timeout, cwd, raise_on_failure, suppress_failure, raise_on_timeout,
+      max_buffer_bytes, spill_dir)
+  for stream, line in lines:
+    line_callback(stream, line)
+  return result.value
+
+
+def IterCommandLines(cmd, force_info_log=False, suppress_warning=False,
+                     env=None, timeout=DEFAULT_TIMEOUT, cwd=None,
+                     raise_on_failure=True, raise_on_timeout=True,
+                     max_buffer_bytes=DEFAULT_MAX_BUFFER_BYTES, spill_dir=None):
+  """Runs the provided command once, yielding its output lines as they arrive.
+
+  Failures are raised once the command has finished, after every line has been
+  yielded. Closing the generator early kills the command.
+
+  Args:
+    cmd: A list of strings such as is given to the subprocess.Popen()
+        constructor.
+    force_info_log: See IssueCommand.
+    suppress_warning: See IssueCommand.
+    env: See IssueCommand.
+    timeout: See IssueCommand.
+    cwd: See IssueCommand.
+    raise_on_failure: See IssueCommand.
+    raise_on_timeout: See IssueCommand.
+    max_buffer_bytes: See IssueStreamingCommand.
+    spill_dir: See IssueStreamingCommand.
+
+  Yields:
+    (stream, line) tuples where stream is OUTPUT_STDOUT or OUTPUT_STDERR and
+    line includes its line ending.
+
+  Raises:
+    IssueCommandError: When raise_on_failure=True and retcode is non-zero.
+    IssueCommandTimeoutError:  When raise_on_timeout=True and
+                               command duration exceeds timeout
+  """
+  lines = _StreamCommand(
+      cmd, _BoxedObject(None), True, force_info_log, suppress_warning, env,
+      timeout, cwd, raise_on_failure, None, raise_on_timeout, max_buffer_bytes,
+      spill_dir)
+  for stream_and_line in lines:
+    yield stream_and_line
 
 
 def IssueBackgroundCommand(cmd, stdout_path, stderr_path, env=None):
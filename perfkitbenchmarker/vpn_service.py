@@ -30,6 +30,7 @@ from enum import Enum
 
 from perfkitbenchmarker import context
 from perfkitbenchmarker import errors
+from perfkitbenchmarker import provision_graph
 from absl import flags
 from perfkitbenchmarker import resource
 from perfkitbenchmarker import vm_util
@@ -260,6 +261,10 @@ class VPNService(resource.BaseResource):
         'shared_key': self.shared_key,
     }
 
+  def GetProvisionDependencies(self):
+    """See base class."""
+    return [provision_graph.VMS_READY]
+
   def GetResourceMetadata(self):
     """Returns a dictionary of metadata about the resource."""
 
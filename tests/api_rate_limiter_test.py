@@ -0,0 +1,188 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.api_rate_limiter."""
+
+import os
+import unittest
+
+from absl import flags
+import mock
+
+from perfkitbenchmarker import api_rate_limiter
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import vm_util
+from perfkitbenchmarker.providers.aws import util as aws_util
+from perfkitbenchmarker.providers.gcp import util as gcp_util
+from tests import pkb_common_test_case
+
+FLAGS = flags.FLAGS
+
+
+class _FakeClock(object):
+
+  def __init__(self):
+    self.now = 1000.0
+
+  def time(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.now += seconds
+
+
+class RateLimiterTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(RateLimiterTestCase, self).setUp()
+    FLAGS.api_rate_limit_initial_qps = 2
+    FLAGS.api_rate_limit_min_qps = 0.5
+    FLAGS.api_rate_limit_max_qps = 2.2
+    FLAGS.api_circuit_breaker_threshold = 3
+    FLAGS.api_circuit_breaker_seconds = 60
+    self.clock = _FakeClock()
+    self.enter_context(mock.patch.object(api_rate_limiter, 'time', self.clock))
+    self.enter_context(mock.patch.object(api_rate_limiter, '_WAIT_FUZZ', 0))
+    self.stats = api_rate_limiter._LimiterStats()
+    self.backend = api_rate_limiter._LocalBackend()
+    self.limiter = api_rate_limiter.RateLimiter('GCP', 'compute', self.backend,
+                                                self.stats)
+
+  def _Rate(self):
+    with self.backend.Transaction() as state:
+      return state['GCP:compute']['rate']
+
+  def testAcquireFollowsRate(self):
+    for _ in range(5):
+      self.limiter.Acquire()
+    # One call may be made immediately and the rest at 2 per second.
+    self.assertAlmostEqual(1002.0, self.clock.now)
+
+  def testAdditiveIncreaseMultiplicativeDecrease(self):
+    self.limiter.Acquire()
+    self.limiter.RecordResult(throttled=False)
+    self.assertAlmostEqual(2.1, self._Rate())
+    self.limiter.RecordResult(throttled=False)
+    self.limiter.RecordResult(throttled=False)
+    self.assertAlmostEqual(2.2, self._Rate())
+    self.limiter.RecordResult(throttled=True)
+    self.assertAlmostEqual(1.1, self._Rate())
+    self.limiter.RecordResult(throttled=True)
+    self.assertAlmostEqual(0.55, self._Rate())
+    self.limiter.RecordResult(throttled=True)
+    self.assertAlmostEqual(0.5, self._Rate())
+
+  def testCircuitBreakerPausesCalls(self):
+    self.limiter.Acquire()
+    for _ in range(3):
+      self.limiter.RecordResult(throttled=True)
+    start = self.clock.now
+    self.limiter.Acquire()
+    self.assertGreaterEqual(self.clock.now - start, 60)
+    sample, = self.stats.GetSamples()
+    self.assertEqual('API Rate Limiter Throttled Time', sample.metric)
+    self.assertGreaterEqual(sample.value, 60)
+    self.assertEqual(
+        {'provider': 'GCP', 'api_family': 'compute', 'calls': 2,
+         'throttled_calls': 3, 'circuit_breaker_trips': 1}, sample.metadata)
+    self.assertEqual([], self.stats.GetSamples())
+
+  def testSuccessResetsThrottledInARow(self):
+    self.limiter.Acquire()
+    for _ in range(2):
+      self.limiter.RecordResult(throttled=True)
+    self.limiter.RecordResult(throttled=False)
+    self.limiter.RecordResult(throttled=True)
+    with self.backend.Transaction() as state:
+      self.assertEqual(0, state['GCP:compute']['breaker_until'])
+
+
+class FileBackendTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  @unittest.skipIf(api_rate_limiter.fcntl is None, 'Requires fcntl.')
+  def testStateIsSharedThroughFile(self):
+    path = os.path.join(self.create_tempdir().full_path, 'state.json')
+    stats = api_rate_limiter._LimiterStats()
+    first = api_rate_limiter.RateLimiter(
+        'AWS', 'ec2', api_rate_limiter._FileBackend(path), stats)
+    second = api_rate_limiter.RateLimiter(
+        'AWS', 'ec2', api_rate_limiter._FileBackend(path), stats)
+    first.Acquire()
+    first.RecordResult(throttled=True)
+    with api_rate_limiter._FileBackend(path).Transaction() as state:
+      self.assertAlmostEqual(FLAGS.api_rate_limit_initial_qps / 2,
+                             state['AWS:ec2']['rate'])
+    second.RecordResult(throttled=True)
+    with api_rate_limiter._FileBackend(path).Transaction() as state:
+      self.assertAlmostEqual(FLAGS.api_rate_limit_initial_qps / 4,
+                             state['AWS:ec2']['rate'])
+
+
+class ProviderIntegrationTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(ProviderIntegrationTestCase, self).setUp()
+    FLAGS.api_rate_limiting = True
+    self.limiter = mock.Mock()
+    self.get_limiter = self.enter_context(mock.patch.object(
+        api_rate_limiter, 'GetLimiter', return_value=self.limiter))
+
+  def testDisabled(self):
+    FLAGS.api_rate_limiting = False
+    with api_rate_limiter.Limit('GCP', 'compute') as report_throttled:
+      report_throttled(True)
+    self.get_limiter.assert_not_called()
+
+  def testGcloudRateLimited(self):
+    FLAGS.retry_on_rate_limited = False
+    cmd = gcp_util.GcloudCommand(None, 'beta', 'compute', 'instances', 'list')
+    with mock.patch.object(vm_util, 'IssueCommand',
+                           return_value=('', 'Rate Limit Exceeded', 1)):
+      cmd.Issue()
+    self.get_limiter.assert_called_once_with('GCP', 'compute')
+    self.limiter.Acquire.assert_called_once_with()
+    self.limiter.RecordResult.assert_called_once_with(True)
+
+  def testGcloudRateLimitedError(self):
+    FLAGS.retry_on_rate_limited = False
+    cmd = gcp_util.GcloudCommand(None, 'compute', 'instances', 'list')
+    with mock.patch.object(
+        vm_util, 'IssueCommand',
+        side_effect=errors.VmUtil.IssueCommandError('Rate Limit Exceeded')):
+      with self.assertRaises(errors.VmUtil.IssueCommandError):
+        cmd.Issue()
+    self.limiter.RecordResult.assert_called_once_with(True)
+
+  def testAwsThrottled(self):
+    self.enter_context(mock.patch.object(
+        vm_util, 'IssueCommand', side_effect=[
+            ('', 'An error occurred (RequestLimitExceeded)', 255),
+            ('{}', '', 0)]))
+    self.enter_context(mock.patch.object(vm_util.time, 'sleep'))
+    aws_util.IssueRetryableCommand(aws_util.AWS_PREFIX +
+                                   ['ec2', 'describe-instances'])
+    self.get_limiter.assert_called_with('AWS', 'ec2')
+    self.assertEqual([mock.call(True), mock.call(False)],
+                     self.limiter.RecordResult.call_args_list)
+
+  def testAwsApiFamilySkipsGlobalOptions(self):
+    self.assertEqual('ec2', aws_util._GetApiFamily(
+        ['aws', '--region', 'us-east-1', '--debug', '--output=json', 'ec2',
+         'describe-instances']))
+    self.assertEqual('s3api', aws_util._GetApiFamily(
+        aws_util.AWS_PREFIX + ['--profile', 'p', 's3api', 'list-buckets']))
+    self.assertEqual('aws', aws_util._GetApiFamily(['aws', '--version']))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -24,13 +24,20 @@ import multiprocessing.managers
 import os
 import signal
 import threading
+import time
 import unittest
 
+from absl import flags
+import mock
+
 from perfkitbenchmarker import background_tasks
 from perfkitbenchmarker import errors
+from perfkitbenchmarker import vm_util
 from tests import pkb_common_test_case
 from six.moves import range
 
+FLAGS = flags.FLAGS
+
 
 def _ReturnArgs(a, b=None):
   return b, a
@@ -156,6 +163,257 @@ class RunThreadedTestCase(pkb_common_test_case.PkbCommonTestCase):
     self.assertEqual(result, [(None, 'red'), ('blue', 'green')])
 
 
+def _RetryUntilCancelled(started):
+
+  @vm_util.Retry(poll_interval=0.01, timeout=10, log_errors=False)
+  def _Fail():
+    started.set()
+    raise ValueError('Not yet.')
+
+  _Fail()
+
+
+class CancellationTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def testFailFastCancelsRunningTasks(self):
+    started = threading.Event()
+
+    def _FailAfterStart():
+      started.wait(5)
+      raise ValueError('Failed.')
+
+    int_list = []
+    calls = [(_RetryUntilCancelled, (started,), {}),
+             (_FailAfterStart, (), {}),
+             (_AppendLength, (int_list,), {})]
+    with self.assertRaises(errors.VmUtil.ThreadException) as cm:
+      background_tasks.RunParallelThreads(calls, max_concurrency=2,
+                                          fail_fast=True)
+    self.assertIn('1 tasks were cancelled and 1 were not started',
+                  str(cm.exception))
+    self.assertNotIn('_RetryUntilCancelled', str(cm.exception))
+    self.assertEqual(int_list, [])
+
+  def testWithoutFailFastRunsAllTasks(self):
+    int_list = []
+    calls = [(_RaiseValueError, (), {}), (_AppendLength, (int_list,), {})]
+    with self.assertRaises(errors.VmUtil.ThreadException):
+      background_tasks.RunParallelThreads(calls, max_concurrency=1)
+    self.assertEqual(int_list, [0])
+
+  def testCallerCancellation(self):
+    token = background_tasks.CancellationToken()
+    started = threading.Event()
+
+    def _Cancel():
+      started.wait(5)
+      token.Cancel()
+
+    with self.assertRaises(errors.VmUtil.ThreadException):
+      background_tasks.RunThreaded(
+          lambda f: f(), [functools.partial(_RetryUntilCancelled, started),
+                          _Cancel], cancellation_token=token)
+
+  def testNestedTasksAreCancelled(self):
+    parent = background_tasks.CancellationToken()
+    child = background_tasks.CancellationToken(parent)
+    parent.Cancel()
+    self.assertTrue(child.cancelled)
+    late_child = background_tasks.CancellationToken(parent)
+    self.assertTrue(late_child.cancelled)
+
+  def testCheckCancelledOutsideTasks(self):
+    background_tasks.CheckCancelled()
+    self.assertIsNone(background_tasks.GetCancellationToken())
+
+
+class IterThreadedTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def testYieldsResultsAsTheyComplete(self):
+    event = threading.Event()
+
+    def _Return(i):
+      if i == 0:
+        event.wait(5)
+      return i * 10
+
+    results = []
+    for i, result in background_tasks.IterThreaded(_Return, [0, 1]):
+      results.append((i, result))
+      event.set()
+    self.assertEqual(results, [(1, 10), (0, 0)])
+
+  def testRaisesAfterResults(self):
+    results = []
+    with self.assertRaises(errors.VmUtil.ThreadException):
+      for _, result in background_tasks.IterThreaded(
+          lambda i: 1 / i, [1, 0], max_concurrent_threads=1):
+        results.append(result)
+    self.assertEqual(results, [1])
+
+  def testStoppingEarlyCancelsTasks(self):
+    started = threading.Event()
+    tasks = background_tasks.IterThreaded(
+        lambda f: f(), [lambda: 'done',
+                        functools.partial(_RetryUntilCancelled, started)])
+    self.assertEqual((0, 'done'), next(tasks))
+    started.wait(5)
+    # Closing the iterator returns once the retrying task has been cancelled.
+    tasks.close()
+
+
+class ConcurrencyClassTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(ConcurrencyClassTestCase, self).setUp()
+    background_tasks.SetConcurrencyLimit('test', 2)
+    self.addCleanup(background_tasks.SetConcurrencyLimit, 'test', None)
+
+  def testLimitIsSharedByNestedCalls(self):
+    lock = threading.Lock()
+    counts = {'active': 0, 'max': 0}
+
+    def _Work(unused_i):
+      with lock:
+        counts['active'] += 1
+        counts['max'] = max(counts['max'], counts['active'])
+      time.sleep(0.01)
+      with lock:
+        counts['active'] -= 1
+
+    def _RunGroup(unused_group):
+      background_tasks.RunThreaded(_Work, list(range(5)),
+                                   concurrency_class='test')
+
+    background_tasks.RunThreaded(_RunGroup, list(range(3)))
+    self.assertEqual(2, counts['max'])
+    sample, = background_tasks.GetConcurrencySamples()
+    self.assertEqual('Concurrency Class Wait Time', sample.metric)
+    self.assertEqual('test', sample.metadata['concurrency_class'])
+    self.assertEqual(15, sample.metadata['acquisitions'])
+    self.assertGreater(sample.metadata['waits'], 0)
+    self.assertEqual([], background_tasks.GetConcurrencySamples())
+
+  def testNestedSlotsOfAThreadAreReentrant(self):
+    background_tasks.SetConcurrencyLimit('test', 1)
+    with background_tasks.ConcurrencySlot('test'):
+      with background_tasks.ConcurrencySlot('test'):
+        self.assertEqual(0, background_tasks.GetConcurrencyQueueDepth('test'))
+
+  def testChildTasksInheritSlots(self):
+    background_tasks.SetConcurrencyLimit('test', 1)
+
+    def _Create(unused_i):
+      with background_tasks.ConcurrencySlot('test'):
+        return background_tasks.GetConcurrencyQueueDepth('test')
+
+    def _CreateAll():
+      with background_tasks.ConcurrencySlot('test'):
+        results.extend(background_tasks.RunThreaded(_Create, list(range(3))))
+
+    results = []
+    thread = threading.Thread(target=_CreateAll)
+    thread.daemon = True
+    thread.start()
+    thread.join(10)
+    self.assertFalse(thread.is_alive())
+    self.assertEqual([0, 0, 0], results)
+
+  def testPriority(self):
+    background_tasks.SetConcurrencyLimit('test', 1)
+    order = []
+
+    def _Append(priority):
+      with background_tasks.ConcurrencySlot('test', priority):
+        order.append(priority)
+
+    holder = threading.Event()
+    release = threading.Event()
+
+    def _Hold():
+      with background_tasks.ConcurrencySlot('test'):
+        holder.set()
+        release.wait(5)
+
+    threads = [threading.Thread(target=_Hold)]
+    threads[0].start()
+    holder.wait(5)
+    for priority in (0, 5, 1):
+      threads.append(threading.Thread(target=_Append, args=(priority,)))
+      threads[-1].start()
+      while background_tasks.GetConcurrencyQueueDepth('test') < len(
+          threads) - 1:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual([5, 1, 0], order)
+
+  def testFlag(self):
+    FLAGS.concurrency_classes = ['flag-class:3']
+    self.addCleanup(background_tasks.SetConcurrencyLimit, 'flag-class', None)
+    self.assertEqual(3, background_tasks._GetConcurrencyClass(
+        'flag-class').limit)
+    with self.assertRaises(ValueError):
+      background_tasks._ParseConcurrencyClasses(['flag-class:0'])
+
+  def testInvalidFlag(self):
+    with self.assertRaises(flags.IllegalFlagValueError):
+      FLAGS.concurrency_classes = ['gcp-create:many']
+
+  def testFlagWithUnknownClass(self):
+    self.enter_context(mock.patch.object(
+        background_tasks, '_known_concurrency_classes', {'gcp-create'}))
+    with self.assertLogs(level='WARNING') as logs:
+      FLAGS.concurrency_classes = ['gcp-create:50', 'gce-create:50']
+    self.assertEqual(1, len(logs.output))
+    self.assertIn('gce-create', logs.output[0])
+
+
+class RunDagTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def testRunsTasksAfterDependencies(self):
+    order = []
+    tasks = [('c', lambda: order.append('c'), ['a', 'b']),
+             ('a', lambda: order.append('a'), []),
+             ('b', lambda: order.append('b'), ['a'])]
+    timings = background_tasks.RunDag(tasks, max_concurrency=3)
+    self.assertEqual(order, ['a', 'b', 'c'])
+    self.assertEqual(set(timings), {'a', 'b', 'c'})
+    self.assertLessEqual(timings['a'][1], timings['b'][0])
+
+  def testIndependentTasksRunConcurrently(self):
+    # Each task waits for the other to start, so this only completes if they
+    # run at the same time.
+    events = [threading.Event(), threading.Event()]
+
+    def _SetAndWait(i):
+      events[i].set()
+      if not events[1 - i].wait(5):
+        raise ValueError('Task %d ran alone.' % i)
+
+    background_tasks.RunDag(
+        [('a', functools.partial(_SetAndWait, 0), []),
+         ('b', functools.partial(_SetAndWait, 1), [])], max_concurrency=2)
+
+  def testExceptionSkipsDependentTasks(self):
+    int_list = []
+    tasks = [('fail', _RaiseValueError, []),
+             ('dependent', functools.partial(_AppendLength, int_list), ['fail'])]
+    with self.assertRaises(errors.VmUtil.ThreadException):
+      background_tasks.RunDag(tasks, max_concurrency=2)
+    self.assertEqual(int_list, [])
+
+  def testCycle(self):
+    with self.assertRaises(ValueError):
+      background_tasks.RunDag([('a', _RaiseValueError, ['b']),
+                               ('b', _RaiseValueError, ['a'])])
+
+  def testUnknownDependency(self):
+    with self.assertRaises(ValueError):
+      background_tasks.RunDag([('a', _RaiseValueError, ['b'])])
+
+
 class RunParallelProcessesTestCase(pkb_common_test_case.PkbCommonTestCase):
 
   def testFewerThreadsThanConcurrencyLimit(self):
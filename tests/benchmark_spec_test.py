@@ -13,17 +13,23 @@
 # limitations under the License.
 """Tests for perfkitbenchmarker.benchmark_spec."""
 
+import threading
 import unittest
 from absl import flags
 import mock
 
 from perfkitbenchmarker import benchmark_spec
+from perfkitbenchmarker import benchmark_status
 from perfkitbenchmarker import configs
 from perfkitbenchmarker import context
 from perfkitbenchmarker import linux_benchmarks
 from perfkitbenchmarker import pkb  # pylint: disable=unused-import # noqa
 from perfkitbenchmarker import providers
+from perfkitbenchmarker import provision_graph
+from perfkitbenchmarker import relational_db
+from perfkitbenchmarker import stages
 from perfkitbenchmarker import static_virtual_machine as static_vm
+from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.configs import benchmark_config_spec
 from perfkitbenchmarker.linux_benchmarks import iperf_benchmark
 from perfkitbenchmarker.providers.aws import aws_virtual_machine as aws_vm
@@ -269,5 +275,57 @@ class RedirectGlobalFlagsTestCase(pkb_common_test_case.PkbCommonTestCase):
     self.assertEqual(FLAGS.benchmark_spec_test_flag, 0)
 
 
+class ProvisionStepsTestCase(_BenchmarkSpecTestCase):
+
+  def testManagedDbIsCreatedWhileVmsBoot(self):
+    spec = self._CreateBenchmarkSpecFromYaml(SIMPLE_CONFIG)
+    spec.ConstructVirtualMachines()
+    db_created = threading.Event()
+    spec.relational_db = mock.Mock(is_managed_db=True)
+    spec.relational_db.GetProvisionDependencies.side_effect = (
+        lambda: relational_db.BaseRelationalDb.GetProvisionDependencies(
+            spec.relational_db))
+    spec.relational_db.Create.side_effect = db_created.set
+    vm = spec.vms[0]
+    self.enter_context(mock.patch.object(vm, 'Create'))
+    self.enter_context(mock.patch.object(vm, 'AllowRemoteAccessPorts'))
+    # The VM only boots once the database was created.
+    self.enter_context(mock.patch.object(
+        vm, 'WaitForBootCompletion',
+        side_effect=lambda: self.assertTrue(db_created.wait(10))))
+    self.enter_context(mock.patch.object(spec, '_CreateNetworks'))
+    self.enter_context(mock.patch.object(spec, '_PrepareVms'))
+    provision_graph.Provision(spec._GetProvisionSteps())
+    vm.WaitForBootCompletion.assert_called_once_with()
+    spec.relational_db.Create.assert_called_once_with()
+
+
+class CheckpointTestCase(_BenchmarkSpecTestCase):
+
+  def setUp(self):
+    super(CheckpointTestCase, self).setUp()
+    self.enter_context(mock.patch.object(
+        vm_util, 'GetTempDir', return_value=self.create_tempdir().full_path))
+    self.spec = self._CreateBenchmarkSpecFromYaml(SIMPLE_CONFIG)
+    self.spec.ConstructVirtualMachines()
+    FLAGS.run_stage = [stages.TEARDOWN]
+
+  def _Load(self):
+    return benchmark_spec.BenchmarkSpec.GetBenchmarkSpec(
+        iperf_benchmark, self.spec.config, UID)
+
+  def testLoadJournal(self):
+    self.spec.Pickle()
+    loaded = self._Load()
+    self.assertEqual(self.spec.vms[0].name, loaded.vms[0].name)
+    self.assertIs(loaded.vms[0], loaded.vm_groups['default'][0])
+    self.assertEqual(benchmark_status.SKIPPED, loaded.status)
+
+  def testLoadPickle(self):
+    FLAGS.spec_checkpoint_format = 'pickle'
+    self.spec.Pickle()
+    self.assertEqual(self.spec.vms[0].name, self._Load().vms[0].name)
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,138 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.command_profiler."""
+
+import json
+import os
+import unittest
+
+from absl import flags
+import mock
+
+from perfkitbenchmarker import command_profiler
+from perfkitbenchmarker import temp_dir
+from perfkitbenchmarker import vm_util
+from tests import pkb_common_test_case
+
+FLAGS = flags.FLAGS
+
+
+def _Record(start, end, category='ssh', vm='vm0', phase='provision',
+            thread='Thread-1', command='ssh vm0 true'):
+  return command_profiler.CommandRecord(start, end, category, vm, phase,
+                                        thread, command, 0)
+
+
+class CommandProfilerTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(CommandProfilerTestCase, self).setUp()
+    FLAGS.profile_commands = True
+    self.addCleanup(command_profiler._ResetAtBenchmarkEnd, None, None)
+
+  def testGetCategory(self):
+    self.assertEqual('ssh', command_profiler.GetCategory(['ssh', '-A', 'h']))
+    self.assertEqual('gcloud', command_profiler.GetCategory(
+        ['/usr/bin/gcloud', 'compute', 'instances', 'create']))
+    self.assertEqual('gcloud', command_profiler.GetCategory(['gsutil', 'cp']))
+    self.assertEqual('az', command_profiler.GetCategory(['az.exe', 'vm']))
+    self.assertEqual('local', command_profiler.GetCategory(['ls', '-l']))
+
+  def testIssueCommandIsRecorded(self):
+    with command_profiler.VmContext('vm0'):
+      vm_util.IssueCommand(['false'], raise_on_failure=False)
+    record, = command_profiler.GetRecords()
+    self.assertEqual('false', record.command)
+    self.assertEqual('local', record.category)
+    self.assertEqual('vm0', record.vm)
+    self.assertEqual(1, record.retcode)
+    self.assertLessEqual(record.start, record.end)
+
+  def testPipeEngineIsRecorded(self):
+    FLAGS.issue_command_engine = vm_util.ISSUE_COMMAND_ENGINE_PIPE
+    vm_util.IssueCommand(['true'])
+    self.assertEqual(['true'],
+                     [r.command for r in command_profiler.GetRecords()])
+
+  def testDisabled(self):
+    FLAGS.profile_commands = False
+    vm_util.IssueCommand(['true'])
+    self.assertEqual([], command_profiler.GetRecords())
+
+  def testAttributeToVm(self):
+
+    class FakeVm(object):
+      name = 'vm1'
+
+      @command_profiler.AttributeToVm
+      def Run(self):
+        vm_util.IssueCommand(['true'])
+
+    FakeVm().Run()
+    vm_util.IssueCommand(['true'])
+    self.assertEqual(['vm1', None],
+                     [r.vm for r in command_profiler.GetRecords()])
+
+  def testMakeSamples(self):
+    records = [_Record(0, 0.05), _Record(0, 3), _Record(1, 2),
+               _Record(0, 700, category='gcloud', command='gcloud create')]
+    samples = command_profiler.MakeSamples(records, 'provision', top_n=2)
+    histograms = [s for s in samples if s.metric == 'Command Duration Histogram']
+    self.assertEqual(['gcloud', 'ssh'],
+                     [s.metadata['category'] for s in histograms])
+    ssh_histogram = json.loads(histograms[1].metadata['histogram'])
+    self.assertEqual(1, ssh_histogram['<=0.1s'])
+    self.assertEqual(1, ssh_histogram['<=1s'])
+    self.assertEqual(1, ssh_histogram['<=5s'])
+    self.assertEqual(3, histograms[1].value)
+    self.assertEqual(1, json.loads(histograms[0].metadata['histogram'])['>600s'])
+    slowest = [s for s in samples if s.metric == 'Slowest Command']
+    self.assertEqual([700, 3], [s.value for s in slowest])
+    self.assertEqual('gcloud create', slowest[0].metadata['command'])
+    self.assertEqual([1, 2], [s.metadata['rank'] for s in slowest])
+
+  def testToChromeTrace(self):
+    trace = command_profiler.ToChromeTrace([
+        _Record(1, 2), _Record(1.5, 3, vm=None, thread='MainThread')])
+    events = trace['traceEvents']
+    complete = [e for e in events if e['ph'] == 'X']
+    self.assertEqual([1000000, 1500000], [e['ts'] for e in complete])
+    self.assertEqual([1000000, 1500000], [e['dur'] for e in complete])
+    names = {e['args']['name'] for e in events if e['ph'] == 'M'}
+    self.assertEqual({'vm0', 'pkb', 'Thread-1', 'MainThread'}, names)
+    self.assertNotEqual(complete[0]['pid'], complete[1]['pid'])
+
+  def testProfilePhase(self):
+    run_dir = self.create_tempdir().full_path
+    self.enter_context(mock.patch.object(temp_dir, 'GetRunDirPath',
+                                         return_value=run_dir))
+    spec = mock.Mock(sequence_number=1)
+    spec.name = 'bench'
+    collector = mock.Mock()
+    vm_util.IssueCommand(['true'])
+    with command_profiler.ProfilePhase('prepare', spec, collector):
+      vm_util.IssueCommand(['true'])
+    samples = collector.AddSamples.call_args[0][0]
+    self.assertEqual(['Command Duration Histogram', 'Slowest Command'],
+                     [s.metric for s in samples])
+    self.assertEqual(1, samples[0].value)
+    self.assertEqual('prepare', samples[0].metadata['phase'])
+    with open(os.path.join(run_dir, 'command_trace_bench_1.json')) as f:
+      trace = json.load(f)
+    self.assertEqual(2, len([e for e in trace['traceEvents']
+                             if e['ph'] == 'X']))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -111,6 +111,32 @@ class ConfigsTestCase(unittest.TestCase):
     config = configs.MergeConfigs(old_config, None)
     self.assertEqual(config, old_config)
 
+  def testMergeConfigsDoesNotModifyInputs(self):
+    old_config = yaml.safe_load(CONFIG_A)
+    new_config = yaml.safe_load(CONFIG_B)
+    configs.MergeConfigs(old_config, new_config)
+    self.assertEqual(yaml.safe_load(CONFIG_A), old_config)
+    self.assertEqual(yaml.safe_load(CONFIG_B), new_config)
+
+  def testLoadConfigReturnsCopy(self):
+    expected = configs.LoadConfig(REF_CONFIG, {}, CONFIG_NAME)
+    config = configs.LoadConfig(REF_CONFIG, {}, CONFIG_NAME)
+    config['vm_groups']['default']['vm_spec']['GCP']['machine_type'] = 'other'
+    config['vm_groups']['default']['vm_count'] = 5
+    self.assertEqual(expected, configs.LoadConfig(REF_CONFIG, {}, CONFIG_NAME))
+
+  def testLoadConfigParsesOnce(self):
+    config_text = VALID_CONFIG + '\n# testLoadConfigParsesOnce\n'
+    with mock.patch.object(yaml, 'safe_load', wraps=yaml.safe_load) as load:
+      configs.LoadConfig(config_text, {}, CONFIG_NAME)
+      configs.LoadConfig(config_text, {'flags': {'a': 1}}, CONFIG_NAME)
+    self.assertEqual(1, load.call_count)
+
+  def testLoadConfigKeepsAliases(self):
+    config = configs.LoadConfig(
+        'a:\n  x: &ref [1]\n  y: *ref\n', {}, CONFIG_NAME)
+    self.assertIs(config['x'], config['y'])
+
   def testLoadConfigWithExternalReference(self):
     self.assertIsInstance(
         configs.LoadMinimalConfig(REF_CONFIG, CONFIG_NAME), dict)
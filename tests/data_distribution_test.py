@@ -0,0 +1,147 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.data_distribution.
+
+Each fake VM is a local directory standing in for the VM's filesystem, so
+copies between peers are real file copies.
+"""
+
+import collections
+import os
+import shutil
+import threading
+import time
+import unittest
+
+from absl import flags
+import mock
+
+from perfkitbenchmarker import background_tasks
+from perfkitbenchmarker import data_distribution
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import vm_util
+from tests import pkb_common_test_case
+
+FLAGS = flags.FLAGS
+
+_MODULE = 'test_module'
+_FILENAME = 'data.tar'
+_INSTALL_PATH = '/opt/pkb'
+_CONTENTS = 'preprovisioned'
+
+
+class _LocalVm(object):
+  """A VM whose filesystem is a local directory."""
+
+  active_copies = collections.Counter()
+  max_active_copies = collections.Counter()
+  lock = threading.Lock()
+
+  def __init__(self, name, root):
+    self.name = name
+    self.root = root
+    self.downloads = 0
+
+  def LocalPath(self, remote_path):
+    return os.path.join(self.root, remote_path.lstrip('/'))
+
+  def RemoteCommand(self, command):
+    _, path = command.split(' -p ')
+    os.makedirs(self.LocalPath(path), exist_ok=True)
+
+  def MoveFile(self, target, source_path, remote_path, use_internal_ip):
+    del use_internal_ip  # unused
+    with self.lock:
+      self.active_copies[self.name] += 1
+      self.max_active_copies[self.name] = max(
+          self.max_active_copies[self.name], self.active_copies[self.name])
+    time.sleep(0.01)
+    shutil.copy(self.LocalPath(source_path), target.LocalPath(remote_path))
+    with self.lock:
+      self.active_copies[self.name] -= 1
+
+  def Download(self, contents=_CONTENTS):
+    self.downloads += 1
+    path = self.LocalPath(os.path.join(_INSTALL_PATH, _FILENAME))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+      f.write(contents)
+
+  def CheckPreprovisionedData(self, install_path, module_name, filename,
+                              expected_sha256):
+    with open(self.LocalPath(os.path.join(install_path, filename))) as f:
+      if f.read() != expected_sha256:
+        raise errors.Setup.BadPreprovisionedDataError('bad checksum')
+
+
+class DataDistributionTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(DataDistributionTestCase, self).setUp()
+    self.enter_context(mock.patch.object(
+        vm_util, 'ShouldRunOnInternalIpAddress', return_value=True))
+    self.addCleanup(data_distribution._ResetAtBenchmarkEnd, None, None)
+    self.addCleanup(data_distribution.GetSamples)
+    _LocalVm.active_copies.clear()
+    _LocalVm.max_active_copies.clear()
+    self.vms = [_LocalVm('vm%d' % i, self.create_tempdir().full_path)
+                for i in range(10)]
+
+  def _Install(self, vm, download=None):
+    data_distribution.Install(vm, _MODULE, _FILENAME, _INSTALL_PATH,
+                              _CONTENTS, download or vm.Download)
+
+  def testOneSeedServesAllVms(self):
+    FLAGS.preprovisioned_data_fanout = 2
+    background_tasks.RunThreaded(self._Install, self.vms)
+    self.assertEqual(1, sum(vm.downloads for vm in self.vms))
+    for vm in self.vms:
+      vm.CheckPreprovisionedData(_INSTALL_PATH, _MODULE, _FILENAME, _CONTENTS)
+    self.assertLessEqual(max(_LocalVm.max_active_copies.values()), 2)
+    samples = data_distribution.GetSamples()
+    self.assertEqual(10, len(samples))
+    self.assertEqual(
+        1, sum(s.metadata['source'] == data_distribution.SEED_SOURCE
+               for s in samples))
+
+  def testMultipleSeeds(self):
+    FLAGS.preprovisioned_data_seeds = 3
+    ready = threading.Barrier(3)
+
+    def _SlowDownload(vm):
+      ready.wait(timeout=5)
+      vm.Download()
+
+    background_tasks.RunThreaded(
+        lambda vm: self._Install(vm, lambda: _SlowDownload(vm)), self.vms[:3])
+    self.assertEqual(3, sum(vm.downloads for vm in self.vms))
+
+  def testBadCopyFallsBackToDownload(self):
+    self._Install(self.vms[0], lambda: self.vms[0].Download('corrupt'))
+    self._Install(self.vms[1])
+    self.assertEqual(1, self.vms[1].downloads)
+
+  def testFailedSeedIsReplaced(self):
+
+    def _FailingDownload():
+      raise errors.Setup.BadPreprovisionedDataError('download failed')
+
+    with self.assertRaises(errors.Setup.BadPreprovisionedDataError):
+      self._Install(self.vms[0], _FailingDownload)
+    self._Install(self.vms[1])
+    self.assertEqual(1, self.vms[1].downloads)
+
+
+if __name__ == '__main__':
+  unittest.main()
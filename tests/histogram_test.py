@@ -0,0 +1,108 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.histogram."""
+
+import unittest
+
+import numpy as np
+
+from perfkitbenchmarker import histogram
+from tests import pkb_common_test_case
+
+
+class HistogramTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def testItemsAreExact(self):
+    items = [(0.0, 2), (1e-30, 1), (0.123, 7), (1.0, 3), (1e6, 1)]
+    hist = histogram.Histogram.FromItems(items)
+    self.assertEqual(items, hist.GetItems())
+    self.assertEqual(14, hist.total_count)
+
+  def testPrecision(self):
+    values = np.random.RandomState(0).lognormal(5, 2, 100000)
+    hist = histogram.Histogram(precision_bits=7)
+    hist.Record(values)
+    percentiles = [1, 50, 90, 99, 99.9]
+    ranks = np.ceil(len(values) * np.array(percentiles) / 100).astype(int)
+    expected = np.sort(values)[ranks - 1]
+    np.testing.assert_allclose(expected, hist.GetPercentiles(percentiles),
+                               rtol=2.0 ** -7)
+
+  def testPercentiles(self):
+    hist = histogram.Histogram.FromItems({1: 5, 2: 10, 5: 5})
+    self.assertEqual([1, 1, 2, 2, 5, 5],
+                     hist.GetPercentiles([0, 20, 30, 74, 80, 100]).tolist())
+    with self.assertRaises(ValueError):
+      hist.GetPercentiles([101])
+    with self.assertRaises(ValueError):
+      histogram.Histogram().GetPercentiles([50])
+
+  def testGetStats(self):
+    stats = histogram.Histogram.FromItems({1: 5, 2: 10, 5: 5}).GetStats([50])
+    self.assertEqual(2, stats['p50'])
+    self.assertEqual(2.5, stats['average'])
+    self.assertAlmostEqual(1.539, stats['stddev'], places=3)
+
+  def testMerge(self):
+    low = histogram.Histogram.FromItems({1: 1, 2: 2})
+    high = histogram.Histogram.FromItems({2: 1, 1000: 3})
+    low.Merge(high)
+    self.assertEqual([(1.0, 1), (2.0, 3), (1000.0, 3)], low.GetItems())
+    high.Merge(histogram.Histogram.FromItems({0.5: 1}))
+    self.assertEqual([(0.5, 1), (2.0, 1), (1000.0, 3)], high.GetItems())
+    empty = histogram.Histogram()
+    empty.Merge(high)
+    self.assertEqual(high, empty)
+    with self.assertRaises(ValueError):
+      high.Merge(histogram.Histogram(precision_bits=4))
+
+  def testMergeEqualsRecordingAll(self):
+    values = np.random.RandomState(0).exponential(100, 10000)
+    merged = histogram.Histogram()
+    for client_values in np.split(values, 4):
+      client = histogram.Histogram()
+      client.Record(client_values)
+      merged.Merge(client)
+    recorded = histogram.Histogram()
+    recorded.Record(values)
+    self.assertEqual(recorded.total_count, merged.total_count)
+    np.testing.assert_allclose(recorded.GetPercentiles([50, 99]),
+                               merged.GetPercentiles([50, 99]))
+
+  def testInvalidValues(self):
+    hist = histogram.Histogram()
+    for values, counts in (([-1], None), ([np.nan], None), ([1], [-1]),
+                           ([1, 2], [1])):
+      with self.assertRaises(ValueError):
+        hist.Record(values, counts)
+
+  def testSerialization(self):
+    hist = histogram.Histogram.FromItems({0: 1, 0.5: 2, 3: 4, 1e9: 5})
+    self.assertEqual(hist, histogram.Histogram.FromBytes(hist.ToBytes()))
+    self.assertEqual(hist, histogram.Histogram.FromBase64(hist.ToBase64()))
+    self.assertEqual(
+        hist.ToBase64(), hist.GetMetadata()[histogram.METADATA_KEY])
+    empty = histogram.Histogram()
+    self.assertEqual(empty, histogram.Histogram.FromBytes(empty.ToBytes()))
+    with self.assertRaises(ValueError):
+      histogram.Histogram.FromBytes(b'x' * 32)
+
+  def testSerializationIsCompact(self):
+    hist = histogram.Histogram()
+    hist.Record(np.arange(10000) // 10)
+    self.assertLess(len(hist.ToBytes()), 20000)
+
+
+if __name__ == '__main__':
+  unittest.main()
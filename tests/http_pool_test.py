@@ -0,0 +1,325 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.http_pool and the publishers that use it."""
+
+import base64
+import gzip
+import http.server
+import json
+import logging
+import threading
+import time
+import unittest
+
+from absl import flags
+from absl.testing import flagsaver
+import mock
+
+from perfkitbenchmarker import http_pool
+from perfkitbenchmarker import publisher
+from tests import pkb_common_test_case
+
+FLAGS = flags.FLAGS
+
+
+class FakeServer(object):
+  """A local HTTP server standing in for Elasticsearch or InfluxDB.
+
+  Attributes:
+    requests: list of (method, path, headers, body) tuples. Bodies are
+      decompressed.
+    client_ports: set of the client ports of the connections requests came on.
+    responder: function that takes a request tuple and returns a (status,
+      body) tuple.
+    delay: number of seconds to wait before each response.
+  """
+
+  def __init__(self, responder):
+    self.requests = []
+    self.client_ports = set()
+    self.responder = responder
+    self.delay = 0
+    self._lock = threading.Lock()
+    fake_server = self
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def _Handle(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.headers.get('Content-Encoding') == 'gzip':
+          body = gzip.decompress(body)
+        request = (self.command, self.path, dict(self.headers), body)
+        with fake_server._lock:
+          fake_server.requests.append(request)
+          fake_server.client_ports.add(self.client_address[1])
+          status, data = fake_server.responder(request)
+        time.sleep(fake_server.delay)
+        data = data.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+          self.wfile.write(data)
+
+      do_GET = do_HEAD = do_POST = do_PUT = _Handle
+
+      def log_message(self, *args):
+        pass
+
+    self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self._server.daemon_threads = True
+    self.uri = 'http://127.0.0.1:%d' % self._server.server_address[1]
+    self._thread = threading.Thread(target=self._server.serve_forever)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def Stop(self):
+    self._server.shutdown()
+    self._server.server_close()
+
+
+class FakeElasticsearch(object):
+  """Indexes documents like Elasticsearch, rejecting some bulk items."""
+
+  def __init__(self, version='7.10.0', rejections=0):
+    self.version = version
+    self.rejections = rejections
+    self.documents = {}
+    self.index_created = False
+
+  def __call__(self, request):
+    method, path, _, body = request
+    if method == 'GET':
+      return 200, json.dumps({'version': {'number': self.version}})
+    if method == 'HEAD':
+      return (200 if self.index_created else 404), ''
+    if method == 'PUT':
+      self.index_created = True
+      return 200, '{}'
+    lines = body.decode('utf-8').splitlines()
+    items = []
+    for action, document in zip(lines[::2], lines[1::2]):
+      action = json.loads(action)['create']
+      if self.rejections:
+        self.rejections -= 1
+        status = 429
+      elif action['_id'] in self.documents:
+        status = 409
+      else:
+        self.documents[action['_id']] = (action, json.loads(document))
+        status = 201
+      items.append({'create': {'_id': action['_id'], 'status': status}})
+    return 200, json.dumps({
+        'errors': any(i['create']['status'] != 201 for i in items),
+        'items': items})
+
+
+def _Samples(num_samples):
+  return [{
+      'test': 'test', 'official': False, 'owner': 'owner', 'run_uri': 'abc',
+      'sample_uri': 'uri%d' % i, 'metric': 'latency', 'value': float(i),
+      'unit': 'ms', 'timestamp': 1600000000.5, 'metadata': {'a.b': i}
+  } for i in range(num_samples)]
+
+
+class HttpPoolTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(HttpPoolTestCase, self).setUp()
+    self.enter_context(mock.patch.object(http_pool, '_RETRY_DELAY', 0))
+    self.statuses = []
+    self.server = FakeServer(
+        lambda _: (self.statuses.pop(0) if self.statuses else 200, 'ok'))
+    self.addCleanup(self.server.Stop)
+    self.pool = http_pool.ConnectionPool(self.server.uri)
+    self.addCleanup(self.pool.Close)
+
+  def testConnectionsAreReused(self):
+    for _ in range(5):
+      self.assertEqual(b'ok', self.pool.Request('GET', '/').data)
+    self.assertEqual(1, len(self.server.client_ports))
+
+  def testUriWithoutScheme(self):
+    pool = http_pool.ConnectionPool(self.server.uri[len('http://'):] + '/db')
+    pool.Request('POST', '/write?db=x', b'data')
+    self.assertEqual(('POST', '/db/write?db=x'), self.server.requests[0][:2])
+
+  def testCredentialsInUri(self):
+    uri = self.server.uri.replace('://', '://us%40er:p%3Aw@') + '/es'
+    pool = http_pool.ConnectionPool(uri)
+    pool.Request('GET', '/', headers={'Accept': 'application/json'})
+    _, path, headers, _ = self.server.requests[0]
+    self.assertEqual('/es/', path)
+    self.assertEqual('Basic ' + base64.b64encode(b'us@er:p:w').decode(),
+                     headers['Authorization'])
+    self.assertEqual('application/json', headers['Accept'])
+    self.assertNotIn('p%3Aw', repr(pool))
+
+  def testRetriesThrottledRequests(self):
+    self.statuses = [429, 503]
+    self.assertEqual(200, self.pool.Request('POST', '/', b'data').status)
+    self.assertEqual(3, len(self.server.requests))
+
+  def testRetriesAreLimited(self):
+    FLAGS.publish_http_retries = 1
+    self.statuses = [503, 503, 200]
+    with self.assertRaises(http_pool.HttpError) as e:
+      self.pool.Request('GET', '/')
+    self.assertEqual(503, e.exception.status)
+    self.assertEqual(2, len(self.server.requests))
+
+  def testClientErrorIsNotRetried(self):
+    self.statuses = [400]
+    with self.assertRaises(http_pool.HttpError):
+      self.pool.Request('GET', '/')
+    self.assertEqual(1, len(self.server.requests))
+    self.statuses = [404]
+    self.assertEqual(
+        404, self.pool.Request('HEAD', '/', allowed_statuses=(404,)).status)
+
+  def testConnectionErrorIsRetried(self):
+    FLAGS.publish_http_retries = 1
+    pool = http_pool.ConnectionPool('127.0.0.1:1')
+    with self.assertRaises(http_pool.HttpError):
+      pool.Request('GET', '/')
+
+  def testChunk(self):
+    self.assertEqual([['aa', 'bb'], ['ccc'], ['dddd']],
+                     list(http_pool.Chunk(['aa', 'bb', 'ccc', 'dddd'], 6)))
+
+  def testMapUsesConcurrentConnections(self):
+    self.server.delay = 0.2
+    self.pool.Map(lambda chunk: self.pool.Request('POST', '/', chunk),
+                  [b'a', b'b', b'c'])
+    self.assertEqual(3, len(self.server.client_ports))
+    self.pool.Request('GET', '/')
+    self.assertEqual(3, len(self.server.client_ports))
+
+
+class ElasticsearchPublisherTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(ElasticsearchPublisherTestCase, self).setUp()
+    self.enter_context(mock.patch.object(http_pool, '_RETRY_DELAY', 0))
+
+  def _StartServer(self, elasticsearch):
+    server = FakeServer(elasticsearch)
+    self.addCleanup(server.Stop)
+    return publisher.ElasticsearchPublisher(server.uri, 'perfkit', 'result')
+
+  def testPublishInChunks(self):
+    FLAGS.publish_http_chunk_bytes = 4096
+    elasticsearch = FakeElasticsearch()
+    es_publisher = self._StartServer(elasticsearch)
+    es_publisher.PublishSamples(_Samples(100))
+    self.assertTrue(elasticsearch.index_created)
+    self.assertEqual(100, len(elasticsearch.documents))
+    action, document = elasticsearch.documents['uri7']
+    self.assertEqual({'_index': 'perfkit', '_id': 'uri7'}, action)
+    self.assertEqual({'a_b': 7}, document['metadata'])
+    self.assertEqual('2020-09-13 12:26:40.500000', document['timestamp'])
+
+  def testMappingTypeBeforeVersion7(self):
+    elasticsearch = FakeElasticsearch(version='6.8.0')
+    es_publisher = self._StartServer(elasticsearch)
+    es_publisher.PublishSamples(_Samples(1))
+    self.assertEqual('result', elasticsearch.documents['uri0'][0]['_type'])
+
+  def testRepublishedSamplesAreNotDuplicated(self):
+    elasticsearch = FakeElasticsearch()
+    es_publisher = self._StartServer(elasticsearch)
+    es_publisher.PublishSamples(_Samples(3))
+    es_publisher.PublishSamples(_Samples(5))
+    self.assertEqual(5, len(elasticsearch.documents))
+
+  def testRejectedSamplesAreRetried(self):
+    elasticsearch = FakeElasticsearch(rejections=2)
+    es_publisher = self._StartServer(elasticsearch)
+    es_publisher.PublishSamples(_Samples(5))
+    self.assertEqual(5, len(elasticsearch.documents))
+
+  def testFailedSampleRaises(self):
+    elasticsearch = FakeElasticsearch()
+    es_publisher = self._StartServer(lambda request: (
+        (200, json.dumps({'errors': True, 'items': [
+            {'create': {'status': 400, 'error': 'bad document'}}]}))
+        if request[1] == '/_bulk' else elasticsearch(request)))
+    with self.assertRaises(http_pool.HttpError):
+      es_publisher.PublishSamples(_Samples(1))
+
+
+class InfluxDBPublisherTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(InfluxDBPublisherTestCase, self).setUp()
+    self.server = FakeServer(lambda _: (204, ''))
+    self.addCleanup(self.server.Stop)
+    uri = self.server.uri[len('http://'):]
+    self.influx_publisher = publisher.InfluxDBPublisher(uri, 'perfkit')
+
+  def testPublishInGzipChunks(self):
+    FLAGS.publish_http_chunk_bytes = 4096
+    self.influx_publisher.PublishSamples(_Samples(100))
+    self.influx_publisher.PublishSamples(_Samples(1))
+    create, = [r for r in self.server.requests if r[1].startswith('/query')]
+    self.assertIn('CREATE', create[1])
+    writes = [r for r in self.server.requests if r[1] == '/write?db=perfkit']
+    self.assertGreater(len(writes), 2)
+    for _, _, headers, body in writes:
+      self.assertEqual('gzip', headers['Content-Encoding'])
+      self.assertLessEqual(len(body), 4096)
+    lines = [line for r in writes for line in r[3].decode('utf-8').split('\n')]
+    self.assertEqual(101, len(lines))
+    self.assertEqual(100, len(set(lines)))
+
+
+class ThroughputTestCase(pkb_common_test_case.PkbCommonTestCase):
+  """Measures publishing throughput against the local stand-in server."""
+
+  def _Measure(self, name, publish, num_samples):
+    start_time = time.time()
+    publish(_Samples(num_samples))
+    samples_per_second = num_samples / (time.time() - start_time)
+    logging.info('%s publisher throughput: %.0f samples/s', name,
+                 samples_per_second)
+    return samples_per_second
+
+  @flagsaver.flagsaver(publish_http_chunk_bytes=256 * 1024)
+  def testThroughput(self):
+    elasticsearch = FakeElasticsearch()
+    es_server = FakeServer(elasticsearch)
+    self.addCleanup(es_server.Stop)
+    es_publisher = publisher.ElasticsearchPublisher(es_server.uri, 'perfkit',
+                                                    'result')
+    self.assertGreater(
+        self._Measure('Elasticsearch', es_publisher.PublishSamples, 20000), 0)
+    self.assertEqual(20000, len(elasticsearch.documents))
+    # One bulk request per chunk, on at most --publish_http_connections
+    # connections.
+    self.assertLessEqual(len(es_server.client_ports),
+                         FLAGS.publish_http_connections)
+
+    influx_server = FakeServer(lambda _: (204, ''))
+    self.addCleanup(influx_server.Stop)
+    influx_publisher = publisher.InfluxDBPublisher(influx_server.uri, 'perfkit')
+    self.assertGreater(
+        self._Measure('InfluxDB', influx_publisher.PublishSamples, 20000), 0)
+    self.assertLessEqual(len(influx_server.client_ports),
+                         FLAGS.publish_http_connections)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,149 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.import_util."""
+
+import importlib
+import itertools
+import os
+import sys
+import unittest
+
+import mock
+
+from perfkitbenchmarker import import_util
+from tests import pkb_common_test_case
+
+_package_ids = itertools.count()
+
+_FIRST_MODULE = """
+from absl import flags
+
+flags.DEFINE_string('{package}_first_flag', None, 'A flag.')
+FLAGS = flags.FLAGS
+NAME = 'first'
+CONFIG = 'first config'
+
+
+def Value():
+  return FLAGS.{package}_second_flag
+"""
+
+_SECOND_MODULE = """
+from absl import flags
+
+flags.DEFINE_string('{package}_second_flag', 'second value', 'A flag.')
+NAME = 'second'
+CONFIG = 'second config'
+"""
+
+
+def _GetEntries(module):
+  return [(module.NAME, {'config': module.CONFIG})]
+
+
+class ModuleRegistryTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(ModuleRegistryTestCase, self).setUp()
+    root = self.create_tempdir().full_path
+    self.package = 'fake_registry_package_%d' % next(_package_ids)
+    self.path = os.path.join(root, self.package)
+    os.mkdir(self.path)
+    for filename, source in (('__init__.py', ''),
+                             ('first.py', _FIRST_MODULE),
+                             ('second.py', _SECOND_MODULE)):
+      self._WriteModule(filename, source)
+    self.enter_context(mock.patch.object(sys, 'path', [root] + sys.path))
+    self.enter_context(mock.patch.object(
+        import_util, '_INDEX_DIR', self.create_tempdir().full_path))
+    self.enter_context(mock.patch.object(import_util, '_registries', []))
+    importlib.invalidate_caches()
+
+  def _WriteModule(self, filename, source):
+    with open(os.path.join(self.path, filename), 'w') as module_file:
+      module_file.write(source.format(package=self.package))
+
+  def _Registry(self):
+    return import_util.ModuleRegistry([self.path], self.package, _GetEntries)
+
+  def _Unimport(self):
+    for name in list(sys.modules):
+      if name.startswith(self.package + '.'):
+        del sys.modules[name]
+
+  def _IsImported(self, module):
+    return '%s.%s' % (self.package, module) in sys.modules
+
+  def testLookupImportsOnlyTheModule(self):
+    registry = self._Registry()
+    self.assertEqual(['first', 'second'], list(registry))
+    self._Unimport()
+    self.assertIn('second', registry)
+    self.assertNotIn('third', registry)
+    self.assertFalse(self._IsImported('second'))
+    self.assertEqual('second config', registry['second'].CONFIG)
+    self.assertTrue(self._IsImported('second'))
+    self.assertFalse(self._IsImported('first'))
+    self.assertIsNone(registry.get('third'))
+
+  def testGetMetadataDoesNotImport(self):
+    list(self._Registry())
+    self._Unimport()
+    registry = self._Registry()
+    self.assertEqual({'config': 'first config'}, registry.GetMetadata('first'))
+    self.assertFalse(self._IsImported('first'))
+
+  def testIndexIsReused(self):
+    list(self._Registry())
+    with mock.patch.object(import_util, 'LoadModulesForPath') as load:
+      self.assertEqual(['first', 'second'], list(self._Registry()))
+    load.assert_not_called()
+
+  def testIndexIsRebuiltWhenSourcesChange(self):
+    list(self._Registry())
+    self._WriteModule('third.py', "NAME = 'third'\nCONFIG = ''\n")
+    importlib.invalidate_caches()
+    self.assertIn('third', self._Registry())
+
+  def testDuplicateNames(self):
+    self._WriteModule('third.py', "NAME = 'first'\nCONFIG = ''\n")
+    with self.assertRaises(ValueError):
+      list(self._Registry())
+
+  def testImportsModulesDefiningReadFlags(self):
+    list(self._Registry())
+    self._Unimport()
+    registry = self._Registry()
+    registry['first']
+    self.assertTrue(self._IsImported('second'))
+
+  def testImportFlagModules(self):
+    list(self._Registry())
+    self._Unimport()
+    self._Registry()
+    import_util.ImportFlagModules(['%s_second_flag' % self.package])
+    self.assertTrue(self._IsImported('second'))
+    self.assertFalse(self._IsImported('first'))
+
+  def testImportMatchingModules(self):
+    list(self._Registry())
+    self._Unimport()
+    self._Registry()
+    import_util.ImportMatchingModules('sec')
+    self.assertTrue(self._IsImported('second'))
+    self.assertFalse(self._IsImported('first'))
+
+
+if __name__ == '__main__':
+  unittest.main()
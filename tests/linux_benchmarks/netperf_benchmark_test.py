@@ -22,6 +22,7 @@ import mock
 
 from perfkitbenchmarker import benchmark_spec
 from perfkitbenchmarker import errors
+from perfkitbenchmarker import histogram
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.linux_benchmarks import netperf_benchmark
 
@@ -74,6 +75,17 @@ class NetperfBenchmarkTestCase(parameterized.TestCase, unittest.TestCase):
     self.assertEqual(stats['p100'], 5)
     self.assertLessEqual(abs(stats['stddev'] - 1.538), 0.001)
 
+  def testHistogramStatsCalculatorRankRule(self):
+    # The p-th percentile is the value at index int(N * p / 100), which for
+    # p25 is the first 2 rather than the last 1.
+    items = {1: 5, 2: 10, 5: 5}
+    stats = netperf_benchmark._HistogramStatsCalculator(items, [25, 75])
+    self.assertEqual({'p25': 2, 'p75': 5}, {
+        p: stats[p] for p in ('p25', 'p75')})
+    self.assertIsInstance(stats['p25'], int)
+    self.assertEqual(stats, netperf_benchmark._HistogramStatsCalculator(
+        histogram.Histogram.FromItems(items), [25, 75]))
+
   def testExternalAndInternal(self):
     self._ConfigureIpTypes()
     vm_spec = mock.MagicMock(spec=benchmark_spec.BenchmarkSpec)
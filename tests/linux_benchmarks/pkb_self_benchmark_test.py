@@ -0,0 +1,92 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for pkb_self_benchmark."""
+
+import unittest
+
+from absl import flags
+from absl.testing import flagsaver
+import mock
+
+from perfkitbenchmarker import vm_util
+from perfkitbenchmarker.linux_benchmarks import pkb_self_benchmark
+from tests import pkb_common_test_case
+
+FLAGS = flags.FLAGS
+
+
+class PkbSelfBenchmarkTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(PkbSelfBenchmarkTestCase, self).setUp()
+    self.enter_context(flagsaver.flagsaver(pkb_self_iterations=2))
+    self.enter_context(mock.patch.object(
+        vm_util, 'GetTempDir', return_value=self.create_tempdir().full_path))
+
+  def _Run(self, measurement):
+    FLAGS.pkb_self_measurements = [measurement]
+    return pkb_self_benchmark.Run(mock.MagicMock(uuid='uuid', vms=[]))
+
+  def testImport(self):
+    with mock.patch.object(pkb_self_benchmark, '_RunPython',
+                           side_effect=[('0.5\n', 1), ('0.7\n', 1)]):
+      result, = self._Run(pkb_self_benchmark.IMPORT)
+    self.assertEqual('PKB Import Time', result.metric)
+    self.assertAlmostEqual(0.6, result.value)
+    self.assertEqual(0.5, result.metadata['min'])
+    self.assertIn('python_version', result.metadata)
+
+  def testStartup(self):
+    # Two cold runs, one run to warm the index, then two warm runs.
+    with mock.patch.object(pkb_self_benchmark, '_RunPython',
+                           side_effect=[('', 3), ('', 5), ('', 4), ('', 1),
+                                        ('', 1)]) as run_python:
+      cold, warm = self._Run(pkb_self_benchmark.STARTUP)
+    self.assertEqual(('cold', 4), (cold.metadata['module_index'], cold.value))
+    self.assertEqual(('warm', 1), (warm.metadata['module_index'], warm.value))
+    cold_env = run_python.call_args_list[0][0][2]
+    self.assertNotEqual(cold_env['TMPDIR'],
+                        run_python.call_args_list[1][0][2]['TMPDIR'])
+
+  def testConfigLoading(self):
+    result, = self._Run(pkb_self_benchmark.CONFIG_LOADING)
+    self.assertEqual('Config Loading Time', result.metric)
+    self.assertGreater(result.metadata['num_configs'], 100)
+    self.assertTrue(result.metadata['slowest_config'])
+
+  def testBenchmarkSpecs(self):
+    FLAGS.pkb_self_flag_matrix_size = 3
+    benchmarks = FLAGS.benchmarks
+    total, per_spec = self._Run(pkb_self_benchmark.BENCHMARK_SPECS)
+    self.assertEqual(3, total.metadata['num_specs'])
+    self.assertAlmostEqual(total.value / 3, per_spec.value)
+    self.assertEqual(benchmarks, FLAGS.benchmarks)
+    self.assertIsNone(FLAGS.flag_matrix)
+
+  def testPublishing(self):
+    FLAGS.pkb_self_num_samples = 25
+    with mock.patch.object(pkb_self_benchmark, '_PUBLISH_BATCH_SIZE', 10):
+      result, = self._Run(pkb_self_benchmark.PUBLISHING)
+    self.assertEqual('Sample Publishing Throughput', result.metric)
+    self.assertEqual(25, result.metadata['num_samples'])
+
+  def testIssueCommand(self):
+    FLAGS.pkb_self_num_commands = 2
+    result, = self._Run(pkb_self_benchmark.ISSUE_COMMAND)
+    self.assertEqual('IssueCommand Overhead', result.metric)
+    self.assertEqual(2, result.metadata['num_commands'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -7,6 +7,7 @@ from __future__ import print_function
 import json
 import unittest
 from absl import flags
+from perfkitbenchmarker import histogram
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import test_util
 from perfkitbenchmarker.linux_packages import memtier
@@ -51,7 +52,9 @@ class MemtierTestCase(unittest.TestCase, test_util.SamplesTestMixin):
     get_metadata = {
         'histogram': json.dumps([
             {'microsec': 0.0, 'count': 4500},
-            {'microsec': 2000.0, 'count': 4500}])
+            {'microsec': 2000.0, 'count': 4500}]),
+        histogram.METADATA_KEY: histogram.Histogram.FromItems(
+            [(0.0, 4500), (2000.0, 4500)]).ToBase64(),
     }
     get_metadata.update(METADATA)
     set_metadata = {
@@ -65,7 +68,11 @@ class MemtierTestCase(unittest.TestCase, test_util.SamplesTestMixin):
             {'microsec': 6000.0, 'count': 200},
             {'microsec': 7000.0, 'count': 50},
             {'microsec': 8000.0, 'count': 40},
-            {'microsec': 9000.0, 'count': 10}])
+            {'microsec': 9000.0, 'count': 10}]),
+        histogram.METADATA_KEY: histogram.Histogram.FromItems(
+            [(0.0, 50), (1000.0, 50), (2000.0, 50), (3000.0, 150),
+             (4000.0, 200), (5000.0, 200), (6000.0, 200), (7000.0, 50),
+             (8000.0, 40), (9000.0, 10)]).ToBase64(),
     }
     set_metadata.update(METADATA)
     expected_result = [
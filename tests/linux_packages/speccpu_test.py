@@ -25,6 +25,8 @@ from perfkitbenchmarker import test_util
 # from perfkitbenchmarker.linux_benchmarks import speccpu2017_benchmark  # noqa
 from perfkitbenchmarker.linux_packages import build_tools
 from perfkitbenchmarker.linux_packages import speccpu
+# Defines the spec17 flags that speccpu reads.
+from perfkitbenchmarker.linux_packages import speccpu2017  # noqa
 
 FLAGS = flags.FLAGS
 FLAGS.mark_as_parsed()
@@ -21,11 +21,16 @@ import copy
 import os
 import unittest
 
+from absl import flags
+import mock
 from perfkitbenchmarker import errors
 from perfkitbenchmarker.linux_packages import ycsb
+from tests import pkb_common_test_case
 import six
 from six.moves import range
 
+FLAGS = flags.FLAGS
+
 
 def open_data_file(filename):
   path = os.path.join(os.path.dirname(__file__), '..', 'data', filename)
@@ -123,31 +128,49 @@ class BadResultParserTestCase(unittest.TestCase):
                       ycsb.ParseResults, contents, 'histogram')
 
 
-class WeightedQuantileTestCase(unittest.TestCase):
+class PercentilesFromHistogramTestCase(unittest.TestCase):
+
+  def _GetPercentile(self, x, weights, percentile):
+    return ycsb._PercentilesFromHistogram(list(zip(x, weights)),
+                                          [percentile])['p%s' % percentile]
 
   def testEvenlyWeightedSamples(self):
     x = list(range(1, 101))  # 1-100
     weights = [1 for _ in x]
-    self.assertEqual(50, ycsb._WeightedQuantile(x, weights, 0.50))
-    self.assertEqual(75, ycsb._WeightedQuantile(x, weights, 0.75))
-    self.assertEqual(90, ycsb._WeightedQuantile(x, weights, 0.90))
-    self.assertEqual(95, ycsb._WeightedQuantile(x, weights, 0.95))
-    self.assertEqual(99, ycsb._WeightedQuantile(x, weights, 0.99))
-    self.assertEqual(100, ycsb._WeightedQuantile(x, weights, 1))
+    self.assertEqual(50, self._GetPercentile(x, weights, 50))
+    self.assertEqual(75, self._GetPercentile(x, weights, 75))
+    self.assertEqual(90, self._GetPercentile(x, weights, 90))
+    self.assertEqual(95, self._GetPercentile(x, weights, 95))
+    self.assertEqual(99, self._GetPercentile(x, weights, 99))
+    self.assertEqual(100, self._GetPercentile(x, weights, 100))
 
   def testLowWeight(self):
     x = [1, 4]
     weights = [99, 1]
     for i in range(100):
-      self.assertEqual(1, ycsb._WeightedQuantile(x, weights, i / 100.0))
-    self.assertEqual(4, ycsb._WeightedQuantile(x, weights, 0.995))
+      self.assertEqual(1, self._GetPercentile(x, weights, i))
+    self.assertEqual(4, self._GetPercentile(x, weights, 99.5))
 
   def testMidWeight(self):
     x = [0, 1.2, 4]
     weights = [1, 98, 1]
     for i in range(2, 99):
-      self.assertAlmostEqual(1.2, ycsb._WeightedQuantile(x, weights, i / 100.0))
-    self.assertEqual(4, ycsb._WeightedQuantile(x, weights, 0.995))
+      self.assertAlmostEqual(1.2, self._GetPercentile(x, weights, i))
+    self.assertEqual(4, self._GetPercentile(x, weights, 99.5))
+
+  def testDistinctHighLatencies(self):
+    # A histogram_lib.Histogram bucket holds both latencies.
+    self.assertEqual(
+        {'p50': 512, 'p100': 513},
+        ycsb._PercentilesFromHistogram([(512, 1), (513, 1)], [50, 100]))
+    x = list(range(1000, 1100))
+    weights = [1 for _ in x]
+    self.assertEqual(1049, self._GetPercentile(x, weights, 50))
+    self.assertEqual(1098, self._GetPercentile(x, weights, 99))
+
+  def testInvalidPercentile(self):
+    with self.assertRaises(ValueError):
+      ycsb._PercentilesFromHistogram([(1, 1)], [101])
 
 
 class ParseWorkloadTestCase(unittest.TestCase):
@@ -244,6 +267,37 @@ class CombineResultsTestCase(unittest.TestCase):
     self.assertEqual(r, combined)
 
 
+class RunStaircaseLoadsTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def testResultsAreParsedWhileNextStepRuns(self):
+    FLAGS.ycsb_threads_per_client = ['1', '2']
+    FLAGS.ycsb_measurement_type = ycsb.HISTOGRAM
+    events = []
+    contents = open_data_file('ycsb-test-run.dat')
+
+    def _Run(unused_vm, threads, **unused_kwargs):
+      events.append(('run', threads))
+      job = mock.Mock()
+
+      def _Result():
+        events.append(('result', threads))
+        return ycsb.ParseResults(contents, ycsb.HISTOGRAM)
+
+      job.Result.side_effect = _Result
+      return job
+
+    executor = ycsb.YCSBExecutor('test')
+    workload_file = os.path.join(
+        os.path.dirname(__file__), '..', 'data', 'ycsb_workloada')
+    with mock.patch.object(executor, '_Run', side_effect=_Run):
+      samples = executor.RunStaircaseLoads([mock.Mock()], [workload_file])
+    self.assertEqual(
+        [('run', 1), ('run', 2), ('result', 1), ('result', 2)], events)
+    self.assertEqual(
+        [1, 2], [s.metadata['threads_per_client_vm'] for s in samples
+                 if s.metric == 'overall Throughput'])
+
+
 class HdrLogsParserTestCase(unittest.TestCase):
 
   def testParseHdrLogFile(self):
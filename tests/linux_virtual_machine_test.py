@@ -20,11 +20,16 @@ from absl import flags
 from absl.testing import parameterized
 import mock
 
+from perfkitbenchmarker import errors
 from perfkitbenchmarker import linux_virtual_machine
 from perfkitbenchmarker import os_types
 from perfkitbenchmarker import pkb
+from perfkitbenchmarker import robust_command_stream
 from perfkitbenchmarker import sample
+from perfkitbenchmarker import ssh_session_pool
+from perfkitbenchmarker import ssh_tar_copy
 from perfkitbenchmarker import test_util
+from perfkitbenchmarker import vm_util
 from tests import pkb_common_test_case
 
 FLAGS = flags.FLAGS
@@ -43,24 +48,25 @@ _CENTOS7_KERNEL_COMMAND_LINE = (
 
 class TestSetFiles(pkb_common_test_case.PkbCommonTestCase):
 
-  def runTest(self, set_files, calls):
+  def runTest(self, set_files, commands):
     """Run a SetFiles test.
 
     Args:
       set_files: the value of FLAGS.set_files
-      calls: a list of mock.call() objects giving the expected calls to
-        vm.RemoteCommand() for the test.
+      commands: a list of the commands expected to be passed to
+        vm.RemoteCommandBatch() for the test.
     """
     FLAGS['set_files'].parse(set_files)
 
     vm = CreateTestLinuxVm()
 
-    with mock.patch.object(vm, 'RemoteCommand') as remote_command:
+    with mock.patch.object(vm, 'RemoteCommandBatch') as remote_command_batch:
       vm.SetFiles()
 
+    remote_command_batch.assert_called_once_with(mock.ANY)
     self.assertCountEqual(  # use assertCountEqual because order is undefined
-        remote_command.call_args_list,
-        calls)
+        remote_command_batch.call_args[0][0],
+        commands)
 
   def testNoFiles(self):
     self.runTest([],
@@ -68,42 +74,189 @@ class TestSetFiles(pkb_common_test_case.PkbCommonTestCase):
 
   def testOneFile(self):
     self.runTest(['/sys/kernel/mm/transparent_hugepage/enabled=always'],
-                 [mock.call('echo "always" | sudo tee '
-                            '/sys/kernel/mm/transparent_hugepage/enabled')])
+                 ['echo "always" | sudo tee '
+                  '/sys/kernel/mm/transparent_hugepage/enabled'])
 
   def testMultipleFiles(self):
     self.runTest(['/sys/kernel/mm/transparent_hugepage/enabled=always',
                   '/sys/kernel/mm/transparent_hugepage/defrag=never'],
-                 [mock.call('echo "always" | sudo tee '
-                            '/sys/kernel/mm/transparent_hugepage/enabled'),
-                  mock.call('echo "never" | sudo tee '
-                            '/sys/kernel/mm/transparent_hugepage/defrag')])
+                 ['echo "always" | sudo tee '
+                  '/sys/kernel/mm/transparent_hugepage/enabled',
+                  'echo "never" | sudo tee '
+                  '/sys/kernel/mm/transparent_hugepage/defrag'])
 
 
 class TestSysctl(pkb_common_test_case.PkbCommonTestCase):
 
-  def runTest(self, sysctl, calls):
+  def runTest(self, sysctl, commands):
     FLAGS['sysctl'].parse(sysctl)
     vm = CreateTestLinuxVm()
 
-    with mock.patch.object(vm, 'RemoteCommand') as remote_command:
+    with mock.patch.object(vm, 'RemoteCommandBatch') as remote_command_batch:
       vm.DoSysctls()
 
-    self.assertEqual(sorted(remote_command.call_args_list), sorted(calls))
+    if commands:
+      remote_command_batch.assert_called_once_with(mock.ANY)
+      self.assertEqual(sorted(remote_command_batch.call_args[0][0]),
+                       sorted(commands))
+    else:
+      remote_command_batch.assert_not_called()
 
   def testSysctl(self):
     self.runTest(
         ['vm.dirty_background_ratio=10', 'vm.dirty_ratio=25'],
-        [mock.call('sudo bash -c \'echo "vm.dirty_background_ratio=10" >> '
-                   '/etc/sysctl.conf\''),
-         mock.call('sudo bash -c \'echo "vm.dirty_ratio=25" >> '
-                   '/etc/sysctl.conf\'')])
+        ['sudo bash -c \'echo "vm.dirty_background_ratio=10" >> '
+         '/etc/sysctl.conf\'',
+         'sudo bash -c \'echo "vm.dirty_ratio=25" >> '
+         '/etc/sysctl.conf\''])
 
   def testNoSysctl(self):
     self.runTest([],
                  [])
 
 
+class RemoteCommandBatchTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(RemoteCommandBatchTestCase, self).setUp()
+    self.vm = CreateTestLinuxVm()
+    # Runs the batch script with a local shell in place of ssh.
+    self.enter_context(mock.patch.object(
+        self.vm, 'RemoteCommand', side_effect=self._RunLocally))
+
+  def _RunLocally(self, command, **kwargs):
+    del kwargs  # unused
+    return vm_util.IssueCommand(['/bin/sh', '-c', command],
+                                raise_on_failure=False)[:2]
+
+  def testReturnsResultPerCommand(self):
+    self.assertEqual(
+        [('a\n', 'b\n', 0), ('c', '', 0)],
+        self.vm.RemoteCommandBatch(['echo a; echo b >&2', 'printf c']))
+    self.assertEqual(1, self.vm.RemoteCommand.call_count)
+
+  def testStopOnError(self):
+    with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+      self.vm.RemoteCommandBatch(['true', 'exit 3', 'echo skipped'])
+    self.assertEqual(
+        [('', '', 0), ('', '', 3)],
+        self.vm.RemoteCommandBatch(['true', 'exit 3', 'echo skipped'],
+                                   ignore_failure=True))
+
+  def testContinueOnError(self):
+    self.assertEqual(
+        [('', '', 3), ('ran\n', '', 0)],
+        self.vm.RemoteCommandBatch(['exit 3', 'echo ran'], stop_on_error=False,
+                                   ignore_failure=True))
+
+  def testCommandsRunInSeparateShells(self):
+    self.assertEqual(
+        [('', '', 0), ('\n', '', 0)],
+        self.vm.RemoteCommandBatch(['FOO=bar', 'echo "$FOO"']))
+
+  def testIncompleteBatchRaises(self):
+    self.vm.RemoteCommand.side_effect = None
+    self.vm.RemoteCommand.return_value = ('', 'ssh: connection refused')
+    with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+      self.vm.RemoteCommandBatch(['true'], ignore_failure=True)
+
+
+class TarCopyTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(TarCopyTestCase, self).setUp()
+    self.vm = CreateTestLinuxVm()
+    self.enter_context(mock.patch.object(self.vm, 'GetConnectionIp',
+                                         return_value='1.2.3.4'))
+    self.push = self.enter_context(mock.patch.object(ssh_tar_copy, 'Push'))
+    self.pull = self.enter_context(mock.patch.object(ssh_tar_copy, 'Pull'))
+
+  def testPushFilesCopiesEachFileByDefault(self):
+    with mock.patch.object(self.vm, 'RemoteCopy') as remote_copy:
+      self.vm.PushFiles([('a', '/tmp/a'), ('b', '/tmp/b')])
+    self.assertEqual([mock.call('a', '/tmp/a'), mock.call('b', '/tmp/b')],
+                     remote_copy.call_args_list)
+    self.push.assert_not_called()
+
+  def testPushFilesUsesOneTarCopy(self):
+    FLAGS.ssh_tar_copy = True
+    self.vm.PushFiles([('a', '/tmp/a'), ('b', '/tmp/b')])
+    self.push.assert_called_once_with(
+        mock.ANY, [('a', '/tmp/a'), ('b', '/tmp/b')],
+        compression=ssh_tar_copy.COMPRESSION_NONE)
+    self.assertEqual('ssh', self.push.call_args[0][0][0])
+
+  def testRemoteHostCopyUsesScpByDefault(self):
+    with mock.patch.object(vm_util, 'IssueCommand',
+                           return_value=('', '', 0)) as issue_command:
+      self.vm.RemoteHostCopy('a', '/tmp/a')
+    self.assertEqual('scp', issue_command.call_args[0][0][0])
+    self.push.assert_not_called()
+
+  def testRemoteHostCopyWithTarCopy(self):
+    FLAGS.ssh_tar_copy = True
+    FLAGS.ssh_tar_copy_compression = ssh_tar_copy.COMPRESSION_GZIP
+    self.vm.RemoteHostCopy('a', '/tmp/a', copy_to=False)
+    self.pull.assert_called_once_with(
+        mock.ANY, [('a', '/tmp/a')], compression=ssh_tar_copy.COMPRESSION_GZIP)
+
+
+class RobustRemoteCommandStreamingTestCase(
+    pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(RobustRemoteCommandStreamingTestCase, self).setUp()
+    FLAGS.robust_remote_command_streaming = True
+    self.vm = CreateTestLinuxVm()
+    self.vm._has_remote_command_script = True
+    self.enter_context(mock.patch.object(self.vm, 'GetConnectionIp',
+                                         return_value='1.2.3.4'))
+    self.remote_command = self.enter_context(mock.patch.object(
+        self.vm, 'RemoteCommand', return_value=('', '')))
+    self.follow = self.enter_context(mock.patch.object(
+        robust_command_stream, 'Follow'))
+
+  def testReturnsStreamedOutput(self):
+    self.follow.return_value = ('out', 'err', 0)
+    self.assertEqual(('out', 'err'), self.vm.RobustRemoteCommand('echo out'))
+    # Started the command and deleted its files, without polling.
+    self.assertEqual(2, self.remote_command.call_count)
+    self.assertIn('rm -f', self.remote_command.call_args[0][0])
+    build_cmd = self.follow.call_args[0][0]
+    cmd = build_cmd(10, 20)
+    self.assertEqual('ssh', cmd[0])
+    self.assertIn('--follow --stdout_offset 10 --stderr_offset 20', cmd[-1])
+
+  def testRaisesOnFailure(self):
+    self.follow.return_value = ('', 'boom', 3)
+    with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+      self.vm.RobustRemoteCommand('false')
+
+  def testIgnoreFailure(self):
+    self.follow.return_value = ('', 'boom', 3)
+    self.assertEqual(('', 'boom'),
+                     self.vm.RobustRemoteCommand('false', ignore_failure=True))
+
+
+class GetDestinationSha256sumsTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def testGetDestinationSha256sums(self):
+    vm = CreateTestLinuxVm()
+    remote_dir = self.create_tempdir()
+    remote_dir.create_file('in_dir', content='a')
+    remote_file = remote_dir.create_file('renamed', content='b').full_path
+    with mock.patch.object(vm, 'RemoteCommand', side_effect=lambda cmd: (
+        vm_util.IssueCommand(['/bin/sh', '-c', cmd])[:2])):
+      digests = vm.GetDestinationSha256sums(
+          [('/local/in_dir', remote_dir.full_path),
+           ('/local/b', remote_file),
+           ('/local/missing', remote_dir.full_path)])
+    self.assertEqual(
+        ['ca978112ca1bbdcafac231b39a23dc4da786eff8147c4e72b9807785afee48bb',
+         '3e23e8160039594a33894f6564e1b1348bbd7a0088d42c4acb73eeaed59c009d',
+         None], digests)
+
+
 class TestDiskOperations(pkb_common_test_case.PkbCommonTestCase):
 
   def setUp(self):
@@ -485,5 +638,41 @@ class LinuxVirtualMachineTestCase(pkb_common_test_case.PkbCommonTestCase):
     self.assertEqual(expected_asdict, cpu_vuln.asdict)
 
 
+class SshSessionPoolTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(SshSessionPoolTestCase, self).setUp()
+    FLAGS.ssh_session_pool = True
+    self.vm = CreateTestLinuxVm()
+    self.vm.ip_address = '1.2.3.4'
+    self.enter_context(mock.patch.object(vm_util, 'GetPrivateKeyPath',
+                                         return_value='key'))
+    self.issue_command = self.enter_context(
+        mock.patch.object(vm_util, 'IssueCommand'))
+    self.run_command = self.enter_context(
+        mock.patch.object(ssh_session_pool, 'RunCommand'))
+
+  def testUsesSessionPool(self):
+    self.run_command.return_value = ('out', '', 0)
+    self.assertEqual(('out', '', 0),
+                     self.vm.RemoteHostCommandWithReturnCode('echo out'))
+    self.issue_command.assert_not_called()
+    session_cmd, command = self.run_command.call_args[0]
+    self.assertEqual('echo out', command)
+    self.assertEqual(['-T', ssh_session_pool.REMOTE_SHELL], session_cmd[-2:])
+
+  def testRetriesOnSshFailure(self):
+    self.run_command.side_effect = [('', '', 255), ('out', '', 0)]
+    self.assertEqual(('out', '', 0),
+                     self.vm.RemoteHostCommandWithReturnCode('echo out'))
+    self.assertEqual(2, self.run_command.call_count)
+
+  def testLoginShellFallsBackToIssueCommand(self):
+    self.issue_command.return_value = ('out', '', 0)
+    self.vm.RemoteHostCommandWithReturnCode('echo out', login_shell=True)
+    self.run_command.assert_not_called()
+    self.issue_command.assert_called_once()
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,96 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.parse_executor."""
+
+import os
+import unittest
+
+from absl import flags
+import numpy as np
+from perfkitbenchmarker import parse_executor
+from tests import pkb_common_test_case
+
+FLAGS = flags.FLAGS
+
+
+@parse_executor.Parser
+def _ParseArrays(size):
+  return {'pid': os.getpid(),
+          'large': np.arange(size, dtype=float),
+          'small': [np.ones(2), 'label']}
+
+
+@parse_executor.Parser
+def _ParseFails(message):
+  raise ValueError(message)
+
+
+def _NotRegistered():
+  return None
+
+
+class InlineTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def testRunsInCallingProcess(self):
+    result = parse_executor.Parse(_ParseArrays, 10)
+    self.assertEqual(os.getpid(), result['pid'])
+    np.testing.assert_array_equal(np.arange(10), result['large'])
+
+  def testUnregisteredParserRunsInline(self):
+    self.assertIsNone(parse_executor.Parse(_NotRegistered))
+
+  def testException(self):
+    job = parse_executor.Submit(_ParseFails, 'bad output')
+    self.assertTrue(job.Done())
+    with self.assertRaisesRegex(ValueError, 'bad output'):
+      job.Result()
+
+
+@unittest.skipIf(parse_executor.shared_memory is None,
+                 'Requires multiprocessing.shared_memory.')
+class PoolTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(PoolTestCase, self).setUp()
+    FLAGS.parse_processes = 2
+    self.addCleanup(parse_executor.Shutdown)
+
+  def testArraysReturnedThroughSharedMemory(self):
+    size = parse_executor._MIN_SHARED_BYTES
+    job = parse_executor.Submit(_ParseArrays, size)
+    result = job.Result()
+    self.assertNotEqual(os.getpid(), result['pid'])
+    np.testing.assert_array_equal(np.arange(size), result['large'])
+    np.testing.assert_array_equal(np.ones(2), result['small'][0])
+    self.assertEqual('label', result['small'][1])
+    # Results may be retrieved again once their shared memory has been freed.
+    self.assertIs(result, job.Result())
+
+  def testUnretrievedResultsFreedOnShutdown(self):
+    job = parse_executor.Submit(_ParseArrays, parse_executor._MIN_SHARED_BYTES)
+    parse_executor.Shutdown()
+    self.assertTrue(job.Done())
+    self.assertEqual(set(), parse_executor._unretrieved_jobs)
+
+  def testException(self):
+    with self.assertRaisesRegex(ValueError, 'bad output'):
+      parse_executor.Parse(_ParseFails, 'bad output')
+
+  def testUnregisteredParser(self):
+    with self.assertRaisesRegex(ValueError, 'not a registered parser'):
+      parse_executor.Submit(_NotRegistered)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -23,6 +23,7 @@ from absl.testing import parameterized
 
 import mock
 
+from perfkitbenchmarker import import_util
 from perfkitbenchmarker import linux_virtual_machine
 from perfkitbenchmarker import pkb  # pylint:disable=unused-import
 from perfkitbenchmarker import virtual_machine
@@ -33,6 +34,11 @@ from perfkitbenchmarker.providers.gcp import util
 FLAGS = flags.FLAGS
 FLAGS.mark_as_parsed()
 
+# Benchmark and package modules are imported when they are first used, and
+# flagsaver removes the flags a module defines if that happens during a test.
+# Import them all up front so that their flags stay defined.
+import_util.ImportAllModules()
+
 
 class TestVmSpec(virtual_machine.BaseVmSpec):
   CLOUD = 'test_vm_spec_cloud'
@@ -14,18 +14,42 @@
 
 """Tests for pkb.py."""
 
+import collections
+import threading
+import time
+import types
 import unittest
 from absl import flags
+from absl.testing import flagsaver
 import mock
+from perfkitbenchmarker import context
 from perfkitbenchmarker import linux_virtual_machine
 from perfkitbenchmarker import pkb
+from perfkitbenchmarker import reaper
 from perfkitbenchmarker import stages
+from perfkitbenchmarker import static_virtual_machine
 from tests import pkb_common_test_case
 
 FLAGS = flags.FLAGS
 FLAGS.mark_as_parsed()
 
 
+def _FakeSpec(name, vm_count=1):
+  return types.SimpleNamespace(name=name, config=types.SimpleNamespace(
+      vm_groups={'default': types.SimpleNamespace(vm_count=vm_count)}))
+
+
+def _FakeBenchmarkTask(spec, pipeline_turn):
+  """Sleeps through the phases of a benchmark, recording when it ran."""
+  time.sleep(0.2)
+  pipeline_turn.WaitToRun()
+  run = (time.time(), time.time() + 0.2)
+  time.sleep(0.2)
+  pipeline_turn.FinishRun()
+  time.sleep(0.2)
+  return spec, [{'run': run}]
+
+
 class TestCreateFailedRunSampleFlag(unittest.TestCase):
 
   def PatchPkbFunction(self, function_name):
@@ -106,6 +130,75 @@ class TestCreateFailedRunSampleFlag(unittest.TestCase):
     self.make_failed_run_sample_mock.assert_not_called()
 
 
+class TestPipeline(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(TestPipeline, self).setUp()
+    self.enter_context(mock.patch.object(pkb, '_PIPELINE_POLL_SECONDS', 0.01))
+    self.teardown_event = threading.Event()
+    self.enter_context(
+        mock.patch.object(pkb, '_TEARDOWN_EVENT', self.teardown_event))
+
+  def _Turn(self, vm_count=1, max_vms=None, previous_ran=None, earlier=()):
+    return pkb._PipelineTurn(vm_count, max_vms, threading.Event(),
+                             threading.Event(), previous_ran, list(earlier))
+
+  def testWaitToRun(self):
+    previous_ran = threading.Event()
+    turn = self._Turn(previous_ran=previous_ran)
+    threading.Timer(0.1, previous_ran.set).start()
+    self.assertTrue(turn.WaitToRun())
+    self.assertGreater(turn.waited_seconds, 0)
+
+  def testWaitToRunStopped(self):
+    self.teardown_event.set()
+    self.assertFalse(self._Turn(previous_ran=threading.Event()).WaitToRun())
+
+  def testWaitToProvisionWithinMaxVms(self):
+    released = threading.Event()
+    turn = self._Turn(vm_count=2, max_vms=3, earlier=[(1, released)])
+    self.assertTrue(turn.WaitToProvision())
+    self.assertEqual(0, turn.waited_seconds)
+
+  def testWaitToProvisionForReleasedVms(self):
+    released = threading.Event()
+    turn = self._Turn(vm_count=2, max_vms=3, earlier=[(2, released)])
+    threading.Timer(0.1, released.set).start()
+    self.assertTrue(turn.WaitToProvision())
+    self.assertTrue(released.is_set())
+
+  def testRunBenchmarkStoppedBeforeRun(self):
+    self.enter_context(mock.patch.object(pkb, 'DoProvisionPhase'))
+    prepare = self.enter_context(mock.patch.object(pkb, 'DoPreparePhase'))
+    self.enter_context(mock.patch.object(pkb, 'DoTeardownPhase'))
+    FLAGS.run_stage = [stages.PROVISION, stages.PREPARE]
+    turn = mock.Mock()
+    turn.WaitToRun.return_value = False
+    with self.assertRaises(pkb.errors.Benchmarks.RunError):
+      pkb.RunBenchmark(mock.MagicMock(), mock.Mock(), turn)
+    prepare.assert_not_called()
+    turn.FinishRun.assert_called_with()
+
+  def testRunBenchmarkTasksPipelined(self):
+    # Tasks are pickled along with the benchmark spec of the thread.
+    context.SetThreadBenchmarkSpec(None)
+    collector = mock.Mock(samples=[])
+    self.enter_context(
+        mock.patch.object(pkb, 'SampleCollector', return_value=collector))
+    tasks = [(_FakeBenchmarkTask, (_FakeSpec('spec%d' % i),), {})
+             for i in range(3)]
+    results = pkb.RunBenchmarkTasksPipelined(tasks, 1)
+    self.assertEqual(['spec0', 'spec1', 'spec2'],
+                     [spec.name for spec, _ in results])
+    runs = [samples[0]['run'] for _, samples in results]
+    for (_, previous_end), (start, _) in zip(runs, runs[1:]):
+      self.assertGreaterEqual(start, previous_end)
+    (saved,), _, _ = collector.AddSamples.call_args[0]
+    self.assertEqual('Pipeline Time Saved', saved.metric)
+    self.assertGreater(saved.value, 0)
+    self.assertEqual(3, saved.metadata['num_benchmarks'])
+
+
 class TestMakeFailedRunSample(unittest.TestCase):
 
   @mock.patch('perfkitbenchmarker.sample.Sample')
@@ -142,6 +235,45 @@ class TestMakeFailedRunSample(unittest.TestCase):
     })
 
 
+class TestAsyncTeardown(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(TestAsyncTeardown, self).setUp()
+    self.submit = self.enter_context(mock.patch.object(reaper, 'Submit'))
+
+  @flagsaver.flagsaver(async_teardown=True)
+  def testTeardownIsSubmitted(self):
+    spec = mock.Mock(vms=[])
+    pkb.DoTeardownPhase(spec, mock.MagicMock())
+    self.submit.assert_called_once_with(spec)
+    spec.Delete.assert_not_called()
+
+  @flagsaver.flagsaver(async_teardown=True, vm_pool=True)
+  def testTeardownWithVmPool(self):
+    spec = mock.Mock()
+    pkb.DoTeardownPhase(spec, mock.MagicMock())
+    self.submit.assert_not_called()
+    spec.Delete.assert_called_once_with()
+
+  @flagsaver.flagsaver(async_teardown=True)
+  def testStaticVmIsReturnedToPool(self):
+    self.enter_context(mock.patch.object(
+        static_virtual_machine.StaticVirtualMachine, 'vm_pool',
+        collections.deque()))
+    vm_spec = static_virtual_machine.StaticVmSpec(
+        'test_component', ip_address='1.1.1.1', user_name='perfkit')
+    static_virtual_machine.StaticVirtualMachine.vm_pool.append(
+        static_virtual_machine.GetStaticVmClass(None)(vm_spec))
+    # Both benchmarks lease the only static VM.
+    for _ in range(2):
+      vm = static_virtual_machine.StaticVirtualMachine.GetStaticVirtualMachine()
+      self.assertIsNotNone(vm)
+      spec = mock.Mock(vms=[vm])
+      spec.Delete.side_effect = vm.Delete
+      pkb.DoTeardownPhase(spec, mock.MagicMock())
+    self.submit.assert_not_called()
+
+
 class TestMiscFunctions(pkb_common_test_case.PkbCommonTestCase):
   """Testing for various functions in pkb.py."""
 
@@ -199,5 +331,22 @@ class TestMiscFunctions(pkb_common_test_case.PkbCommonTestCase):
     self.assertLen(samples, 2)
 
 
+class TestFlagModules(pkb_common_test_case.PkbCommonTestCase):
+
+  def testGetFlagNames(self):
+    flag_file = self.create_tempfile(content='--fio_jobfile=job\n# comment\n')
+    self.assertEqual(
+        {'benchmarks', 'nofio_hist_log', 'fio_hist_log', 'fio_jobfile',
+         'flagfile'},
+        pkb._GetFlagNames(['--benchmarks=fio', '--nofio_hist_log',
+                           '--flagfile=%s' % flag_file.full_path, 'arg',
+                           '--', '--not_a_flag']))
+
+  @mock.patch.object(pkb.import_util, 'ImportFlagModules')
+  def testImportFlagModules(self, import_flag_modules):
+    pkb._ImportFlagModules(['pkb.py', '--fio_jobfile=job'])
+    import_flag_modules.assert_called_once_with({'fio_jobfile'})
+
+
 if __name__ == '__main__':
   unittest.main()
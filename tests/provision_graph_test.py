@@ -0,0 +1,92 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.provision_graph."""
+
+import threading
+import unittest
+
+from perfkitbenchmarker import provision_graph
+from tests import pkb_common_test_case
+
+
+class ProvisionGraphTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(ProvisionGraphTestCase, self).setUp()
+    self.lock = threading.Lock()
+    self.calls = []
+
+  def _Call(self, name):
+
+    def _Record():
+      with self.lock:
+        self.calls.append(name)
+
+    return _Record
+
+  def _Steps(self):
+    return [
+        provision_graph.Step('vms', self._Call('create vms'),
+                             self._Call('delete vms'), ['networks']),
+        provision_graph.Step('networks', self._Call('create networks'),
+                             self._Call('delete networks'),
+                             ['capacity_reservations']),
+        provision_graph.Step('ready', self._Call('prepare vms'), None,
+                             ['vms']),
+        provision_graph.Step('db', self._Call('create db'),
+                             self._Call('delete db'), ['ready']),
+    ]
+
+  def testProvisionOrder(self):
+    samples = provision_graph.Provision(self._Steps())
+    self.assertEqual(['create networks', 'create vms', 'prepare vms',
+                      'create db'], self.calls)
+    critical_path, = [s for s in samples
+                      if s.metric == 'Resource Critical Path Time']
+    self.assertEqual('networks -> vms -> ready -> db',
+                     critical_path.metadata['critical_path'])
+    self.assertEqual('provision', critical_path.metadata['stage'])
+
+  def testTeardownOrder(self):
+    samples = provision_graph.Teardown(self._Steps())
+    self.assertEqual(['delete db', 'delete vms', 'delete networks'],
+                     self.calls)
+    self.assertEqual({'teardown'}, {s.metadata['stage'] for s in samples})
+
+  def testGetCriticalPath(self):
+    dependencies = {'networks': [], 'registry': [],
+                    'vms': ['networks'], 'cluster': ['networks', 'registry']}
+    timings = {'networks': (0, 10), 'registry': (0, 50),
+               'vms': (10, 40), 'cluster': (50, 60)}
+    self.assertEqual(['registry', 'cluster'],
+                     provision_graph.GetCriticalPath(dependencies, timings))
+
+  def testMakeSamples(self):
+    dependencies = {'networks': [], 'vms': ['networks'], 'db': ['networks']}
+    timings = {'networks': (100, 110), 'vms': (110, 150), 'db': (110, 130)}
+    samples = provision_graph.MakeSamples('provision', dependencies, timings)
+    steps = [s for s in samples if s.metric == 'Resource Step Time']
+    self.assertEqual(['networks', 'db', 'vms'],
+                     [s.metadata['step'] for s in steps])
+    self.assertEqual([10, 20, 40], [s.value for s in steps])
+    self.assertEqual([0, 10, 10], [s.metadata['start_offset'] for s in steps])
+    self.assertEqual([True, False, True],
+                     [s.metadata['on_critical_path'] for s in steps])
+    critical_path = samples[-1]
+    self.assertEqual(50, critical_path.value)
+    self.assertEqual(50, critical_path.metadata['total_seconds'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,216 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.publish_pipeline."""
+
+import os
+import threading
+import time
+import unittest
+
+from absl import flags
+from absl.testing import flagsaver
+import mock
+import numpy as np
+
+from perfkitbenchmarker import publish_pipeline
+from tests import pkb_common_test_case
+
+FLAGS = flags.FLAGS
+
+
+class FakePublisher(object):
+  """Records the batches of samples it publishes."""
+
+  STREAMING = True
+
+  def __init__(self, failures=0, event=None):
+    self.batches = []
+    self.samples = []
+    self.failures = failures
+    self.event = event
+
+  def PublishSamples(self, samples):
+    if self.event:
+      self.event.wait()
+    if self.failures:
+      self.failures -= 1
+      raise IOError('Publishing failed.')
+    self.batches.append([sample['value'] for sample in samples])
+    self.samples.extend(samples)
+
+  def GetValues(self):
+    return [value for batch in self.batches for value in batch]
+
+
+class FakeDeferredPublisher(FakePublisher):
+
+  STREAMING = False
+
+
+def _Samples(values):
+  return [{'metric': 'm', 'value': value} for value in values]
+
+
+class PublishPipelineTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(PublishPipelineTestCase, self).setUp()
+    self.directory = os.path.join(self.create_tempdir().full_path, 'wal')
+    self.enter_context(flagsaver.flagsaver(publish_batch_size=2,
+                                           publish_flush_interval=60))
+    self.enter_context(mock.patch.object(publish_pipeline, '_RETRY_DELAY', 0))
+
+  def _GetLogFiles(self, directory=None):
+    return sorted(name for name in os.listdir(directory or self.directory)
+                  if name.endswith('.jsonl'))
+
+  def _WaitFor(self, condition):
+    deadline = time.time() + 10
+    while not condition():
+      self.assertLess(time.time(), deadline)
+      time.sleep(0.01)
+
+  def testPublishesBatches(self):
+    streaming = FakePublisher()
+    deferred = FakeDeferredPublisher()
+    pipeline = publish_pipeline.Pipeline([streaming, deferred], self.directory)
+    pipeline.Put(_Samples(range(5)))
+    self.assertEqual(0, pipeline.Stop())
+    self.assertEqual([[0, 1], [2, 3], [4]], streaming.batches)
+    self.assertEqual([[0, 1, 2, 3, 4]], deferred.batches)
+    self.assertEqual([], self._GetLogFiles())
+
+  def testMetadataJsonCanNotSerialize(self):
+    deferred = FakeDeferredPublisher()
+    pipeline = publish_pipeline.Pipeline([FakePublisher(), deferred],
+                                         self.directory)
+    pipeline.Put([{'metric': 'm', 'value': 0,
+                   'metadata': {'count': np.int64(1), 'tags': {'a'}}}])
+    self.assertEqual(0, pipeline.Stop())
+    # The deferred publisher reads the sample from the log.
+    self.assertEqual([{'count': 1, 'tags': "{'a'}"}],
+                     [sample['metadata'] for sample in deferred.samples])
+
+  def testFlushInterval(self):
+    FLAGS.publish_flush_interval = 0.01
+    publisher = FakePublisher()
+    pipeline = publish_pipeline.Pipeline([publisher], self.directory)
+    pipeline.Put(_Samples([0]))
+    self._WaitFor(lambda: publisher.batches)
+    self.assertEqual([[0]], publisher.batches)
+    pipeline.Stop()
+
+  def testFlush(self):
+    publisher = FakePublisher()
+    pipeline = publish_pipeline.Pipeline([publisher], self.directory)
+    pipeline.Put(_Samples([0]))
+    pipeline.Flush()
+    self._WaitFor(lambda: publisher.batches)
+    pipeline.Stop()
+
+  def testFullQueueBlocks(self):
+    FLAGS.publish_queue_size = 1
+    FLAGS.publish_batch_size = 1
+    event = threading.Event()
+    slow = FakePublisher(event=event)
+    fast = FakePublisher()
+    pipeline = publish_pipeline.Pipeline([slow, fast], self.directory)
+    put = threading.Thread(target=pipeline.Put, args=(_Samples(range(5)),))
+    put.start()
+    put.join(0.2)
+    self.assertTrue(put.is_alive())
+    event.set()
+    put.join()
+    pipeline.Stop()
+    self.assertEqual(list(range(5)), slow.GetValues())
+    self.assertEqual(list(range(5)), fast.GetValues())
+
+  def testRetriesFailedBatch(self):
+    publisher = FakePublisher(failures=1)
+    pipeline = publish_pipeline.Pipeline([publisher], self.directory)
+    pipeline.Put(_Samples(range(3)))
+    self.assertEqual(0, pipeline.Stop())
+    self.assertEqual(list(range(3)), publisher.GetValues())
+
+  def testUnpublishedSamplesArePublishedByNextPipeline(self):
+    FLAGS.publish_retries = 0
+    failing = FakePublisher(failures=1)
+    other = FakePublisher()
+    pipeline = publish_pipeline.Pipeline([failing, other], self.directory)
+    pipeline.Put(_Samples(range(3)))
+    self.assertEqual(1, pipeline.Stop())
+    self.assertEqual([2], failing.GetValues())
+    self.assertTrue(self._GetLogFiles())
+
+    # The samples are published again by the publisher that failed.
+    publisher = FakePublisher()
+    other = FakePublisher()
+    pipeline = publish_pipeline.Pipeline([publisher, other], self.directory)
+    pipeline.Put(_Samples([3]))
+    self.assertEqual(0, pipeline.Stop())
+    self.assertEqual([0, 1, 2, 3], publisher.GetValues())
+    self.assertEqual([3], other.GetValues())
+    self.assertEqual([], self._GetLogFiles())
+
+  def testTornLogIsRead(self):
+    FLAGS.publish_retries = 0
+    pipeline = publish_pipeline.Pipeline([FakePublisher(failures=1)],
+                                         self.directory)
+    pipeline.Put(_Samples(range(2)))
+    pipeline.Stop()
+    log_file, = self._GetLogFiles()
+    with open(os.path.join(self.directory, log_file), 'a') as log:
+      log.write('[3, {"metr')
+    publisher = FakePublisher()
+    pipeline = publish_pipeline.Pipeline([publisher], self.directory)
+    pipeline.Put(_Samples([2]))
+    pipeline.Stop()
+    self.assertEqual([0, 1, 2], publisher.GetValues())
+
+  def testPublishedLogFilesAreDeleted(self):
+    FLAGS.publish_batch_size = 1
+    publisher = FakePublisher()
+    deferred = FakeDeferredPublisher()
+    with mock.patch.object(publish_pipeline, '_SEGMENT_SIZE', 2):
+      pipeline = publish_pipeline.Pipeline([publisher], self.directory)
+      pipeline.Put(_Samples(range(5)))
+      self._WaitFor(lambda: len(publisher.batches) == 5)
+      self.assertEqual(['5.jsonl'], self._GetLogFiles())
+      pipeline.Stop()
+
+      # Deferred publishers keep the samples in their own log until the
+      # pipeline stops, without holding back the streaming publishers' log.
+      pipeline = publish_pipeline.Pipeline([publisher, deferred],
+                                           self.directory)
+      pipeline.Put(_Samples(range(5, 10)))
+      self._WaitFor(lambda: len(publisher.batches) == 10)
+      self.assertEqual(['10.jsonl'], self._GetLogFiles())
+      deferred_directory = os.path.join(self.directory,
+                                        publish_pipeline._DEFERRED_DIR)
+      self.assertEqual(['1.jsonl', '3.jsonl', '5.jsonl'],
+                       self._GetLogFiles(deferred_directory))
+      pipeline.Stop()
+    self.assertEqual([[5, 6, 7, 8, 9]], deferred.batches)
+    self.assertEqual([], self._GetLogFiles(deferred_directory))
+
+  def testGetPipelineInChildProcess(self):
+    publish_pipeline.Start([], self.directory)
+    self.addCleanup(publish_pipeline.Stop)
+    self.assertIsNotNone(publish_pipeline.GetPipeline())
+    with mock.patch.object(os, 'getpid', return_value=-1):
+      self.assertIsNone(publish_pipeline.GetPipeline())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,20 +16,29 @@
 import collections
 import csv
 import json
+import os
 import re
 import tempfile
 import unittest
 import uuid
 from absl import flags
+from absl.testing import flagsaver
 import mock
 
+from perfkitbenchmarker import histogram
 from perfkitbenchmarker import pkb  # pylint: disable=unused-import
+from perfkitbenchmarker import publish_pipeline
 from perfkitbenchmarker import publisher
 from perfkitbenchmarker import sample
 from perfkitbenchmarker import vm_util
 from perfkitbenchmarker.providers.gcp import util
 import six
 
+try:
+  from pyarrow import parquet
+except ImportError:
+  parquet = None
+
 FLAGS = flags.FLAGS
 FLAGS.mark_as_parsed()
 
@@ -108,6 +117,12 @@ class NewlineDelimitedJSONPublisherTestCase(unittest.TestCase):
                           {u'test': u'testb', u'labels': u'|key2:val2|'}],
                          result)
 
+  def testLaterCallsAppend(self):
+    self.instance.PublishSamples([{'test': 'testa', 'metadata': {}}])
+    self.instance.PublishSamples([{'test': 'testb', 'metadata': {}}])
+    result = [json.loads(i)['test'] for i in self.fp]
+    self.assertListEqual(['testa', 'testb'], result)
+
 
 class BigQueryPublisherTestCase(unittest.TestCase):
 
@@ -240,6 +255,62 @@ class SampleCollectorTestCase(unittest.TestCase):
         },
         self.instance.samples[0])
 
+  def testAddSamples_SharedMetadataIsAnnotatedOnce(self):
+    provider = mock.Mock()
+    provider.AddMetadata.side_effect = lambda metadata, _: dict(metadata, a=1)
+    self.instance.metadata_providers = [provider]
+    metadata = {'foo': 'bar'}
+    samples = [sample.Sample('widgets', i, 'oz', metadata) for i in range(3)]
+    self.instance.AddSamples(samples, self.benchmark, self.benchmark_spec)
+    provider.AddMetadata.assert_called_once_with(metadata, self.benchmark_spec)
+    self.assertEqual({'foo': 'bar', 'a': 1},
+                     self.instance.samples[2]['metadata'])
+    self.assertEqual(3, len({s['sample_uri'] for s in self.instance.samples}))
+
+  def testAddSamples_SampleBatch(self):
+    batch = sample.SampleBatch('widgets', [100, 101], 'oz', {'foo': 'bar'},
+                               timestamps=[1.0, 2.0],
+                               metadata_columns={'index': [0, 1]})
+    self.instance.AddSamples([batch, self.sample], self.benchmark,
+                             self.benchmark_spec)
+    self.assertEqual(2, len(self.instance.samples))
+    published = mock.Mock()
+    self.instance.publishers = [published]
+    self.instance.PublishSamples()
+    samples, = published.PublishSamples.call_args[0]
+    self.assertEqual(3, len(samples))
+    sample_dicts = list(samples)
+    expected = dict(sample_dicts[2], value=101, timestamp=2.0,
+                    sample_uri=mock.ANY)
+    expected['metadata'] = dict(expected['metadata'], index=1)
+    self.assertEqual(expected, sample_dicts[1])
+    self.assertEqual(list(expected), list(sample_dicts[1]))
+    self.assertEqual(0, sample_dicts[0]['metadata']['index'])
+    self.assertNotIn('index', sample_dicts[2]['metadata'])
+    self.assertEqual(3, len({s['sample_uri'] for s in sample_dicts}))
+    uuid.UUID(sample_dicts[0]['sample_uri'])
+
+  def testAddSamples_Streaming(self):
+    pipeline = mock.Mock()
+    with mock.patch.object(publish_pipeline, 'GetPipeline',
+                           return_value=pipeline):
+      self.instance.AddSamples([self.sample], self.benchmark,
+                               self.benchmark_spec)
+      self.assertEqual([], self.instance.samples)
+      samples, = pipeline.Put.call_args[0]
+      self.assertEqual(['widgets'], [s['metric'] for s in samples])
+      self.instance.PublishSamples()
+      pipeline.Flush.assert_called_once_with()
+
+  def testAddSamples_NotStreamingToOtherPublishers(self):
+    instance = publisher.SampleCollector(
+        publishers=[mock.Mock()], publishers_from_flags=False,
+        add_default_publishers=False)
+    with mock.patch.object(publish_pipeline, 'GetPipeline') as get_pipeline:
+      instance.AddSamples([self.sample], self.benchmark, self.benchmark_spec)
+    get_pipeline.assert_not_called()
+    self.assertEqual(1, len(instance.samples))
+
 
 class DefaultMetadataProviderTestCase(unittest.TestCase):
 
@@ -391,6 +462,102 @@ class CSVPublisherTestCase(unittest.TestCase):
     self.assertEqual(3, len(rows))
 
 
+class ParquetPublisherTestCase(unittest.TestCase):
+
+  def setUp(self):
+    temp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(temp_dir.cleanup)
+    self.dataset_path = os.path.join(temp_dir.name, 'dataset')
+    self.samples = [
+        {'test': 'iperf', 'metric': 'Throughput', 'value': 1.5, 'unit': 'Mbps',
+         'timestamp': 1590969600.25, 'run_uri': 'abc', 'sample_uri': 'a',
+         'official': False, 'owner': 'me', 'product_name': 'PKB',
+         'metadata': {'zone': 'us-a', 'threads': 1}},
+        {'test': 'iperf', 'metric': 'Throughput', 'value': 2.0, 'unit': 'Mbps',
+         'timestamp': 1591056000.0, 'run_uri': 'abc', 'sample_uri': 'b',
+         'official': False, 'owner': 'me', 'product_name': 'PKB',
+         'metadata': {'zone': 'us-a'}},
+        {'test': 'fio', 'metric': 'iops', 'value': 3.0, 'unit': '',
+         'timestamp': 1590969600.0, 'run_uri': 'abc', 'sample_uri': 'c',
+         'official': False, 'owner': 'me', 'product_name': 'PKB',
+         'metadata': histogram.Histogram.FromItems({1: 2}).GetMetadata()},
+    ]
+
+  def _GetFiles(self):
+    return sorted(os.path.relpath(os.path.join(directory, name),
+                                  self.dataset_path)
+                  for directory, _, names in os.walk(self.dataset_path)
+                  for name in names)
+
+  def testGetParquetColumns(self):
+    columns = publisher._GetParquetColumns(self.samples[:2])
+    self.assertEqual(
+        list(publisher.ParquetPublisher.COLUMNS) + ['histogram', 'metadata'],
+        list(columns))
+    self.assertEqual([1.5, 2.0], columns['value'])
+    self.assertEqual([[('threads', '1'), ('zone', 'us-a')], [('zone', 'us-a')]],
+                     columns['metadata'])
+
+  @unittest.skipIf(parquet is None, 'Requires pyarrow.')
+  def testPublishSamples(self):
+    instance = publisher.ParquetPublisher(self.dataset_path)
+    instance.PublishSamples(self.samples)
+    instance.PublishSamples(self.samples[:1])
+    files = self._GetFiles()
+    self.assertEqual(
+        ['test=fio/date=2020-06-01', 'test=iperf/date=2020-06-01',
+         'test=iperf/date=2020-06-01', 'test=iperf/date=2020-06-02'],
+        [os.path.dirname(f) for f in files])
+    table = parquet.read_table(
+        os.path.join(self.dataset_path, 'test=iperf', 'date=2020-06-02'))
+    self.assertEqual(['b'], table.column('sample_uri').to_pylist())
+    self.assertEqual([[('zone', 'us-a')]],
+                     table.column('metadata').to_pylist())
+    self.assertEqual('dictionary<values=string, indices=int32, ordered=0>',
+                     str(table.schema.field('metric').type))
+    self.assertEqual(1591056000.0,
+                     table.column('timestamp')[0].as_py().timestamp())
+    table = parquet.read_table(
+        os.path.join(self.dataset_path, 'test=fio', 'date=2020-06-01'))
+    self.assertEqual(
+        [(1.0, 2)],
+        histogram.Histogram.FromBytes(
+            table.column('histogram')[0].as_py()).GetItems())
+
+  @unittest.skipIf(parquet is None, 'Requires pyarrow.')
+  def testReadDataset(self):
+    instance = publisher.ParquetPublisher(self.dataset_path)
+    # The files have samples with different metadata keys.
+    instance.PublishSamples(self.samples[1:2])
+    instance.PublishSamples(self.samples[:1])
+    instance.PublishSamples(self.samples[2:])
+    table = parquet.read_table(self.dataset_path).sort_by('sample_uri')
+    self.assertEqual(['a', 'b', 'c'], table.column('sample_uri').to_pylist())
+    self.assertEqual(
+        [[('threads', '1'), ('zone', 'us-a')], [('zone', 'us-a')], []],
+        table.column('metadata').to_pylist())
+    self.assertEqual(['iperf', 'iperf', 'fio'],
+                     [str(test) for test in table.column('test').to_pylist()])
+
+  def testPublishersFromFlags(self):
+    with flagsaver.flagsaver(parquet_path=self.dataset_path):
+      publishers = publisher.SampleCollector._PublishersFromFlags()
+    self.assertEqual([publisher.ParquetPublisher],
+                     [type(p) for p in publishers])
+
+  def testRepublishJSONSamples(self):
+    json_path = self.dataset_path + '.json'
+    publisher.NewlineDelimitedJSONPublisher(json_path).PublishSamples(
+        self.samples[:2])
+    with flagsaver.flagsaver(parquet_path=self.dataset_path), \
+        mock.patch.object(publisher.ParquetPublisher,
+                          'PublishSamples') as publish_samples:
+      publisher.RepublishJSONSamples(json_path)
+    samples, = publish_samples.call_args[0]
+    self.assertEqual([{'zone': 'us-a', 'threads': '1'}, {'zone': 'us-a'}],
+                     [sample['metadata'] for sample in samples])
+
+
 class InfluxDBPublisherTestCase(unittest.TestCase):
 
   def setUp(self):
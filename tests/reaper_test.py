@@ -0,0 +1,150 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.reaper."""
+
+import contextlib
+import json
+import os
+import subprocess
+import time
+import unittest
+
+from absl import flags
+from absl.testing import flagsaver
+import mock
+
+from perfkitbenchmarker import benchmark_spec
+from perfkitbenchmarker import reaper
+from perfkitbenchmarker import vm_util
+from tests import pkb_common_test_case
+
+FLAGS = flags.FLAGS
+
+
+class FakeSpec(object):
+  """Records the times its resources were deleted in a file."""
+
+  def __init__(self, uid, directory, delete_time=0, fail=False):
+    self.name = 'fake'
+    self.uid = uid
+    self.uuid = 'uuid-' + uid
+    self.deleted = False
+    self.delete_time = delete_time
+    self.fail = fail
+    self.deleted_path = os.path.join(directory, uid + '.deleted')
+
+  def Delete(self):
+    start_time = time.time()
+    time.sleep(self.delete_time)
+    if self.fail:
+      raise Exception('Delete failed.')
+    with open(self.deleted_path, 'w') as deleted_file:
+      json.dump([start_time, time.time()], deleted_file)
+    self.deleted = True
+
+  def Pickle(self, directory=None):
+    pass
+
+  @contextlib.contextmanager
+  def RedirectGlobalFlags(self):
+    yield
+
+  def GetDeleteTimes(self):
+    with open(self.deleted_path) as deleted_file:
+      return json.load(deleted_file)
+
+
+class ReaperTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(ReaperTestCase, self).setUp()
+    self.directory = self.create_tempdir().full_path
+    self.enter_context(flagsaver.flagsaver(temp_dir=self.directory,
+                                           run_uri='abc'))
+    self.enter_context(mock.patch.object(vm_util, 'GetTempDir',
+                                         return_value=self.directory))
+    self.enter_context(mock.patch.object(reaper, '_pending', {}))
+    self.enter_context(mock.patch.object(reaper, '_submitted', set()))
+    self.queue_dir = os.path.join(self.directory, reaper._QUEUE_DIR)
+
+  def _GetEntryNames(self):
+    return sorted(os.listdir(self.queue_dir))
+
+  def _WriteEntry(self, uid, pid):
+    os.makedirs(self.queue_dir, exist_ok=True)
+    reaper._WriteEntry(os.path.join(self.queue_dir, uid + '.json'), {
+        'name': 'fake', 'uid': uid, 'run_uri': 'abc',
+        'directory': self.directory, 'pid': pid, 'submit_time': 0})
+
+  def testSubmit(self):
+    spec = FakeSpec('fake0', self.directory)
+    reaper.Submit(spec)
+    self.assertTrue(reaper.IsSubmitted(spec))
+    self.assertEqual(0, reaper.WaitForPending())
+    self.assertTrue(os.path.exists(spec.deleted_path))
+    self.assertEqual([], self._GetEntryNames())
+
+  def testSubmitDeletedSpec(self):
+    spec = FakeSpec('fake0', self.directory)
+    spec.deleted = True
+    reaper.Submit(spec)
+    self.assertFalse(reaper.IsSubmitted(spec))
+
+  def testFailedTeardownKeepsEntry(self):
+    reaper.Submit(FakeSpec('fake0', self.directory, fail=True))
+    self.assertEqual(1, reaper.WaitForPending())
+    self.assertEqual(['uuid-fake0.json'], self._GetEntryNames())
+
+  def testSubmitWaitsForSlot(self):
+    FLAGS.async_teardown_max_pending = 1
+    first = FakeSpec('fake0', self.directory, delete_time=0.5)
+    second = FakeSpec('fake1', self.directory)
+    reaper.Submit(first)
+    reaper.Submit(second)
+    self.assertEqual(0, reaper.WaitForPending())
+    self.assertLessEqual(first.GetDeleteTimes()[1],
+                         second.GetDeleteTimes()[0])
+
+  def testExitTimeoutStopsTeardown(self):
+    reaper.Submit(FakeSpec('fake0', self.directory, delete_time=60))
+    # The entry records the reaper process once Submit returns.
+    process, = reaper._pending.values()
+    with open(os.path.join(self.queue_dir, 'uuid-fake0.json')) as entry_file:
+      self.assertEqual(process.pid, json.load(entry_file)['pid'])
+    self.assertEqual(1, reaper.WaitForPending(timeout=0))
+    self.assertEqual(['uuid-fake0.json'], self._GetEntryNames())
+
+  def testReapPending(self):
+    finished = subprocess.Popen(['true'])
+    finished.wait()
+    self._WriteEntry('fake0', finished.pid)
+    spec = FakeSpec('fake0', self.directory)
+    with mock.patch.object(benchmark_spec.BenchmarkSpec, 'Load',
+                           return_value=spec):
+      self.assertEqual(0, reaper.ReapPending())
+    self.assertTrue(os.path.exists(spec.deleted_path))
+    self.assertEqual([], self._GetEntryNames())
+
+  def testReapSkipsRunningTeardown(self):
+    self._WriteEntry('fake0', os.getppid())
+    spec = FakeSpec('fake0', self.directory)
+    with mock.patch.object(benchmark_spec.BenchmarkSpec, 'Load',
+                           return_value=spec):
+      self.assertEqual(0, reaper.ReapPending())
+    self.assertFalse(os.path.exists(spec.deleted_path))
+    self.assertEqual(['fake0.json'], self._GetEntryNames())
+
+
+if __name__ == '__main__':
+  unittest.main()
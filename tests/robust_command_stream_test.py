@@ -0,0 +1,155 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.robust_command_stream.
+
+Commands are run locally with execute_command.py and followed with
+wait_for_command.py, in place of running them on a VM over ssh.
+"""
+
+import base64
+import os
+import pipes
+import subprocess
+import sys
+import time
+import unittest
+
+import mock
+
+from perfkitbenchmarker import data
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import robust_command_stream
+from tests import pkb_common_test_case
+
+_EXECUTE_COMMAND = data.ResourcePath(os.path.join('..', 'scripts',
+                                                  'execute_command.py'))
+_WAIT_FOR_COMMAND = data.ResourcePath(os.path.join('..', 'scripts',
+                                                   'wait_for_command.py'))
+
+
+def _Frame(stream, offset, data):
+  return '%s %s %d %s\n' % (robust_command_stream.FRAME_PREFIX, stream, offset,
+                            base64.b64encode(data).decode('ascii'))
+
+
+class CommandStreamTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def testReassemblesOutput(self):
+    stream = robust_command_stream.CommandStream()
+    self.assertTrue(stream.Parse(_Frame('out', 0, b'hello ')))
+    self.assertTrue(stream.Parse(_Frame('err', 0, b'oops\n')))
+    self.assertTrue(stream.Parse(_Frame('out', 6, b'world\n')))
+    self.assertTrue(stream.Parse('PKB-STREAM exit 3\n'))
+    self.assertEqual('hello world\n', stream.Output('out'))
+    self.assertEqual('oops\n', stream.Output('err'))
+    self.assertEqual(3, stream.retcode)
+    self.assertEqual({'out': 12, 'err': 5}, stream.offsets)
+
+  def testSkipsDataAlreadyReceived(self):
+    stream = robust_command_stream.CommandStream()
+    stream.Parse(_Frame('out', 0, b'abc'))
+    stream.Parse(_Frame('out', 1, b'bcde'))
+    stream.Parse(_Frame('out', 2, b'c'))
+    self.assertEqual('abcde', stream.Output('out'))
+
+  def testRaisesOnMissingData(self):
+    stream = robust_command_stream.CommandStream()
+    with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+      stream.Parse(_Frame('out', 4, b'abc'))
+
+  def testIgnoresOtherLines(self):
+    stream = robust_command_stream.CommandStream()
+    self.assertFalse(stream.Parse('Welcome to the VM\n'))
+    self.assertFalse(stream.Parse('PKB-STREAM unknown 0 YQ==\n'))
+    self.assertEqual('', stream.Output('out'))
+
+
+class FollowTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(FollowTestCase, self).setUp()
+    self.enter_context(mock.patch.object(robust_command_stream,
+                                         '_RECONNECT_SECONDS', 0))
+    base = os.path.join(self.create_tempdir().full_path, 'cmd')
+    self.files = {name: base + '.' + name
+                  for name in ('stdout', 'stderr', 'status', 'exclusive')}
+
+  def _Execute(self, command):
+    """Starts command with execute_command.py, returning the process."""
+    process = subprocess.Popen(
+        [sys.executable, _EXECUTE_COMMAND, '--command', command] +
+        ['--%s=%s' % item for item in sorted(self.files.items())],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    self.addCleanup(process.wait)
+    # Otherwise wait_for_command.py sleeps before checking for it again.
+    while not os.path.exists(self.files['exclusive']):
+      time.sleep(0.01)
+    return process
+
+  def _FollowCommand(self, stdout_offset, stderr_offset, *extra_args):
+    return [sys.executable, _WAIT_FOR_COMMAND, '--follow',
+            '--stdout_offset', str(stdout_offset),
+            '--stderr_offset', str(stderr_offset)] + list(extra_args) + [
+                '--%s=%s' % item for item in sorted(self.files.items())]
+
+  def testFollowsCommandToCompletion(self):
+    self._Execute('for i in 1 2 3; do echo out$i; echo err$i >&2; '
+                  'sleep 0.2; done; exit 4')
+    stdout, stderr, retcode = robust_command_stream.Follow(
+        self._FollowCommand, retries=0)
+    self.assertEqual('out1\nout2\nout3\n', stdout)
+    self.assertEqual('err1\nerr2\nerr3\n', stderr)
+    self.assertEqual(4, retcode)
+
+  def testLargeBinaryOutput(self):
+    self._Execute('head -c 200000 /dev/urandom | od -An -v')
+    stdout, _, retcode = robust_command_stream.Follow(
+        self._FollowCommand, retries=0)
+    self.assertEqual(0, retcode)
+    with open(self.files['stdout']) as f:
+      self.assertEqual(f.read(), stdout)
+
+  def testResumesAfterConnectionDrops(self):
+    self._Execute('seq 1 30000').wait()
+    calls = []
+
+    def _BuildCmd(stdout_offset, stderr_offset):
+      calls.append(stdout_offset)
+      cmd = self._FollowCommand(stdout_offset, stderr_offset)
+      if len(calls) > 1:
+        return cmd
+      # Drop the connection after the first frame.
+      return ['bash', '-c', '%s | head -n 1' % ' '.join(
+          pipes.quote(arg) for arg in cmd)]
+
+    stdout, _, retcode = robust_command_stream.Follow(_BuildCmd, retries=0)
+    self.assertEqual(0, retcode)
+    self.assertEqual(''.join('%d\n' % i for i in range(1, 30001)), stdout)
+    self.assertEqual([0, 48 * 1024], calls)
+
+  def testGivesUpWithoutProgress(self):
+    with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+      robust_command_stream.Follow(lambda *_: ['false'], retries=2)
+
+  def testDeletesFiles(self):
+    self._Execute('echo done')
+    robust_command_stream.Follow(
+        lambda *offsets: self._FollowCommand(*(offsets + ('--delete',))),
+        retries=0)
+    for name in ('stdout', 'stderr', 'status'):
+      self.assertFalse(os.path.exists(self.files[name]))
+
+
+if __name__ == '__main__':
+  unittest.main()
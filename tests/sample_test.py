@@ -57,6 +57,39 @@ class SampleTestCase(unittest.TestCase):
     self.assertEqual(1.0, instance.value)
 
 
+class SampleBatchTestCase(unittest.TestCase):
+
+  def testIterYieldsSamples(self):
+    metadata = {'origin': 'unit test'}
+    batch = sample.SampleBatch('Test', [1, 2], 'Mbps', metadata,
+                               timestamps=[10, 11])
+    self.assertEqual([sample.Sample('Test', 1.0, 'Mbps', metadata, 10.0),
+                      sample.Sample('Test', 2.0, 'Mbps', metadata, 11.0)],
+                     list(batch))
+    self.assertIs(metadata, batch[1].metadata)
+    self.assertIsInstance(batch[0].value, float)
+
+  def testMetadataColumns(self):
+    batch = sample.SampleBatch('Test', [1, 2, 3], 'Mbps', {'origin': 'test'},
+                               metadata_columns={'epoch': [5, 6, 7]})
+    self.assertEqual({'origin': 'test', 'epoch': 6}, batch[1].metadata)
+    self.assertIsInstance(batch[1].metadata['epoch'], int)
+    self.assertEqual({'origin': 'test'}, batch.metadata)
+
+  def testDefaultTimestamp(self):
+    batch = sample.SampleBatch('Test', [1, 2], 'Mbps')
+    self.assertEqual(2, len(batch))
+    self.assertEqual(batch[0].timestamp, batch[1].timestamp)
+    self.assertEqual({}, batch[0].metadata)
+
+  def testColumnLengthMismatch(self):
+    with self.assertRaises(ValueError):
+      sample.SampleBatch('Test', [1, 2], 'Mbps', timestamps=[1])
+    with self.assertRaises(ValueError):
+      sample.SampleBatch('Test', [1, 2], 'Mbps',
+                         metadata_columns={'epoch': [1, 2, 3]})
+
+
 class TestPercentileCalculator(unittest.TestCase):
 
   def testPercentileCalculator(self):
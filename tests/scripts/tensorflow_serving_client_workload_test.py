@@ -24,18 +24,29 @@ from six import StringIO
 # test dependencies. The script under test for this test module is
 # expected to execute only on a client VM which has built tensorflow
 # from source.
-sys.modules['grpc'] = mock.Mock()
-sys.modules['grpc.beta'] = mock.Mock()
-sys.modules['grpc.framework'] = mock.Mock()
-sys.modules['grpc.framework.interfaces'] = mock.Mock()
-sys.modules['grpc.framework.interfaces.face'] = mock.Mock()
-sys.modules['grpc.framework.interfaces.face.face'] = mock.Mock()
-sys.modules['tensorflow'] = mock.Mock()
-sys.modules['tensorflow_serving'] = mock.Mock()
-sys.modules['tensorflow_serving.apis'] = mock.Mock()
+_MOCKED_MODULES = {
+    'grpc': mock.Mock(),
+    'grpc.beta': mock.Mock(),
+    'grpc.framework': mock.Mock(),
+    'grpc.framework.interfaces': mock.Mock(),
+    'grpc.framework.interfaces.face': mock.Mock(),
+    'grpc.framework.interfaces.face.face': mock.Mock(),
+    'tensorflow': mock.Mock(),
+    'tensorflow_serving': mock.Mock(),
+    'tensorflow_serving.apis': mock.Mock(),
+}
+_original_modules = {name: sys.modules.get(name) for name in _MOCKED_MODULES}
+sys.modules.update(_MOCKED_MODULES)
 
 from perfkitbenchmarker.scripts import tensorflow_serving_client_workload  # pylint: disable=g-import-not-at-top,g-bad-import-order
 
+# Restore the real modules, which modules imported by later tests may need.
+for _name, _module in _original_modules.items():
+  if _module is None:
+    del sys.modules[_name]
+  else:
+    sys.modules[_name] = _module
+
 
 class TestTensorflowServingClientWorkload(unittest.TestCase):
 
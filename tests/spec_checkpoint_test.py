@@ -0,0 +1,149 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.spec_checkpoint."""
+
+import json
+import os
+import threading
+import unittest
+
+import mock
+
+from perfkitbenchmarker import resource
+from perfkitbenchmarker import spec_checkpoint
+from tests import pkb_common_test_case
+
+
+class FakeSpec(object):
+
+  def __init__(self, num_vms):
+    self.uid = 'fake0'
+    self.lock = threading.Lock()
+    self.vms = [FakeVm('vm%d' % i) for i in range(num_vms)]
+    self.vm_groups = {'default': list(self.vms)}
+
+
+class FakeVm(resource.BaseResource):
+
+  CLOUD = 'Fake'
+
+  def __init__(self, name):
+    super(FakeVm, self).__init__()
+    self.name = name
+    self.zone = 'zone-a'
+    self.ip_address = None
+    self.spec = None
+
+  def _Create(self):
+    pass
+
+  def _Delete(self):
+    pass
+
+
+class SpecCheckpointTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(SpecCheckpointTestCase, self).setUp()
+    self.path = os.path.join(self.create_tempdir().full_path, 'fake0.journal')
+    self.enter_context(mock.patch.object(spec_checkpoint, '_journals', {}))
+
+  def _GetRecordsWritten(self):
+    save_sample = spec_checkpoint.GetSamples(self.path)[0]
+    return save_sample.metadata['records_written']
+
+  def testLoadRestoresReferences(self):
+    spec = FakeSpec(2)
+    for vm in spec.vms:
+      vm.spec = spec
+    spec_checkpoint.Save(spec, self.path)
+    loaded = spec_checkpoint.Load(self.path)
+    self.assertIsInstance(loaded, FakeSpec)
+    self.assertIsInstance(loaded.vms[0], FakeVm)
+    self.assertEqual(['vm0', 'vm1'], [vm.name for vm in loaded.vms])
+    self.assertIs(loaded.vms[1], loaded.vm_groups['default'][1])
+    self.assertIs(loaded, loaded.vms[0].spec)
+    self.assertFalse(loaded.lock.locked())
+
+  def testSaveAppendsChangedObjects(self):
+    spec = FakeSpec(10)
+    spec_checkpoint.Save(spec, self.path)
+    self.assertEqual(11, self._GetRecordsWritten())
+    spec.vms[3].ip_address = '10.0.0.3'
+    spec_checkpoint.Save(spec, self.path)
+    self.assertEqual(1, self._GetRecordsWritten())
+    spec_checkpoint.Save(spec, self.path)
+    self.assertEqual(0, self._GetRecordsWritten())
+    loaded = spec_checkpoint.Load(self.path)
+    self.assertEqual('10.0.0.3', loaded.vms[3].ip_address)
+
+  def testSaveAfterLoadAppends(self):
+    spec_checkpoint.Save(FakeSpec(3), self.path)
+    loaded = spec_checkpoint.Load(self.path)
+    loaded.vms.append(FakeVm('vm3'))
+    loaded.vms[0].created = True
+    spec_checkpoint.Save(loaded, self.path)
+    # The spec, the changed VM and the new VM.
+    self.assertEqual(3, self._GetRecordsWritten())
+    reloaded = spec_checkpoint.Load(self.path)
+    self.assertEqual(['vm0', 'vm1', 'vm2', 'vm3'],
+                     [vm.name for vm in reloaded.vms])
+    self.assertTrue(reloaded.vms[0].created)
+    self.assertEqual(4, len({vm.name for vm in reloaded.vms}))
+
+  def testUnpicklableAttributeIsSkipped(self):
+    spec = FakeSpec(1)
+    spec.vms[0].callback = lambda: None
+    with self.assertLogs(level='WARNING'):
+      spec_checkpoint.Save(spec, self.path)
+    loaded = spec_checkpoint.Load(self.path)
+    self.assertFalse(hasattr(loaded.vms[0], 'callback'))
+    self.assertEqual('vm0', loaded.vms[0].name)
+
+  def testInterruptedSaveIsIgnored(self):
+    spec = FakeSpec(2)
+    spec_checkpoint.Save(spec, self.path)
+    with open(self.path, 'ab') as journal:
+      journal.write(b'{"type": "object", "key": "root", "size": 1000}\nabc')
+    self.assertEqual(2, len(spec_checkpoint.Load(self.path).vms))
+    loaded = spec_checkpoint.Load(self.path)
+    loaded.vms[0].ip_address = '10.0.0.1'
+    spec_checkpoint.Save(loaded, self.path)
+    self.assertEqual('10.0.0.1',
+                     spec_checkpoint.Load(self.path).vms[0].ip_address)
+
+  def testNewerSchemaIsRejected(self):
+    spec_checkpoint.Save(FakeSpec(1), self.path)
+    with open(self.path, 'rb') as journal:
+      header, rest = journal.read().split(b'\n', 1)
+    header = json.loads(header.decode('utf-8'))
+    header['schema_version'] = spec_checkpoint.SCHEMA_VERSION + 1
+    with open(self.path, 'wb') as journal:
+      journal.write(json.dumps(header).encode('utf-8') + b'\n' + rest)
+    with self.assertRaises(spec_checkpoint.CheckpointError):
+      spec_checkpoint.Load(self.path)
+
+  def testJournalIsCompacted(self):
+    spec = FakeSpec(1)
+    for i in range(20):
+      spec.vms[0].ip_address = '10.0.0.%d' % i
+      spec_checkpoint.Save(spec, self.path)
+    save_sample = spec_checkpoint.GetSamples(self.path)[0]
+    self.assertGreater(save_sample.metadata['compactions'], 0)
+    self.assertEqual('10.0.0.19',
+                     spec_checkpoint.Load(self.path).vms[0].ip_address)
+
+
+if __name__ == '__main__':
+  unittest.main()
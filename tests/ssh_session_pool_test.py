@@ -0,0 +1,111 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.ssh_session_pool.
+
+The sessions under test run a local shell in place of ssh, which exercises the
+same command protocol without a remote host.
+"""
+
+import unittest
+
+from absl import flags
+import mock
+
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import ssh_session_pool
+from tests import pkb_common_test_case
+
+FLAGS = flags.FLAGS
+
+_LOCAL_SHELL_CMD = [ssh_session_pool.REMOTE_SHELL]
+
+
+class SshSessionTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(SshSessionTestCase, self).setUp()
+    self.session = ssh_session_pool.SshSession(_LOCAL_SHELL_CMD)
+    self.session.Start()
+    self.addCleanup(self.session.Close)
+
+  def testStdoutStderrAndReturnCode(self):
+    self.assertEqual(('out\n', 'err\n', 3),
+                     self.session.Run('echo out; echo err >&2; exit 3'))
+
+  def testOutputWithoutTrailingNewline(self):
+    self.assertEqual(('abc', '', 0), self.session.Run('printf abc'))
+
+  def testSessionSurvivesExit(self):
+    self.session.Run('exit 1')
+    self.assertTrue(self.session.alive)
+    self.assertEqual(('again\n', '', 0), self.session.Run('echo again'))
+
+  def testCommandDoesNotReadSessionInput(self):
+    self.assertEqual(('', '', 0), self.session.Run('cat'))
+    self.assertEqual(('next\n', '', 0), self.session.Run('echo next'))
+
+  def testLargeOutput(self):
+    stdout, _, retcode = self.session.Run('seq 1 100000')
+    self.assertEqual(0, retcode)
+    self.assertEqual(100000, len(stdout.splitlines()))
+
+  def testTimeoutClosesSession(self):
+    with self.assertRaises(errors.VmUtil.IssueCommandTimeoutError):
+      self.session.Run('sleep 5', timeout=0.1)
+    self.assertFalse(self.session.alive)
+
+  def testSessionDiedReturnsRetryableCode(self):
+    _, _, retcode = self.session.Run('kill -9 $PPID')
+    self.assertEqual(ssh_session_pool.SESSION_FAILURE_RETCODE, retcode)
+    self.assertFalse(self.session.alive)
+
+
+class SshSessionPoolTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(SshSessionPoolTestCase, self).setUp()
+    self.pool = ssh_session_pool.SshSessionPool()
+    self.addCleanup(self.pool.CloseAll)
+
+  def testReusesSession(self):
+    start_patch = mock.patch.object(
+        ssh_session_pool.SshSession, 'Start', autospec=True,
+        side_effect=ssh_session_pool.SshSession.Start)
+    with start_patch as start:
+      self.pool.RunCommand(_LOCAL_SHELL_CMD, 'true')
+      self.pool.RunCommand(_LOCAL_SHELL_CMD, 'true')
+    self.assertEqual(1, start.call_count)
+
+  def testReopensDeadSession(self):
+    _, _, retcode = self.pool.RunCommand(_LOCAL_SHELL_CMD, 'kill -9 $PPID')
+    self.assertEqual(ssh_session_pool.SESSION_FAILURE_RETCODE, retcode)
+    self.assertEqual(('ok\n', '', 0),
+                     self.pool.RunCommand(_LOCAL_SHELL_CMD, 'echo ok'))
+    self.assertEqual(2, self.pool.stats.sessions_opened)
+
+  def testGetSamples(self):
+    for _ in range(3):
+      self.pool.RunCommand(_LOCAL_SHELL_CMD, 'true')
+    samples = self.pool.stats.GetSamples()
+    self.assertEqual(
+        ['SSH Session Pool Commands Per Second',
+         'SSH Session Pool Command Latency p50',
+         'SSH Session Pool Command Latency p99'],
+        [s.metric for s in samples])
+    self.assertEqual(3, samples[0].metadata['num_commands'])
+    self.assertEqual([], self.pool.stats.GetSamples())
+
+
+if __name__ == '__main__':
+  unittest.main()
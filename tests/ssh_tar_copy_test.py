@@ -0,0 +1,110 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.ssh_tar_copy.
+
+The copies under test run the remote script with a local shell in place of ssh.
+"""
+
+import os
+import unittest
+
+from absl.testing import parameterized
+import mock
+
+from perfkitbenchmarker import errors
+from perfkitbenchmarker import ssh_tar_copy
+from tests import pkb_common_test_case
+
+_LOCAL_SHELL_CMD = ['/bin/sh', '-c']
+
+
+def _ReadFile(path):
+  with open(path) as f:
+    return f.read()
+
+
+def _WriteFile(path, contents):
+  parent = os.path.dirname(path)
+  if not os.path.isdir(parent):
+    os.makedirs(parent)
+  with open(path, 'w') as f:
+    f.write(contents)
+
+
+class SshTarCopyTestCase(pkb_common_test_case.PkbCommonTestCase,
+                         parameterized.TestCase):
+
+  def setUp(self):
+    super(SshTarCopyTestCase, self).setUp()
+    self.src = self.create_tempdir().full_path
+    self.dst = self.create_tempdir().full_path
+    _WriteFile(os.path.join(self.src, 'a.txt'), 'a')
+    _WriteFile(os.path.join(self.src, 'dir', 'b.txt'), 'b')
+    _WriteFile(os.path.join(self.src, 'dir', 'sub', 'c.txt'), 'c')
+
+  @parameterized.parameters(ssh_tar_copy.COMPRESSION_NONE,
+                            ssh_tar_copy.COMPRESSION_GZIP)
+  def testPush(self, compression):
+    summary = ssh_tar_copy.Push(
+        _LOCAL_SHELL_CMD,
+        [(os.path.join(self.src, 'a.txt'), os.path.join(self.dst, 'renamed')),
+         (os.path.join(self.src, 'a.txt'), self.dst),
+         (os.path.join(self.src, 'dir'), os.path.join(self.dst, 'newdir'))],
+        compression=compression)
+    self.assertEqual('a', _ReadFile(os.path.join(self.dst, 'renamed')))
+    self.assertEqual('a', _ReadFile(os.path.join(self.dst, 'a.txt')))
+    self.assertEqual('c', _ReadFile(
+        os.path.join(self.dst, 'newdir', 'sub', 'c.txt')))
+    self.assertEqual((4, 4), (summary.files, summary.bytes))
+
+  def testPushDirectoryIntoExistingDirectory(self):
+    ssh_tar_copy.Push(_LOCAL_SHELL_CMD,
+                      [(os.path.join(self.src, 'dir'), self.dst)])
+    self.assertEqual('b', _ReadFile(os.path.join(self.dst, 'dir', 'b.txt')))
+
+  def testPushRelativeToHome(self):
+    with mock.patch.dict(os.environ, {'HOME': self.dst}):
+      ssh_tar_copy.Push(_LOCAL_SHELL_CMD,
+                        [(os.path.join(self.src, 'a.txt'), ''),
+                         (os.path.join(self.src, 'a.txt'), '~/tilde.txt'),
+                         (os.path.join(self.src, 'a.txt'), 'relative.txt')])
+    self.assertCountEqual(['a.txt', 'tilde.txt', 'relative.txt'],
+                          os.listdir(self.dst))
+
+  @parameterized.parameters(ssh_tar_copy.COMPRESSION_NONE,
+                            ssh_tar_copy.COMPRESSION_GZIP)
+  def testPull(self, compression):
+    summary = ssh_tar_copy.Pull(
+        _LOCAL_SHELL_CMD,
+        [(os.path.join(self.dst, 'renamed'), os.path.join(self.src, 'a.txt')),
+         (self.dst, os.path.join(self.src, 'dir'))],
+        compression=compression)
+    self.assertEqual('a', _ReadFile(os.path.join(self.dst, 'renamed')))
+    self.assertEqual('c', _ReadFile(
+        os.path.join(self.dst, 'dir', 'sub', 'c.txt')))
+    self.assertEqual((3, 3), (summary.files, summary.bytes))
+
+  def testPullMissingFileRaises(self):
+    with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+      ssh_tar_copy.Pull(_LOCAL_SHELL_CMD,
+                        [(self.dst, os.path.join(self.src, 'missing'))])
+
+  def testPushFailureRaises(self):
+    with self.assertRaises(errors.VirtualMachine.RemoteCommandError):
+      ssh_tar_copy.Push(['/bin/sh', '-c', 'exit 255', 'sh'],
+                        [(os.path.join(self.src, 'a.txt'), self.dst)])
+
+
+if __name__ == '__main__':
+  unittest.main()
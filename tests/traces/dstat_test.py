@@ -16,6 +16,7 @@
 import os
 import unittest
 from absl import flags
+from absl.testing import flagsaver
 
 from perfkitbenchmarker import events
 from perfkitbenchmarker.sample import Sample
@@ -105,6 +106,19 @@ class DstatTestCase(pkb_common_test_case.PkbCommonTestCase):
     self.assertEqual(
         expected.metadata, self.samples[0].metadata)
 
+  @flagsaver.flagsaver(dstat_publish_regex='usr__total cpu usage')
+  def testAnalyzePublishRegex(self):
+    events.AddEvent('sender', 'event', 1475708693, 1475708695,
+                    {'label1': 123})
+    self.collector.Analyze('testSender', None, self.samples)
+    batch = self.samples[-1]
+    self.assertEqual('usr__total cpu usage', batch.metric)
+    self.assertGreater(len(batch), 1)
+    self.assertEqual(
+        {'vm_role': 'test_vm0', 'label1': 123, 'event': 'event',
+         'sender': 'sender', 'dstat_epoch': 1475708693.291},
+        batch[0].metadata)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,83 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.upload_cache."""
+
+import hashlib
+import unittest
+
+import mock
+
+from perfkitbenchmarker import upload_cache
+from tests import pkb_common_test_case
+
+
+def _Sha256(contents):
+  return hashlib.sha256(contents.encode()).hexdigest()
+
+
+class UploadCacheTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(UploadCacheTestCase, self).setUp()
+    self.unchanged = self.create_tempfile(content='same').full_path
+    self.changed = self.create_tempfile(content='new').full_path
+    self.directory = self.create_tempdir().full_path
+    self.vm = mock.Mock()
+    self.vm.GetDestinationSha256sums.return_value = [_Sha256('same'),
+                                                     _Sha256('old')]
+    self.addCleanup(upload_cache._STATS.Reset)
+
+  def testLocalSha256sumIsMemoized(self):
+    expected = _Sha256('same')
+    with mock.patch.object(hashlib, 'sha256', wraps=hashlib.sha256) as sha256:
+      self.assertEqual(expected, upload_cache.LocalSha256sum(self.unchanged))
+      self.assertEqual(expected, upload_cache.LocalSha256sum(self.unchanged))
+    self.assertEqual(1, sha256.call_count)
+
+  def testLocalSha256sumNoticesChanges(self):
+    path = self.create_tempfile(content='before').full_path
+    self.assertEqual(_Sha256('before'), upload_cache.LocalSha256sum(path))
+    with open(path, 'w') as f:
+      f.write('after!')
+    self.assertEqual(_Sha256('after!'), upload_cache.LocalSha256sum(path))
+
+  def testFilterUnchangedFiles(self):
+    file_pairs = [(self.unchanged, '/a'), (self.changed, '/b'),
+                  (self.directory, '/c')]
+    self.assertEqual([(self.changed, '/b'), (self.directory, '/c')],
+                     upload_cache.FilterUnchangedFiles(self.vm, file_pairs))
+    self.vm.GetDestinationSha256sums.assert_called_once_with(
+        [(self.unchanged, '/a'), (self.changed, '/b')])
+    samples = upload_cache.GetSamples()
+    self.assertEqual(1, len(samples))
+    self.assertEqual(4, samples[0].value)
+    self.assertEqual(1, samples[0].metadata['files_skipped'])
+    self.assertEqual(3, samples[0].metadata['bytes_uploaded'])
+    self.assertEqual([], upload_cache.GetSamples())
+
+  def testMissingDestinationIsUploaded(self):
+    self.vm.GetDestinationSha256sums.return_value = [None]
+    file_pairs = [(self.unchanged, '/a')]
+    self.assertEqual(file_pairs,
+                     upload_cache.FilterUnchangedFiles(self.vm, file_pairs))
+
+  def testUnsupportedVmUploadsEverything(self):
+    self.vm.GetDestinationSha256sums.side_effect = NotImplementedError()
+    file_pairs = [(self.unchanged, '/a')]
+    self.assertEqual(file_pairs,
+                     upload_cache.FilterUnchangedFiles(self.vm, file_pairs))
+
+
+if __name__ == '__main__':
+  unittest.main()
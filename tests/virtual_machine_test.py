@@ -162,7 +162,7 @@ class TestInstallData(pkb_common_test_case.PkbCommonTestCase):
                                self.fallback_url)
     show.assert_called_once_with(self.module_name, 'fake_pkg')
     remote_command.assert_called_once_with(
-        'wget -O /fake_path/fake_pkg.tar.gz https://fake_url/fake_pkg.tar.gz')
+        'wget -O /fake_path/fake_pkg https://fake_url/fake_pkg.tar.gz')
     check.assert_called_once_with(
         self.install_path, self.module_name, 'fake_pkg', 'fake_checksum')
 
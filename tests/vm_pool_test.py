@@ -0,0 +1,139 @@
+# Copyright 2020 PerfKitBenchmarker Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for perfkitbenchmarker.vm_pool."""
+
+import contextlib
+import unittest
+
+import mock
+from perfkitbenchmarker import disk
+from perfkitbenchmarker import os_types
+from perfkitbenchmarker import vm_pool
+from tests import pkb_common_test_case
+
+_COMPONENT = 'test_component'
+
+
+def _DiskSpec(disk_type=disk.STANDARD, mount_point='/scratch'):
+  return disk.BaseDiskSpec(_COMPONENT, disk_type=disk_type,
+                           mount_point=mount_point)
+
+
+def _MockVm(name, os_type=os_types.DEBIAN9, disk_specs=None, is_static=False):
+  scratch_disk = mock.Mock(mount_point='/scratch', disk_type=disk.STANDARD)
+  vm = mock.Mock(
+      OS_TYPE=os_type, CLOUD='GCP', is_static=is_static, created=True,
+      deleted=False, bootable_time=160, create_start_time=100,
+      disk_specs=disk_specs if disk_specs is not None else [_DiskSpec()],
+      scratch_disks=[scratch_disk], vm_pool_key=None)
+  vm.name = name
+  return vm
+
+
+def _MockSpec(vms):
+  spec = mock.Mock(vms=vms, networks={('GCP', 'zone'): mock.Mock()},
+                   firewalls={'GCP': mock.Mock()})
+  spec.RedirectGlobalFlags.return_value = contextlib.nullcontext()
+  return spec
+
+
+class VmPoolTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(VmPoolTestCase, self).setUp()
+    self.addCleanup(vm_pool.TearDown)
+    self.addCleanup(vm_pool.GetSamples)
+    self.vm_spec = pkb_common_test_case.CreateTestVmSpec()
+    self.vm_spec.zone = 'zone'
+    self.vm_spec.machine_type = 'n1-standard-2'
+
+  def _Key(self, vm):
+    vm.vm_pool_key = vm_pool.GetKey(vm, self.vm_spec)
+    return vm.vm_pool_key
+
+  def testKeyIsSameForEquivalentVms(self):
+    self.assertIsNotNone(self._Key(_MockVm('a')))
+    self.assertEqual(self._Key(_MockVm('a')), self._Key(_MockVm('b')))
+
+  def testKeyDependsOnSpecs(self):
+    key = self._Key(_MockVm('a'))
+    self.assertNotEqual(key, self._Key(_MockVm(
+        'b', disk_specs=[_DiskSpec(mount_point='/other')])))
+    self.vm_spec.machine_type = 'n1-standard-4'
+    self.assertNotEqual(key, self._Key(_MockVm('c')))
+
+  def testUnpooledVms(self):
+    self.assertIsNone(self._Key(_MockVm('a', os_type=os_types.WINDOWS2019_CORE)))
+    self.assertIsNone(self._Key(_MockVm('b', is_static=True)))
+    self.assertIsNone(self._Key(_MockVm(
+        'c', disk_specs=[_DiskSpec(disk_type=disk.NFS)])))
+
+  def testReleaseAndLease(self):
+    vm = _MockVm('a')
+    key = self._Key(vm)
+    spec = _MockSpec([vm])
+    networks = dict(spec.networks)
+    vm_pool.Release(spec)
+    vm.PackageCleanup.assert_called_once_with()
+    self.assertIn('umount /scratch', vm.RemoteCommand.call_args[0][0])
+    self.assertTrue(vm_pool.IsIdle(vm))
+    self.assertEqual({}, spec.networks)
+
+    next_spec = mock.Mock(networks={}, firewalls={})
+    vm_pool.AdoptNetworks(next_spec)
+    self.assertEqual(networks, next_spec.networks)
+    self.assertIs(vm, vm_pool.Lease(key))
+    self.assertFalse(vm_pool.IsIdle(vm))
+    self.assertIsNone(vm_pool.Lease(key))
+
+    reused, saved = vm_pool.GetSamples()
+    self.assertEqual(1, reused.value)
+    self.assertEqual(60, saved.value)
+    self.assertEqual([], vm_pool.GetSamples())
+
+  def testVmThatFailsToResetIsNotPooled(self):
+    vm = _MockVm('a')
+    vm.PackageCleanup.side_effect = Exception('ssh failed')
+    self._Key(vm)
+    vm_pool.Release(_MockSpec([vm]))
+    self.assertFalse(vm_pool.IsIdle(vm))
+
+  def testPrepareLeasedVm(self):
+    vm = _MockVm('a')
+    vm_pool.PrepareLeasedVm(vm)
+    scratch_disk = vm.scratch_disks[0]
+    vm.FormatDisk.assert_called_once_with(scratch_disk.GetDevicePath(),
+                                          disk.STANDARD)
+    vm.MountDisk.assert_called_once_with(
+        scratch_disk.GetDevicePath(), '/scratch', disk.STANDARD,
+        scratch_disk.mount_options, scratch_disk.fstab_options)
+    vm.DropCaches.assert_called_once_with()
+
+  def testTearDown(self):
+    vm = _MockVm('a')
+    self._Key(vm)
+    spec = _MockSpec([vm])
+    network = spec.networks[('GCP', 'zone')]
+    firewall = spec.firewalls['GCP']
+    vm_pool.Release(spec)
+    vm_pool.TearDown()
+    vm.Delete.assert_called_once_with()
+    vm.DeleteScratchDisks.assert_called_once_with()
+    firewall.DisallowAllPorts.assert_called_once_with()
+    network.Delete.assert_called_once_with()
+    self.assertFalse(vm_pool.IsIdle(vm))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -208,6 +208,82 @@ class IssueCommandTestCase(pkb_common_test_case.PkbCommonTestCase):
                   str(cm.exception))
 
 
+class IssueStreamingCommandTestCase(pkb_common_test_case.PkbCommonTestCase):
+
+  def setUp(self):
+    super(IssueStreamingCommandTestCase, self).setUp()
+    self.spill_dir = self.create_tempdir().full_path
+
+  def testResultUnpacksLikeIssueCommand(self):
+    stdout, stderr, retcode = vm_util.IssueStreamingCommand(
+        ['sh', '-c', 'echo out; echo err >&2'])
+    self.assertEqual(('out\n', 'err\n', 0), (stdout, stderr, retcode))
+
+  def testLineCallback(self):
+    lines = []
+    vm_util.IssueStreamingCommand(
+        ['sh', '-c', 'echo a; echo b >&2; printf c'],
+        line_callback=lambda stream, line: lines.append((stream, line)))
+    self.assertCountEqual([(vm_util.OUTPUT_STDOUT, 'a\n'),
+                           (vm_util.OUTPUT_STDERR, 'b\n'),
+                           (vm_util.OUTPUT_STDOUT, 'c')], lines)
+
+  def testSpillsToFile(self):
+    result = vm_util.IssueStreamingCommand(
+        ['seq', '1', '10000'], max_buffer_bytes=1024, spill_dir=self.spill_dir)
+    self.assertTrue(result.stdout_path.startswith(self.spill_dir))
+    self.assertIsNone(result.stderr_path)
+    with open(result.stdout_path) as f:
+      self.assertEqual(10000, len(f.read().splitlines()))
+    self.assertEqual(10000, len(result.stdout.splitlines()))
+
+  def testFailureRaises(self):
+    with self.assertRaises(errors.VmUtil.IssueCommandError) as cm:
+      vm_util.IssueStreamingCommand(['cat', 'non_existent_file'])
+    self.assertIn('No such file or directory', str(cm.exception))
+
+  def testFailureSuppressed(self):
+    stdout, stderr, retcode = vm_util.IssueStreamingCommand(
+        ['cat', 'non_existent_file'],
+        suppress_failure=lambda stdout, stderr, retcode: True)
+    self.assertEqual(('', '', 0), (stdout, stderr, retcode))
+
+  def testTimeoutReachedThrows(self):
+    with self.assertRaises(errors.VmUtil.IssueCommandTimeoutError):
+      vm_util.IssueStreamingCommand(['sleep', '2s'], timeout=0.1)
+    self.assertFalse(HaveSleepSubprocess())
+
+  def testTimeoutReached(self):
+    _, _, retcode = vm_util.IssueStreamingCommand(
+        ['sleep', '2s'], timeout=0.1, raise_on_failure=False,
+        raise_on_timeout=False)
+    self.assertEqual(-9, retcode)
+
+  def testIterCommandLines(self):
+    lines = [line for _, line in vm_util.IterCommandLines(['seq', '1', '3'])]
+    self.assertEqual(['1\n', '2\n', '3\n'], lines)
+
+  def testIterCommandLinesRaisesAfterOutput(self):
+    lines = []
+    with self.assertRaises(errors.VmUtil.IssueCommandError):
+      for _, line in vm_util.IterCommandLines(['sh', '-c', 'echo a; exit 1']):
+        lines.append(line)
+    self.assertEqual(['a\n'], lines)
+
+  def testClosingIteratorKillsCommand(self):
+    lines = vm_util.IterCommandLines(['sh', '-c', 'echo a; exec sleep 2s'])
+    next(lines)
+    lines.close()
+    self.assertFalse(HaveSleepSubprocess())
+
+  def testIssueCommandPipeEngine(self):
+    FLAGS.issue_command_engine = vm_util.ISSUE_COMMAND_ENGINE_PIPE
+    with mock.patch.object(vm_util, '_ReadIssueCommandOutput') as read_output:
+      self.assertEqual(('out\n', '', 0),
+                       vm_util.IssueCommand(['echo', 'out']))
+    read_output.assert_not_called()
+
+
 class VmUtilTest(pkb_common_test_case.PkbCommonTestCase):
 
   def setUp(self):